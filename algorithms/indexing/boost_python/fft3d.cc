@@ -20,7 +20,8 @@ namespace dials { namespace algorithms { namespace boost_python {
     def("sampling_volume_map", &sampling_volume_map,
       (arg("data"), arg("angle_ranges"),
        arg("s0"), arg("m2"),
-       arg("rl_grid_spacing"), arg("d_min"), arg("b_iso")));
+       arg("rl_grid_spacing"), arg("d_min"), arg("b_iso"),
+       arg("nthreads")=1));
 
     def("clean_3d", &clean_3d,
       (arg("dirty_beam"), arg("dirty_map"), arg("n_peaks"), arg("gamma")=1));
@@ -28,7 +29,14 @@ namespace dials { namespace algorithms { namespace boost_python {
     def("map_centroids_to_reciprocal_space_grid",
       &map_centroids_to_reciprocal_space_grid,
       (arg("grid"), arg("reciprocal_space_vectors"),
-       arg("selection"), arg("d_min"), arg("b_iso")=0));
+       arg("selection"), arg("d_min"), arg("b_iso")=0,
+       arg("nthreads")=1));
+
+    def("fft3d_real_squared", &fft3d_real_squared,
+      (arg("data"), arg("nthreads")=1));
+
+    def("threshold_map_by_rmsd", &threshold_map_by_rmsd,
+      (arg("data"), arg("rmsd_cutoff"), arg("nthreads")=1));
 
   }
 
@@ -13,6 +13,10 @@
 #include <stdio.h>
 #include <iostream>
 #include <cmath>
+#include <complex>
+#include <vector>
+#include <algorithm>
+#include <boost/bind.hpp>
 #include <scitbx/vec2.h>
 #include <scitbx/array_family/flex_types.h>
 #include <scitbx/math/utils.h>
@@ -22,6 +26,9 @@
 #include <dials/array_family/scitbx_shared_and_versa.h>
 #include <dials/algorithms/spot_prediction/rotation_angles.h>
 #include <dxtbx/model/scan_helpers.h>
+#include <scitbx/fftpack/complex_to_complex.h>
+#include <scitbx/fftpack/real_to_complex.h>
+#include <dials/util/thread_pool.h>
 
 
 namespace dials { namespace algorithms {
@@ -43,6 +50,49 @@ namespace dials { namespace algorithms {
     return false;
   }
 
+  namespace detail {
+
+    // Split the range [0, n) into nthreads contiguous chunks and call
+    // func(begin, end) on each of them from a pool of nthreads threads. The
+    // function must not throw, and chunks must write to disjoint memory.
+    template <typename Function>
+    void parallel_for_chunks(std::size_t n, std::size_t nthreads,
+                             Function func) {
+      DIALS_ASSERT(nthreads > 0);
+      nthreads = std::min(nthreads, n);
+      if (nthreads <= 1) {
+        func(0, n);
+        return;
+      }
+      dials::util::ThreadPool pool(nthreads);
+      for (std::size_t t = 0; t < nthreads; ++t) {
+        pool.post(boost::bind<void>(func,
+          t * n / nthreads, (t + 1) * n / nthreads));
+      }
+      pool.wait();
+    }
+
+    // Fill the sampling volume map for the slabs [i_begin, i_end) of the
+    // first grid dimension
+    struct sampling_volume_slabs {
+      af::ref<double, af::c_grid<3> > data;
+      af::ref<vec2<double> > angle_ranges;
+      vec3<double> s0, m2;
+      double rl_grid_spacing, d_min, b_iso;
+
+      sampling_volume_slabs(
+          af::ref<double, af::c_grid<3> > const & data_,
+          af::ref<vec2<double> > const & angle_ranges_,
+          vec3<double> s0_, vec3<double> m2_,
+          double rl_grid_spacing_, double d_min_, double b_iso_)
+        : data(data_), angle_ranges(angle_ranges_), s0(s0_), m2(m2_),
+          rl_grid_spacing(rl_grid_spacing_), d_min(d_min_), b_iso(b_iso_) {}
+
+      void operator()(std::size_t i_begin, std::size_t i_end) const;
+    };
+
+  } // namespace detail
+
   // compute a map of the sampling volume of a scan
   void sampling_volume_map(
     af::ref<double, af::c_grid<3> > const & data,
@@ -50,7 +100,16 @@ namespace dials { namespace algorithms {
     vec3 <double> s0, vec3 <double> m2,
     double const & rl_grid_spacing,
     double d_min,
-    double b_iso)
+    double b_iso,
+    std::size_t nthreads=1)
+  {
+    detail::parallel_for_chunks(data.accessor()[0], nthreads,
+      detail::sampling_volume_slabs(
+        data, angle_ranges, s0, m2, rl_grid_spacing, d_min, b_iso));
+  }
+
+  void detail::sampling_volume_slabs::operator()(
+    std::size_t i_begin, std::size_t i_end) const
   {
     typedef af::c_grid<3>::index_type index_t;
     index_t const gridding_n_real = index_t(data.accessor());
@@ -59,7 +118,7 @@ namespace dials { namespace algorithms {
 
     double one_over_d_sq_min = 1/(d_min*d_min);
 
-    for (std::size_t i=0; i<gridding_n_real[0]; i++) {
+    for (std::size_t i=i_begin; i<i_end; i++) {
       double i_rl = (double(i) - double(gridding_n_real[0]/2.0)) * rl_grid_spacing;
       double i_rl_sq = i_rl * i_rl;
       for (std::size_t j=0; j<gridding_n_real[1]; j++) {
@@ -173,52 +232,337 @@ namespace dials { namespace algorithms {
   }
 
 
+  namespace detail {
+
+    // Find the grid point and value for each of the reflections in
+    // [begin, end), or deselect the reflection if it is outside the grid
+    struct centroid_grid_points {
+      af::const_ref<vec3<double> > reciprocal_space_vectors;
+      af::ref<bool> selection;
+      long *grid_index;
+      double *grid_value;
+      int n_points;
+      double d_min, b_iso;
+
+      centroid_grid_points(
+          af::const_ref<vec3<double> > const & reciprocal_space_vectors_,
+          af::ref<bool> const & selection_,
+          long *grid_index_, double *grid_value_,
+          int n_points_, double d_min_, double b_iso_)
+        : reciprocal_space_vectors(reciprocal_space_vectors_),
+          selection(selection_),
+          grid_index(grid_index_),
+          grid_value(grid_value_),
+          n_points(n_points_),
+          d_min(d_min_),
+          b_iso(b_iso_) {}
+
+      void operator()(std::size_t begin, std::size_t end) const {
+        const double rlgrid = 2 / (d_min * n_points);
+        const double one_over_rlgrid = 1/rlgrid;
+        const int half_n_points = n_points/2;
+
+        for (std::size_t i=begin; i<end; i++) {
+          grid_index[i] = -1;
+          if (!selection[i]) { continue; }
+          const vec3<double> v = reciprocal_space_vectors[i];
+          const double v_length = v.length();
+          const double d_spacing = 1/v_length;
+          if (d_spacing < d_min) {
+            selection[i] = false;
+            continue;
+          }
+          vec3<int> coord;
+          for (int j=0; j<3; j++) {
+            coord[j] = scitbx::math::iround(v[j] * one_over_rlgrid) + half_n_points;
+          }
+          if ((coord.max() >= n_points) || coord.min() < 0) {
+            selection[i] = false;
+            continue;
+          }
+          double T;
+          if (b_iso != 0) {
+            T = std::exp(-b_iso * v_length * v_length / 4.0);
+          }
+          else {
+            T = 1;
+          }
+          grid_index[i] = (long(coord[0]) * n_points + coord[1]) * n_points
+            + coord[2];
+          grid_value[i] = T;
+        }
+      }
+    };
+
+  } // namespace detail
+
   void map_centroids_to_reciprocal_space_grid(
     af::ref<double, af::c_grid<3> > const & grid,
     af::const_ref<vec3<double> > const & reciprocal_space_vectors,
     af::ref<bool> const & selection,
     double d_min,
-    double b_iso=0)
+    double b_iso=0,
+    std::size_t nthreads=1)
   {
     typedef af::c_grid<3>::index_type index_t;
     index_t const gridding_n_real = index_t(grid.accessor());
     DIALS_ASSERT(d_min >=0);
     DIALS_ASSERT(gridding_n_real[0] == gridding_n_real[1]);
     DIALS_ASSERT(gridding_n_real[0] == gridding_n_real[2]);
+    DIALS_ASSERT(selection.size() == reciprocal_space_vectors.size());
 
-    const int n_points = gridding_n_real[0];
-    const double rlgrid = 2 / (d_min * n_points);
-    const double one_over_rlgrid = 1/rlgrid;
-    const int half_n_points = n_points/2;
-
-    for (int i=0; i<reciprocal_space_vectors.size(); i++) {
-      if (!selection[i]) { continue; }
-      const vec3<double> v = reciprocal_space_vectors[i];
-      const double v_length = v.length();
-      const double d_spacing = 1/v_length;
-      if (d_spacing < d_min) {
-        selection[i] = false;
-        continue;
+    // Find the grid points in parallel, then write them in reflection order
+    // so that where reflections share a grid point the last one is used
+    std::size_t n_refl = reciprocal_space_vectors.size();
+    std::vector<long> grid_index(n_refl);
+    std::vector<double> grid_value(n_refl);
+    detail::parallel_for_chunks(n_refl, nthreads,
+      detail::centroid_grid_points(
+        reciprocal_space_vectors, selection,
+        n_refl > 0 ? &grid_index[0] : 0,
+        n_refl > 0 ? &grid_value[0] : 0,
+        int(gridding_n_real[0]), d_min, b_iso));
+    for (std::size_t i=0; i<n_refl; i++) {
+      if (grid_index[i] >= 0) {
+        grid[grid_index[i]] = grid_value[i];
       }
-      vec3<int> coord;
-      for (int j=0; j<3; j++) {
-        coord[j] = scitbx::math::iround(v[j] * one_over_rlgrid) + half_n_points;
+    }
+  }
+
+  namespace detail {
+
+    typedef std::complex<double> complex_type;
+
+    // Transform the rows of the map along the last dimension with a
+    // real-to-complex FFT, keeping the n2/2+1 non-redundant values of each row
+    struct fft3d_rows {
+      const double *data;
+      complex_type *half;
+      std::size_t n1, n2, n_complex;
+
+      fft3d_rows(const double *data_, complex_type *half_,
+                 std::size_t n1_, std::size_t n2_, std::size_t n_complex_)
+        : data(data_), half(half_), n1(n1_), n2(n2_), n_complex(n_complex_) {}
+
+      void operator()(std::size_t i_begin, std::size_t i_end) const {
+        scitbx::fftpack::real_to_complex<double> fft(n2);
+        DIALS_ASSERT(fft.n_complex() == n_complex);
+        std::vector<double> seq(fft.m_real(), 0);
+        for (std::size_t i = i_begin; i < i_end; i++) {
+          for (std::size_t j = 0; j < n1; j++) {
+            const double *row = data + (i * n1 + j) * n2;
+            std::copy(row, row + n2, seq.begin());
+            fft.forward(&seq[0]);
+            complex_type *out = half + (i * n1 + j) * n_complex;
+            for (std::size_t k = 0; k < n_complex; k++) {
+              out[k] = complex_type(seq[2*k], seq[2*k+1]);
+            }
+          }
+        }
       }
-      if ((coord.max() >= n_points) || coord.min() < 0) {
-        selection[i] = false;
-        continue;
+    };
+
+    // Transform the half complex map with complex-to-complex FFTs of length
+    // n along the lines starting at outer * outer_stride + inner, for each
+    // inner < n_inner, with a stride of line_stride between elements
+    struct fft3d_lines {
+      complex_type *half;
+      std::size_t n, line_stride, outer_stride, n_inner;
+
+      fft3d_lines(complex_type *half_, std::size_t n_,
+                  std::size_t line_stride_, std::size_t outer_stride_,
+                  std::size_t n_inner_)
+        : half(half_), n(n_), line_stride(line_stride_),
+          outer_stride(outer_stride_), n_inner(n_inner_) {}
+
+      void operator()(std::size_t outer_begin, std::size_t outer_end) const {
+        scitbx::fftpack::complex_to_complex<double> fft(n);
+        std::vector<complex_type> seq(n);
+        for (std::size_t outer = outer_begin; outer < outer_end; outer++) {
+          for (std::size_t inner = 0; inner < n_inner; inner++) {
+            complex_type *line = half + outer * outer_stride + inner;
+            for (std::size_t m = 0; m < n; m++) {
+              seq[m] = line[m * line_stride];
+            }
+            fft.forward(&seq[0]);
+            for (std::size_t m = 0; m < n; m++) {
+              line[m * line_stride] = seq[m];
+            }
+          }
+        }
+      }
+    };
+
+    // Square the real part of the transform over the full map. The values
+    // not stored in the half complex map follow from the Hermitian symmetry
+    // of the transform of a real map, F(h) = conj(F(-h))
+    struct fft3d_expand_real_squared {
+      const complex_type *half;
+      double *result;
+      std::size_t n0, n1, n2, n_complex;
+
+      fft3d_expand_real_squared(const complex_type *half_, double *result_,
+                                std::size_t n0_, std::size_t n1_,
+                                std::size_t n2_, std::size_t n_complex_)
+        : half(half_), result(result_),
+          n0(n0_), n1(n1_), n2(n2_), n_complex(n_complex_) {}
+
+      void operator()(std::size_t i_begin, std::size_t i_end) const {
+        for (std::size_t i = i_begin; i < i_end; i++) {
+          std::size_t i_minus = (n0 - i) % n0;
+          for (std::size_t j = 0; j < n1; j++) {
+            std::size_t j_minus = (n1 - j) % n1;
+            const complex_type *row = half + (i * n1 + j) * n_complex;
+            const complex_type *row_minus =
+              half + (i_minus * n1 + j_minus) * n_complex;
+            double *out = result + (i * n1 + j) * n2;
+            for (std::size_t k = 0; k < n_complex; k++) {
+              double re = row[k].real();
+              out[k] = re * re;
+            }
+            for (std::size_t k = n_complex; k < n2; k++) {
+              double re = row_minus[n2 - k].real();
+              out[k] = re * re;
+            }
+          }
+        }
+      }
+    };
+
+    // Sum the values in each slab [i, i+1) of the first grid dimension,
+    // after subtracting the given mean and raising to the given power
+    struct slab_sums {
+      const double *data;
+      double *sums;
+      std::size_t slab_size;
+      double mean;
+      int power;
+
+      slab_sums(const double *data_, double *sums_, std::size_t slab_size_,
+                double mean_, int power_)
+        : data(data_), sums(sums_), slab_size(slab_size_),
+          mean(mean_), power(power_) {}
+
+      void operator()(std::size_t i_begin, std::size_t i_end) const {
+        for (std::size_t i = i_begin; i < i_end; i++) {
+          const double *slab = data + i * slab_size;
+          double sum = 0;
+          for (std::size_t k = 0; k < slab_size; k++) {
+            double x = slab[k] - mean;
+            sum += power == 1 ? x : x * x;
+          }
+          sums[i] = sum;
+        }
       }
-      double T;
-      if (b_iso != 0) {
-        T = std::exp(-b_iso * v_length * v_length / 4.0);
+    };
+
+    // Set the mask to 1 where the map is positive and at least the cutoff
+    struct threshold_slabs {
+      const double *data;
+      int *mask;
+      std::size_t slab_size;
+      double cutoff;
+
+      threshold_slabs(const double *data_, int *mask_, std::size_t slab_size_,
+                      double cutoff_)
+        : data(data_), mask(mask_), slab_size(slab_size_), cutoff(cutoff_) {}
+
+      void operator()(std::size_t i_begin, std::size_t i_end) const {
+        for (std::size_t idx = i_begin * slab_size; idx < i_end * slab_size;
+             idx++) {
+          mask[idx] = (data[idx] >= cutoff && data[idx] > 0) ? 1 : 0;
+        }
+      }
+    };
+
+    // The sum over the map of (x - mean)^power, reduced over the slabs in a
+    // fixed order so that the result does not depend on the number of threads
+    inline double map_sum(
+        af::const_ref<double, af::c_grid<3> > const & data,
+        double mean,
+        int power,
+        std::size_t nthreads) {
+      std::size_t n0 = data.accessor()[0];
+      if (n0 == 0) {
+        return 0;
       }
-      else {
-        T = 1;
+      std::vector<double> sums(n0);
+      parallel_for_chunks(n0, nthreads,
+        slab_sums(data.begin(), &sums[0], data.size() / n0, mean, power));
+      double sum = 0;
+      for (std::size_t i = 0; i < n0; i++) {
+        sum += sums[i];
       }
-      grid(coord) = T;
+      return sum;
     }
+
+  } // namespace detail
+
+  /**
+   * Compute the square of the real part of the forward 3D FFT of a real map.
+   * This is the same as the real part of a complex-to-complex transform of
+   * the map with zero imaginary part, but only the non-redundant half of the
+   * complex transform is computed and stored, and the 1D transforms along
+   * each dimension are shared between threads.
+   * @param data The real map
+   * @param nthreads The number of threads
+   * @returns The squared real part of the transform, on the same grid
+   */
+  af::versa<double, af::c_grid<3> > fft3d_real_squared(
+    af::const_ref<double, af::c_grid<3> > const & data,
+    std::size_t nthreads=1)
+  {
+    typedef af::c_grid<3>::index_type index_t;
+    index_t const n = index_t(data.accessor());
+    DIALS_ASSERT(nthreads > 0);
+    DIALS_ASSERT(n[0] > 0 && n[1] > 0 && n[2] > 0);
+    std::size_t n_complex = n[2] / 2 + 1;
+
+    std::vector<detail::complex_type> half(n[0] * n[1] * n_complex);
+    detail::parallel_for_chunks(n[0], nthreads,
+      detail::fft3d_rows(data.begin(), &half[0], n[1], n[2], n_complex));
+    detail::parallel_for_chunks(n[0], nthreads,
+      detail::fft3d_lines(&half[0], n[1], n_complex, n[1] * n_complex,
+                          n_complex));
+    detail::parallel_for_chunks(n[1], nthreads,
+      detail::fft3d_lines(&half[0], n[0], n[1] * n_complex, n_complex,
+                          n_complex));
+
+    af::versa<double, af::c_grid<3> > result(
+      af::c_grid<3>(n[0], n[1], n[2]), 0);
+    detail::parallel_for_chunks(n[0], nthreads,
+      detail::fft3d_expand_real_squared(
+        &half[0], result.begin(), n[0], n[1], n[2], n_complex));
+    return result;
   }
 
+  /**
+   * Mark the grid points where the map is positive and at least rmsd_cutoff
+   * times the root mean square deviation of the map from its mean. This is the
+   * binary map used for the flood fill peak search.
+   * @param data The map
+   * @param rmsd_cutoff The cutoff in units of the rmsd of the map
+   * @param nthreads The number of threads
+   * @returns A map of 1 for the selected points and 0 elsewhere
+   */
+  af::versa<int, af::c_grid<3> > threshold_map_by_rmsd(
+    af::const_ref<double, af::c_grid<3> > const & data,
+    double rmsd_cutoff,
+    std::size_t nthreads=1)
+  {
+    DIALS_ASSERT(nthreads > 0);
+    DIALS_ASSERT(data.size() > 0);
+    double mean = detail::map_sum(data, 0, 1, nthreads) / data.size();
+    double rmsd = std::sqrt(
+      detail::map_sum(data, mean, 2, nthreads) / data.size());
+
+    std::size_t n0 = data.accessor()[0];
+    af::versa<int, af::c_grid<3> > mask(data.accessor(), 0);
+    detail::parallel_for_chunks(n0, nthreads,
+      detail::threshold_slabs(data.begin(), mask.begin(), data.size() / n0,
+                              rmsd_cutoff * rmsd));
+    return mask;
+  }
 
 }}
 
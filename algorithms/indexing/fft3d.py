@@ -68,6 +68,13 @@ def find_lattices(self):
                                       crystal=cm))
     return experiments
 
+  def fft3d_nthreads(self):
+    """The number of threads for the sampling, FFT and peak search steps."""
+    nthreads = self.params.fft3d.nthreads
+    if nthreads is libtbx.Auto:
+      nthreads = self.params.nproc
+    return nthreads
+
   def map_centroids_to_reciprocal_space_grid(self):
     d_min = self.params.fft3d.reciprocal_space_grid.d_min
 
@@ -92,7 +99,7 @@ def map_centroids_to_reciprocal_space_grid(self):
     from dials.algorithms.indexing import map_centroids_to_reciprocal_space_grid
     map_centroids_to_reciprocal_space_grid(
       grid, self.reflections['rlp'], selection,
-      d_min, b_iso=self.params.b_iso)
+      d_min, b_iso=self.params.b_iso, nthreads=self.fft3d_nthreads())
     reflections_used_for_indexing = selection.iselection()
 
     self.reciprocal_space_grid = grid
@@ -127,24 +134,19 @@ def fft(self):
     logger.info("Number of centroids used: %i" %(
       (self.reciprocal_space_grid>0).count(True)))
 
+    # The grid is real, so only the non-redundant half of its transform is
+    # computed (n_points*n_points*(n_points//2+1) complex values) and the
+    # rest of the map follows from the Hermitian symmetry of the transform.
     #gb_to_bytes = 1073741824
     #bytes_to_gb = 1/gb_to_bytes
-    #(128**3)*8*2*bytes_to_gb
-    #0.03125
-    #(256**3)*8*2*bytes_to_gb
-    #0.25
-    #(512**3)*8*2*bytes_to_gb
-    #2.0
-
-    fft = fftpack.complex_to_complex_3d(self.gridding)
-    grid_complex = flex.complex_double(
-      reals=self.reciprocal_space_grid,
-      imags=flex.double(self.reciprocal_space_grid.size(), 0))
-    grid_transformed = fft.forward(grid_complex)
-    #self.grid_real = flex.pow2(flex.abs(grid_transformed))
-    self.grid_real = flex.pow2(flex.real(grid_transformed))
-    #self.grid_real = flex.pow2(flex.imag(self.grid_transformed))
-    del grid_transformed
+    #(128**3)*8*bytes_to_gb
+    #0.015625
+    #(256**3)*8*bytes_to_gb
+    #0.125
+    #(512**3)*8*bytes_to_gb
+    #1.0
+    self.grid_real = fft3d_real_squared(
+      self.reciprocal_space_grid, nthreads=self.fft3d_nthreads())
 
     if self.params.debug:
       self.debug_write_ccp4_map(map_data=self.grid_real, file_name="fft3d.map")
@@ -154,14 +156,8 @@ def fft(self):
       self.find_peaks_clean()
 
   def find_peaks(self):
-    grid_real_binary = self.grid_real.deep_copy()
-    rmsd = math.sqrt(
-      flex.mean(flex.pow2(grid_real_binary.as_1d()-flex.mean(grid_real_binary.as_1d()))))
-    grid_real_binary.set_selected(grid_real_binary < (self.params.rmsd_cutoff)*rmsd, 0)
-    grid_real_binary.as_1d().set_selected(grid_real_binary.as_1d() > 0, 1)
-    grid_real_binary = grid_real_binary.iround()
-    from cctbx import masks
-    flood_fill = masks.flood_fill(grid_real_binary, self.fft_cell)
+    flood_fill = flood_fill_peaks(self.grid_real, self.fft_cell,
+      self.params.rmsd_cutoff, nthreads=self.fft3d_nthreads())
     if flood_fill.n_voids() < 4:
       # Require at least peak at origin and one peak for each basis vector
       raise Sorry("Indexing failed: fft3d peak search failed to find sufficient number of peaks.")
@@ -582,7 +578,7 @@ def debug_plot_clusters(self, vectors, labels, min_cluster_size=1):
   def find_peaks_clean(self):
     import omptbx
     # doesn't seem to be any benefit to using more than say 8 threads
-    num_threads = min(8, omptbx.omp_get_num_procs(), self.params.nproc)
+    num_threads = min(8, omptbx.omp_get_num_procs(), self.fft3d_nthreads())
     omptbx.omp_set_num_threads(num_threads)
     d_min = self.params.fft3d.reciprocal_space_grid.d_min
     rlgrid = 2 / (d_min * self.gridding[0])
@@ -607,14 +603,10 @@ def find_peaks_clean(self):
     sampling_volume_map(grid, flex.vec2_double(angle_ranges),
                         self.imagesets[0].get_beam().get_s0(),
                         self.imagesets[0].get_goniometer().get_rotation_axis(),
-                        rlgrid, d_min, self.params.b_iso)
+                        rlgrid, d_min, self.params.b_iso,
+                        nthreads=self.fft3d_nthreads())
 
-    fft = fftpack.complex_to_complex_3d(self.gridding)
-    grid_complex = flex.complex_double(
-      reals=grid,
-      imags=flex.double(grid.size(), 0))
-    grid_transformed = fft.forward(grid_complex)
-    grid_real = flex.pow2(flex.real(grid_transformed))
+    grid_real = fft3d_real_squared(grid, nthreads=self.fft3d_nthreads())
 
     gamma = 1
     peaks = flex.vec3_double()
@@ -679,10 +671,29 @@ def optimise_peaks(self, peaks, reciprocal_lattice_points):
 
 
 def sampling_volume_map(data, angle_range, beam_vector, rotation_axis,
-                        rl_grid_spacing, d_min, b_iso):
+                        rl_grid_spacing, d_min, b_iso, nthreads=1):
     from dials.algorithms.indexing import sampling_volume_map
     return sampling_volume_map(
-      data, angle_range, beam_vector, rotation_axis, rl_grid_spacing, d_min, b_iso)
+      data, angle_range, beam_vector, rotation_axis, rl_grid_spacing, d_min,
+      b_iso, nthreads=nthreads)
+
+
+def fft3d_real_squared(grid, nthreads=1):
+  """The square of the real part of the forward FFT of a real grid, using
+  a real-to-complex transform on nthreads threads."""
+  from dials.algorithms.indexing import fft3d_real_squared as _fft3d
+  return _fft3d(grid, nthreads=nthreads)
+
+
+def flood_fill_peaks(grid_real, fft_cell, rmsd_cutoff, nthreads=1):
+  """Flood fill the regions of the map above rmsd_cutoff times its rmsd.
+  The thresholding is shared between nthreads threads; the flood fill itself
+  is serial."""
+  from cctbx import masks
+  from dials.algorithms.indexing import threshold_map_by_rmsd
+  grid_real_binary = threshold_map_by_rmsd(
+    grid_real, rmsd_cutoff, nthreads=nthreads)
+  return masks.flood_fill(grid_real_binary, fft_cell)
 
 
 def clean_3d(dirty_beam, dirty_map, n_peaks, gamma=1):
@@ -16,6 +16,7 @@
 logger = logging.getLogger(__name__)
 
 from dials.util import log
+from dials.util import trace
 
 debug_handle = log.debug_handle(logger)
 info_handle = log.info_handle(logger)
@@ -106,6 +107,12 @@
     peak_volume_cutoff = 0.15
       .type = float
       .expert_level = 2
+    nthreads = Auto
+      .type = int(value_min=1)
+      .help = "The number of threads used to map the spots onto the"
+              "reciprocal space grid, for the FFT and for the peak search."
+              "If Auto, indexing.nproc threads are used."
+      .expert_level = 2
     reciprocal_space_grid {
       n_points = 256
         .type = int(value_min=0)
@@ -317,6 +324,20 @@
   {
     characteristic_grid = 0.02
       .type = float(value_min=0)
+    coarse_grid = None
+      .type = float(value_min=0)
+      .help = "If set, first search a hemisphere grid of this spacing (in"
+              "radians), then search the characteristic_grid only in the"
+              "neighbourhood of the best coarse directions."
+    n_coarse_directions = 100
+      .type = int(value_min=1)
+      .help = "The number of best coarse directions around which to refine"
+              "the search when coarse_grid is set."
+    block_size = 128
+      .type = int(value_min=1)
+      .help = "The number of search vectors scored together as one matrix"
+              "product. Blocks are shared out between indexing.nproc threads."
+      .expert_level = 2
   }
   stills {
     indexer = *Auto stills sweeps
@@ -765,10 +786,13 @@ def index(self):
         self.d_min = self.params.refinement_protocol.d_min_start
 
       if len(experiments) == 0:
-        experiments.extend(self.find_lattices())
+        with trace.span('find_lattices', 'indexing', lattice=0):
+          experiments.extend(self.find_lattices())
       else:
         try:
-          new = self.find_lattices()
+          with trace.span('find_lattices', 'indexing',
+                          lattice=len(experiments)):
+            new = self.find_lattices()
           experiments.extend(new)
         except Sorry:
           logger.info("Indexing remaining reflections failed")
@@ -806,7 +830,9 @@ def index(self):
         # that a reflection doesn't belong to any lattice so far
         self.reflections['id'] = flex.int(len(self.reflections), -1)
 
-        self.index_reflections(experiments, self.reflections)
+        with trace.span('index_reflections', 'indexing', cycle=i_cycle) as args:
+          self.index_reflections(experiments, self.reflections)
+          args['indexed'] = (self.reflections['id'] > -1).count(True)
 
         if i_cycle == 0 and self.params.known_symmetry.space_group is not None:
           # now apply the space group symmetry only after the first indexing
@@ -888,8 +914,10 @@ def index(self):
           ref_predictor(refined_reflections)
         else:
           try:
-            refined_experiments, refined_reflections = self.refine(
-              experiments, reflections_for_refinement)
+            with trace.span('refine', 'indexing', cycle=i_cycle,
+                            reflections=len(reflections_for_refinement)):
+              refined_experiments, refined_reflections = self.refine(
+                experiments, reflections_for_refinement)
           except RuntimeError as e:
             s = str(e)
             if ("below the configured limit" in s or
@@ -1404,35 +1432,48 @@ def run_one_refinement(args):
       params.refinement.reflections.outlier.tukey.iqr_multiplier = \
         2 * params.refinement.reflections.outlier.tukey.iqr_multiplier
 
-    args = []
-
     from dials.algorithms.indexing.compare_orientation_matrices \
          import difference_rotation_matrix_axis_angle
-    for cm in candidate_orientation_matrices:
-      sel = (self.reflections['id'] == -1)
-      if self.d_min is not None:
-        sel &= (1/self.reflections['rlp'].norms() > self.d_min)
-      xo, yo, zo = self.reflections['xyzobs.mm.value'].parts()
-      imageset_id = self.reflections['imageset_id']
+
+    # The reflections are the same for every candidate, apart from the
+    # indexing, so select them once
+    sel = (self.reflections['id'] == -1)
+    if self.d_min is not None:
+      sel &= (1/self.reflections['rlp'].norms() > self.d_min)
+    xo, yo, zo = self.reflections['xyzobs.mm.value'].parts()
+    imageset_id = self.reflections['imageset_id']
+    for i_imageset, imageset in enumerate(self.imagesets):
+      scan = imageset.get_scan()
+      if scan is not None:
+        start, end = scan.get_oscillation_range()
+        if (end - start) > 360:
+          # only use reflections from the first 360 degrees of the scan
+          sel.set_selected(
+            (imageset_id == i_imageset) & (zo > ((start * math.pi/180) + 2 * math.pi)), False)
+    reflections = self.reflections.select(sel)
+
+    # index_reflections applies any hkl offset to the first candidate only
+    hkl_offset = self.hkl_offset
+    if len(candidate_orientation_matrices):
+      self.hkl_offset = None
+
+    def prepare_candidate(i_candidate):
+      cm = candidate_orientation_matrices[i_candidate]
       experiments = ExperimentList()
-      for i_imageset, imageset in enumerate(self.imagesets):
-        scan = imageset.get_scan()
-        if scan is not None:
-          start, end = scan.get_oscillation_range()
-          if (end - start) > 360:
-            # only use reflections from the first 360 degrees of the scan
-            sel.set_selected(
-              (imageset_id == i_imageset) & (zo > ((start * math.pi/180) + 2 * math.pi)), False)
+      for imageset in self.imagesets:
         experiments.append(Experiment(imageset=imageset,
                                       beam=imageset.get_beam(),
                                       detector=imageset.get_detector(),
                                       goniometer=imageset.get_goniometer(),
-                                      scan=scan,
+                                      scan=imageset.get_scan(),
                                       crystal=cm))
-      refl = self.reflections.select(sel)
+      refl = reflections.copy()
       self.index_reflections(experiments, refl)
+      if i_candidate == 0 and hkl_offset is not None and hkl_offset != (0,0,0):
+        refl['miller_index'] = apply_hkl_offset(
+          refl['miller_index'], hkl_offset)
       if refl.get_flags(refl.flags.indexed).count(True) == 0:
-        continue
+        return
 
       from rstbx.dps_core.cell_assessment import SmallUnitCellVolume
       threshold = self.params.basis_vector_combinations.sys_absent_threshold
@@ -1443,22 +1484,22 @@ def run_one_refinement(args):
         except SmallUnitCellVolume:
           logger.debug("correct_non_primitive_basis SmallUnitCellVolume error for unit cell %s:"
                        %experiments[0].crystal.get_unit_cell())
-          continue
+          return
         except RuntimeError as e:
           if 'Krivy-Gruber iteration limit exceeded' in str(e):
             logger.debug("correct_non_primitive_basis Krivy-Gruber iteration limit exceeded error for unit cell %s:"
                          %experiments[0].crystal.get_unit_cell())
-            continue
+            return
           raise
         if experiments[0].crystal.get_unit_cell().volume() < self.params.min_cell_volume:
-          continue
+          return
 
       if self.params.known_symmetry.space_group is not None:
         target_space_group = self.target_symmetry_primitive.space_group()
         new_crystal, cb_op_to_primitive = self.apply_symmetry(
           experiments[0].crystal, target_space_group)
         if new_crystal is None:
-          continue
+          return
         experiments[0].crystal.update(new_crystal)
         if not cb_op_to_primitive.is_identity_op():
           sel = refl['id'] > -1
@@ -1486,17 +1527,45 @@ def run_one_refinement(args):
             break
         if orientation_too_similar:
           logger.debug("skipping crystal: too similar to other crystals")
-          continue
+          return
 
-      args.append((params, refl, experiments))
+      return refl, experiments
 
-    from libtbx import easy_mp
-    results = easy_mp.parallel_map(
-      run_one_refinement,
-      args,
-      processes=self.params.nproc,
-      preserve_exception_message=True,
-    )
+    # Candidates that index too few reflections compared with a solution
+    # that has already been refined would be rejected whatever the outcome of
+    # their own refinement, so they are not refined. The largest number of
+    # reflections indexed by a solution so far is shared between the workers.
+    import multiprocessing
+    max_n_indexed = multiprocessing.Value('l', 0)
+
+    def evaluate_candidate(i_candidate):
+      prepared = prepare_candidate(i_candidate)
+      if prepared is None:
+        return
+      refl, experiments = prepared
+      n_indexed = (refl['id'] > -1).count(True)
+      if solutions.is_rejected(n_indexed, max_n_indexed.value):
+        logger.debug("skipping crystal: only %i reflections indexed"
+                     %n_indexed)
+        return
+      soln = run_one_refinement((params, refl, experiments))
+      if soln is not None:
+        with max_n_indexed.get_lock():
+          max_n_indexed.value = max(max_n_indexed.value, soln.n_indexed)
+      return soln
+
+    # The worker processes inherit the reflections and the candidate models
+    # when they are forked, so only the index of the candidate is sent with
+    # each task
+    candidates = range(len(candidate_orientation_matrices))
+    if self.params.nproc > 1 and len(candidates) > 1:
+      from libtbx import easy_mp
+      results = easy_mp.pool_map(
+        fixed_func=evaluate_candidate,
+        iterable=candidates,
+        processes=self.params.nproc)
+    else:
+      results = [evaluate_candidate(i) for i in candidates]
 
     for soln in results:
       if soln is None:
@@ -1785,6 +1854,11 @@ def filter_doubled_cell(solutions):
 
 # Tracker for solutions based on code in rstbx/dps_core/basis_choice.py
 class SolutionTrackerFilter(object):
+
+  # solutions that index fewer than this fraction of the reflections indexed
+  # by the best one are always rejected
+  min_n_indexed_fraction = 0.05
+
   def __init__(self, check_doubled_cell=True, likelihood_cutoff=0.8,
                volume_cutoff=1.25, n_indexed_cutoff=0.9):
     self.check_doubled_cell = check_doubled_cell
@@ -1801,6 +1875,12 @@ def append(self, item):
   def __len__(self):
     return len(self.filtered_solutions)
 
+  def is_rejected(self, n_indexed, max_n_indexed):
+    """Whether a solution indexing n_indexed reflections is rejected
+    regardless of its other properties, given another solution that indexes
+    max_n_indexed reflections"""
+    return n_indexed < self.min_n_indexed_fraction * max_n_indexed
+
   def filter_by_likelihood(self, solutions):
     best_likelihood = max(s.model_likelihood for s in solutions)
     offset = 0
@@ -1831,7 +1911,7 @@ def update_analysis(self):
     # pre-filter out solutions that only account for a very small
     # percentage of the indexed spots relative to the best one
     self.filtered_solutions = self.filter_by_n_indexed(
-      self.all_solutions, n_indexed_cutoff=0.05) # 5 percent
+      self.all_solutions, n_indexed_cutoff=self.min_n_indexed_fraction)
 
     if self.check_doubled_cell:
       self.filtered_solutions = filter_doubled_cell(self.filtered_solutions)
@@ -1882,6 +1962,11 @@ def append(self, item):
   def __len__(self):
     return len(self.all_solutions)
 
+  def is_rejected(self, n_indexed, max_n_indexed):
+    """The scores are relative to the other solutions, so any solution may
+    affect which is best and none can be rejected in advance"""
+    return False
+
   def score_by_volume(self, reverse=False):
     # smaller volume = better
     volumes = flex.double(
@@ -15,15 +15,145 @@
 import logging
 logger = logging.getLogger(__name__)
 
+import numpy
 from scitbx import matrix
 from scitbx.array_family import flex
 from dials.algorithms.indexing.indexer import \
      indexer_base, optimise_basis_vectors
-from dials.algorithms.indexing.indexer import \
-     is_approximate_integer_multiple
 from dxtbx.model.experiment_list import Experiment, ExperimentList
 
 
+def _as_vector_array(vectors):
+  if isinstance(vectors, flex.vec3_double):
+    return vectors.as_double().as_numpy_array().reshape(-1, 3)
+  return numpy.asarray(vectors, dtype=numpy.float64).reshape(-1, 3)
+
+
+class batched_functional(object):
+  '''
+  Evaluate the real space grid search functional, f(v) = sum(cos(2 pi S.v))
+  over the reciprocal lattice points S, for many search vectors v at once.
+
+  The search vectors are scored in blocks, each block as a single matrix
+  product with the reciprocal lattice points. numpy releases the GIL in the
+  product and the cosine, so blocks are shared out between nproc threads.
+
+  '''
+
+  def __init__(self, reciprocal_lattice_points, block_size=128, nproc=1):
+    self._two_pi_S = 2 * math.pi * _as_vector_array(reciprocal_lattice_points)
+    self._block_size = block_size
+    self._nproc = nproc
+
+  def _score_block(self, vectors):
+    two_pi_S_dot_v = numpy.dot(self._two_pi_S, vectors.T)
+    numpy.cos(two_pi_S_dot_v, out=two_pi_S_dot_v)
+    return two_pi_S_dot_v.sum(axis=0)
+
+  def __call__(self, vectors):
+    ''' Return a numpy array of the functional for each of the vectors. '''
+    vectors = _as_vector_array(vectors)
+    blocks = [vectors[i:i+self._block_size]
+              for i in range(0, len(vectors), self._block_size)]
+    if len(blocks) == 0:
+      return numpy.zeros(0)
+    if self._nproc > 1 and len(blocks) > 1:
+      from multiprocessing.pool import ThreadPool
+      pool = ThreadPool(min(self._nproc, len(blocks)))
+      try:
+        results = pool.map(self._score_block, blocks)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [self._score_block(block) for block in blocks]
+    return numpy.concatenate(results)
+
+
+def hemisphere_directions(grid):
+  ''' The unit vectors of a hemisphere grid with the given spacing (radians). '''
+  from rstbx.dps_core import SimpleSamplerTool
+  SST = SimpleSamplerTool(grid)
+  SST.construct_hemisphere_grid(SST.incr)
+  return numpy.array([direction.dvec for direction in SST.angles],
+                     dtype=numpy.float64).reshape(-1, 3)
+
+
+def search_vectors(directions, lengths):
+  '''
+  Every direction scaled by every length, ordered by direction then length.
+
+  '''
+  lengths = numpy.asarray(lengths, dtype=numpy.float64)
+  return (directions[:,numpy.newaxis,:] *
+          lengths[numpy.newaxis,:,numpy.newaxis]).reshape(-1, 3)
+
+
+def coarse_to_fine_directions(compute_functional, lengths, characteristic_grid,
+                              coarse_grid, n_coarse_directions):
+  '''
+  Search a coarse hemisphere grid and return only those directions of the
+  characteristic_grid hemisphere that lie within coarse_grid of one of the
+  n_coarse_directions best coarse directions. Since the functional is even
+  in v, directions are compared up to sign.
+
+  '''
+  coarse = hemisphere_directions(coarse_grid)
+  f = compute_functional(search_vectors(coarse, lengths))
+  f = f.reshape(len(coarse), len(lengths)).max(axis=1)
+  best = coarse[numpy.argsort(-f, kind='mergesort')[:n_coarse_directions]]
+  fine = hemisphere_directions(characteristic_grid)
+  cos_nearest = numpy.abs(numpy.dot(fine, best.T)).max(axis=1)
+  directions = fine[cos_nearest >= math.cos(coarse_grid)]
+  logger.info("Refining around %i of %i coarse directions: %i of %i directions"
+              %(len(best), len(coarse), len(directions), len(fine)))
+  return directions
+
+
+def approximate_integer_multiples(vectors_a, vectors_b,
+                                  relative_tolerance=0.2,
+                                  angular_tolerance=5.0):
+  '''
+  Pairwise equivalent of indexer.is_approximate_integer_multiple, returning
+  a len(vectors_a) x len(vectors_b) boolean array.
+
+  '''
+  length_a = numpy.sqrt((vectors_a * vectors_a).sum(axis=1))[:,numpy.newaxis]
+  length_b = numpy.sqrt((vectors_b * vectors_b).sum(axis=1))[numpy.newaxis,:]
+  cos_angle = numpy.dot(vectors_a, vectors_b.T) / (length_a * length_b)
+  n = numpy.maximum(length_a, length_b) / numpy.minimum(length_a, length_b)
+  return ((numpy.abs(cos_angle) > math.cos(math.radians(angular_tolerance))) &
+          (numpy.abs(numpy.round(n) - n) < relative_tolerance))
+
+
+def unique_vector_indices(vectors, max_vectors, chunk_size=1024):
+  '''
+  The indices of the first max_vectors of vectors that are not approximate
+  integer multiples of an earlier accepted vector.
+
+  Candidates are first screened a chunk at a time against all the vectors
+  accepted so far, leaving only the few survivors to be checked one by one.
+
+  '''
+  unique = []
+  start = 0
+  while len(unique) < max_vectors and start < len(vectors):
+    chunk = numpy.arange(start, min(start + chunk_size, len(vectors)))
+    start += chunk_size
+    if unique:
+      chunk = chunk[~approximate_integer_multiples(
+        vectors[chunk], vectors[unique]).any(axis=1)]
+    n_screened = len(unique)
+    for i in chunk:
+      if len(unique) == max_vectors:
+        break
+      if len(unique) > n_screened and approximate_integer_multiples(
+          vectors[i:i+1], vectors[unique[n_screened:]]).any():
+        continue
+      unique.append(i)
+  return unique
+
+
 class indexer_real_space_grid_search(indexer_base):
 
   def __init__(self, reflections, imagesets, params):
@@ -54,54 +184,38 @@ def real_space_grid_search(self):
 
     logger.info("Indexing from %i reflections" %len(reciprocal_lattice_points))
 
-    def compute_functional(vector):
-      two_pi_S_dot_v = 2 * math.pi * reciprocal_lattice_points.dot(vector)
-      return flex.sum(flex.cos(two_pi_S_dot_v))
+    grid_params = self.params.real_space_grid_search
+    compute_functional = batched_functional(
+      reciprocal_lattice_points,
+      block_size=grid_params.block_size,
+      nproc=self.params.nproc)
 
-    from rstbx.array_family import flex
-    from rstbx.dps_core import SimpleSamplerTool
     assert self.target_symmetry_primitive is not None
     assert self.target_symmetry_primitive.unit_cell() is not None
-    SST = SimpleSamplerTool(
-      self.params.real_space_grid_search.characteristic_grid)
-    SST.construct_hemisphere_grid(SST.incr)
     cell_dimensions = self.target_symmetry_primitive.unit_cell().parameters()[:3]
-    unique_cell_dimensions = set(cell_dimensions)
-    logger.info(
-      "Number of search vectors: %i" %(len(SST.angles) * len(unique_cell_dimensions)))
-    vectors = flex.vec3_double()
-    function_values = flex.double()
-    for i, direction in enumerate(SST.angles):
-      for l in unique_cell_dimensions:
-        v = matrix.col(direction.dvec) * l
-        f = compute_functional(v.elems)
-        vectors.append(v.elems)
-        function_values.append(f)
-
-    perm = flex.sort_permutation(function_values, reverse=True)
-    vectors = vectors.select(perm)
-    function_values = function_values.select(perm)
-
-    unique_vectors = []
-    i = 0
-    while len(unique_vectors) < 30:
-      v = matrix.col(vectors[i])
-      is_unique = True
-      if i > 0:
-        for v_u in unique_vectors:
-          if v.length() < v_u.length():
-            if is_approximate_integer_multiple(v, v_u):
-              is_unique = False
-              break
-          elif is_approximate_integer_multiple(v_u, v):
-            is_unique = False
-            break
-      if is_unique:
-        unique_vectors.append(v)
-      i += 1
-
-    for i in range(30):
-      v = matrix.col(vectors[i])
+    unique_cell_dimensions = sorted(set(cell_dimensions))
+
+    if (grid_params.coarse_grid is not None and
+        grid_params.coarse_grid > grid_params.characteristic_grid):
+      directions = coarse_to_fine_directions(
+        compute_functional, unique_cell_dimensions,
+        grid_params.characteristic_grid, grid_params.coarse_grid,
+        grid_params.n_coarse_directions)
+    else:
+      directions = hemisphere_directions(grid_params.characteristic_grid)
+    vectors = search_vectors(directions, unique_cell_dimensions)
+    logger.info("Number of search vectors: %i" %len(vectors))
+    function_values = compute_functional(vectors)
+
+    perm = numpy.argsort(-function_values, kind='mergesort')
+    vectors = vectors[perm]
+    function_values = function_values[perm]
+
+    unique_vectors = [matrix.col(vectors[i].tolist())
+                      for i in unique_vector_indices(vectors, 30)]
+
+    for i in range(min(30, len(vectors))):
+      v = matrix.col(vectors[i].tolist())
       logger.debug("%s %s %s" %(str(v.elems), str(v.length()), str(function_values[i])))
 
     basis_vectors = [v.elems for v in unique_vectors]
@@ -110,8 +224,8 @@ def compute_functional(vector):
     if self.params.optimise_initial_basis_vectors:
       optimised_basis_vectors = optimise_basis_vectors(
         reciprocal_lattice_points, basis_vectors)
-      optimised_function_values = flex.double([
-        compute_functional(v) for v in optimised_basis_vectors])
+      optimised_function_values = flex.double(
+        list(compute_functional(optimised_basis_vectors)))
 
       perm = flex.sort_permutation(optimised_function_values, reverse=True)
       optimised_basis_vectors = optimised_basis_vectors.select(perm)
@@ -121,11 +235,11 @@ def compute_functional(vector):
 
     logger.info("Number of unique vectors: %i" %len(unique_vectors))
 
-    for i in range(len(unique_vectors)):
-      logger.debug("%s %s %s" %(
-        str(compute_functional(unique_vectors[i].elems)),
-        str(unique_vectors[i].length()),
-        str(unique_vectors[i].elems)))
+    if unique_vectors:
+      unique_function_values = compute_functional(
+        [v.elems for v in unique_vectors])
+      for v, f in zip(unique_vectors, unique_function_values):
+        logger.debug("%s %s %s" %(str(f), str(v.length()), str(v.elems)))
 
     crystal_models = []
     self.candidate_basis_vectors = unique_vectors
@@ -0,0 +1,153 @@
+#
+# block_planner.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+
+def block_boundaries(frame_range, block_size):
+  '''
+  Compute the boundaries between the half blocks of a range of frames. Each
+  job covers two adjacent half blocks so that consecutive jobs overlap by half
+  a block. This gives the same jobs as JobList.add with a fixed block size.
+
+  :param frame_range: The range of frames
+  :param block_size: The block size in frames
+  :return: The list of boundaries, or None if each job is a single frame
+
+  '''
+  from math import ceil
+  frame0, frame1 = frame_range
+  nframes = frame1 - frame0
+  assert nframes > 0, "Invalid frame range"
+  block_size = min(block_size, nframes)
+  assert block_size > 0, "Invalid block size"
+  if block_size == 1:
+    return None
+  nblocks = int(ceil(2.0 * nframes / block_size))
+  half_block_size = int(ceil(nframes / nblocks))
+  boundaries = [frame0]
+  for i in range(nblocks):
+    frame = min(frame0 + (i + 1) * half_block_size, frame1)
+    boundaries.append(frame)
+    if frame == frame1:
+      break
+  return boundaries
+
+
+def jobs_from_boundaries(frame_range, boundaries):
+  '''
+  Get the frame ranges of the jobs from the half block boundaries.
+
+  :param frame_range: The range of frames
+  :param boundaries: The half block boundaries (or None for single frames)
+  :return: The list of job frame ranges
+
+  '''
+  if boundaries is None:
+    return [(f, f+1) for f in range(frame_range[0], frame_range[1])]
+  return [(boundaries[i], boundaries[i+2]) for i in range(len(boundaries)-2)]
+
+
+def split_jobs(boundaries, indices):
+  '''
+  Split jobs by splitting both of their half blocks in two. Half blocks which
+  are a single frame cannot be split.
+
+  :param boundaries: The half block boundaries
+  :param indices: The indices of the jobs to split
+  :return: The new boundaries
+
+  '''
+  halves = set()
+  for i in indices:
+    halves.update((i, i+1))
+  result = [boundaries[0]]
+  for i in range(len(boundaries)-1):
+    b0, b1 = boundaries[i], boundaries[i+1]
+    if i in halves and b1 - b0 > 1:
+      result.append(b0 + (b1 - b0) // 2)
+    result.append(b1)
+  return result
+
+
+class BlockPlanner(object):
+  '''
+  A class to plan the blocks of frames processed by each job so that the jobs
+  running at the same time fit in a memory budget.
+
+  The starting point is the usual set of overlapping blocks of a fixed size.
+  The memory for each job is predicted from the bounding boxes of the
+  reflections it will process, plus a fixed amount for image buffers. Jobs
+  predicted to need more than their share of the budget are split in two, as
+  often as needed and possible, rather than failing when the job is run. If
+  a job still does not fit, the number of processes is reduced so that each
+  job gets a larger share.
+
+  '''
+
+  def __init__(self, job_memory, budget, nproc=1):
+    '''
+    Initialise the planner
+
+    :param job_memory: A function taking a list of the jobs in each group and
+                       returning the predicted memory of each job in bytes
+    :param budget: The total memory budget in bytes
+    :param nproc: The number of jobs to run at the same time
+
+    '''
+    assert budget > 0, "Invalid memory budget"
+    assert nproc > 0, "Invalid number of processes"
+    self.job_memory = job_memory
+    self.budget = budget
+    self.nproc = nproc
+
+  def plan(self, groups):
+    '''
+    Plan the jobs
+
+    :param groups: A list of (frame range, block size) for each group
+    :return: The list of jobs in each group, the predicted memory of each job
+             in each group and the number of processes
+
+    '''
+    limit = self.budget / self.nproc
+    boundaries = [block_boundaries(r, b) for r, b in groups]
+    num_split = 0
+    while True:
+      jobs = [jobs_from_boundaries(r, b)
+              for (r, s), b in zip(groups, boundaries)]
+      memory = self.job_memory(jobs)
+      changed = False
+      for i, (b, m) in enumerate(zip(boundaries, memory)):
+        if b is None:
+          continue
+        over = [j for j in range(len(m)) if m[j] > limit]
+        if len(over) > 0:
+          new_boundaries = split_jobs(b, over)
+          if len(new_boundaries) > len(b):
+            boundaries[i] = new_boundaries
+            num_split += len(over)
+            changed = True
+      if not changed:
+        break
+    if num_split > 0:
+      logger.info(
+        ' Split %d jobs to fit in %g GB of memory per process\n' % (
+          num_split, limit / 1e9))
+
+    # If the jobs do not fit even when split, reduce the number of processes
+    max_memory = max(max(m) for m in memory)
+    nproc = self.nproc
+    if max_memory > limit:
+      nproc = max(1, min(self.nproc, int(self.budget // max_memory)))
+      logger.info(
+        ' Reduced the number of processes from %d to %d to fit in memory\n' % (
+          self.nproc, nproc))
+    return jobs, memory, nproc
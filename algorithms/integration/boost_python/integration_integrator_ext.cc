@@ -252,10 +252,17 @@ namespace dials { namespace algorithms { namespace boost_python {
       .def("nframes", &JobList::Job::nframes)
       ;
 
+    void (JobList::*job_list_add_with_block_size)(
+        tiny<int,2>, tiny<int,2>, int) = &JobList::add;
+    void (JobList::*job_list_add_with_jobs)(
+        tiny<int,2>, tiny<int,2>,
+        const af::const_ref< tiny<int,2> >&) = &JobList::add;
+
     class_<JobList>("JobList")
       .def(init< tiny<int,2>,
                  const af::const_ref< tiny<int,2> >& >())
-      .def("add", &JobList::add)
+      .def("add", job_list_add_with_block_size)
+      .def("add", job_list_add_with_jobs)
       .def("__len__", &JobList::size)
       .def("__getitem__", &JobList::operator[],
           return_internal_reference<>())
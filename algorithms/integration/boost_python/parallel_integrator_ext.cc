@@ -354,7 +354,9 @@ namespace dials { namespace algorithms { namespace boost_python {
           std::size_t,
           std::size_t,
           bool,
-          bool>((
+          bool,
+          std::size_t,
+          std::size_t>((
               arg("reflections"),
               arg("imageset"),
               arg("compute_mask"),
@@ -364,9 +366,17 @@ namespace dials { namespace algorithms { namespace boost_python {
               arg("nthreads") = 1,
               arg("buffer_size") = 0,
               arg("use_dynamic_mask") = true,
-              arg("debug") = false)))
+              arg("debug") = false,
+              arg("nreaders") = 0,
+              arg("prefetch_depth") = 4)))
       .def("reflections",
           &ParallelIntegrator::reflections)
+      .def("read_time",
+          &ParallelIntegrator::read_time)
+      .def("wait_time",
+          &ParallelIntegrator::wait_time)
+      .def("total_time",
+          &ParallelIntegrator::total_time)
       .def("compute_required_memory",
           &ParallelIntegrator::compute_required_memory, (
             arg("imageset")))
@@ -389,7 +399,9 @@ namespace dials { namespace algorithms { namespace boost_python {
           std::size_t,
           std::size_t,
           bool,
-          bool>((
+          bool,
+          std::size_t,
+          std::size_t>((
               arg("reflections"),
               arg("imageset"),
               arg("compute_mask"),
@@ -399,9 +411,17 @@ namespace dials { namespace algorithms { namespace boost_python {
               arg("nthreads") = 1,
               arg("buffer_size") = 0,
               arg("use_dynamic_mask") = true,
-              arg("debug") = false)))
+              arg("debug") = false,
+              arg("nreaders") = 0,
+              arg("prefetch_depth") = 4)))
       .def("reflections",
           &ParallelReferenceProfiler::reflections)
+      .def("read_time",
+          &ParallelReferenceProfiler::read_time)
+      .def("wait_time",
+          &ParallelReferenceProfiler::wait_time)
+      .def("total_time",
+          &ParallelReferenceProfiler::total_time)
       .def("compute_required_memory",
           &ParallelReferenceProfiler::compute_required_memory, (
             arg("imageset")))
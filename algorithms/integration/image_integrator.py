@@ -88,9 +88,11 @@ def process(self):
     '''
     from time import time
     from dials.util.mp import multi_node_parallel_map
+    from dials.util import trace
     import platform
     start_time = time()
-    self.manager.initialize()
+    with trace.span('initialize', 'integration'):
+      self.manager.initialize()
     mp_method = self.manager.params.integration.mp.method
     mp_nproc = min(len(self.manager), self.manager.params.integration.mp.nproc)
     if mp_nproc > 1 and platform.system() == "Windows": # platform.system() forks which is bad for MPI, so don't use it unless nproc > 1
@@ -108,17 +110,20 @@ def process(self):
       def process_output(result):
         for message in result[1]:
           logger.log(message.levelno, message.msg)
+        trace.extend(result[2])
         self.manager.accumulate(result[0])
         result[0].reflections = None
         result[0].data = None
+      trace_state = trace.state()
       def execute_task(task):
         from dials.util import log
         import logging
         log.config_simple_cached()
-        result = task()
+        with trace.child_process(trace_state) as traced:
+          result = task()
         handlers = logging.getLogger('dials').handlers
         assert len(handlers) == 1, "Invalid number of logging handlers"
-        return result, handlers[0].messages()
+        return result, handlers[0].messages(), traced.events
       multi_node_parallel_map(
         func                       = execute_task,
         iterable                   = list(self.manager.tasks()),
@@ -131,7 +136,8 @@ def execute_task(task):
     else:
       for task in self.manager.tasks():
         self.manager.accumulate(task())
-    self.manager.finalize()
+    with trace.span('finalize', 'integration'):
+      self.manager.finalize()
     end_time = time()
     self.manager.time.user_time = end_time - start_time
     result = self.manager.result()
@@ -221,6 +227,7 @@ def __call__(self):
     from dials.model.data import MultiPanelImageVolume
     from dials.model.data import ImageVolume
     from dials.algorithms.integration.processor import job
+    from dials.util import trace
     from time import time
 
     # Set the job index
@@ -299,6 +306,13 @@ def __call__(self):
     result.process_time = process_time
     result.total_time = time() - start_time
     result.data = data
+    trace.complete(
+      'process_job', 'integration', start_time, start_time + result.total_time,
+      job=self.index,
+      image_range=(frame0, frame1),
+      reflections=len(self.reflections),
+      read_time=read_time,
+      process_time=process_time)
     return result
 
 
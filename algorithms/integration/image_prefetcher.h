@@ -0,0 +1,303 @@
+/*
+ * image_prefetcher.h
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+
+#ifndef DIALS_ALGORITHMS_INTEGRATION_IMAGE_PREFETCHER_H
+#define DIALS_ALGORITHMS_INTEGRATION_IMAGE_PREFETCHER_H
+
+#include <boost/python.hpp>
+#include <boost/shared_ptr.hpp>
+#include <boost/thread.hpp>
+#include <boost/date_time/posix_time/posix_time.hpp>
+#include <map>
+#include <string>
+#include <dxtbx/imageset.h>
+#include <dials/error.h>
+
+namespace dials { namespace algorithms {
+
+  using dxtbx::ImageSweep;
+  using dxtbx::format::Image;
+
+  /**
+   * @returns The wall clock time in seconds
+   */
+  inline
+  double wall_time() {
+    using namespace boost::posix_time;
+    static const ptime epoch(boost::gregorian::date(1970, 1, 1));
+    return (microsec_clock::universal_time() - epoch).total_microseconds() * 1e-6;
+  }
+
+  /**
+   * Acquire the python GIL for the lifetime of the object. This can be used
+   * from threads which may or may not already hold the GIL.
+   */
+  class ScopedGILAcquire {
+  public:
+
+    ScopedGILAcquire()
+      : state_(PyGILState_Ensure()) {}
+
+    ~ScopedGILAcquire() {
+      PyGILState_Release(state_);
+    }
+
+  private:
+
+    PyGILState_STATE state_;
+  };
+
+  /**
+   * Release the python GIL for the lifetime of the object. This must only be
+   * used from a thread holding the GIL.
+   */
+  class ScopedGILRelease {
+  public:
+
+    /**
+     * @param enable Only release the GIL if true
+     */
+    ScopedGILRelease(bool enable)
+      : state_(enable ? PyEval_SaveThread() : NULL) {}
+
+    ~ScopedGILRelease() {
+      if (state_ != NULL) {
+        PyEval_RestoreThread(state_);
+      }
+    }
+
+  private:
+
+    PyThreadState *state_;
+  };
+
+  /**
+   * A class to read images ahead of processing. A number of reader threads
+   * read and decode the images into a bounded queue from which the images are
+   * taken in order. If the number of reader threads is zero, the images are
+   * read when they are requested.
+   *
+   * The image reading may call into python so the reader threads acquire the
+   * GIL while reading. The thread using the prefetcher must therefore release
+   * the GIL while waiting for images (see ScopedGILRelease).
+   */
+  class ImagePrefetcher {
+  public:
+
+    /**
+     * A decoded image and mask
+     */
+    struct Frame {
+      Image<double> data;
+      boost::shared_ptr< Image<bool> > mask;
+      bool rejected;
+
+      Frame(const Image<double> &data_,
+            boost::shared_ptr< Image<bool> > mask_,
+            bool rejected_)
+        : data(data_),
+          mask(mask_),
+          rejected(rejected_) {}
+    };
+
+    typedef boost::shared_ptr<Frame> frame_pointer;
+
+    /**
+     * Start the reader threads
+     * @param imageset The imageset to read
+     * @param nreaders The number of reader threads
+     * @param depth The maximum number of images to read ahead
+     * @param use_dynamic_mask Read the dynamic mask
+     */
+    ImagePrefetcher(
+          ImageSweep &imageset,
+          std::size_t nreaders,
+          std::size_t depth,
+          bool use_dynamic_mask)
+      : imageset_(imageset),
+        nreaders_(nreaders),
+        depth_(std::max(depth, (std::size_t)1)),
+        use_dynamic_mask_(use_dynamic_mask),
+        size_(imageset.size()),
+        next_read_(0),
+        next_(0),
+        read_time_(0.0),
+        wait_time_(0.0),
+        stop_(false) {
+      for (std::size_t i = 0; i < nreaders_; ++i) {
+        threads_.create_thread(
+            boost::bind(&ImagePrefetcher::read_loop, this));
+      }
+    }
+
+    /**
+     * Stop and join the reader threads
+     */
+    ~ImagePrefetcher() {
+      {
+        boost::lock_guard<boost::mutex> guard(mutex_);
+        stop_ = true;
+      }
+      space_.notify_all();
+      threads_.join_all();
+    }
+
+    /**
+     * Get the next image, waiting until it has been read.
+     * @returns The frame
+     */
+    frame_pointer next() {
+      DIALS_ASSERT(next_ < size_);
+      std::size_t index = next_;
+      if (nreaders_ == 0) {
+        double start_time = wall_time();
+        frame_pointer frame = read(index);
+        double time_taken = wall_time() - start_time;
+        read_time_ += time_taken;
+        wait_time_ += time_taken;
+        next_++;
+        return frame;
+      }
+      double start_time = wall_time();
+      boost::unique_lock<boost::mutex> lock(mutex_);
+      std::map<std::size_t, frame_pointer>::iterator it;
+      std::map<std::size_t, std::string>::iterator err;
+      for (;;) {
+        err = errors_.find(index);
+        if (err != errors_.end()) {
+          throw DIALS_ERROR(err->second);
+        }
+        it = frames_.find(index);
+        if (it != frames_.end()) {
+          break;
+        }
+        ready_.wait(lock);
+      }
+      frame_pointer frame = it->second;
+      frames_.erase(it);
+      next_++;
+      wait_time_ += wall_time() - start_time;
+      lock.unlock();
+      space_.notify_all();
+      return frame;
+    }
+
+    /**
+     * @returns The number of reader threads
+     */
+    std::size_t nreaders() const {
+      return nreaders_;
+    }
+
+    /**
+     * @returns The total time spent reading images (summed over readers)
+     */
+    double read_time() const {
+      boost::lock_guard<boost::mutex> guard(mutex_);
+      return read_time_;
+    }
+
+    /**
+     * @returns The time spent waiting for images to be read
+     */
+    double wait_time() const {
+      return wait_time_;
+    }
+
+  protected:
+
+    /**
+     * Read a single image
+     * @param index The image index
+     * @returns The frame
+     */
+    frame_pointer read(std::size_t index) {
+      ScopedGILAcquire gil;
+      try {
+        bool rejected = imageset_.is_marked_for_rejection(index);
+        boost::shared_ptr< Image<bool> > mask;
+        if (!rejected && use_dynamic_mask_) {
+          mask = boost::shared_ptr< Image<bool> >(
+              new Image<bool>(imageset_.get_dynamic_mask(index)));
+        }
+        return frame_pointer(new Frame(
+              imageset_.get_corrected_data(index),
+              mask,
+              rejected));
+      } catch (boost::python::error_already_set) {
+        PyErr_Print();
+        throw DIALS_ERROR("Error reading image");
+      }
+    }
+
+    /**
+     * The function run by each reader thread
+     */
+    void read_loop() {
+      for (;;) {
+
+        // Get the next image to read, waiting if the queue is full
+        std::size_t index = 0;
+        {
+          boost::unique_lock<boost::mutex> lock(mutex_);
+          while (!stop_ && next_read_ < size_ && next_read_ >= next_ + depth_) {
+            space_.wait(lock);
+          }
+          if (stop_ || next_read_ >= size_) {
+            return;
+          }
+          index = next_read_++;
+        }
+
+        // Read the image
+        double start_time = wall_time();
+        frame_pointer frame;
+        std::string error;
+        try {
+          frame = read(index);
+        } catch (const std::exception &e) {
+          error = e.what();
+        }
+        double time_taken = wall_time() - start_time;
+
+        // Add the image to the queue
+        {
+          boost::lock_guard<boost::mutex> guard(mutex_);
+          read_time_ += time_taken;
+          if (frame) {
+            frames_[index] = frame;
+          } else {
+            errors_[index] = error;
+          }
+        }
+        ready_.notify_all();
+      }
+    }
+
+    ImageSweep &imageset_;
+    std::size_t nreaders_;
+    std::size_t depth_;
+    bool use_dynamic_mask_;
+    std::size_t size_;
+    std::size_t next_read_;
+    std::size_t next_;
+    double read_time_;
+    double wait_time_;
+    bool stop_;
+    std::map<std::size_t, frame_pointer> frames_;
+    std::map<std::size_t, std::string> errors_;
+    mutable boost::mutex mutex_;
+    boost::condition_variable ready_;
+    boost::condition_variable space_;
+    boost::thread_group threads_;
+  };
+
+}}
+
+#endif // DIALS_ALGORITHMS_INTEGRATION_IMAGE_PREFETCHER_H
@@ -76,6 +76,41 @@ def generate_phil_scope():
         .type = bool
         .help = "Use dynamic mask if available"
 
+      single_pass
+        .expert_level = 1
+      {
+
+        enable = False
+          .type = bool
+          .help = "Read each image only once. The processed reference and"
+                  "integration shoeboxes are kept in a bounded store and the"
+                  "profile modelling, validation and fitting are done from the"
+                  "store after all the images have been read. The results are"
+                  "the same as those of the separate passes, except with"
+                  "block.size=auto and more than one processor: the separate"
+                  "modelling pass then computes its block size from the"
+                  "reference reflections alone, whereas here the blocks of"
+                  "the integration pass are used, so the profile models and"
+                  "the fitted intensities may differ slightly."
+
+        max_memory_usage = 0.25
+          .type = float(value_min=0.0, value_max=1.0)
+          .help = "The maximum percentage of total physical memory to use for"
+                  "keeping processed shoeboxes in memory. The shoeboxes of all"
+                  "the jobs are kept until they are used, so each job gets a"
+                  "share of this memory in proportion to the size of its"
+                  "shoeboxes. Any more shoeboxes are spilled to disk."
+
+        directory = None
+          .type = path
+          .help = "The directory in which to spill shoeboxes. It is read by"
+                  "the main process, so with a cluster mp.method it must be"
+                  "shared with the cluster nodes. By default the system"
+                  "temporary directory is used for local processing and the"
+                  "working directory otherwise."
+
+      }
+
       debug {
 
         reference {
@@ -192,6 +227,16 @@ def generate_phil_scope():
         nproc = 1
           .type = int(value_min=1)
           .help = "The number of processes to use per cluster job"
+
+        prefetch = 0
+          .type = int(value_min=0)
+          .help = "The number of threads reading images ahead of processing."
+                  "If 0, each image is read when it is needed."
+
+        prefetch_depth = 4
+          .type = int(value_min=1)
+          .help = "The maximum number of decoded images to read ahead of"
+                  "processing."
       }
 
       summation {
@@ -317,6 +362,16 @@ def __init__(self):
       self.fitting = True
       self.validation = Parameters.Profile.Validation()
 
+  class SinglePass(object):
+    '''
+    Single pass parameters
+
+    '''
+    def __init__(self):
+      self.enable = False
+      self.max_memory_usage = 0.25
+      self.directory = None
+
   def __init__(self):
     '''
     Initialize
@@ -327,6 +382,7 @@ def __init__(self):
     self.integration = processor.Parameters()
     self.filter = Parameters.Filter()
     self.profile = Parameters.Profile()
+    self.single_pass = Parameters.SinglePass()
     self.debug_reference_filename = "reference_profiles.pickle"
     self.debug_reference_output = False
 
@@ -347,6 +403,8 @@ def from_phil(params):
     mp.method = params.mp.method
     mp.nproc = params.mp.nproc
     mp.njobs = params.mp.njobs
+    mp.prefetch = params.mp.prefetch
+    mp.prefetch_depth = params.mp.prefetch_depth
 
     # Set the lookup parameters
     lookup = processor.Lookup()
@@ -397,6 +455,11 @@ def from_phil(params):
     result.profile.validation.min_partition_size = \
       params.profile.validation.min_partition_size
 
+    # Set the single pass parameters
+    result.single_pass.enable = params.single_pass.enable
+    result.single_pass.max_memory_usage = params.single_pass.max_memory_usage
+    result.single_pass.directory = params.single_pass.directory
+
     # Return the result
     return result
 
@@ -947,6 +1010,147 @@ def __getinitargs__(self):
     return (self.experiments, self.profile_fitter)
 
 
+class SinglePassExecutor(Executor):
+  '''
+  The class to process the data when each image is read only once.
+
+  The shoeboxes are processed as in the ProfileModellerExecutor and then kept
+  in a bounded ShoeboxStore. Profile modelling, validation and fitting are then
+  done from the store once all the images have been read. Each reflection is
+  labelled with its job and row so that the results can be put back into the
+  integrated reflection table. The stores of all the jobs are held until they
+  are replayed, so each job keeps the same fraction of its shoeboxes in memory.
+
+  '''
+
+  def __init__(self, experiments, memory_fraction=None, directory=None):
+    '''
+    Initialize the executor
+
+    :param experiments: The experiment list
+    :param memory_fraction: The fraction of the shoebox memory of each job to
+                            keep in memory (None for no limit)
+    :param directory: The directory for spilled shoeboxes
+
+    '''
+    self.experiments = experiments
+    self.memory_fraction = memory_fraction
+    self.directory = directory
+    self.store = None
+    super(SinglePassExecutor, self).__init__()
+
+  def initialize(self, frame0, frame1, reflections):
+    '''
+    Initialize the processing for the job
+
+    :param frame0: The first frame to process
+    :param frame1: The last frame to process
+    :param reflections: The reflections to process
+
+    '''
+    from dials.array_family import flex
+    from dials.algorithms.integration.shoebox_store import ShoeboxStore
+    from dials.algorithms.integration.shoebox_store import shoebox_memory
+
+    # Get some info
+    EPS = 1e-7
+    full_value = (0.997300203937 - EPS)
+    fully_recorded = reflections['partiality'] > full_value
+    npart = fully_recorded.count(False)
+    nfull = fully_recorded.count(True)
+    nice = reflections.get_flags(reflections.flags.in_powder_ring).count(True)
+    nint = reflections.get_flags(reflections.flags.dont_integrate).count(False)
+    nref = reflections.get_flags(reflections.flags.reference_spot).count(True)
+    ntot = len(reflections)
+
+    # Write some output
+    logger.info(" Beginning single pass job %d" % job.index)
+    logger.info("")
+    logger.info(" Frames: %d -> %d" % (frame0, frame1))
+    logger.info("")
+    logger.info(" Number of reflections")
+    logger.info("  Partial:     %d" % npart)
+    logger.info("  Full:        %d" % nfull)
+    logger.info("  In ice ring: %d" % nice)
+    logger.info("  Reference:   %d" % nref)
+    logger.info("  Integrate:   %d" % nint)
+    logger.info("  Total:       %d" % ntot)
+    logger.info("")
+
+    # Print a histogram of reflections on frames
+    if frame1 - frame0 > 1:
+      logger.info(' The following histogram shows the number of reflections predicted')
+      logger.info(' to have all or part of their intensity on each frame.')
+      logger.info('')
+      logger.info(frame_hist(reflections['bbox'], prefix=' ', symbol='*'))
+      logger.info('')
+
+    # Label the reflections so the results can be put back later
+    reflections['single_pass.job'] = flex.size_t(len(reflections), job.index)
+    reflections['single_pass.row'] = flex.size_t_range(len(reflections))
+
+    # Create the store for the processed shoeboxes
+    max_memory = None
+    if self.memory_fraction is not None:
+      max_memory = int(self.memory_fraction * shoebox_memory(reflections))
+    self.store = ShoeboxStore(
+      max_memory=max_memory,
+      directory=self.directory,
+      prefix='single_pass_%d_' % job.index)
+
+  def process(self, frame, reflections):
+    '''
+    Process the reflections on a frame
+
+    :param frame: The frame to process
+    :param reflections: The reflections to process
+
+    '''
+
+    # Check if pixels are overloaded
+    reflections.is_overloaded(self.experiments)
+
+    # Compute the shoebox mask
+    reflections.compute_mask(self.experiments)
+
+    # Process the data
+    reflections.compute_background(self.experiments)
+    reflections.compute_centroid(self.experiments)
+    reflections.compute_summed_intensity()
+
+    # Keep the shoeboxes for modelling and fitting
+    self.store.append(reflections)
+
+    # Print some info
+    fmt = ' Processed % 5d reflections on image %d'
+    logger.info(fmt % (len(reflections), frame))
+
+  def finalize(self):
+    '''
+    Finalize the processing
+
+    '''
+    if self.store.num_spilled > 0:
+      logger.info(' Spilled %d / %d shoebox tables to %s' % (
+        self.store.num_spilled,
+        len(self.store),
+        self.store.tempdir))
+
+  def data(self):
+    '''
+    :return: The shoebox store
+
+    '''
+    return self.store
+
+  def __getinitargs__(self):
+    '''
+    Support for pickling
+
+    '''
+    return (self.experiments, self.memory_fraction, self.directory)
+
+
 class Integrator(object):
   '''
   The integrator class
@@ -979,15 +1183,8 @@ def integrate(self):
 
     '''
     from dials.algorithms.integration.report import IntegrationReport
-    from dials.algorithms.integration.report import ProfileModelReport
-    from dials.algorithms.integration.report import ProfileValidationReport
     from dials.util.command_line import heading
-    from dials.util import pprint
-    from random import shuffle, seed
-    from math import floor, ceil
-    from dials.array_family import flex
-    from dials.algorithms.profile_model.modeller import MultiExpProfileModeller
-    from dials.algorithms.integration.validation import ValidatedMultiExpProfileModeller
+    from random import seed
 
     # Ensure we get the same random sample each time
     seed(0)
@@ -1034,12 +1231,51 @@ def integrate(self):
     # Check if we want to do some profile fitting
     fitting_class = [e.profile.fitting_class() for e in self.experiments]
     fitting_avail = all(c is not None for c in fitting_class)
-    if self.params.profile.fitting and fitting_avail:
-      profile_fitting = True
-      profile_fitter = None
+    profile_fitting = self.params.profile.fitting and fitting_avail
+
+    # Process the reflections
+    if self.params.single_pass.enable:
+      time_info = self._process_single_pass(profile_fitting)
     else:
-      profile_fitting = False
-      profile_fitter = None
+      time_info = self._process(profile_fitting)
+
+    # Finalize the reflections
+    finalize = self.FinalizerClass(
+      self.reflections,
+      self.experiments,
+      self.params)
+    finalize()
+    self.reflections = finalize.reflections
+    self.experiments = finalize.experiments
+
+    # Create the integration report
+    self.integration_report = IntegrationReport(
+      self.experiments,
+      self.reflections)
+    logger.info("")
+    logger.info(self.integration_report.as_str(prefix=' '))
+
+    # Print the time info
+    logger.info("Timing information for integration")
+    logger.info(str(time_info))
+    logger.info("")
+
+    # Return the reflections
+    return self.reflections
+
+  def _process(self, profile_fitting):
+    '''
+    Model the profiles, validate them and integrate the reflections, reading
+    the images once for each step.
+
+    :param profile_fitting: Do profile fitting
+    :return: The integration timing info
+
+    '''
+    from dials.util.command_line import heading
+
+    # No profile fitter by default
+    profile_fitter = None
 
     # Do profile modelling
     if profile_fitting:
@@ -1061,30 +1297,8 @@ def integrate(self):
         logger.info("** Skipping profile modelling - no reference profiles given **")
       else:
 
-        # Try to set up the validation
-        if self.params.profile.validation.number_of_partitions > 1:
-          n = len(reference)
-          k_max = int(floor(n / self.params.profile.validation.min_partition_size))
-          if k_max < self.params.profile.validation.number_of_partitions:
-            num_folds = k_max
-          else:
-            num_folds = self.params.profile.validation.number_of_partitions
-          if num_folds > 1:
-            indices = (list(range(num_folds)) * int(ceil(n/num_folds)))[0:n]
-            shuffle(indices)
-            reference['profile.index'] = flex.size_t(indices)
-          if num_folds < 1:
-            num_folds = 1
-        else:
-          num_folds = 1
-
         # Create the profile fitter
-        profile_fitter = ValidatedMultiExpProfileModeller()
-        for i in range(num_folds):
-          profile_fitter_single = MultiExpProfileModeller()#(num_folds)
-          for expr in self.experiments:
-            profile_fitter_single.add(expr.profile.fitting_class()(expr))
-          profile_fitter.add(profile_fitter_single)
+        profile_fitter, num_folds = self._create_profile_fitter(reference)
 
         # Create the data processor
         executor = ProfileModellerExecutor(
@@ -1104,60 +1318,13 @@ def integrate(self):
         #self.reflections.set_selected(selection, reference)
 
         # Finalize the profile models for validation
-        assert len(profile_fitter_list) > 0, "No profile fitters"
-        profile_fitter = None
-        for index, pf in profile_fitter_list.iteritems():
-          if pf is None:
-            continue
-          if profile_fitter is None:
-            profile_fitter = pf
-          else:
-            profile_fitter.accumulate(pf)
-        profile_fitter.finalize()
+        profile_fitter = self._finalize_profile_fitter(profile_fitter_list)
 
         # Get the finalized modeller
         finalized_profile_fitter = profile_fitter.finalized_model()
 
-        # Print profiles
-        if self.params.debug_reference_output:
-          reference_debug = []
-          for i in range(len(finalized_profile_fitter)):
-            m = finalized_profile_fitter[i]
-            p = []
-            for j in range(len(m)):
-              try:
-                p.append((m.data(j), m.mask(j)))
-              except Exception:
-                p.append(None)
-          reference_debug.append(p)
-          with open(self.params.debug_reference_filename, "wb") as outfile:
-            import cPickle as pickle
-            pickle.dump(reference_debug, outfile)
-
-        for i in range(len(finalized_profile_fitter)):
-          m = finalized_profile_fitter[i]
-          logger.debug("")
-          logger.debug("Profiles for experiment %d" % i)
-          for j in range(len(m)):
-            logger.debug("Profile %d" % j)
-            try:
-              logger.debug(pprint.profile3d(m.data(j)))
-            except Exception:
-              logger.debug("** NO PROFILE **")
-
-        # Print the modeller report
-        self.profile_model_report = ProfileModelReport(
-          self.experiments,
-          finalized_profile_fitter,
-          reference)
-        logger.info("")
-        logger.info(self.profile_model_report.as_str(prefix=' '))
-
-        # Print the time info
-        logger.info("")
-        logger.info("Timing information for reference profile formation")
-        logger.info(str(time_info))
-        logger.info("")
+        # Print the profiles and the modeller report
+        self._report_profile_model(finalized_profile_fitter, reference, time_info)
 
         # If we have more than 1 fold then do the validation
         if num_folds > 1:
@@ -1176,20 +1343,9 @@ def integrate(self):
           # Process the reference profiles
           reference, validation, time_info = processor.process()
 
-          # Print the modeller report
-          self.profile_validation_report = ProfileValidationReport(
-            self.experiments,
-            profile_fitter,
-            reference,
-            num_folds)
-          logger.info("")
-          logger.info(self.profile_validation_report.as_str(prefix=' '))
-
-          # Print the time info
-          logger.info("")
-          logger.info("Timing information for reference profile validation")
-          logger.info(str(time_info))
-          logger.info("")
+          # Print the validation report
+          self._report_profile_validation(
+            profile_fitter, reference, num_folds, time_info)
 
         # Set to the finalized fitter
         profile_fitter = finalized_profile_fitter
@@ -1212,30 +1368,362 @@ def integrate(self):
 
     # Process the reflections
     self.reflections, _, time_info = processor.process()
+    return time_info
 
-    # Finalize the reflections
-    finalize = self.FinalizerClass(
-      self.reflections,
+  def _process_single_pass(self, profile_fitting):
+    '''
+    Model the profiles, validate them and integrate the reflections, reading
+    each image only once.
+
+    The shoeboxes are processed while the images are read and kept in a
+    ShoeboxStore for each job. The profile modelling, validation and fitting
+    are then replayed from the stores in the same order as the separate passes
+    so that the results are the same, unless the separate modelling pass would
+    use a different block size (block.size=auto with more than one processor).
+    The stores of all the jobs are held until they are replayed, so they share
+    one memory budget in proportion to the size of their shoeboxes.
+
+    :param profile_fitting: Do profile fitting
+    :return: The integration timing info
+
+    '''
+    from dials.util.command_line import heading
+    from dials.array_family import flex
+    from dials.algorithms.integration.shoebox_store import shoebox_memory
+    from libtbx.introspection import machine_memory_info
+    from time import time
+    from os.path import abspath
+    import cPickle as pickle
+
+    # Get the reference spots
+    profile_fitter = None
+    num_folds = 0
+    if profile_fitting:
+      selection = self.reflections.get_flags(
+        self.reflections.flags.reference_spot)
+      reference = self.reflections.select(selection)
+      if len(reference) == 0:
+        logger.info("** Skipping profile modelling - no reference profiles given **")
+      else:
+        profile_fitter, num_folds = self._create_profile_fitter(reference)
+        if num_folds > 1:
+          index = flex.size_t(len(self.reflections), 0)
+          index.set_selected(selection, reference['profile.index'])
+          self.reflections['profile.index'] = index
+
+    # Compute the fraction of the shoeboxes that can be kept in memory. The
+    # reflections split over job boundaries keep the same number of pixels,
+    # so the stores of all the jobs together stay within the budget.
+    memory_fraction = None
+    total_memory = machine_memory_info().memory_total()
+    required_memory = shoebox_memory(self.reflections)
+    if total_memory is not None and required_memory > 0:
+      memory_fraction = min(1.0,
+        total_memory *
+        self.params.single_pass.max_memory_usage /
+        required_memory)
+
+    # Spill to a directory this process can read. The temporary directory of
+    # a job run on another machine is not visible here.
+    directory = self.params.single_pass.directory
+    mp = self.params.integration.mp
+    local = mp.method in ('none', 'multiprocessing') and mp.njobs == 1
+    if directory is None and not local:
+      directory = '.'
+    if directory is not None:
+      directory = abspath(directory)
+
+    logger.info("=" * 80)
+    logger.info("")
+    logger.info(heading("Processing reflections in a single pass"))
+    logger.info("")
+
+    # Create the data processor
+    executor = SinglePassExecutor(
       self.experiments,
-      self.params)
-    finalize()
-    self.reflections = finalize.reflections
-    self.experiments = finalize.experiments
+      memory_fraction=memory_fraction,
+      directory=directory)
+    processor = ProcessorBuilder(
+      self.ProcessorClass,
+      self.experiments,
+      self.reflections,
+      self.params.integration).build()
+    processor.executor = executor
 
-    # Create the integration report
-    self.integration_report = IntegrationReport(
+    # Process the reflections
+    self.reflections, stores, time_info = processor.process()
+    start_time = time()
+    stores = dict((k, v) for k, v in stores.iteritems() if v is not None)
+
+    # Get the indices of the rows of each job in the integrated reflections
+    rows = self._single_pass_rows(self.reflections, stores.keys())
+
+    # Do the profile modelling and validation from the stored shoeboxes
+    if profile_fitter is not None:
+
+      logger.info("=" * 80)
+      logger.info("")
+      logger.info(heading("Modelling reflection profiles"))
+      logger.info("")
+
+      # The processed reference reflections and their position in the table
+      selection = self.reflections.get_flags(
+        self.reflections.flags.reference_spot)
+      reference_rows = flex.size_t_range(len(self.reflections)).select(selection)
+      reference = self.reflections.select(reference_rows)
+      position = flex.size_t(len(self.reflections), 0)
+      position.set_selected(reference_rows, flex.size_t_range(len(reference)))
+
+      # Model the profiles, each job with its own modeller as when each job
+      # is sent to a different process
+      profile_fitter_list = {}
+      for index in sorted(stores.keys()):
+        if processor.parallel:
+          job_fitter = pickle.loads(pickle.dumps(profile_fitter))
+        else:
+          job_fitter = profile_fitter
+        num_reference = 0
+        for reflections in stores[index]:
+          subset = reflections.select(reflections.get_flags(
+            reflections.flags.reference_spot))
+          if len(subset) == 0:
+            continue
+          job_fitter.model(subset)
+          del subset['shoebox']
+          reference.set_selected(position.select(
+            rows[index].select(subset['single_pass.row'])), subset)
+          num_reference += len(subset)
+        if num_reference > 0:
+          profile_fitter_list[index] = job_fitter
+      profile_fitter = self._finalize_profile_fitter(profile_fitter_list)
+      finalized_profile_fitter = profile_fitter.finalized_model()
+      self._report_profile_model(finalized_profile_fitter, reference, time_info)
+
+      # If we have more than 1 fold then do the validation
+      if num_folds > 1:
+        for index in sorted(stores.keys()):
+          for reflections in stores[index]:
+            subset = reflections.select(reflections.get_flags(
+              reflections.flags.reference_spot))
+            if len(subset) == 0:
+              continue
+            subset_position = position.select(
+              rows[index].select(subset['single_pass.row']))
+            subset['flags'] = reference['flags'].select(subset_position)
+            profile_fitter.validate(subset)
+            del subset['shoebox']
+            reference.set_selected(subset_position, subset)
+        self._report_profile_validation(
+          profile_fitter, reference, num_folds, time_info)
+        del self.reflections['profile.index']
+
+      # Set to the finalized fitter
+      profile_fitter = finalized_profile_fitter
+
+    logger.info("=" * 80)
+    logger.info("")
+    logger.info(heading("Integrating reflections"))
+    logger.info("")
+
+    # Integrate the stored shoeboxes and put the results in the table
+    from dials.algorithms.shoebox import MaskCode
+    code1 = MaskCode.Valid
+    code2 = MaskCode.Background | code1
+    code3 = MaskCode.BackgroundUsed | code2
+    code4 = MaskCode.Foreground | code1
+    for index in sorted(stores.keys()):
+      for reflections in stores[index]:
+        reflections.contains_invalid_pixels()
+        if profile_fitter:
+          reflections.compute_fitted_intensity(profile_fitter)
+        sbox = reflections['shoebox']
+        reflections['num_pixels.valid'] = sbox.count_mask_values(code1)
+        reflections['num_pixels.background'] = sbox.count_mask_values(code2)
+        reflections['num_pixels.background_used'] = sbox.count_mask_values(code3)
+        reflections['num_pixels.foreground'] = sbox.count_mask_values(code4)
+        del reflections['shoebox']
+        self.reflections.set_selected(
+          rows[index].select(reflections['single_pass.row']), reflections)
+      stores[index].clear()
+    fmt = ' Integrated % 5d (sum) + % 5d (prf) / % 5d reflections'
+    nsum = self.reflections.get_flags(self.reflections.flags.integrated_sum).count(True)
+    nprf = self.reflections.get_flags(self.reflections.flags.integrated_prf).count(True)
+    logger.info(fmt % (nsum, nprf, len(self.reflections)))
+
+    # Remove the book-keeping columns
+    del self.reflections['single_pass.job']
+    del self.reflections['single_pass.row']
+
+    # Add the time to replay the shoeboxes
+    replay_time = time() - start_time
+    time_info.process += replay_time
+    time_info.user += replay_time
+    return time_info
+
+  def _single_pass_rows(self, reflections, jobs):
+    '''
+    Get the rows of the reflection table processed by each job.
+
+    :param reflections: The reflections with the single pass book-keeping
+    :param jobs: The job indices
+    :return: A dictionary of row indices, ordered by row in each job
+
+    '''
+    from dials.array_family import flex
+    if len(reflections) == 0:
+      return dict((index, flex.size_t()) for index in jobs)
+    job = reflections['single_pass.job']
+    row = reflections['single_pass.row']
+    key = job.as_double() * (flex.max(row) + 1) + row.as_double()
+    perm = flex.sort_permutation(key)
+    result = {}
+    for index in jobs:
+      offset = (job < index).count(True)
+      count = (job == index).count(True)
+      result[index] = perm[offset:offset+count]
+    return result
+
+  def _create_profile_fitter(self, reference):
+    '''
+    Create the profile fitter and split the reference spots into folds for
+    validation.
+
+    :param reference: The reference reflections
+    :return: The profile fitter and the number of folds
+
+    '''
+    from random import shuffle
+    from math import floor, ceil
+    from dials.array_family import flex
+    from dials.algorithms.profile_model.modeller import MultiExpProfileModeller
+    from dials.algorithms.integration.validation import ValidatedMultiExpProfileModeller
+
+    # Try to set up the validation
+    if self.params.profile.validation.number_of_partitions > 1:
+      n = len(reference)
+      k_max = int(floor(n / self.params.profile.validation.min_partition_size))
+      if k_max < self.params.profile.validation.number_of_partitions:
+        num_folds = k_max
+      else:
+        num_folds = self.params.profile.validation.number_of_partitions
+      if num_folds > 1:
+        indices = (list(range(num_folds)) * int(ceil(n/num_folds)))[0:n]
+        shuffle(indices)
+        reference['profile.index'] = flex.size_t(indices)
+      if num_folds < 1:
+        num_folds = 1
+    else:
+      num_folds = 1
+
+    # Create the profile fitter
+    profile_fitter = ValidatedMultiExpProfileModeller()
+    for i in range(num_folds):
+      profile_fitter_single = MultiExpProfileModeller()#(num_folds)
+      for expr in self.experiments:
+        profile_fitter_single.add(expr.profile.fitting_class()(expr))
+      profile_fitter.add(profile_fitter_single)
+    return profile_fitter, num_folds
+
+  def _finalize_profile_fitter(self, profile_fitter_list):
+    '''
+    Accumulate the profile fitters from each job and finalize.
+
+    :param profile_fitter_list: The profile fitters from each job
+    :return: The accumulated profile fitter
+
+    '''
+    assert len(profile_fitter_list) > 0, "No profile fitters"
+    profile_fitter = None
+    for index, pf in profile_fitter_list.iteritems():
+      if pf is None:
+        continue
+      if profile_fitter is None:
+        profile_fitter = pf
+      else:
+        profile_fitter.accumulate(pf)
+    profile_fitter.finalize()
+    return profile_fitter
+
+  def _report_profile_model(self, finalized_profile_fitter, reference, time_info):
+    '''
+    Print the profiles and the profile model report.
+
+    :param finalized_profile_fitter: The finalized profile fitter
+    :param reference: The reference reflections
+    :param time_info: The timing info for modelling
+
+    '''
+    from dials.algorithms.integration.report import ProfileModelReport
+    from dials.util import pprint
+
+    # Print profiles
+    if self.params.debug_reference_output:
+      reference_debug = []
+      for i in range(len(finalized_profile_fitter)):
+        m = finalized_profile_fitter[i]
+        p = []
+        for j in range(len(m)):
+          try:
+            p.append((m.data(j), m.mask(j)))
+          except Exception:
+            p.append(None)
+      reference_debug.append(p)
+      with open(self.params.debug_reference_filename, "wb") as outfile:
+        import cPickle as pickle
+        pickle.dump(reference_debug, outfile)
+
+    for i in range(len(finalized_profile_fitter)):
+      m = finalized_profile_fitter[i]
+      logger.debug("")
+      logger.debug("Profiles for experiment %d" % i)
+      for j in range(len(m)):
+        logger.debug("Profile %d" % j)
+        try:
+          logger.debug(pprint.profile3d(m.data(j)))
+        except Exception:
+          logger.debug("** NO PROFILE **")
+
+    # Print the modeller report
+    self.profile_model_report = ProfileModelReport(
       self.experiments,
-      self.reflections)
+      finalized_profile_fitter,
+      reference)
     logger.info("")
-    logger.info(self.integration_report.as_str(prefix=' '))
+    logger.info(self.profile_model_report.as_str(prefix=' '))
 
     # Print the time info
-    logger.info("Timing information for integration")
+    logger.info("")
+    logger.info("Timing information for reference profile formation")
     logger.info(str(time_info))
     logger.info("")
 
-    # Return the reflections
-    return self.reflections
+  def _report_profile_validation(self, profile_fitter, reference, num_folds,
+                                 time_info):
+    '''
+    Print the profile validation report.
+
+    :param profile_fitter: The validated profile fitter
+    :param reference: The reference reflections
+    :param num_folds: The number of folds
+    :param time_info: The timing info for validation
+
+    '''
+    from dials.algorithms.integration.report import ProfileValidationReport
+
+    # Print the modeller report
+    self.profile_validation_report = ProfileValidationReport(
+      self.experiments,
+      profile_fitter,
+      reference,
+      num_folds)
+    logger.info("")
+    logger.info(self.profile_validation_report.as_str(prefix=' '))
+
+    # Print the time info
+    logger.info("")
+    logger.info("Timing information for reference profile validation")
+    logger.info(str(time_info))
+    logger.info("")
 
   def report(self):
     '''
@@ -258,6 +258,26 @@ def assert_enough_memory(required_memory, max_memory_usage):
     logger.info('')
 
 
+def log_read_timing(processor):
+  '''
+  Write the time spent reading images and the time spent blocked waiting for
+  images. If the wait time is a large fraction of the total time then the
+  processing is limited by reading the images and more prefetch threads may
+  help.
+
+  :param processor: The multi threaded integrator or reference profiler
+
+  '''
+  total_time = processor.total_time()
+  wait_time = processor.wait_time()
+  logger.info("")
+  logger.info(" Image read time:         %.2f seconds" % processor.read_time())
+  logger.info(" Time waiting for images: %.2f seconds" % wait_time)
+  logger.info(" Time processing:         %.2f seconds" % (total_time - wait_time))
+  logger.info(" Total time:              %.2f seconds" % total_time)
+  logger.info("")
+
+
 class Result(object):
   '''
   A class representing a processing result.
@@ -455,11 +475,16 @@ def integrate(self, imageset):
       nthreads           = self.params.integration.mp.nproc,
       buffer_size        = self.params.integration.block.size,
       use_dynamic_mask   = self.params.integration.use_dynamic_mask,
-      debug              = self.params.integration.debug.output)
+      debug              = self.params.integration.debug.output,
+      nreaders           = self.params.integration.mp.prefetch,
+      prefetch_depth     = self.params.integration.mp.prefetch_depth)
 
     # Assign the reflections
     self.reflections = integrator.reflections()
 
+    # Write the timing info
+    log_read_timing(integrator)
+
   def write_debug_files(self):
     '''
     Write some debug output
@@ -650,10 +675,21 @@ def compute_max_block_size(self):
     assert max_memory_usage >  0.0, "maximum memory usage must be > 0"
     assert max_memory_usage <= 1.0, "maximum memory usage must be <= 1"
     limit_memory = int(floor(total_memory * max_memory_usage))
-    return MultiThreadedIntegrator.compute_max_block_size(
+    max_block_size = MultiThreadedIntegrator.compute_max_block_size(
       self.experiments[0].imageset,
       max_memory_usage = limit_memory)
 
+    # Leave room for the images read ahead of the block
+    if self.params.integration.mp.prefetch > 0:
+      max_block_size -= self.params.integration.mp.prefetch_depth
+    if max_block_size < 1:
+      raise RuntimeError('''
+        There is not enough memory for a single image. Possible solutions
+        include increasing the percentage of memory allowed or reducing the
+        number of images read ahead.
+      ''')
+    return max_block_size
+
   def compute_blocks(self):
     '''
     Compute the processing block size.
@@ -670,7 +706,8 @@ def compute_blocks(self):
       cutoff = int(block.threshold*len(nframes))
       block_size = nframes[cutoff] * 2
       if block_size > max_block_size:
-        logger.warn("Computed block size (%s) > maximum block size (%s).")
+        logger.warn("Computed block size (%s) > maximum block size (%s)." % (
+          block_size, max_block_size))
         logger.warn("Setting block size to maximum; some reflections may be partial")
         block_size = max_block_size
     else:
@@ -686,11 +723,10 @@ def compute_blocks(self):
       else:
         raise RuntimeError('Unknown block_size_units = %s' % block_size_units)
       if block_size > max_block_size:
-        raise RuntimeError('''
-          The requested block size (%s) is larger than the maximum allowable block
-          size (%s). Either decrease the requested block size or increase the
-          amount of available memory.
-        ''' % (block_size, max_block_size))
+        logger.warn("Requested block size (%s) > maximum block size (%s)." % (
+          block_size, max_block_size))
+        logger.warn("Setting block size to maximum; some reflections may be partial")
+        block_size = max_block_size
     block.size = block_size
     block.units = 'frames'
 
@@ -939,11 +975,16 @@ def compute_reference_profiles(self, imageset):
       nthreads           = self.params.integration.mp.nproc,
       buffer_size        = self.params.integration.block.size,
       use_dynamic_mask   = self.params.integration.use_dynamic_mask,
-      debug              = self.params.integration.debug.output)
+      debug              = self.params.integration.debug.output,
+      nreaders           = self.params.integration.mp.prefetch,
+      prefetch_depth     = self.params.integration.mp.prefetch_depth)
 
     # Assign the reflections
     self.reflections = reference_calculator.reflections()
 
+    # Write the timing info
+    log_read_timing(reference_calculator)
+
     # Assign the reference profiles
     self.reference = compute_reference
 
@@ -1161,10 +1202,21 @@ def compute_max_block_size(self):
     assert max_memory_usage >  0.0, "maximum memory usage must be > 0"
     assert max_memory_usage <= 1.0, "maximum memory usage must be <= 1"
     limit_memory = int(floor(total_memory * max_memory_usage))
-    return MultiThreadedReferenceProfiler.compute_max_block_size(
+    max_block_size = MultiThreadedReferenceProfiler.compute_max_block_size(
       self.experiments[0].imageset,
       max_memory_usage = limit_memory)
 
+    # Leave room for the images read ahead of the block
+    if self.params.integration.mp.prefetch > 0:
+      max_block_size -= self.params.integration.mp.prefetch_depth
+    if max_block_size < 1:
+      raise RuntimeError('''
+        There is not enough memory for a single image. Possible solutions
+        include increasing the percentage of memory allowed or reducing the
+        number of images read ahead.
+      ''')
+    return max_block_size
+
   def compute_blocks(self):
     '''
     Compute the processing block size.
@@ -1181,7 +1233,8 @@ def compute_blocks(self):
       cutoff = int(block.threshold*len(nframes))
       block_size = nframes[cutoff] * 2
       if block_size > max_block_size:
-        logger.warn("Computed block size (%s) > maximum block size (%s).")
+        logger.warn("Computed block size (%s) > maximum block size (%s)." % (
+          block_size, max_block_size))
         logger.warn("Setting block size to maximum; some reflections may be partial")
         block_size = max_block_size
     else:
@@ -1197,11 +1250,10 @@ def compute_blocks(self):
       else:
         raise RuntimeError('Unknown block_size_units = %s' % block_size_units)
       if block_size > max_block_size:
-        raise RuntimeError('''
-          The requested block size (%s) is larger than the maximum allowable block
-          size (%s). Either decrease the requested block size or increase the
-          amount of available memory.
-        ''' % (block_size, max_block_size))
+        logger.warn("Requested block size (%s) > maximum block size (%s)." % (
+          block_size, max_block_size))
+        logger.warn("Setting block size to maximum; some reflections may be partial")
+        block_size = max_block_size
     block.size = block_size
     block.units = 'frames'
 
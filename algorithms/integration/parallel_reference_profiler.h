@@ -463,6 +463,8 @@ namespace dials { namespace algorithms {
      * @param buffer_size The buffer_size
      * @param use_dynamic_mask Use the dynamic mask if present
      * @param debug Add debug output
+     * @param nreaders The number of threads reading images ahead
+     * @param prefetch_depth The maximum number of images to read ahead
      */
     ParallelReferenceProfiler(
           af::reflection_table reflections,
@@ -474,7 +476,12 @@ namespace dials { namespace algorithms {
           std::size_t nthreads,
           std::size_t buffer_size,
           bool use_dynamic_mask,
-          bool debug) {
+          bool debug,
+          std::size_t nreaders,
+          std::size_t prefetch_depth)
+        : read_time_(0.0),
+          wait_time_(0.0),
+          total_time_(0.0) {
 
       using dials::algorithms::shoebox::find_overlapping_multi_panel;
 
@@ -566,6 +573,8 @@ namespace dials { namespace algorithms {
           flags,
           nthreads,
           use_dynamic_mask,
+          nreaders,
+          prefetch_depth,
           logger);
 
       // Transform the row major reflection array to the reflection table
@@ -579,6 +588,27 @@ namespace dials { namespace algorithms {
       return reflections_;
     }
 
+    /**
+     * @returns The time spent reading images (summed over reader threads)
+     */
+    double read_time() const {
+      return read_time_;
+    }
+
+    /**
+     * @returns The time spent waiting for images to be read
+     */
+    double wait_time() const {
+      return wait_time_;
+    }
+
+    /**
+     * @returns The total time spent processing the images
+     */
+    double total_time() const {
+      return total_time_;
+    }
+
     /**
      * Static method to get the memory in bytes needed
      * @param imageset the imageset class
@@ -647,6 +677,10 @@ namespace dials { namespace algorithms {
      * 4. Loop through all reflections complete on the image
      * 5. For each complete reflection post a reflection integration job to the
      *    thread pool.
+     *
+     * If nreaders > 0 the images are read ahead by an ImagePrefetcher and the
+     * GIL is released while the images are processed so that the reader
+     * threads can call into python.
      */
     void process(
         const Lookup &lookup,
@@ -659,10 +693,15 @@ namespace dials { namespace algorithms {
         af::const_ref<std::size_t> flags,
         std::size_t nthreads,
         bool use_dynamic_mask,
-        const Logger &logger) const {
+        std::size_t nreaders,
+        std::size_t prefetch_depth,
+        const Logger &logger) {
 
       using dials::util::ThreadPool;
 
+      // Get the start time
+      double start_time = wall_time();
+
       // Create the thread pool
       ThreadPool pool(nthreads);
 
@@ -673,19 +712,30 @@ namespace dials { namespace algorithms {
       // Create the buffer manager
       BufferManager bm(buffer, bbox, flags, zstart);
 
+      // Release the GIL so the reader threads can run and start reading. The
+      // prefetcher must be destroyed before the GIL is reacquired.
+      ScopedGILRelease nogil(nreaders > 0);
+      ImagePrefetcher prefetcher(
+          imageset,
+          nreaders,
+          prefetch_depth,
+          use_dynamic_mask);
+
       // Loop through all the images
       for (std::size_t i = 0; i < zsize; ++i) {
 
         // Copy the image to the buffer. If the image number is greater than the
         // buffer size (i.e. we are now deleting old images) then wait for the
         // threads to finish so that we don't end up reading the wrong data
-        if (imageset.is_marked_for_rejection(i)) {
-          bm.copy_when_ready(imageset.get_corrected_data(i), false, i);
-        } else if (use_dynamic_mask) {
-          bm.copy_when_ready(imageset.get_corrected_data(i), imageset.get_dynamic_mask(i), i);
+        ImagePrefetcher::frame_pointer frame = prefetcher.next();
+        if (frame->rejected) {
+          bm.copy_when_ready(frame->data, false, i);
+        } else if (frame->mask) {
+          bm.copy_when_ready(frame->data, *frame->mask, i);
         } else {
-          bm.copy_when_ready(imageset.get_corrected_data(i), i);
+          bm.copy_when_ready(frame->data, i);
         }
+        frame.reset();
 
         // Get the reflections recorded at this point
         af::const_ref<std::size_t> indices = lookup.indices(i);
@@ -734,9 +784,17 @@ namespace dials { namespace algorithms {
 
       // Wait for all the integration jobs to complete
       bm.wait(pool);
+
+      // Set the timing info
+      read_time_ = prefetcher.read_time();
+      wait_time_ = prefetcher.wait_time();
+      total_time_ = wall_time() - start_time;
     }
 
     af::reflection_table reflections_;
+    double read_time_;
+    double wait_time_;
+    double total_time_;
   };
 
 }}
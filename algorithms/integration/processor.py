@@ -14,6 +14,9 @@
 logger = logging.getLogger(__name__)
 from dials_algorithms_integration_integrator_ext import *
 from dials.util import phil
+from dials.algorithms.integration.block_planner import BlockPlanner
+from dials.algorithms.integration.block_planner import block_boundaries
+from dials.algorithms.integration.block_planner import jobs_from_boundaries
 import libtbx
 
 class ExecutorAux(Executor, boost.python.injector):
@@ -42,12 +45,16 @@ def __init__(self):
     self.nproc = 1
     self.njobs = 1
     self.nthreads = 1
+    self.prefetch = 0
+    self.prefetch_depth = 4
 
   def update(self, other):
     self.method = other.method
     self.nproc = other.nproc
     self.njobs = other.njobs
     self.nthreads = other.nthreads
+    self.prefetch = other.prefetch
+    self.prefetch_depth = other.prefetch_depth
 
 class Lookup(object):
   '''
@@ -144,6 +151,7 @@ class TimingInfo(object):
   '''
   def __init__(self):
     self.read = 0
+    self.wait = 0
     self.extract = 0
     self.initialize = 0
     self.process = 0
@@ -156,6 +164,7 @@ def __str__(self):
     from libtbx.table_utils import format as table
     rows = [
       ["Read time"        , "%.2f seconds" % (self.read)       ],
+      ["Read wait time"   , "%.2f seconds" % (self.wait)       ],
       ["Extract time"     , "%.2f seconds" % (self.extract)    ],
       ["Pre-process time" , "%.2f seconds" % (self.initialize) ],
       ["Process time"     , "%.2f seconds" % (self.process)    ],
@@ -172,14 +181,20 @@ class ExecuteParallelTask(object):
 
   '''
 
+  def __init__(self):
+    from dials.util import trace
+    self.trace_state = trace.state()
+
   def __call__(self, task):
     from dials.util import log
+    from dials.util import trace
     import logging
     log.config_simple_cached()
-    result = task()
+    with trace.child_process(self.trace_state) as traced:
+      result = task()
     handlers = logging.getLogger('dials').handlers
     assert len(handlers) == 1, "Invalid number of logging handlers"
-    return result, handlers[0].messages()
+    return result, handlers[0].messages(), traced.events
 
 
 class Processor(object):
@@ -198,6 +213,7 @@ def __init__(self, manager):
 
     '''
     self.manager = manager
+    self.parallel = False
 
   @property
   def executor(self):
@@ -228,10 +244,12 @@ def process(self):
     '''
     from time import time
     from dials.util.mp import multi_node_parallel_map
+    from dials.util import trace
     import platform
     from math import ceil
     start_time = time()
-    self.manager.initialize()
+    with trace.span('initialize', 'integration'):
+      self.manager.initialize()
     mp_method = self.manager.params.mp.method
     mp_njobs = self.manager.params.mp.njobs
     mp_nproc = self.manager.params.mp.nproc
@@ -247,16 +265,18 @@ def process(self):
     if mp_nproc * mp_njobs > len(self.manager):
       mp_nproc = min(mp_nproc, len(self.manager))
       mp_njobs = int(ceil(len(self.manager) / mp_nproc))
+    self.parallel = mp_njobs * mp_nproc > 1
     logger.info(self.manager.summary())
     if mp_njobs > 1:
       assert mp_method is not 'none' and mp_method is not None
       logger.info(' Using %s with %d parallel job(s) and %d processes per node\n' % (mp_method, mp_njobs, mp_nproc))
     else:
       logger.info(' Using multiprocessing with %d parallel job(s)\n' % (mp_nproc))
-    if mp_njobs * mp_nproc > 1:
+    if self.parallel:
       def process_output(result):
         for message in result[1]:
           logger.log(message.levelno, message.msg)
+        trace.extend(result[2])
         self.manager.accumulate(result[0])
         result[0].reflections = None
         result[0].data = None
@@ -272,7 +292,8 @@ def process_output(result):
     else:
       for task in self.manager.tasks():
         self.manager.accumulate(task())
-    self.manager.finalize()
+    with trace.span('finalize', 'integration'):
+      self.manager.finalize()
     end_time = time()
     self.manager.time.user_time = end_time - start_time
     result1, result2 = self.manager.result()
@@ -325,6 +346,7 @@ def __call__(self):
     '''
     result = Result(self.index, self.reflections, None)
     result.read_time = 0
+    result.wait_time = 0
     result.extract_time = 0
     result.process_time = 0
     result.total_time = 0
@@ -378,6 +400,8 @@ def __call__(self):
     from dials.array_family import flex
     from time import time
     from dials.model.data import make_image
+    from dials.util.prefetch import Prefetcher
+    from dials.util import trace
     from libtbx.introspection import machine_memory_info
 
     # Get the start time
@@ -462,10 +486,8 @@ def __call__(self):
         logger.info('  Required shoebox memory: %g GB' % (sbox_memory/1e9))
         logger.info('')
 
-    # Loop through the imageset, extract pixels and process reflections
-    read_time = 0.0
-    for i in range(len(imageset)):
-      st = time()
+    # Function to read an image and mask
+    def read_image(i):
       image = imageset.get_corrected_data(i)
       if imageset.is_marked_for_rejection(i):
         mask = tuple(flex.bool(im.accessor(), False) for im in image)
@@ -477,8 +499,16 @@ def __call__(self):
               len(mask),
               len(self.params.lookup.mask))
           mask = tuple(m1 & m2 for m1, m2 in zip(self.params.lookup.mask, mask))
-
-      read_time += time() - st
+      return image, mask
+
+    # Loop through the imageset, extract pixels and process reflections. The
+    # images are optionally read ahead in background threads.
+    prefetcher = Prefetcher(
+      read_image,
+      range(len(imageset)),
+      nthreads=self.params.mp.prefetch,
+      depth=self.params.mp.prefetch_depth)
+    for image, mask in prefetcher:
       processor.next(make_image(image, mask), self.executor)
       del image
       del mask
@@ -506,10 +536,20 @@ def __call__(self):
 
     # Return the result
     result = Result(self.index, self.reflections, self.executor.data())
-    result.read_time = read_time
+    result.read_time = prefetcher.read_time
+    result.wait_time = prefetcher.wait_time
     result.extract_time = processor.extract_time()
     result.process_time = processor.process_time()
     result.total_time = time() - start_time
+    trace.complete(
+      'process_job', 'integration', start_time, start_time + result.total_time,
+      job=self.index,
+      image_range=(frame0, frame1),
+      reflections=len(self.reflections),
+      read_time=result.read_time,
+      wait_time=result.wait_time,
+      extract_time=result.extract_time,
+      process_time=result.process_time)
     return result
 
 
@@ -561,11 +601,11 @@ def initialize(self):
     # Ensure the reflections contain bounding boxes
     assert "bbox" in self.reflections, "Reflections have no bbox"
 
-    # Compute the block size and processors
+    # Compute the block size and plan the jobs and processors
     self.compute_blocks()
     self.compute_jobs()
-    self.split_reflections()
     self.compute_processors()
+    self.split_reflections()
 
     # Create the reflection manager
     self.manager = ReflectionManager(self.jobs, self.reflections)
@@ -621,6 +661,7 @@ def accumulate(self, result):
     self.data[result.index] = result.data
     self.manager.accumulate(result.index, result.reflections)
     self.time.read += result.read_time
+    self.time.wait += result.wait_time
     self.time.extract += result.extract_time
     self.time.process += result.process_time
     self.time.total += result.total_time
@@ -701,7 +742,7 @@ def compute_jobs(self):
       range(len(self.experiments)),
       lambda x: (id(self.experiments[x].imageset),
                  id(self.experiments[x].scan)))
-    self.jobs = JobList()
+    self.groups = []
     for key, indices in groups:
       indices = list(indices)
       i0 = indices[0]
@@ -725,9 +766,26 @@ def compute_jobs(self):
         block_size_frames = int(ceil(self.params.block.size))
       else:
         raise RuntimeError('Unknown block_size_units = %s' % block_size_units)
-      self.jobs.add((i0, i1), array_range, block_size_frames)
+      self.groups.append(((i0, i1), array_range, block_size_frames))
+    self.jobs = self.create_job_list(
+      [jobs_from_boundaries(r, block_boundaries(r, b))
+       for e, r, b in self.groups])
     assert len(self.jobs) > 0, "Invalid number of jobs"
 
+  def create_job_list(self, jobs):
+    '''
+    Create the job list from the frame ranges of the jobs in each group
+
+    :param jobs: The list of job frame ranges for each group
+    :return: The job list
+
+    '''
+    from scitbx.array_family import shared
+    job_list = JobList()
+    for (expr, array_range, block_size), group_jobs in zip(self.groups, jobs):
+      job_list.add(expr, array_range, shared.tiny_int_2(group_jobs))
+    return job_list
+
   def split_reflections(self):
     '''
     Split the reflections into partials or over job boundaries
@@ -759,41 +817,99 @@ def split_reflections(self):
 
   def compute_processors(self):
     '''
-    Compute the number of processors
+    Plan the jobs and number of processors to fit in the memory budget
+
+    The memory needed by each job is predicted from the bounding boxes of its
+    reflections and the size of the image buffers. Jobs which would use more
+    than their share of the memory are split further and, if that is not
+    enough, the number of processors is reduced.
+
+    The plan is only made for local processing (mp.method none or
+    multiprocessing with mp.njobs=1), since it uses the memory of this
+    machine. The jobs of the other methods run on cluster nodes and are left
+    as they are. The parameters given to the manager are not modified: the
+    manager keeps a copy with the planned number of processors and each
+    process's share of the memory.
 
     '''
     from libtbx.introspection import machine_memory_info
-    from math import floor
+
+    if (self.params.mp.method not in ('none', 'multiprocessing') or
+        self.params.mp.njobs > 1):
+      return
+
+    # Compute percentage of max available. The function is not portable to
+    # windows so need to add a check if the function fails. On windows no
+    # plan is made
+    memory_info = machine_memory_info()
+    total_memory = memory_info.memory_total()
+    if total_memory is None:
+      return
+    assert total_memory > 0, "Your system appears to have no memory!"
+    limit_memory = total_memory * self.params.block.max_memory_usage
+
+    # Plan the jobs
+    planner = BlockPlanner(
+      self.compute_job_memory,
+      limit_memory,
+      self.params.mp.nproc)
+    jobs, memory, nproc = planner.plan([(r, b) for e, r, b in self.groups])
+    max_memory = max(max(m) for m in memory)
+    if max_memory > limit_memory:
+      raise RuntimeError('''
+        No enough memory to run integration jobs. Possible solutions
+        include increasing the percentage of memory allowed for shoeboxes or
+        decreasing the block size.
+          Total system memory: %g GB
+          Limit shoebox memory: %g GB
+          Max shoebox memory: %g GB
+      ''' % (total_memory/1e9, limit_memory/1e9, max_memory/1e9))
+    self.jobs = self.create_job_list(jobs)
+    params = Parameters()
+    params.update(self.params)
+    params.mp.nproc = nproc
+    params.block.max_memory_usage /= nproc
+    self.params = params
+
+  def compute_job_memory(self, jobs):
+    '''
+    Predict the memory used by each job: the peak shoebox memory, as computed
+    by the shoebox processor, plus the image buffers.
+
+    :param jobs: The list of job frame ranges for each group
+    :return: The list of the memory of each job in each group (bytes)
+
+    '''
     from dials.array_family import flex
 
-    # Set the memory usage per processor
-    if self.params.mp.method == 'multiprocessing' and self.params.mp.nproc > 1:
-
-      # Get the maximum shoebox memory
-      max_memory = flex.max(self.jobs.shoebox_memory(
-        self.reflections, self.params.shoebox.flatten))
-
-      # Compute percentage of max available. The function is not portable to
-      # windows so need to add a check if the function fails. On windows no
-      # warning will be printed
-      memory_info = machine_memory_info()
-      total_memory = memory_info.memory_total()
-      if total_memory is not None:
-        assert total_memory > 0, "Your system appears to have no memory!"
-        limit_memory = total_memory * self.params.block.max_memory_usage
-        njobs = int(floor(limit_memory / max_memory))
-        if njobs < 1:
-          raise RuntimeError('''
-            No enough memory to run integration jobs. Possible solutions
-            include increasing the percentage of memory allowed for shoeboxes or
-            decreasing the block size.
-              Total system memory: %g GB
-              Limit shoebox memory: %g GB
-              Max shoebox memory: %g GB
-          ''' % (total_memory/1e9, limit_memory/1e9, max_memory/1e9))
-        else:
-          self.params.mp.nproc = min(self.params.mp.nproc, njobs)
-          self.params.block.max_memory_usage /= self.params.mp.nproc
+    # Copy just the columns needed to split the reflections
+    reflections = flex.reflection_table()
+    for key in ['bbox', 'id', 'flags']:
+      reflections[key] = self.reflections[key].deep_copy()
+    job_list = self.create_job_list(jobs)
+    if self.params.shoebox.partials:
+      reflections.split_partials()
+    else:
+      job_list.split(reflections)
+    shoebox_memory = job_list.shoebox_memory(
+      reflections, self.params.shoebox.flatten)
+
+    # The images being processed and read ahead
+    num_images = 1
+    if self.params.mp.prefetch > 0:
+      num_images += self.params.mp.prefetch_depth
+    memory = []
+    k = 0
+    for (expr, array_range, block_size), group_jobs in zip(self.groups, jobs):
+      detector = self.experiments[expr[0]].detector
+      num_pixels = sum(p.get_image_size()[0] * p.get_image_size()[1]
+                       for p in detector)
+      # Corrected image data (double) and mask (bool) for each pixel
+      image_memory = num_images * num_pixels * (8 + 1)
+      memory.append([
+        shoebox_memory[k + j] + image_memory for j in range(len(group_jobs))])
+      k += len(group_jobs)
+    return memory
 
   def summary(self):
     '''
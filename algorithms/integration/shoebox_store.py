@@ -0,0 +1,122 @@
+#
+# shoebox_store.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+
+def shoebox_memory(reflections):
+  '''
+  Compute the number of bytes used by the shoeboxes of a reflection table.
+
+  Each shoebox pixel holds a data value, a background value and a mask code.
+
+  :param reflections: The reflection table
+  :return: The number of bytes
+
+  '''
+  from dials.array_family import flex
+  if len(reflections) == 0:
+    return 0
+  x0, x1, y0, y1, z0, z1 = reflections['bbox'].parts()
+  npixels = flex.sum(((x1 - x0) * (y1 - y0) * (z1 - z0)).as_double())
+  return int(npixels) * 12
+
+
+class ShoeboxStore(object):
+  '''
+  A bounded store of reflection tables holding processed shoeboxes.
+
+  Tables are kept in memory until the shoeboxes would exceed the memory
+  limit. After that they are spilled to pickle files in a temporary directory
+  and read back when the store is iterated. Tables are returned in the order
+  in which they were added.
+
+  '''
+
+  def __init__(self, max_memory=None, directory=None, prefix='shoeboxes_'):
+    '''
+    Initialise the store
+
+    :param max_memory: The maximum number of bytes to keep in memory (None for
+                       no limit)
+    :param directory: The directory in which to create the spill directory
+    :param prefix: The prefix for the spill directory
+
+    '''
+    self.max_memory = max_memory
+    self.directory = directory
+    self.prefix = prefix
+    self.memory = 0
+    self.tempdir = None
+    self.items = []
+    self.num_spilled = 0
+
+  def append(self, reflections):
+    '''
+    Add a reflection table to the store
+
+    :param reflections: The reflection table
+
+    '''
+    nbytes = shoebox_memory(reflections)
+    if self.max_memory is None or self.memory + nbytes <= self.max_memory:
+      self.items.append(reflections)
+      self.memory += nbytes
+    else:
+      self.items.append(self._spill(reflections))
+
+  def _spill(self, reflections):
+    '''
+    Write a reflection table to disk
+
+    :param reflections: The reflection table
+    :return: The filename
+
+    '''
+    from os.path import join
+    from tempfile import mkdtemp
+    if self.tempdir is None:
+      self.tempdir = mkdtemp(prefix=self.prefix, dir=self.directory)
+    filename = join(self.tempdir, '%d.pickle' % len(self.items))
+    reflections.as_pickle(filename)
+    self.num_spilled += 1
+    return filename
+
+  def clear(self):
+    '''
+    Remove all the tables and any spill files
+
+    '''
+    from shutil import rmtree
+    if self.tempdir is not None:
+      rmtree(self.tempdir, ignore_errors=True)
+      self.tempdir = None
+    self.items = []
+    self.memory = 0
+    self.num_spilled = 0
+
+  def __iter__(self):
+    '''
+    Iterate through the tables
+
+    '''
+    from dials.array_family import flex
+    for item in self.items:
+      if isinstance(item, str):
+        yield flex.reflection_table.from_pickle(item)
+      else:
+        yield item
+
+  def __len__(self):
+    '''
+    :return: The number of tables in the store
+
+    '''
+    return len(self.items)
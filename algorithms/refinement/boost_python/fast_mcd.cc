@@ -0,0 +1,31 @@
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include "../outlier_detection/fast_mcd.h"
+
+using namespace boost::python;
+
+namespace dials { namespace refinement { namespace boost_python {
+
+  void export_fast_mcd()
+  {
+    class_<MCDEstimate>("MCDEstimate", no_init)
+      .def("get_location", &MCDEstimate::get_location)
+      .def("get_covariance", &MCDEstimate::get_covariance)
+      .def("get_determinant", &MCDEstimate::get_determinant)
+    ;
+
+    def("mcd_initial_estimate", &mcd_initial_estimate, (
+      arg("obs"),
+      arg("h"),
+      arg("permutation"),
+      arg("nsteps")));
+
+    def("mcd_concentration_steps", &mcd_concentration_steps, (
+      arg("obs"),
+      arg("h"),
+      arg("start"),
+      arg("max_steps"),
+      arg("stop_at_convergence")));
+  }
+
+}}} // namespace dials::refinement::boost_python
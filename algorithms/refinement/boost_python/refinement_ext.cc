@@ -9,6 +9,7 @@ namespace dials { namespace refinement { namespace boost_python {
   void export_parameterisation_helpers();
   void export_gallego_yezzi();
   void export_mahalanobis();
+  void export_fast_mcd();
   void export_outlier_helpers();
   void export_calculate_cell_gradients();
   void export_rtmats();
@@ -24,6 +25,7 @@ namespace dials { namespace refinement { namespace boost_python {
     export_parameterisation_helpers();
     export_gallego_yezzi();
     export_mahalanobis();
+    export_fast_mcd();
     export_outlier_helpers();
     export_calculate_cell_gradients();
     export_rtmats();
@@ -14,12 +14,13 @@
 from __future__ import absolute_import, division
 import logging
 logger = logging.getLogger(__name__)
+import time
 
 from scitbx import lbfgs
 from scitbx.array_family import flex
 import libtbx
-from libtbx import easy_mp
 from libtbx.phil import parse
+from dials.util import trace
 
 # use lstbx classes
 from scitbx.lstbx import normal_eqns, normal_eqns_solving
@@ -216,8 +217,13 @@ def __init__(self, target, prediction_parameterisation, constraints_manager=None
     if tracking.track_condition_number:
       self.history.add_column("condition_number")
 
-    # number of processes to use, for engines that support multiprocessing
+    # number of processes to use, for engines that support multiprocessing,
+    # and the pool of worker processes, which is started on demand
     self._nproc = 1
+    self._worker_pool = None
+
+    # start time of the current step, for tracing
+    self._step_start_time = time.time()
 
     self.prepare_for_step()
 
@@ -234,14 +240,23 @@ def prepare_for_step(self):
     # set current parameter values
     self._parameters.set_param_vals(x)
 
-    # do reflection prediction
-    self._target.predict()
+    # do reflection prediction. If there is a worker pool then the gradients
+    # are calculated by the workers, so the derivatives are not required here
+    self._target.predict(skip_derivatives=self._worker_pool is not None)
 
     return
 
   def update_journal(self):
     """Append latest step information to the journal attributes"""
 
+    # record the time taken by the step
+    end_time = time.time()
+    trace.complete('step', 'refinement', self._step_start_time, end_time,
+      step=self.history.get_nrows(),
+      num_reflections=self._target.get_num_matches(),
+      objective=self._f)
+    self._step_start_time = end_time
+
     # add step quantities to journal
     self.history.add_row()
     self.history.set_last_cell("num_reflections", self._target.get_num_matches())
@@ -436,9 +451,35 @@ def test_objective_increasing_but_not_nref(self):
   def set_nproc(self, nproc):
     """Set number of processors for multiprocessing. Override in derived classes
     if a policy dictates that this must not be user-controlled"""
+    if nproc != self._nproc:
+      self.close_worker_pool()
     self._nproc = nproc
     return
 
+  def start_worker_pool(self):
+    """Start the pool of worker processes used when nproc > 1, if it is not
+    already running, and return it. Each worker holds a block of the working
+    reflections and a copy of the parameterisation for the lifetime of the
+    pool, so this should be called once the reflections are finalised. If the
+    working reflections have changed since, the pool is restarted"""
+
+    if self._worker_pool is not None and \
+        not self._worker_pool.is_current(self._target):
+      self.close_worker_pool()
+    if self._worker_pool is None:
+      from dials.algorithms.refinement.worker_pool import RefinementWorkerPool
+      self._worker_pool = RefinementWorkerPool(self._target, self._parameters,
+        self._constr_manager, len(self.x), self._nproc)
+    return self._worker_pool
+
+  def close_worker_pool(self):
+    """Stop the pool of worker processes, if it is running"""
+
+    if self._worker_pool is not None:
+      self._worker_pool.close()
+      self._worker_pool = None
+    return
+
   def run(self):
     """
     To be implemented by derived class. It is expected that each step of
@@ -481,20 +522,18 @@ def compute_functional_and_gradients(self):
 
   def compute_functional_gradients_and_curvatures(self):
 
+    if self._nproc > 1:
+      self.start_worker_pool()
+
     self.prepare_for_step()
 
     # observation terms
-    blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
     if self._nproc > 1:
-      task_results = easy_mp.parallel_map(
-        func=self._target.compute_functional_gradients_and_curvatures,
-        iterable=blocks,
-        processes=self._nproc,
-        method="multiprocessing",
-        #preserve_exception_message=True
-        )
+      task_results = self._worker_pool.functional_gradients_and_curvatures(
+        self._parameters.get_param_vals())
 
     else:
+      blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
       task_results = [self._target. \
         compute_functional_gradients_and_curvatures(block) for block in blocks]
 
@@ -640,6 +679,11 @@ def build_up(self, objective_only=False):
     # observations... See http://en.wikipedia.org/wiki/Non-linear_least_squares
     # at 'diagonal weight matrix'
 
+    # start the worker pool before prediction, so that derivatives are not
+    # calculated needlessly here
+    if self._nproc > 1 and not objective_only:
+      self.start_worker_pool()
+
     # set current parameter values
     self.prepare_for_step()
 
@@ -651,41 +695,26 @@ def build_up(self, objective_only=False):
       residuals, weights = self._target.compute_residuals()
       self.add_residuals(residuals, weights)
     else:
-      blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
-
       if self._nproc > 1:
 
         # ensure the jacobian is not tracked
         self._jacobian = None
 
-        # processing functions
-        def task_wrapper(block):
-          residuals, jacobian, weights = \
-            self._target.compute_residuals_and_gradients(block)
-          return dict(residuals=residuals,
-                      jacobian=jacobian,
-                      weights=weights)
-        def callback_wrapper(result):
-          j = result['jacobian']
-          if self._constr_manager is not None:
-            j = self._constr_manager.constrain_jacobian(j)
-          self.add_equations(result['residuals'], j, result['weights'])
-          # no longer need the result
-          result['residuals'] = None
-          result['jacobian'] = None
-          result['weights'] = None
-          return
-
-        task_results = easy_mp.parallel_map(
-          func=task_wrapper,
-          iterable=blocks,
-          processes=self._nproc,
-          callback=callback_wrapper,
-          method="multiprocessing",
-          #preserve_exception_message=True
-          )
+        # the workers predict for their own blocks of reflections at the
+        # current parameter values and return partial normal equations, which
+        # are summed here
+        results = self._worker_pool.normal_equations(
+          self._parameters.get_param_vals())
+        for result in results:
+          for residuals, weights in zip(result['residuals'], result['weights']):
+            self.add_residuals(residuals, weights)
+          a = self.normal_matrix_packed_u()
+          a += result['normal_matrix']
+          b = self.step_equations().right_hand_side()
+          b += result['right_hand_side']
 
       else:
+        blocks = self._target.split_matches_into_blocks(nproc = self._nproc)
         for block in blocks:
           residuals, self._jacobian, weights = \
             self._target.compute_residuals_and_gradients(block)
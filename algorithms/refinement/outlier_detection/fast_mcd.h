@@ -0,0 +1,211 @@
+#ifndef DIALS_REFINEMENT_FAST_MCD_H
+#define DIALS_REFINEMENT_FAST_MCD_H
+
+#include <algorithm>
+#include <cmath>
+#include <vector>
+#include <dials/array_family/scitbx_shared_and_versa.h>
+#include <dials/error.h>
+#include "mahalanobis.h"
+
+namespace dials { namespace refinement {
+
+  // A return type for the FAST-MCD helpers: the location and scatter estimate
+  // over a subset of the observations and the determinant of the scatter
+  // matrix
+  struct MCDEstimate {
+    af::shared<double> location;
+    af::versa< double, af::c_grid<2> > covariance;
+    double determinant;
+
+    MCDEstimate(af::shared<double> location_,
+                af::versa< double, af::c_grid<2> > covariance_,
+                double determinant_)
+      : location(location_),
+        covariance(covariance_),
+        determinant(determinant_){}
+
+    af::shared<double> get_location() const {
+      return location;
+    }
+
+    af::versa< double, af::c_grid<2> > get_covariance() const {
+      return covariance;
+    }
+
+    double get_determinant() const {
+      return determinant;
+    }
+  };
+
+  namespace detail {
+
+    // Determinant of a square matrix by LU decomposition with partial pivoting
+    inline double determinant_via_lu(
+        const af::const_ref< double, af::c_grid<2> > &mat) {
+      std::size_t n = mat.accessor()[0];
+      std::vector<double> a(mat.begin(), mat.end());
+      double det = 1.0;
+      for (std::size_t k = 0; k < n; k++) {
+        std::size_t pivot = k;
+        for (std::size_t i = k + 1; i < n; i++) {
+          if (std::abs(a[i * n + k]) > std::abs(a[pivot * n + k])) {
+            pivot = i;
+          }
+        }
+        if (a[pivot * n + k] == 0.0) {
+          return 0.0;
+        }
+        if (pivot != k) {
+          for (std::size_t j = 0; j < n; j++) {
+            std::swap(a[k * n + j], a[pivot * n + j]);
+          }
+          det = -det;
+        }
+        det *= a[k * n + k];
+        for (std::size_t i = k + 1; i < n; i++) {
+          double f = a[i * n + k] / a[k * n + k];
+          for (std::size_t j = k + 1; j < n; j++) {
+            a[i * n + j] -= f * a[k * n + j];
+          }
+        }
+      }
+      return det;
+    }
+
+    // Sample means and covariance matrix of the given rows of the observations
+    inline MCDEstimate mean_and_covariance(
+        const af::const_ref< double, af::c_grid<2> > &obs,
+        const std::size_t *rows,
+        std::size_t nrows) {
+      std::size_t nparam = obs.accessor()[1];
+      DIALS_ASSERT(nrows > 1);
+
+      af::shared<double> mean(nparam, 0.0);
+      for (std::size_t k = 0; k < nrows; k++) {
+        for (std::size_t j = 0; j < nparam; j++) {
+          mean[j] += obs(rows[k], j);
+        }
+      }
+      for (std::size_t j = 0; j < nparam; j++) {
+        mean[j] /= nrows;
+      }
+
+      af::versa< double, af::c_grid<2> > cov(
+          af::c_grid<2>(nparam, nparam), 0.0);
+      for (std::size_t i = 0; i < nparam; i++) {
+        for (std::size_t j = i; j < nparam; j++) {
+          double sum = 0.0;
+          for (std::size_t k = 0; k < nrows; k++) {
+            sum += (obs(rows[k], i) - mean[i]) * (obs(rows[k], j) - mean[j]);
+          }
+          cov(i, j) = sum / (nrows - 1);
+          cov(j, i) = cov(i, j);
+        }
+      }
+      return MCDEstimate(mean, cov, determinant_via_lu(cov.const_ref()));
+    }
+
+    // Order row indices by squared Mahalanobis distance, breaking ties by
+    // index so that the selected subset does not depend on the sort
+    struct distance_less {
+      const af::shared<double> &d2;
+      distance_less(const af::shared<double> &d2_) : d2(d2_) {}
+      bool operator()(std::size_t a, std::size_t b) const {
+        return d2[a] < d2[b] || (d2[a] == d2[b] && a < b);
+      }
+    };
+
+    // A single concentration step (Theorem 1 of Rousseeuw & van Driessen).
+    // Return the estimate over the h observations closest to the current one
+    inline MCDEstimate concentration_step(
+        const af::const_ref< double, af::c_grid<2> > &obs,
+        std::size_t h,
+        const MCDEstimate &current) {
+      std::size_t nobs = obs.accessor()[0];
+      af::shared<double> d2 = maha_dist_sq(obs,
+          current.location.const_ref(), current.covariance.const_ref());
+      std::vector<std::size_t> index(nobs);
+      for (std::size_t i = 0; i < nobs; i++) {
+        index[i] = i;
+      }
+      if (h < nobs) {
+        std::nth_element(index.begin(), index.begin() + h, index.end(),
+            distance_less(d2));
+      }
+      std::sort(index.begin(), index.begin() + h);
+      return mean_and_covariance(obs, &index[0], h);
+    }
+
+  } // namespace detail
+
+  // Form an initial estimate by method 2 of subsection 3.1 of Rousseeuw & van
+  // Driessen: starting from the first p + 1 rows of the random permutation,
+  // grow the subset until its covariance matrix is not singular, then take
+  // a concentration step to a subset of size h, followed by nsteps more.
+  inline MCDEstimate mcd_initial_estimate(
+      const af::const_ref< double, af::c_grid<2> > &obs,
+      std::size_t h,
+      const af::const_ref< std::size_t > &permutation,
+      std::size_t nsteps) {
+    std::size_t nobs = obs.accessor()[0];
+    std::size_t nparam = obs.accessor()[1];
+    DIALS_ASSERT(permutation.size() == nobs);
+    DIALS_ASSERT(h > nparam && h <= nobs);
+    for (std::size_t i = 0; i < nobs; i++) {
+      DIALS_ASSERT(permutation[i] < nobs);
+    }
+
+    // draw random p+1 subset J (or larger if required)
+    std::size_t subset_size = nparam + 1;
+    MCDEstimate current = detail::mean_and_covariance(obs, permutation.begin(),
+        subset_size);
+    while (!(current.determinant > 0.0)) {
+      subset_size++;
+      DIALS_ASSERT(subset_size <= nobs);
+      current = detail::mean_and_covariance(obs, permutation.begin(),
+          subset_size);
+    }
+    current = detail::concentration_step(obs, h, current);
+
+    for (std::size_t i = 0; i < nsteps; i++) {
+      MCDEstimate next = detail::concentration_step(obs, h, current);
+
+      // the determinant cannot increase by Theorem 1. In practice (rounding
+      // errors?) this is not always the case, so only ensure that it does not
+      // increase by more than one billionth of its value
+      DIALS_ASSERT(current.determinant >
+          (next.determinant - next.determinant / 1.e9));
+      current = next;
+    }
+    return current;
+  }
+
+  // Take up to max_steps concentration steps from the start estimate. If
+  // stop_at_convergence, stop as soon as the determinant is unchanged by a
+  // step. Return the estimate from the last step.
+  inline MCDEstimate mcd_concentration_steps(
+      const af::const_ref< double, af::c_grid<2> > &obs,
+      std::size_t h,
+      const MCDEstimate &start,
+      std::size_t max_steps,
+      bool stop_at_convergence) {
+    std::size_t nobs = obs.accessor()[0];
+    std::size_t nparam = obs.accessor()[1];
+    DIALS_ASSERT(h > nparam && h <= nobs);
+    DIALS_ASSERT(start.location.size() == nparam);
+    MCDEstimate current = start;
+    for (std::size_t i = 0; i < max_steps; i++) {
+      MCDEstimate next = detail::concentration_step(obs, h, current);
+      bool converged = next.determinant == current.determinant;
+      current = next;
+      if (stop_at_convergence && converged) {
+        break;
+      }
+    }
+    return current;
+  }
+
+}} // namespace dials::refinement
+
+#endif // DIALS_REFINEMENT_FAST_MCD_H
@@ -8,7 +8,7 @@
 
 namespace dials { namespace refinement {
 
-  af::shared<double> maha_dist_sq(
+  inline af::shared<double> maha_dist_sq(
       const af::const_ref< double, af::c_grid<2> > &obs,
       const af::const_ref< double> &center,
       const af::const_ref< double, af::c_grid<2> > &cov){
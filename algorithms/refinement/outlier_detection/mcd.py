@@ -33,7 +33,8 @@ def __init__(self, cols=None,
                k1=2,
                k2=2,
                k3=100,
-               threshold_probability=0.975):
+               threshold_probability=0.975,
+               random_seed=None):
 
     if cols is None:
       cols = ["x_resid", "y_resid", "phi_resid"]
@@ -53,6 +54,12 @@ def __init__(self, cols=None,
     self._k2 = k2
     self._k3 = k3
 
+    # Use the same seed for the random subsets of every job, so that the
+    # results do not depend on the order in which jobs are processed
+    if random_seed is None:
+      random_seed = flex.random_size_t(1, 2**31)[0]
+    self._random_seed = random_seed
+
     # Calculate Mahalanobis distance threshold
     df = len(cols)
     self._mahasq_cutoff = qchisq(threshold_probability, df)
@@ -70,7 +77,8 @@ def _detect_outliers(self, cols):
                        n_trials = self._n_trials,
                        k1 = self._k1,
                        k2 = self._k2,
-                       k3 = self._k3)
+                       k3 = self._k3,
+                       seed = self._random_seed)
 
     # get location and MCD scatter estimate
     T, S = fast_mcd.get_corrected_T_and_S()
@@ -40,6 +40,9 @@ def __init__(self, cols=None,
 
     self._verbosity = 0
 
+    # the number of processes over which to spread the jobs
+    self._nproc = 1
+
     return
 
   def get_block_width(self, exp_id=None):
@@ -62,6 +65,12 @@ def set_verbosity(self, verbosity):
     logger.disabled = (verbosity == 0)
     self._verbosity = verbosity
 
+  def set_nproc(self, nproc):
+    """Set the number of processes over which the independent outlier
+    detection jobs are spread. Each job is processed identically in serial or
+    in parallel, so the result does not depend on this number."""
+    self._nproc = nproc
+
   def _detect_outliers(cols):
     """Perform outlier detection using the input cols and return a flex.bool
     indicating which rows in the cols are considered outlying. cols should be
@@ -169,6 +178,26 @@ def __call__(self, reflections):
     header.extend(['Nref', 'Nout', '%out'])
     rows = []
 
+    # determine the position of outliers in each of the lowest level of splits
+    # that has enough reflections. These jobs are independent, so they may be
+    # spread over a pool of processes
+    to_detect = [i for i, job in enumerate(jobs3)
+                 if len(job['indices']) >= self._min_num_obs]
+    def detect_outliers(i):
+      # get the subset of data as a list of columns
+      data = jobs3[i]['data']
+      cols = [data[col] for col in self._cols]
+      return self._detect_outliers(cols)
+    if self._nproc > 1 and len(to_detect) > 1:
+      from libtbx import easy_mp
+      results = easy_mp.pool_map(
+        fixed_func=detect_outliers,
+        iterable=to_detect,
+        processes=self._nproc)
+    else:
+      results = [detect_outliers(i) for i in to_detect]
+    job_outliers = dict(zip(to_detect, results))
+
     # now loop over the lowest level of splits
     for i, job in enumerate(jobs3):
 
@@ -180,14 +209,8 @@ def __call__(self, reflections):
 
       if nref >= self._min_num_obs:
 
-        # get the subset of data as a list of columns
-        cols = [data[col] for col in self._cols]
-
-        # determine the position of outliers on this sub-dataset
-        outliers = self._detect_outliers(cols)
-
         # get positions of outliers from the original matches
-        ioutliers = indices.select(outliers)
+        ioutliers = indices.select(job_outliers[i])
 
       elif nref > 0:
         # too few reflections in the job
@@ -368,7 +391,8 @@ def __call__(self, reflections):
 class CentroidOutlierFactory(object):
 
   @classmethod
-  def from_parameters_and_colnames(cls, params, colnames, verbosity=0):
+  def from_parameters_and_colnames(cls, params, colnames, verbosity=0,
+                                   nproc=1):
 
     # id the relevant scope for the requested method
     method = params.outlier.algorithm
@@ -399,6 +423,7 @@ def from_parameters_and_colnames(cls, params, colnames, verbosity=0):
       block_width=params.outlier.block_width,
       **kwargs)
     od.set_verbosity(verbosity)
+    od.set_nproc(nproc)
     return od
 
 if __name__ == "__main__":
@@ -299,25 +299,25 @@ def get_gradients(self, reflections, callback=None):
     self._setting_rotation = flex.mat3_double(self._nref)
 
     # Set up experiment to index mapping
-    self._experiment_to_idx = []
+    self._experiment_to_idx = reflections.split_indices_by_experiment_id(
+      len(self._experiments))
 
     # Populate values in these arrays
     for iexp, exp in enumerate(self._experiments):
 
-      sel = reflections['id'] == iexp
-      isel = sel.iselection()
-      self._experiment_to_idx.append(isel)
-      subref = reflections.select(sel)
+      isel = self._experiment_to_idx[iexp]
+      if len(isel) == 0: continue
+      subref = reflections.select(isel)
       states = self._get_model_data_for_experiment(exp, subref)
 
-      self._D.set_selected(sel, states['D'])
-      self._s0.set_selected(sel, states['s0'])
-      self._U.set_selected(sel, states['U'])
-      self._B.set_selected(sel, states['B'])
+      self._D.set_selected(isel, states['D'])
+      self._s0.set_selected(isel, states['s0'])
+      self._U.set_selected(isel, states['U'])
+      self._B.set_selected(isel, states['B'])
       if exp.goniometer:
-        self._setting_rotation.set_selected(sel, states['S'])
-        self._axis.set_selected(sel, exp.goniometer.get_rotation_axis_datum())
-        self._fixed_rotation.set_selected(sel, exp.goniometer.get_fixed_rotation())
+        self._setting_rotation.set_selected(isel, states['S'])
+        self._axis.set_selected(isel, exp.goniometer.get_rotation_axis_datum())
+        self._fixed_rotation.set_selected(isel, exp.goniometer.get_fixed_rotation())
 
     # Other derived values
     self._h = reflections['miller_index'].as_vec3_double()
@@ -699,8 +699,62 @@ def _grads_goniometer_loop(self, reflections, results, callback=None):
 
     return results
 
+class BlockSparseGradient(object):
+  """Storage for the gradients of one type of residual with respect to one
+  parameter, for m reflections. A parameterisation only affects the
+  reflections of its own experiments, so the gradient is kept as a list of
+  blocks, each consisting of the indices of a subset of the reflections and
+  the values of the gradient for those reflections. All other elements are
+  zero. The blocks must not overlap. Memory use and the cost of building a
+  Jacobian or of dot products with a dense vector are therefore proportional
+  to the number of non-zero elements, not to m."""
+
+  def __init__(self, m):
+    self._size = m
+    self._blocks = []
+
+  def size(self):
+    return self._size
+
+  def set_selected(self, indices, values):
+    """Set the elements at the given indices, which must not already have
+    been set"""
+
+    self._blocks.append((indices, values))
+
+  def non_zeroes(self):
+    return sum(len(indices) for indices, _ in self._blocks)
+
+  def as_dense_vector(self):
+    result = flex.double(self._size, 0.)
+    for indices, values in self._blocks:
+      result.set_selected(indices, values)
+    return result
+
+  def set_in_column(self, column, offset=0):
+    """Set the elements in a sparse matrix column, for the rows starting at
+    the offset"""
+
+    for indices, values in self._blocks:
+      column.set_selected(indices + offset, values)
+    return column
+
+  def dot(self, vector, offset=0):
+    """Dot product with the elements of a dense vector starting at the
+    offset"""
+
+    return sum(flex.sum(vector.select(indices + offset) * values)
+               for indices, values in self._blocks)
+
+  def weighted_dot(self, weights, offset=0):
+    """Weighted dot product of the gradient with itself, with the weights
+    given by the elements of a dense vector starting at the offset"""
+
+    return sum(flex.sum(weights.select(indices + offset) * values * values)
+               for indices, values in self._blocks)
+
 class SparseGradientVectorMixin(object):
-  """Mixin class to use sparse vectors for storage of gradients of the
+  """Mixin class to use block-sparse vectors for storage of gradients of the
   prediction formula"""
 
   @staticmethod
@@ -709,15 +763,13 @@ def _extend_gradient_vectors(results, m, n,
     """Extend results list by n empty results. These will each be a dictionary
     indexed by the given keys. The value for each key will be an empty vector of
     size m, to store the derivatives of n parameters, for m reflections.
-    This is the sparse vector version."""
-
-    from scitbx import sparse
+    This is the block-sparse vector version."""
 
     new_results = []
     for i in range(n):
       result = {}
       for key in keys:
-        result[key] = sparse.matrix_column(m)
+        result[key] = BlockSparseGradient(m)
       new_results.append(result)
     results.extend(new_results)
 
@@ -73,9 +73,9 @@ def compose(self, t):
     mu1_set, mu2_set, nu_set = self._param
 
     # extract data at time t using the smoother
-    mu1, mu1_weights, mu1_sumweights = self._smoother.value_weight(t, mu1_set)
-    mu2, mu2_weights, mu2_sumweights = self._smoother.value_weight(t, mu2_set)
-    nu, nu_weights, nu_sumweights = self._smoother.value_weight(t, nu_set)
+    mu1, mu1_weights, mu1_sumweights = self._value_weight(t, mu1_set)
+    mu2, mu2_weights, mu2_sumweights = self._value_weight(t, mu2_set)
+    nu, nu_weights, nu_sumweights = self._value_weight(t, nu_set)
 
     # calculate derivatives of values at image t wrt underlying parameters.
     dmu1_dp = mu1_weights * (1. / mu1_sumweights)
@@ -72,9 +72,9 @@ def compose(self, t):
     phi1_set, phi2_set, phi3_set = self._param
 
     # extract angles and other data at time t using the smoother
-    phi1, phi1_weights, phi1_sumweights = self._smoother.value_weight(t, phi1_set)
-    phi2, phi2_weights, phi2_sumweights = self._smoother.value_weight(t, phi2_set)
-    phi3, phi3_weights, phi3_sumweights = self._smoother.value_weight(t, phi3_set)
+    phi1, phi1_weights, phi1_sumweights = self._value_weight(t, phi1_set)
+    phi2, phi2_weights, phi2_sumweights = self._value_weight(t, phi2_set)
+    phi3, phi3_weights, phi3_sumweights = self._value_weight(t, phi3_set)
 
     # calculate derivatives of angles wrt underlying parameters.
     # FIXME write up notes in orange notebook
@@ -154,7 +154,7 @@ def compose(self, t):
     """calculate state and derivatives for model at image number t"""
 
     # extract values and weights at time t using the smoother
-    vals, weights, sumweights = zip(*(self._smoother.value_weight(t,
+    vals, weights, sumweights = zip(*(self._value_weight(t,
       pset) for pset in self._param))
 
     # calculate derivatives of metrical matrix parameters wrt underlying
@@ -56,17 +56,17 @@ def compose(self, t):
     dist_set, shift1_set, shift2_set, tau1_set, tau2_set, tau3_set = self._param
 
     # extract data at time t using the smoother
-    dist, dist_weights, dist_sumweights = self._smoother.value_weight(
+    dist, dist_weights, dist_sumweights = self._value_weight(
       t, dist_set)
-    shift1, shift1_weights, shift1_sumweights = self._smoother.value_weight(
+    shift1, shift1_weights, shift1_sumweights = self._value_weight(
       t, shift1_set)
-    shift2, shift2_weights, shift2_sumweights = self._smoother.value_weight(
+    shift2, shift2_weights, shift2_sumweights = self._value_weight(
       t, shift2_set)
-    tau1, tau1_weights, tau1_sumweights = self._smoother.value_weight(
+    tau1, tau1_weights, tau1_sumweights = self._value_weight(
       t, tau1_set)
-    tau2, tau2_weights, tau2_sumweights = self._smoother.value_weight(
+    tau2, tau2_weights, tau2_sumweights = self._value_weight(
       t, tau2_set)
-    tau3, tau3_weights, tau3_sumweights = self._smoother.value_weight(
+    tau3, tau3_weights, tau3_sumweights = self._value_weight(
       t, tau3_set)
 
     # calculate derivatives of values at image t wrt underlying parameters.
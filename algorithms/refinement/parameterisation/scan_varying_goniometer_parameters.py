@@ -73,8 +73,8 @@ def compose(self, t):
     gamma1_set, gamma2_set = self._param
 
     # extract angles and other data at time t using the smoother
-    gamma1, gamma1_weights, gamma1_sumweights = self._smoother.value_weight(t, gamma1_set)
-    gamma2, gamma2_weights, gamma2_sumweights = self._smoother.value_weight(t, gamma2_set)
+    gamma1, gamma1_weights, gamma1_sumweights = self._value_weight(t, gamma1_set)
+    gamma2, gamma2_weights, gamma2_sumweights = self._value_weight(t, gamma2_set)
 
     # calculate derivatives of angles wrt underlying parameters.
     # FIXME write up notes in orange notebook
@@ -151,8 +151,46 @@ def __init__(self, model, initial_state, param_sets, smoother,
     # parameters
     self._var_cov = None
 
+    # smoothed values and weights at a set of image numbers, keyed by
+    # parameter set (see set_smoothed_frames)
+    self._smoothed = {}
+
     return
 
+  def set_smoothed_frames(self, frames):
+    """evaluate the smoother for each parameter set at all of the image
+    numbers in frames, in a single call per parameter set. Later calls to
+    compose at one of these image numbers use the stored values and weights,
+    for as long as the values of the parameter set are unchanged."""
+
+    self._smoothed = {}
+    frames = sorted(set(frames))
+    # multi_value_weight requires more than one point
+    if len(frames) < 2: return
+    rows = dict((t, i) for i, t in enumerate(frames))
+    for pset in self._param:
+      values, weights, sumweights = self._smoother.multi_value_weight(
+        frames, pset)
+      # the weights matrix has one row per frame
+      weights = weights.transpose()
+      weights = [weights.col(i) for i in range(weights.n_cols)]
+      self._smoothed[pset] = (pset.value, rows, values, weights, sumweights)
+
+    return
+
+  def _value_weight(self, t, pset):
+    """the smoothed value of a parameter set at image number t, with the
+    weights and the sum of the weights, as GaussianSmoother.value_weight"""
+
+    smoothed = self._smoothed.get(pset)
+    # parameter values are replaced, not modified in place, so an identity
+    # check is enough to know the stored values are current
+    if smoothed is not None and smoothed[0] is pset.value:
+      i = smoothed[1].get(t)
+      if i is not None:
+        return smoothed[2][i], smoothed[3][i], smoothed[4][i]
+    return self._smoother.value_weight(t, pset)
+
   def num_samples(self):
     """the number of samples of each parameter"""
     return self._num_samples
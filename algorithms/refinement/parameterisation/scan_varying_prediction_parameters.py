@@ -15,6 +15,64 @@
     XYPhiPredictionParameterisation, SparseGradientVectorMixin
 from collections import namedtuple
 
+class BlockSegments(object):
+  """Sort the reflections of one experiment by block, and by panel within each
+  block, so that each block (and each panel of a block) is a contiguous segment
+  of the sorted indices. States calculated once per block can then be set for
+  all reflections with a single scatter, rather than with a mask per block"""
+
+  _Block = namedtuple('Block', ['frame', 'start', 'end', 'panels'])
+
+  def __init__(self, reflections, isel):
+
+    # sort by panel, then stably by block, so that within each block the
+    # reflections are sorted by panel and otherwise stay in their input order
+    panels = reflections['panel'].select(isel)
+    perm = flex.sort_permutation(panels, stable=True)
+    blocks = reflections['block'].select(isel).select(perm)
+    perm2 = flex.sort_permutation(blocks, stable=True)
+    perm = perm.select(perm2)
+    blocks = blocks.select(perm2)
+
+    # the indices of the reflections, in the sorted order
+    self.order = isel.select(perm)
+    panels = reflections['panel'].select(self.order)
+    centres = reflections['block_centre'].select(self.order)
+
+    # the positions in the sorted order at which each block, and each panel
+    # within a block, starts
+    same_block = blocks[1:] == blocks[:-1]
+    new_panel = ~same_block | (panels[1:] != panels[:-1])
+    block_starts = [0] + list((~same_block).iselection() + 1)
+    panel_starts = [0] + list(new_panel.iselection() + 1)
+    n = len(self.order)
+    block_ends = block_starts[1:] + [n]
+    panel_ends = panel_starts[1:] + [n]
+
+    # can only be false if original block assignment has gone wrong
+    assert (same_block & (centres[1:] != centres[:-1])).count(True) == 0, \
+        "Failing: a block contains reflections that shouldn't be there"
+
+    # the index of the block, and of the panel segment, of each reflection in
+    # the sorted order
+    self.block_index = flex.size_t()
+    for i, (start, end) in enumerate(zip(block_starts, block_ends)):
+      self.block_index.extend(flex.size_t(end - start, i))
+    self.panel_index = flex.size_t()
+    for i, (start, end) in enumerate(zip(panel_starts, panel_ends)):
+      self.panel_index.extend(flex.size_t(end - start, i))
+
+    # the integer frame number nearest the centre of each block, and the
+    # panels hit by its reflections
+    block_panels = [[] for start in block_starts]
+    for start in panel_starts:
+      block_panels[self.block_index[start]].append(panels[start])
+    self.blocks = [self._Block(int(floor(centres[start])), start, end, p)
+                   for start, end, p in zip(block_starts, block_ends,
+                                            block_panels)]
+
+    return
+
 class StateDerivativeCache(object):
   """Keep derivatives of the model states in a memory-efficient format
   by storing each derivative once alongside the indices of reflections affected
@@ -53,26 +111,33 @@ def build_gradients(self, parameterisation, isel=None, imatch=None):
     else:
       raise TypeError("Unrecognised model state derivative type")
 
+    # The rows of the original reflection list for which gradients are
+    # required: first only those relevant to the current gradient calculation
+    # block (i.e. if nproc > 1 or gradient_calculation_blocksize was set), then
+    # only those affected by this parameterisation
+    if imatch is not None:
+      rows = imatch if isel is None else imatch.select(isel)
+    elif isel is not None:
+      rows = isel
+    else:
+      rows = flex.size_t_range(self._nref)
+    n = len(rows)
+
+    # Map rows of the original list to positions in the output array, with n
+    # for those rows that are not required. This avoids reconstituting an
+    # array of the full length for each parameter.
+    position = flex.size_t(self._nref, n)
+    position.set_selected(rows, flex.size_t_range(n))
+
     # Loop over the data for each parameter
     for p_data in entry:
 
-      # Build an empty array of the same length as the original reflection
-      # list used when the cache was filled
-      ds_dp = arr_type(self._nref, null)
+      ds_dp = arr_type(n, null)
 
-      # Reconstitute full array from the cache
+      # Scatter each cached derivative to the positions of its reflections
       for pair in p_data:
-        ds_dp.set_selected(pair.iselection, pair.derivative)
-
-      # First select only elements relevant to the current gradient calculation
-      # block (i.e. if nproc > 1 or gradient_calculation_blocksize was set)
-      if imatch is not None:
-        ds_dp = ds_dp.select(imatch)
-
-      # Now select only those reflections from the full list that are affected
-      # by this parameterisation
-      if isel is not None:
-        ds_dp = ds_dp.select(isel)
+        pos = position.select(pair.iselection)
+        ds_dp.set_selected(pos.select(pos < n), pair.derivative)
 
       yield ds_dp
 
@@ -156,6 +221,9 @@ def __init__(self,
       to_cache.extend(goniometer_parameterisations)
     self._derivative_cache = StateDerivativeCache(to_cache)
 
+    # the segmentation of the last reflection table passed to compose
+    self._block_segments = None
+
     # set up base class
     super(ScanVaryingPredictionParameterisation, self).__init__(
       experiments,
@@ -265,6 +333,27 @@ def _prepare_for_compose(self, reflections, skip_derivatives=False):
 
     return
 
+  def _get_block_segments(self, reflections):
+    """Return a BlockSegments for the reflections of each experiment (or None
+    for an experiment with no reflections). The reflections are split by
+    experiment only when a new reflection table is passed in, which for
+    refinement is once per update of the observations held by the
+    ReflectionManager"""
+
+    cached = self._block_segments
+    if cached is not None and cached[0] is reflections and \
+        cached[1] == len(reflections):
+      return cached[2]
+
+    isels = reflections.split_indices_by_experiment_id(
+      len(self._experiments))
+    segments = [BlockSegments(reflections, isel) if len(isel) > 0 else None
+                for isel in isels]
+
+    # keep a reference to the table, so that its id cannot be reused
+    self._block_segments = (reflections, len(reflections), segments)
+    return segments
+
   def compose(self, reflections, skip_derivatives=False):
     """Compose scan-varying crystal parameterisations at the specified image
     number, for the specified experiment, for each image. Put the varying
@@ -272,13 +361,10 @@ def compose(self, reflections, skip_derivatives=False):
 
     self._prepare_for_compose(reflections, skip_derivatives)
 
-    for iexp, exp in enumerate(self._experiments):
-
-      # select the reflections of interest
-      sel = reflections['id'] == iexp
-      isel = sel.iselection()
+    for iexp, (exp, segments) in enumerate(zip(self._experiments,
+        self._get_block_segments(reflections))):
 
-      blocks = reflections['block'].select(isel)
+      if segments is None: continue
 
       # identify which parameterisations to use for this experiment
       xl_op = self._get_xl_orientation_parameterisation(iexp)
@@ -290,24 +376,23 @@ def compose(self, reflections, skip_derivatives=False):
       # reset current frame cache for scan-varying parameterisations
       self._current_frame = {}
 
-      # get state and derivatives for each block
-      for block in xrange(flex.min(blocks),
-                          flex.max(blocks) + 1):
+      # evaluate the smoothers at the frames of all blocks at once
+      frames = [block.frame for block in segments.blocks]
+      for p in (xl_op, xl_ucp, bp, dp, gp):
+        if hasattr(p, 'num_sets'): p.set_smoothed_frames(frames)
 
-        # determine the subset of reflections this affects
-        subsel = isel.select(blocks == block)
-        if len(subsel) == 0: continue
+      multi_panel = dp is not None and dp.is_multi_state()
 
-        # get the panels hit by these reflections
-        panels = reflections['panel'].select(subsel)
+      # model states for each block, and for each panel of each block for the
+      # detector if it is multi-panel
+      U_blocks, B_blocks, s0_blocks, S_blocks = [], [], [], []
+      d_states, D_states = [], []
 
-        # get the integer frame number nearest the centre of that block
-        frames = reflections['block_centre'].select(subsel)
+      # get state and derivatives for each block
+      for block in segments.blocks:
 
-        # can only be false if original block assignment has gone wrong
-        assert frames.all_eq(frames[0]), \
-            "Failing: a block contains reflections that shouldn't be there"
-        frame = int(floor(frames[0]))
+        frame = block.frame
+        subsel = segments.order[block.start:block.end]
 
         # model states at current frame
         U = self._get_state_from_parameterisation(xl_op, frame)
@@ -322,32 +407,26 @@ def compose(self, reflections, skip_derivatives=False):
         S = self._get_state_from_parameterisation(gp, frame)
         if S is None: S = matrix.sqr(exp.goniometer.get_setting_rotation())
 
-        # set states for crystal, beam and goniometer
-        reflections['u_matrix'].set_selected(subsel, U.elems)
-        reflections['b_matrix'].set_selected(subsel, B.elems)
-        reflections['s0_vector'].set_selected(subsel, s0.elems)
-        reflections['S_matrix'].set_selected(subsel, S.elems)
+        U_blocks.append(U.elems)
+        B_blocks.append(B.elems)
+        s0_blocks.append(s0.elems)
+        S_blocks.append(S.elems)
 
         # set states and derivatives for multi-panel detector
-        if dp is not None and dp.is_multi_state():
+        if multi_panel:
 
-          # loop through the panels in this detector
-          for panel_id, _ in enumerate(exp.detector):
-
-            # get the right subset of array indices to set for this panel
-            subsel2 = subsel.select(panels == panel_id)
-            if len(subsel2) == 0:
-              # if no reflections intersect this panel, skip calculation
-              continue
+          # loop through the panels hit by reflections in this block
+          for panel_id in block.panels:
 
             dmat  = self._get_state_from_parameterisation(dp,
               frame, multi_state_elt=panel_id)
-            if dmat is None: dmat = exp.detector[panel_id].get_d_matrix()
+            if dmat is None:
+              dmat = matrix.sqr(exp.detector[panel_id].get_d_matrix())
             Dmat = exp.detector[panel_id].get_D_matrix()
-            reflections['d_matrix'].set_selected(subsel2, dmat)
-            reflections['D_matrix'].set_selected(subsel2, Dmat)
+            d_states.append(dmat.elems)
+            D_states.append(Dmat)
 
-            if dp is not None and self._varying_detectors and not skip_derivatives:
+            if self._varying_detectors and not skip_derivatives:
               for j, dd in enumerate(dp.get_ds_dp(multi_state_elt=panel_id,
                                                   use_none_as_null=True)):
                 if dd is None: continue
@@ -356,10 +435,10 @@ def compose(self, reflections, skip_derivatives=False):
         else: # set states and derivatives for single panel detector
 
           dmat  = self._get_state_from_parameterisation(dp, frame)
-          if dmat is None: dmat = exp.detector[0].get_d_matrix()
+          if dmat is None: dmat = matrix.sqr(exp.detector[0].get_d_matrix())
           Dmat = exp.detector[0].get_D_matrix()
-          reflections['d_matrix'].set_selected(subsel, dmat)
-          reflections['D_matrix'].set_selected(subsel, Dmat)
+          d_states.append(dmat.elems)
+          D_states.append(Dmat)
 
           if dp is not None and self._varying_detectors and not skip_derivatives:
             for j, dd in enumerate(dp.get_ds_dp(use_none_as_null=True)):
@@ -385,6 +464,23 @@ def compose(self, reflections, skip_derivatives=False):
               if dS is None: continue
               self._derivative_cache.append(gp, j, dS, subsel)
 
+      # scatter the states into the reflection table, one call per column
+      order = segments.order
+      block_index = segments.block_index
+      reflections['u_matrix'].set_selected(order,
+        flex.mat3_double(U_blocks).select(block_index))
+      reflections['b_matrix'].set_selected(order,
+        flex.mat3_double(B_blocks).select(block_index))
+      reflections['s0_vector'].set_selected(order,
+        flex.vec3_double(s0_blocks).select(block_index))
+      reflections['S_matrix'].set_selected(order,
+        flex.mat3_double(S_blocks).select(block_index))
+      detector_index = segments.panel_index if multi_panel else block_index
+      reflections['d_matrix'].set_selected(order,
+        flex.mat3_double(d_states).select(detector_index))
+      reflections['D_matrix'].set_selected(order,
+        flex.mat3_double(D_states).select(detector_index))
+
     # set the UB matrices for prediction
     reflections['ub_matrix'] = reflections['u_matrix'] * reflections['b_matrix']
 
@@ -76,31 +76,97 @@ def __init__(self, experiments, force_stills=False, spherical_relp=False):
     self._force_stills = force_stills
     self._spherical_relp = spherical_relp
 
+    # predictors from previous calls, with the states of the models they were
+    # constructed from, keyed by experiment
+    self._predictors = {}
+
+  def _split_indices(self, reflections):
+    """Return a list of the indices of the reflections belonging to each
+    experiment, splitting the table in a single pass. Reflections with an id
+    that does not refer to an experiment are left out."""
+
+    from dials.array_family import flex
+    n = len(self._experiments)
+    if len(reflections) == 0:
+      return [flex.size_t() for i in range(n)]
+    ids = reflections['id']
+    if flex.min(ids) >= 0 and flex.max(ids) < n:
+      return reflections.split_indices_by_experiment_id(n)
+    isel = ((ids >= 0) & (ids < n)).iselection()
+    if len(isel) == 0:
+      return [flex.size_t() for i in range(n)]
+    return [isel.select(i) for i in
+            reflections.select(isel).split_indices_by_experiment_id(n)]
+
+  def _get_predictor(self, iexp, e, scan_varying, model_state):
+    """Get the predictor for an experiment. The predictors copy the models
+    they are constructed from, so a predictor from a previous call is reused
+    only if the states of those models have not changed since."""
+
+    beam = model_state(e.beam, lambda b: b.get_s0())
+    detector = model_state(e.detector,
+      lambda d: tuple(p.get_d_matrix() for p in d))
+    if not e.goniometer or self._force_stills:
+      # the Nave model also uses the mosaic parameters of the crystal
+      try:
+        mosaicity = (e.crystal.get_half_mosaicity_deg(),
+                     e.crystal.get_domain_size_ang())
+      except AttributeError:
+        mosaicity = None
+      key = ('stills', beam, detector, e.crystal.get_A(), mosaicity)
+      create = lambda: st(e, spherical_relp=self._spherical_relp)
+    else:
+      goniometer = model_state(e.goniometer, lambda g: (
+        g.get_rotation_axis_datum(),
+        g.get_fixed_rotation(),
+        g.get_setting_rotation()))
+      scan = model_state(e.scan, lambda s: (
+        s.get_array_range(), s.get_oscillation()))
+      if scan_varying:
+        key = ('scan-varying', beam, detector, goniometer, scan)
+        create = lambda: sv(e)
+      else:
+        key = ('scan-static', beam, detector, goniometer, scan,
+               e.crystal.get_unit_cell().parameters())
+        create = lambda: sc(e)
+    try:
+      cached_key, predictor = self._predictors[iexp]
+      if cached_key == key:
+        return predictor
+    except KeyError:
+      pass
+    predictor = create()
+    self._predictors[iexp] = (key, predictor)
+    return predictor
+
   def __call__(self, reflections):
     """Predict for all reflections at the current model geometry"""
 
-    if self._force_stills:
-      predictors = [st(e, spherical_relp=self._spherical_relp) \
-                          for e in self._experiments]
-    else:
-      predictors = [sc(e) if e.goniometer else st(e,
-        spherical_relp=self._spherical_relp) for e in self._experiments]
-    self._UBs = [e.crystal.get_A() for e in self._experiments]
+    # the states of models shared between experiments are only found once
+    states = {}
+    def model_state(model, get_state):
+      try:
+        return states[id(model)]
+      except KeyError:
+        state = states[id(model)] = get_state(model)
+        return state
 
-    for iexp, e in enumerate(self._experiments):
+    for iexp, (e, isel) in enumerate(zip(self._experiments,
+                                         self._split_indices(reflections))):
+      if len(isel) == 0:
+        continue
 
       # select the reflections for this experiment only
-      sel = reflections['id'] == iexp
-      refs = reflections.select(sel)
+      refs = reflections.select(isel)
+      scan_varying = 'ub_matrix' in refs
+      predictor = self._get_predictor(iexp, e, scan_varying, model_state)
 
       # stills
       if not e.goniometer or self._force_stills:
-        predictor = st(e, spherical_relp=self._spherical_relp)
         UB = e.crystal.get_A()
         predictor.for_reflection_table(refs, UB)
       # scan-varying
-      elif 'ub_matrix' in refs:
-        predictor = sv(e)
+      elif scan_varying:
         UB = refs['ub_matrix']
         s0 = refs['s0_vector']
         dmat = refs['d_matrix']
@@ -108,12 +174,12 @@ def __call__(self, reflections):
         predictor.for_reflection_table(refs, UB, s0, dmat, Smat)
       # scan static
       else:
-        predictor = sc(e)
         UB = e.crystal.get_A()
         predictor.for_reflection_table(refs, UB)
 
-      # write predictions back to overall reflections
-      reflections.set_selected(sel, refs)
+      # write predictions back to overall reflections. Using the indices
+      # rather than a boolean selection, this is proportional to the number of
+      # reflections for this experiment only
+      reflections.set_selected(isel, refs)
 
     return reflections
-
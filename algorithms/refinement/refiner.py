@@ -20,6 +20,7 @@
 from dxtbx.model.experiment_list import ExperimentList
 from dials.array_family import flex
 from dials.algorithms.refinement.refinement_helpers import ordinal_number
+from dials.util import trace
 from libtbx.phil import parse
 from libtbx.utils import Sorry
 import libtbx
@@ -63,8 +64,11 @@
       .type = int(value_min=1)
       .help = "The number of processes to use. Not all choices of refinement"
               "engine support nproc > 1. Where multiprocessing is possible,"
-              "it is helpful only in certain circumstances, so this is not"
-              "recommended for typical use."
+              "a pool of worker processes is started once per refinement run,"
+              "each holding a block of the reflections. This is most helpful"
+              "for large jobs, such as scan-varying refinement with many"
+              "reflections. Outlier rejection jobs for separate experiments,"
+              "panels and blocks are also spread over this many processes."
   }
 
   verbosity = 0
@@ -1681,7 +1685,7 @@ def config_refman(params, reflections, experiments, do_stills, verbosity):
         colnames = ["x_resid", "y_resid", "phi_resid"]
       from dials.algorithms.refinement.outlier_detection import CentroidOutlierFactory
       outlier_detector = CentroidOutlierFactory.from_parameters_and_colnames(
-        options, colnames, verbosity)
+        options, colnames, verbosity, nproc=params.refinement.mp.nproc)
 
     # override default weighting strategy?
     weighting_strategy = None
@@ -2143,7 +2147,15 @@ def run(self):
       for i, crystal in enumerate(self._experiments.crystals()):
         logger.debug(ordinal_number(i) + ' ' + str(crystal))
 
-    self._refinery.run()
+    # any pool of worker processes started by the refinery lives for the
+    # duration of this run only
+    try:
+      with trace.span('refine', 'refinement',
+                      experiments=len(self._experiments)) as args:
+        self._refinery.run()
+        args['steps'] = self._refinery.get_num_steps()
+    finally:
+      self._refinery.close_worker_pool()
 
     # These involve calculation, so skip them when verbosity is zero, even
     # though the logger is disabled
@@ -245,10 +245,11 @@ def get_gradients(self, reflections, callback=None):
     #B = flex.mat3_double(n)
     #axis = flex.vec3_double(n)
 
+    experiment_to_idx = reflections.split_indices_by_experiment_id(
+      len(self._experiments))
     for iexp, exp in enumerate(self._experiments):
 
-      sel = reflections['id'] == iexp
-      isel = sel.iselection()
+      isel = experiment_to_idx[iexp]
 
       # D matrix array
       panels = reflections['panel'].select(isel)
@@ -398,12 +399,12 @@ class StillsDetectorPredictionParameterisationSparse(SparseGradientVectorMixin,
 class LeastSquaresStillsDetector(LeastSquaresStillsResidualWithRmsdCutoff):
 
   _first_predict = True
-  def predict(self):
+  def predict(self, skip_derivatives=False):
     """perform reflection prediction and update the reflection manager"""
 
     if self._first_predict:
       self._first_predict = False
-      super(LeastSquaresStillsDetector, self).predict()
+      super(LeastSquaresStillsDetector, self).predict(skip_derivatives)
 
       # HACK TO PUT IN A PHI COLUMN, WHICH RAY_INTERSECTION EXPECTS
       reflections = self._reflection_manager.get_obs()
@@ -130,7 +130,7 @@ def _predict_core(self, reflections, skip_derivatives=False):
 
     return reflections
 
-  def predict(self):
+  def predict(self, skip_derivatives=False):
     """perform reflection prediction for the working reflections and update the
     reflection manager"""
 
@@ -141,7 +141,7 @@ def predict(self):
     self._reflection_manager.reset_accepted_reflections()
 
     # predict
-    reflections = self._predict_core(reflections)
+    reflections = self._predict_core(reflections, skip_derivatives)
 
     # set used_in_refinement flag to all those that had predictions
     mask = reflections.get_flags(reflections.flags.predicted)
@@ -152,6 +152,28 @@ def predict(self):
 
     return
 
+  def predict_block(self, reflections):
+    """perform reflection prediction for a block of the working reflections,
+    as taken by get_obs_range, and return the matches within that block. The
+    'imatch' column of the matches indexes the rows of the block, as required
+    for scan-varying gradient calculations"""
+
+    # reset the 'use' flag for the block
+    self._reflection_manager.reset_accepted_reflections(reflections)
+
+    # predict
+    reflections = self._predict_core(reflections)
+
+    # set used_in_refinement flag to all those that had predictions
+    mask = reflections.get_flags(reflections.flags.predicted)
+    reflections.set_flags(mask, reflections.flags.used_in_refinement)
+
+    # collect the matches, keeping track of their rows in the block
+    sel = reflections.get_flags(reflections.flags.used_in_refinement)
+    matches = reflections.select(sel)
+    matches['imatch'] = flex.size_t_range(len(reflections)).select(sel)
+    return matches
+
   def predict_for_free_reflections(self):
     """perform prediction for the reflections not used for refinement"""
 
@@ -275,9 +297,8 @@ def process_one_gradient(result):
       for k in result.keys():
         result[k] = None
       # add new keys
-      grads = self._concatenate_gradients(dX, dY, dZ)
-      result['dL_dp'] = flex.sum(w_resid * grads)
-      result['curvature'] = flex.sum(weights * grads * grads)
+      result['dL_dp'], result['curvature'] = self._gradient_sums(
+        dX, dY, dZ, w_resid, weights)
       return result
 
     results = self.calculate_gradients(matches,
@@ -330,36 +351,63 @@ def compute_residuals(self):
     self.update_matches()
     return self._extract_residuals_and_weights(self._matches)
 
-  def split_matches_into_blocks(self, nproc=1):
+  def split_matches_into_blocks(self, nproc=1, matches=None):
     """Return a list of the matches, split into blocks according to the
     gradient_calculation_blocksize parameter and the number of processes (if relevant).
     The number of blocks will be set such that the total number of reflections
-    being processed by concurrent processes does not exceed gradient_calculation_blocksize"""
+    being processed by concurrent processes does not exceed gradient_calculation_blocksize.
+    If matches are supplied (for example by predict_block) then these are
+    split instead of the full table of matches, only as far as required by
+    gradient_calculation_blocksize"""
 
-    self.update_matches()
+    if matches is None:
+      self.update_matches()
+      matches = self._matches
 
-    # Need to be able to track the indices of the original matches table for
-    # scan-varying gradient calculations. A simple and robust (but slightly
-    # expensive) way to do this is to add an index column to the matches table
-    self._matches['imatch'] = flex.size_t_range(len(self._matches))
+      # Need to be able to track the indices of the original matches table for
+      # scan-varying gradient calculations. A simple and robust (but slightly
+      # expensive) way to do this is to add an index column to the matches table
+      matches['imatch'] = flex.size_t_range(len(matches))
 
     if self._gradient_calculation_blocksize:
-      nblocks = int(floor(len(self._matches) * nproc / self._gradient_calculation_blocksize))
-    else:
+      nblocks = int(floor(len(matches) * nproc / self._gradient_calculation_blocksize))
+    elif matches is self._matches:
       nblocks = nproc
+    else:
+      nblocks = 1
+    return [matches[start:end] for start, end in
+            self._split_range(len(matches), nblocks)]
+
+  @staticmethod
+  def _split_range(n, nblocks):
+    """Split the range 0..n into contiguous (start, end) ranges, with at
+    least 100 rows in each"""
+
     # ensure at least 100 reflections per block
-    nblocks = min(nblocks, int(len(self._matches)/100))
+    nblocks = min(nblocks, int(n/100))
     nblocks = max(nblocks, 1)
-    blocksize = int(floor(len(self._matches) / nblocks))
-    blocks = []
+    blocksize = int(floor(n / nblocks))
+    ranges = []
     for block_num in range(nblocks - 1):
-      start = block_num * blocksize
-      end = (block_num + 1) * blocksize
-      blocks.append(self._matches[start:end])
-    start = (nblocks - 1) * blocksize
-    end = len(self._matches)
-    blocks.append(self._matches[start:end])
-    return blocks
+      ranges.append((block_num * blocksize, (block_num + 1) * blocksize))
+    ranges.append(((nblocks - 1) * blocksize, n))
+    return ranges
+
+  def get_obs(self):
+    """Return the working reflections held by the reflection manager"""
+
+    return self._reflection_manager.get_obs()
+
+  def split_obs_into_ranges(self, nproc=1):
+    """Return (start, end) row ranges that split the working reflections into
+    one contiguous range for each of nproc processes"""
+
+    return self._split_range(len(self._reflection_manager.get_obs()), nproc)
+
+  def get_obs_range(self, start, end):
+    """Return a copy of the working reflections in the range start..end"""
+
+    return self._reflection_manager.get_obs()[start:end]
 
   def compute_residuals_and_gradients(self, block=None):
     """return the vector of residuals plus their gradients and weights for
@@ -426,6 +474,15 @@ def _concatenate_gradients(dX, dY, dZ):
     grads.extend(dZ)
     return grads
 
+  def _gradient_sums(self, dX, dY, dZ, w_resid, weights):
+    """return the dot product of the concatenated gradient vector with the
+    weighted residuals, and the weighted dot product of the gradient vector
+    with itself. This method may be overriden for the case where the gradient
+    vectors use sparse storage"""
+
+    grads = self._concatenate_gradients(dX, dY, dZ)
+    return flex.sum(w_resid * grads), flex.sum(weights * grads * grads)
+
   @abc.abstractmethod
   def _extract_residuals_and_weights(matches):
     """extract vector of residuals and corresponding weights. The space the
@@ -583,29 +640,24 @@ def achieved(self):
 
 class SparseGradientsMixin:
   """Mixin class to build a sparse Jacobian from gradients of the prediction
-  formula stored as sparse vectors, and allow concatenation of gradient vectors
-  that employed sparse storage."""
+  formula stored as block-sparse vectors, and allow concatenation of gradient
+  vectors that employed sparse storage."""
 
   @staticmethod
   def _build_jacobian(dX_dp, dY_dp, dZ_dp, nelem=None, nparam=None):
-    """construct Jacobian from lists of sparse gradient vectors."""
+    """construct Jacobian from lists of block-sparse gradient vectors."""
 
     nref = int(nelem / 3)
-    X_mat = sparse.matrix(nref, nparam)
-    Y_mat = sparse.matrix(nref, nparam)
-    Z_mat = sparse.matrix(nref, nparam)
     jacobian = sparse.matrix(nelem, nparam)
 
-    # loop over parameters, building full width blocks of the full Jacobian
+    # loop over parameters, setting the blocks of each gradient vector
+    # directly in a column of the full Jacobian
     for i in range(nparam):
-      X_mat[:,i] = dX_dp[i]
-      Y_mat[:,i] = dY_dp[i]
-      Z_mat[:,i] = dZ_dp[i]
-
-    # set the blocks in the Jacobian
-    jacobian.assign_block(X_mat, 0, 0)
-    jacobian.assign_block(Y_mat, nref, 0)
-    jacobian.assign_block(Z_mat, 2*nref, 0)
+      col = sparse.matrix_column(nelem)
+      dX_dp[i].set_in_column(col, 0)
+      dY_dp[i].set_in_column(col, nref)
+      dZ_dp[i].set_in_column(col, 2*nref)
+      jacobian[:,i] = col
 
     return jacobian
 
@@ -620,6 +672,19 @@ def _concatenate_gradients(dX, dY, dZ):
     grads.extend(dZ)
     return grads
 
+  @staticmethod
+  def _gradient_sums(dX, dY, dZ, w_resid, weights):
+    """calculate the gradient of the target and the approximate curvature
+    from only the non-zero blocks of the gradient vectors"""
+
+    nref = dX.size()
+    dL_dp = 0.
+    curvature = 0.
+    for offset, grad in zip((0, nref, 2*nref), (dX, dY, dZ)):
+      dL_dp += grad.dot(w_resid, offset)
+      curvature += grad.weighted_dot(weights, offset)
+    return dL_dp, curvature
+
 class LeastSquaresPositionalResidualWithRmsdCutoffSparse(
   SparseGradientsMixin, LeastSquaresPositionalResidualWithRmsdCutoff):
   """A version of the LeastSquaresPositionalResidualWithRmsdCutoff Target that
@@ -55,7 +55,7 @@ def __init__(self, experiments, reflection_predictor, ref_man,
 
     return
 
-  def  _predict_core(self, reflections):
+  def  _predict_core(self, reflections, skip_derivatives=False):
     """perform prediction for the specified reflections"""
 
     # do prediction (updates reflection table in situ).
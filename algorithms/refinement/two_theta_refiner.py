@@ -106,14 +106,14 @@ class TwoThetaExperimentsPredictor(ExperimentsPredictor):
   def __call__(self, reflections):
     """Predict 2theta angles for all reflections at the current model geometry"""
 
-    for iexp, e in enumerate(self._experiments):
+    for e, isel in zip(self._experiments, self._split_indices(reflections)):
 
       # select the reflections for this experiment only
-      sel = reflections['id'] == iexp
-      refs = reflections.select(sel)
+      if len(isel) == 0: continue
+      hkl = reflections['miller_index'].select(isel)
 
-      B = flex.mat3_double(len(reflections), e.crystal.get_B())
-      r0 = B * reflections['miller_index'].as_vec3_double()
+      B = flex.mat3_double(len(hkl), e.crystal.get_B())
+      r0 = B * hkl.as_vec3_double()
       r0len = r0.norms()
       wl = e.beam.get_wavelength()
 
@@ -121,10 +121,10 @@ def __call__(self, reflections):
       twotheta = 2.0 * flex.asin(0.5 * r0len * wl)
 
       # write predictions back to overall reflections
-      reflections['2theta_cal.rad'].set_selected(sel, twotheta)
+      reflections['2theta_cal.rad'].set_selected(isel, twotheta)
 
       # set predicted flag
-      reflections.set_flags(sel, reflections.flags.predicted)
+      reflections.set_flags(isel, reflections.flags.predicted)
 
     return reflections
 
@@ -147,7 +147,20 @@ def __init__(self, experiments, reflection_predictor, ref_man,
 
     return
 
-  def predict(self):
+  def _predict_core(self, reflections, skip_derivatives=False):
+    """perform prediction for the specified reflections"""
+
+    # set twotheta in place
+    self._reflection_predictor(reflections)
+
+    # calculate  residuals
+    reflections['2theta_resid'] = (reflections['2theta_cal.rad'] -
+                                   reflections['2theta_obs.rad'])
+    reflections['2theta_resid2'] = reflections['2theta_resid']**2
+
+    return reflections
+
+  def predict(self, skip_derivatives=False):
     """perform reflection prediction for the working reflections and update the
     reflection manager"""
 
@@ -157,13 +170,8 @@ def predict(self):
     # reset the 'use' flag for all observations
     self._reflection_manager.reset_accepted_reflections()
 
-    # set twotheta in place
-    self._reflection_predictor(reflections)
-
-    # calculate  residuals
-    reflections['2theta_resid'] = (reflections['2theta_cal.rad'] -
-                                   reflections['2theta_obs.rad'])
-    reflections['2theta_resid2'] = reflections['2theta_resid']**2
+    # set twotheta in place and calculate residuals
+    reflections = self._predict_core(reflections)
 
     # set used_in_refinement flag to all those that had predictions
     mask = reflections.get_flags(reflections.flags.predicted)
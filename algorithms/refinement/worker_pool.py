@@ -0,0 +1,159 @@
+#
+#  Copyright (C) (2018) Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+#
+
+"""A pool of long-lived worker processes for multiprocess refinement. Each
+worker is forked once, keeping a block of the working reflections and a copy
+of the parameterisation resident. For each step of refinement only the
+parameter vector is sent to the workers, which predict their own block of
+reflections and return either partial normal equations or the partial
+functional, gradients and curvatures"""
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+import multiprocessing
+import traceback
+
+def _normal_equations(target, constraints_manager, n_parameters, nproc,
+                      matches):
+  """Accumulate normal equations for the matches in a worker"""
+
+  from scitbx.lstbx import normal_eqns
+  eqns = normal_eqns.non_linear_ls(n_parameters=n_parameters)
+  residuals = []
+  weights = []
+  for block in target.split_matches_into_blocks(nproc=nproc, matches=matches):
+    r, j, w = target.compute_residuals_and_gradients(block)
+    if constraints_manager is not None:
+      j = constraints_manager.constrain_jacobian(j)
+    eqns.add_equations(r, j, w)
+    residuals.append(r)
+    weights.append(w)
+  step_equations = eqns.step_equations()
+  return dict(residuals=residuals,
+              weights=weights,
+              normal_matrix=step_equations.normal_matrix_packed_u(),
+              right_hand_side=step_equations.right_hand_side())
+
+def _functional_gradients_and_curvatures(target, nproc, matches):
+  """Calculate the functional, gradients and curvatures for the matches in a
+  worker, as a list of results for each block"""
+
+  return [target.compute_functional_gradients_and_curvatures(block)
+          for block in target.split_matches_into_blocks(nproc=nproc,
+                                                        matches=matches)]
+
+def _worker(connection, target, parameterisation, constraints_manager,
+            n_parameters, nproc, obs_range):
+  """The function run by each worker process. The target and the
+  parameterisation are inherited from the parent process when the worker is
+  forked"""
+
+  block = target.get_obs_range(*obs_range)
+  while True:
+    message = connection.recv()
+    if message is None:
+      break
+    task, x = message
+    try:
+      parameterisation.set_param_vals(x)
+      matches = target.predict_block(block)
+      if task == "normal_equations":
+        result = _normal_equations(target, constraints_manager, n_parameters,
+          nproc, matches)
+      else:
+        result = _functional_gradients_and_curvatures(target, nproc, matches)
+      connection.send((result, None))
+    except Exception:
+      connection.send((None, traceback.format_exc()))
+  connection.close()
+
+
+class RefinementWorkerPool(object):
+  """A pool of worker processes, each holding a contiguous block of the
+  working reflections of a Target"""
+
+  def __init__(self, target, prediction_parameterisation, constraints_manager,
+               n_parameters, nproc):
+    """Fork the workers. The number of workers may be fewer than nproc if
+    there are not enough reflections to give each a reasonable block"""
+
+    # the working reflections the workers are forked with. The reflection
+    # manager replaces its table when the observations change
+    self._obs = target.get_obs()
+    self._connections = []
+    self._processes = []
+    for obs_range in target.split_obs_into_ranges(nproc):
+      parent, child = multiprocessing.Pipe()
+      process = multiprocessing.Process(target=_worker,
+        args=(child, target, prediction_parameterisation, constraints_manager,
+              n_parameters, nproc, obs_range))
+      process.daemon = True
+      process.start()
+      child.close()
+      self._connections.append(parent)
+      self._processes.append(process)
+    logger.debug("Started %d refinement worker processes", len(self._processes))
+
+  def __len__(self):
+    return len(self._processes)
+
+  def is_current(self, target):
+    """Return True if the workers hold the current working reflections of the
+    target"""
+
+    return target.get_obs() is self._obs
+
+  def _map(self, task, x):
+    """Send the parameter vector to all workers and collect their results"""
+
+    for connection in self._connections:
+      connection.send((task, x))
+    results = []
+    errors = []
+    for connection in self._connections:
+      result, error = connection.recv()
+      results.append(result)
+      if error is not None:
+        errors.append(error)
+    if errors:
+      self.close()
+      raise RuntimeError("Error in refinement worker process:\n" + errors[0])
+    return results
+
+  def normal_equations(self, x):
+    """Return a list of the partial normal equations from each worker, for the
+    expanded parameter vector x"""
+
+    return self._map("normal_equations", x)
+
+  def functional_gradients_and_curvatures(self, x):
+    """Return a list of (functional, gradients, curvatures) tuples for the
+    blocks of reflections held by all workers, for the expanded parameter
+    vector x"""
+
+    results = []
+    for result in self._map("functional_gradients_and_curvatures", x):
+      results.extend(result)
+    return results
+
+  def close(self):
+    """Stop the workers"""
+
+    for connection in self._connections:
+      try:
+        connection.send(None)
+      except (IOError, OSError):
+        pass
+    for process in self._processes:
+      process.join()
+    for connection in self._connections:
+      connection.close()
+    self._connections = []
+    self._processes = []
+    self._obs = None
@@ -1,7 +1,7 @@
 from __future__ import absolute_import, division
 
 def filter_shadowed_reflections(experiments, reflections,
-                                experiment_goniometer=False):
+                                experiment_goniometer=False, nproc=1):
   from dials.util.ext import is_inside_polygon
   from scitbx.array_family import flex
   shadowed = flex.bool(reflections.size(), False)
@@ -16,25 +16,54 @@ def filter_shadowed_reflections(experiments, reflections,
       masker = imageset.masker().format_class(
         imageset.paths()[0]).get_goniometer_shadow_masker()
     detector = expt.detector
+    scan = expt.scan
     sel = reflections['id'] == expt_id
     isel = sel.iselection()
     x,y,z = reflections['xyzcal.px'].select(isel).parts()
-    start, end = expt.scan.get_array_range()
-    for i in range(start, end):
+    panel = reflections['panel'].select(isel)
+
+    # Bucket the reflections by frame once, keeping only those in the scan
+    start, end = scan.get_array_range()
+    frame = flex.floor(z).iround()
+    in_scan = ((frame >= start) & (frame < end)).iselection()
+    in_scan = in_scan.select(flex.sort_permutation(frame.select(in_scan)))
+    if in_scan.size() == 0:
+      continue
+    frames = frame.select(in_scan)
+    bounds = [0]
+    if frames.size() > 1:
+      bounds.extend(
+        list((frames[1:] != frames[:-1]).iselection() + 1))
+    bounds.append(frames.size())
+    groups = [(frames[b0], in_scan[b0:b1])
+              for b0, b1 in zip(bounds[:-1], bounds[1:])]
+
+    # Only compute the shadow for frames that contain reflections
+    def shadow_frame(i_group):
+      i, local = groups[i_group]
       shadow = masker.project_extrema(
-        detector, expt.scan.get_angle_from_array_index(i))
-      img_sel = (z >= i) & (z < (i+1))
-      img_isel = img_sel.iselection()
+        detector, scan.get_angle_from_array_index(i))
+      inside = flex.bool(local.size(), False)
+      local_panel = panel.select(local)
       for p_id in range(len(detector)):
-        panel = reflections['panel'].select(img_isel)
         if shadow[p_id].size() < 4:
           continue
-        panel_isel = img_isel.select(panel == p_id)
-        inside = is_inside_polygon(
+        panel_isel = (local_panel == p_id).iselection()
+        inside.set_selected(panel_isel, is_inside_polygon(
           shadow[p_id],
-          flex.vec2_double(x.select(isel.select(panel_isel)),
-                           y.select(isel.select(panel_isel))))
-        shadowed.set_selected(panel_isel, inside)
+          flex.vec2_double(x.select(local.select(panel_isel)),
+                           y.select(local.select(panel_isel)))))
+      return inside
 
-  return shadowed
+    if nproc > 1 and len(groups) > 1:
+      from libtbx import easy_mp
+      results = easy_mp.pool_map(
+        fixed_func=shadow_frame,
+        iterable=range(len(groups)),
+        processes=nproc)
+    else:
+      results = [shadow_frame(i_group) for i_group in range(len(groups))]
+    for (i, local), inside in zip(groups, results):
+      shadowed.set_selected(isel.select(local), inside)
 
+  return shadowed
@@ -18,8 +18,22 @@ namespace dials { namespace algorithms { namespace boost_python {
 
   BOOST_PYTHON_MODULE(dials_algorithms_simulation_ext)
   {
+    typedef int (*simulate_func)(
+        const BeamBase &, const Detector &, const Goniometer &, const Scan &,
+        double, double, const vec3<double>, double, const int6 &, std::size_t,
+        af::ref< double, af::c_grid<3> >,
+        const af::const_ref<int, af::c_grid<3> > &);
+    typedef int (*simulate_seeded_func)(
+        const BeamBase &, const Detector &, const Goniometer &, const Scan &,
+        double, double, const vec3<double>, double, const int6 &, std::size_t,
+        af::ref< double, af::c_grid<3> >,
+        const af::const_ref<int, af::c_grid<3> > &,
+        std::size_t);
+
+    def("simulate_reciprocal_space_gaussian",
+        (simulate_func)&simulate_reciprocal_space_gaussian);
     def("simulate_reciprocal_space_gaussian",
-        &simulate_reciprocal_space_gaussian);
+        (simulate_seeded_func)&simulate_reciprocal_space_gaussian);
     def("integrate_reciprocal_space_gaussian",
         &integrate_reciprocal_space_gaussian);
   }
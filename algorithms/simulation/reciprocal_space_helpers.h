@@ -38,7 +38,8 @@ namespace dials { namespace algorithms {
 
   /**
    * Simulate a gaussian in reciprocal space and transform back to detector
-   * space.
+   * space. The random number generator is seeded with the given seed, so the
+   * same seed gives the same counts.
    */
   int simulate_reciprocal_space_gaussian(
       const BeamBase &beam,
@@ -52,13 +53,14 @@ namespace dials { namespace algorithms {
       const int6 &bbox,
       std::size_t I,
       af::ref< double, af::c_grid<3> > shoebox,
-      const af::const_ref<int, af::c_grid<3> > &mask) {
+      const af::const_ref<int, af::c_grid<3> > &mask,
+      std::size_t seed) {
 
     vec3<double> s0 = beam.get_s0();
     vec3<double> m2 = goniometer.get_rotation_axis();
 
     // Seed the random number generator
-    boost::random::mt19937 gen(time(0));
+    boost::random::mt19937 gen(seed);
     boost::random::normal_distribution<double> dist_x(0, sigma_b);
     boost::random::normal_distribution<double> dist_y(0, sigma_b);
     boost::random::normal_distribution<double> dist_z(0, sigma_m);
@@ -106,6 +108,28 @@ namespace dials { namespace algorithms {
     return counts;
   }
 
+  /**
+   * Simulate a gaussian in reciprocal space and transform back to detector
+   * space, seeding the random number generator with the current time.
+   */
+  int simulate_reciprocal_space_gaussian(
+      const BeamBase &beam,
+      const Detector &detector,
+      const Goniometer &goniometer,
+      const Scan &scan,
+      double sigma_b,
+      double sigma_m,
+      const vec3<double> s1,
+      double phi,
+      const int6 &bbox,
+      std::size_t I,
+      af::ref< double, af::c_grid<3> > shoebox,
+      const af::const_ref<int, af::c_grid<3> > &mask) {
+    return simulate_reciprocal_space_gaussian(
+        beam, detector, goniometer, scan, sigma_b, sigma_m, s1, phi, bbox,
+        I, shoebox, mask, time(0));
+  }
+
   /**
    * Simulate a gaussian in reciprocal space and transform back to detector
    * space. Estimate the expected intensity within the masked region.
@@ -127,6 +127,20 @@ def generate_phil_scope():
       min_chunksize = 20
         .type = int(value_min=1)
         .help = "When chunksize is auto, this is the minimum chunksize"
+
+      shared_memory = True
+        .type = bool
+        .help = "Pass the strong pixels from the worker processes back"
+                "through files in shared memory rather than pickling them."
+                "Only used when njobs=1."
+        .expert_level = 2
+
+      label_in_workers = False
+        .type = bool
+        .help = "Label the spots on each chunk of images in the worker"
+                "processes and merge the spots crossing chunk boundaries,"
+                "rather than labelling all the pixels in the main process."
+        .expert_level = 2
     }
   }
 
@@ -534,7 +548,9 @@ def from_parameters(params=None, datablock=None):
       min_spot_size             = params.spotfinder.filter.min_spot_size,
       max_spot_size             = params.spotfinder.filter.max_spot_size,
       no_shoeboxes_2d           = no_shoeboxes_2d,
-      min_chunksize             = params.spotfinder.mp.min_chunksize)
+      min_chunksize             = params.spotfinder.mp.min_chunksize,
+      mp_shared_memory          = params.spotfinder.mp.shared_memory,
+      mp_label_in_workers       = params.spotfinder.mp.label_in_workers)
 
   @staticmethod
   def configure_threshold(params, datablock):
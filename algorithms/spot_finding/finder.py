@@ -78,6 +78,7 @@ def __call__(self, index):
     from dials.model.data import PixelList
     from dxtbx.imageset import ImageSweep
     from dials.array_family import flex
+    from dials.util import trace
     from math import ceil
 
     # Parallel reading of HDF5 from the same handle is not allowed. Python
@@ -101,8 +102,9 @@ def __call__(self, index):
     pixel_list = []
 
     # Get the image and mask
-    image = self.imageset.get_corrected_data(index)
-    mask = self.imageset.get_mask(index)
+    with trace.span('read_image', 'spot_finding', image=frame):
+      image = self.imageset.get_corrected_data(index)
+      mask = self.imageset.get_mask(index)
 
     # Set the mask
     if self.mask is not None:
@@ -115,38 +117,40 @@ def __call__(self, index):
     # Add the images to the pixel lists
     num_strong = 0
     average_background = 0
-    for im, mk in zip(image, mask):
-      if self.region_of_interest is not None:
-        x0, x1, y0, y1 = self.region_of_interest
-        height, width = im.all()
-        assert x0 < x1, "x0 < x1"
-        assert y0 < y1, "y0 < y1"
-        assert x0 >= 0, "x0 >= 0"
-        assert y0 >= 0, "y0 >= 0"
-        assert x1 <= width, "x1 <= width"
-        assert y1 <= height, "y1 <= height"
-        im_roi = im[y0:y1,x0:x1]
-        mk_roi = mk[y0:y1,x0:x1]
-        tm_roi = self.threshold_function.compute_threshold(im_roi, mk_roi)
-        threshold_mask = flex.bool(im.accessor(),False)
-        threshold_mask[y0:y1,x0:x1] = tm_roi
-      else:
-        threshold_mask = self.threshold_function.compute_threshold(im, mk)
+    with trace.span('threshold_image', 'spot_finding', image=frame) as span_args:
+      for im, mk in zip(image, mask):
+        if self.region_of_interest is not None:
+          x0, x1, y0, y1 = self.region_of_interest
+          height, width = im.all()
+          assert x0 < x1, "x0 < x1"
+          assert y0 < y1, "y0 < y1"
+          assert x0 >= 0, "x0 >= 0"
+          assert y0 >= 0, "y0 >= 0"
+          assert x1 <= width, "x1 <= width"
+          assert y1 <= height, "y1 <= height"
+          im_roi = im[y0:y1,x0:x1]
+          mk_roi = mk[y0:y1,x0:x1]
+          tm_roi = self.threshold_function.compute_threshold(im_roi, mk_roi)
+          threshold_mask = flex.bool(im.accessor(),False)
+          threshold_mask[y0:y1,x0:x1] = tm_roi
+        else:
+          threshold_mask = self.threshold_function.compute_threshold(im, mk)
 
-      # Add the pixel list
-      plist = PixelList(frame, im, threshold_mask)
-      pixel_list.append(plist)
+        # Add the pixel list
+        plist = PixelList(frame, im, threshold_mask)
+        pixel_list.append(plist)
 
-      # Get average background
-      if self.compute_mean_background:
-        background = im.as_1d().select((mk & ~threshold_mask).as_1d())
-        average_background += flex.mean(background)
+        # Get average background
+        if self.compute_mean_background:
+          background = im.as_1d().select((mk & ~threshold_mask).as_1d())
+          average_background += flex.mean(background)
 
-      # Add to the spot count
-      num_strong += len(plist)
+        # Add to the spot count
+        num_strong += len(plist)
 
-    # Make average background
-    average_background /= len(image)
+      # Make average background
+      average_background /= len(image)
+      span_args['strong_pixels'] = num_strong
 
     # Check total number of strong pixels
     if self.max_strong_pixel_fraction < 1:
@@ -261,20 +265,36 @@ def __init__(self, function):
     Initialise with the function to call
 
     '''
+    from dials.util import trace
     self.function = function
+    self.trace_state = trace.state()
 
   def __call__(self, task):
     '''
-    Call the function with th task and save the IO
+    Call the function with th task and save the IO and trace events
 
     '''
     from dials.util import log
+    from dials.util import trace
     import logging
     log.config_simple_cached()
-    result = self.function(task)
+    with trace.child_process(self.trace_state) as traced:
+      result = self.function(task)
     handlers = logging.getLogger('dials').handlers
     assert len(handlers) == 1, "Invalid number of logging handlers"
-    return result, handlers[0].messages()
+    return result, handlers[0].messages(), traced.events
+
+
+# The task run by each worker of the incremental spot finder. This is set
+# when the worker is started so the imageset is not pickled for every image.
+_incremental_task = None
+
+def _init_incremental_worker(task):
+  global _incremental_task
+  _incremental_task = task
+
+def _run_incremental_task(index):
+  return _incremental_task(index)
 
 
 class PixelListToShoeboxes(object):
@@ -291,10 +311,14 @@ def __init__(self, min_spot_size, max_spot_size, write_hot_pixel_mask):
     self.max_spot_size = max_spot_size
     self.write_hot_pixel_mask = write_hot_pixel_mask
 
-  def __call__(self, imageset, pixel_labeller):
+  def __call__(self, imageset, pixel_labeller, labels=None):
     '''
     Convert the pixel list to shoeboxes
 
+    :param imageset: The imageset
+    :param pixel_labeller: The pixel labeller for each panel
+    :param labels: The spot labels of the pixels on each panel (optional)
+
     '''
     from dxtbx.imageset import ImageSweep
     from dials.array_family import flex
@@ -308,7 +332,18 @@ def __call__(self, imageset, pixel_labeller):
     else:
       twod = True
     for i, (p, hp) in enumerate(zip(pixel_labeller, hotpixels)):
-      if p.num_pixels() > 0:
+      if p.num_pixels() == 0:
+        continue
+      if labels is not None:
+        creator = flex.PixelListShoeboxCreator(
+            p,
+            labels[i],           # labels
+            i,                   # panel
+            0,                   # zrange
+            self.min_spot_size,  # min_pixels
+            self.max_spot_size,  # max_pixels
+            self.write_hot_pixel_mask)
+      else:
         creator = flex.PixelListShoeboxCreator(
             p,
             i,                   # panel
@@ -317,9 +352,9 @@ def __call__(self, imageset, pixel_labeller):
             self.min_spot_size,  # min_pixels
             self.max_spot_size,  # max_pixels
             self.write_hot_pixel_mask)
-        shoeboxes.extend(creator.result())
-        spotsizes.extend(creator.spot_size())
-        hp.extend(creator.hot_pixels())
+      shoeboxes.extend(creator.result())
+      spotsizes.extend(creator.spot_size())
+      hp.extend(creator.hot_pixels())
     logger.info('')
     logger.info('Extracted {0} spots'.format(len(shoeboxes)))
 
@@ -405,13 +440,13 @@ def __init__(self, min_spot_size, max_spot_size, filter_spots, write_hot_pixel_m
     self.shoeboxes_to_reflection_table = ShoeboxesToReflectionTable(
       filter_spots)
 
-  def __call__(self, imageset, pixel_labeller):
+  def __call__(self, imageset, pixel_labeller, labels=None):
     '''
     Convert to reflection table
 
     '''
     shoeboxes, hot_pixels = self.pixel_list_to_shoeboxes(
-      imageset, pixel_labeller)
+      imageset, pixel_labeller, labels)
 
     return self.shoeboxes_to_reflection_table(imageset, shoeboxes), hot_pixels
 
@@ -437,7 +472,9 @@ def __init__(self,
                filter_spots=None,
                no_shoeboxes_2d=False,
                min_chunksize=50,
-               write_hot_pixel_mask=False):
+               write_hot_pixel_mask=False,
+               mp_shared_memory=True,
+               mp_label_in_workers=False):
     '''
     Initialise the class with the strategy
 
@@ -446,6 +483,8 @@ def __init__(self,
     :param mp_method: The multi processing method
     :param nproc: The number of processors
     :param max_strong_pixel_fraction: The maximum number of strong pixels
+    :param mp_shared_memory: Pass strong pixels back through shared memory
+    :param mp_label_in_workers: Label the spots on each chunk in the workers
 
     '''
     # Set the required strategies
@@ -464,6 +503,8 @@ def __init__(self,
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
     self.write_hot_pixel_mask = write_hot_pixel_mask
+    self.mp_shared_memory = mp_shared_memory
+    self.mp_label_in_workers = mp_label_in_workers
 
   def __call__(self, imageset):
     '''
@@ -473,10 +514,106 @@ def __call__(self, imageset):
     :return: The list of spot shoeboxes
 
     '''
-    if not self.no_shoeboxes_2d:
-      return self._find_spots(imageset)
+    from dials.util import trace
+    try:
+      image_range = imageset.get_array_range()
+    except Exception:
+      image_range = (0, len(imageset))
+    with trace.span('extract_spots', 'spot_finding',
+                    image_range=image_range) as span_args:
+      if not self.no_shoeboxes_2d:
+        result = self._find_spots(imageset)
+      else:
+        result = self._find_spots_2d_no_shoeboxes(imageset)
+      if result[0] is not None:
+        span_args['spots'] = len(result[0])
+    return result
+
+  def find_spots_incrementally(self,
+                               imageset,
+                               indices,
+                               callback=None,
+                               max_window=None):
+    '''
+    Find the spots on the images of a sweep as they become available. The
+    images are thresholded by a pool of worker processes and the spots are
+    labelled in 3D one image at a time, so each spot is finished as soon as it
+    can no longer grow.
+
+    :param imageset: The imageset to process
+    :param indices: An iterable giving the index of each image, in order, once
+                    it can be read. This may block while waiting for images.
+    :param callback: A function called with the reflections of each batch of
+                     finished spots, before they are added to the result
+    :param max_window: The maximum number of images spanned by a spot
+    :return: The reflections and a list of per-image statistics
+
+    '''
+    from collections import deque
+    from multiprocessing import Pool
+    from dials.array_family import flex
+    from dials.algorithms.spot_finding.incremental import IncrementalSpotFinder
+    from dials.util import trace
+
+    # The extract pixels function
+    function = ExtractPixelsFromImage(
+        imageset                  = imageset,
+        threshold_function        = self.threshold_function,
+        mask                      = self.mask,
+        max_strong_pixel_fraction = self.max_strong_pixel_fraction,
+        compute_mean_background   = self.compute_mean_background,
+        region_of_interest        = self.region_of_interest)
+
+    # The incremental labelling
+    finder = IncrementalSpotFinder(
+      imageset,
+      min_spot_size = self.min_spot_size,
+      max_spot_size = self.max_spot_size,
+      filter_spots  = self.filter_spots,
+      max_window    = max_window)
+
+    # Collect the finished spots
+    reflections = flex.reflection_table()
+    def process_spots(table):
+      if len(table) > 0:
+        if callback is not None:
+          callback(table)
+        reflections.extend(table)
+
+    logger.info('Extracting strong pixels from images as they arrive')
+    logger.info(' Using multiprocessing with %d parallel job(s)\n' % (
+      self.mp_nproc))
+    if self.mp_nproc > 1:
+
+      # Keep a bounded queue of images being processed so that the results are
+      # handled in order as soon as they are ready
+      def process_output(result):
+        for message in result[1]:
+          logger.log(message.levelno, message.msg)
+        trace.extend(result[2])
+        process_spots(finder.add(result[0].pixel_list))
+      pool = Pool(
+        processes   = self.mp_nproc,
+        initializer = _init_incremental_worker,
+        initargs    = (ExtractSpotsParallelTask(function),))
+      pending = deque()
+      try:
+        for index in indices:
+          pending.append(pool.apply_async(_run_incremental_task, (index,)))
+          while len(pending) > 0 and (pending[0].ready() or
+                                      len(pending) > 2 * self.mp_nproc):
+            process_output(pending.popleft().get())
+        while len(pending) > 0:
+          process_output(pending.popleft().get())
+      finally:
+        pool.terminate()
+        pool.join()
     else:
-      return self._find_spots_2d_no_shoeboxes(imageset)
+      for index in indices:
+        process_spots(finder.add(function(index).pixel_list))
+    process_spots(finder.flush())
+    logger.info('Found %d spots' % len(reflections))
+    return reflections, finder.statistics
 
   def _compute_chunksize(self, nimg, nproc, min_chunksize):
     '''
@@ -507,8 +644,14 @@ def _find_spots(self, imageset):
     from dxtbx.imageset import ImageSweep
     from dials.model.data import PixelListLabeller
     from dials.util.mp import batch_multi_node_parallel_map
+    from dials.util import trace
+    from dials.algorithms.spot_finding.pixel_transport import \
+      ChunkLabelMerger, ExtractPixelsFromChunk, SharedPixelLists, \
+      shared_memory_directory
     from math import floor, ceil
     import platform
+    import shutil
+    import tempfile
 
     # Change the number of processors if necessary
     mp_nproc = self.mp_nproc
@@ -568,22 +711,51 @@ def _find_spots(self, imageset):
       logger.info(' Using %s with %d parallel job(s) and %d processes per node\n' % (mp_method, mp_njobs, mp_nproc))
     else:
       logger.info(' Using multiprocessing with %d parallel job(s)\n' % (mp_nproc))
+    labels = None
     if mp_nproc > 1 or mp_njobs > 1:
+
+      # Files in shared memory can only be used if all processes are on this
+      # node. If the spots are labelled in the workers, each task is a chunk
+      # of consecutive images and the labels are merged across chunks here.
+      twod = not isinstance(imageset, ImageSweep)
+      directory = None
+      if self.mp_shared_memory and mp_njobs == 1:
+        directory = tempfile.mkdtemp(
+          prefix='dials_find_spots_', dir=shared_memory_directory())
+      if self.mp_label_in_workers:
+        indices = [(i, min(i + mp_chunksize, len(imageset)))
+                   for i in range(0, len(imageset), mp_chunksize)]
+        mp_chunksize = 1
+        label_merger = [ChunkLabelMerger(twod) for p in range(num_panels)]
       def process_output(result):
         for message in result[1]:
           logger.log(message.levelno, message.msg)
-        assert len(pixel_labeller) == len(result[0].pixel_list), "Inconsistent size"
-        for plabeller, plist in zip(pixel_labeller, result[0].pixel_list):
-          plabeller.add(plist)
-        result[0].pixel_list = None
-      batch_multi_node_parallel_map(
-        func           = ExtractSpotsParallelTask(function),
-        iterable       = indices,
-        nproc          = mp_nproc,
-        njobs          = mp_njobs,
-        cluster_method = mp_method,
-        chunksize      = mp_chunksize,
-        callback       = process_output)
+        trace.extend(result[2])
+        chunk = result[0]
+        if isinstance(chunk, SharedPixelLists):
+          chunk = chunk.read()
+        for pixel_list in chunk.pixel_lists:
+          assert len(pixel_labeller) == len(pixel_list), "Inconsistent size"
+          for plabeller, plist in zip(pixel_labeller, pixel_list):
+            plabeller.add(plist)
+        if chunk.labels is not None:
+          for i, merger in enumerate(label_merger):
+            merger.add([p[i] for p in chunk.pixel_lists], chunk.labels[i])
+      try:
+        batch_multi_node_parallel_map(
+          func           = ExtractSpotsParallelTask(ExtractPixelsFromChunk(
+            function, directory, self.mp_label_in_workers, twod)),
+          iterable       = indices,
+          nproc          = mp_nproc,
+          njobs          = mp_njobs,
+          cluster_method = mp_method,
+          chunksize      = mp_chunksize,
+          callback       = process_output)
+      finally:
+        if directory is not None:
+          shutil.rmtree(directory, ignore_errors=True)
+      if self.mp_label_in_workers:
+        labels = [merger.labels_after_merge() for merger in label_merger]
     else:
       for task in indices:
         result = function(task)
@@ -598,7 +770,8 @@ def process_output(result):
       self.max_spot_size,
       self.filter_spots,
       self.write_hot_pixel_mask)
-    return converter(imageset, pixel_labeller)
+    with trace.span('label_pixels', 'spot_finding'):
+      return converter(imageset, pixel_labeller, labels)
 
   def _find_spots_2d_no_shoeboxes(self, imageset):
     '''
@@ -612,6 +785,7 @@ def _find_spots_2d_no_shoeboxes(self, imageset):
     from dxtbx.imageset import ImageSweep
     from dials.model.data import PixelListLabeller
     from dials.util.mp import batch_multi_node_parallel_map
+    from dials.util import trace
     from math import floor, ceil
     import platform
 
@@ -677,6 +851,7 @@ def _find_spots_2d_no_shoeboxes(self, imageset):
       def process_output(result):
         for message in result[1]:
           logger.log(message.levelno, message.msg)
+        trace.extend(result[2])
         reflections.extend(result[0][0])
         result[0][0] = None
       batch_multi_node_parallel_map(
@@ -719,7 +894,9 @@ def __init__(self,
                min_spot_size=1,
                max_spot_size=20,
                no_shoeboxes_2d=False,
-               min_chunksize=50):
+               min_chunksize=50,
+               mp_shared_memory=True,
+               mp_label_in_workers=False):
     '''
     Initialise the class.
 
@@ -748,6 +925,8 @@ def __init__(self,
     self.mp_njobs = mp_njobs
     self.no_shoeboxes_2d = no_shoeboxes_2d
     self.min_chunksize = min_chunksize
+    self.mp_shared_memory = mp_shared_memory
+    self.mp_label_in_workers = mp_label_in_workers
 
   def __call__(self, datablock):
     '''
@@ -800,16 +979,49 @@ def __call__(self, datablock):
     # Return the reflections
     return reflections
 
-  def _find_spots_in_imageset(self, imageset):
+  def find_spots_incrementally(self,
+                               imageset,
+                               indices,
+                               callback=None,
+                               max_window=None):
     '''
-    Do the spot finding.
+    Do the spot finding on the images of a sweep as they arrive.
 
     :param imageset: The imageset to process
-    :return: The observed spots
+    :param indices: An iterable giving the index of each image as it arrives
+    :param callback: A function called with the reflections of each batch of
+                     finished spots
+    :param max_window: The maximum number of images spanned by a spot
+    :return: The observed spots and a list of per-image statistics
 
     '''
     from dials.array_family import flex
-    from dxtbx.imageset import ImageSweep
+
+    # Set the strong spot flag on the finished spots
+    def set_flags(table):
+      table['id'] = flex.int(table.nrows(), 0)
+      table.set_flags(
+        flex.size_t_range(len(table)),
+        table.flags.strong)
+      if callback is not None:
+        callback(table)
+
+    # Find the spots
+    extract_spots = self._create_extract_spots(imageset)
+    reflections, statistics = extract_spots.find_spots_incrementally(
+      imageset, indices, set_flags, max_window)
+    if len(reflections) == 0:
+      reflections['id'] = flex.int()
+    return reflections, statistics
+
+  def _create_extract_spots(self, imageset):
+    '''
+    Create the spot finding algorithm for the imageset.
+
+    :param imageset: The imageset to process
+    :return: The spot finding algorithm
+
+    '''
 
     # The input mask
     mask = self.mask_generator.generate(imageset)
@@ -817,7 +1029,7 @@ def _find_spots_in_imageset(self, imageset):
       mask = tuple(m1 & m2 for m1, m2 in zip(mask, self.mask))
 
     # Set the spot finding algorithm
-    extract_spots = ExtractSpots(
+    return ExtractSpots(
       threshold_function        = self.threshold_function,
       mask                      = mask,
       region_of_interest        = self.region_of_interest,
@@ -832,7 +1044,23 @@ def _find_spots_in_imageset(self, imageset):
       filter_spots              = self.filter_spots,
       no_shoeboxes_2d           = self.no_shoeboxes_2d,
       min_chunksize             = self.min_chunksize,
-      write_hot_pixel_mask      = self.write_hot_mask)
+      write_hot_pixel_mask      = self.write_hot_mask,
+      mp_shared_memory          = self.mp_shared_memory,
+      mp_label_in_workers       = self.mp_label_in_workers)
+
+  def _find_spots_in_imageset(self, imageset):
+    '''
+    Do the spot finding.
+
+    :param imageset: The imageset to process
+    :return: The observed spots
+
+    '''
+    from dials.array_family import flex
+    from dxtbx.imageset import ImageSweep
+
+    # Set the spot finding algorithm
+    extract_spots = self._create_extract_spots(imageset)
 
     # Get the max scan range
     if isinstance(imageset, ImageSweep):
@@ -0,0 +1,367 @@
+#
+# incremental.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+'''
+Find spots on images as they arrive, rather than after the whole sweep has
+been collected.
+
+The strong pixels on each new image are labelled in 2D and joined to the
+spots on the previous image, so the 3D labelling is kept up to date one
+image at a time. Only the images holding pixels of spots which are still
+open are kept. A spot which has no pixels on the newest image can no longer
+grow, so it is finished and passed on straight away.
+
+'''
+
+from __future__ import absolute_import, division
+
+import logging
+
+from dials.algorithms.spot_finding.pixel_transport import UnionFind
+
+logger = logging.getLogger(__name__)
+
+
+class LabelledFrame(object):
+  '''
+  The strong pixels of spots which are still open on one frame.
+
+  '''
+
+  def __init__(self, frame, index, value, ids):
+    self.frame = frame
+    self.index = index
+    self.value = value
+    self.ids = ids
+
+  def select(self, selection):
+    return LabelledFrame(
+      self.frame,
+      self.index[selection],
+      self.value[selection],
+      self.ids[selection])
+
+
+class IncrementalLabeller(UnionFind):
+  '''
+  A class to label the strong pixels on one panel in 3D as the images arrive
+  in order.
+
+  '''
+
+  def __init__(self, size, max_window=None):
+    '''
+    Initialise the labeller
+
+    :param size: The size of the panel (height, width)
+    :param max_window: The maximum number of images spanned by a spot. Spots
+                       still open after this many images (for example from
+                       hot pixels) are discarded.
+
+    '''
+    super(IncrementalLabeller, self).__init__()
+    self.size = size
+    self.max_window = max_window
+    self.window = []
+    self.next_id = 0
+    self.discarded = set()
+    self.num_discarded = 0
+
+  def add(self, pixel_list):
+    '''
+    Add the strong pixels on the next image.
+
+    :param pixel_list: The pixel list for the image on this panel
+    :return: The pixel lists and labels of the finished spots, or None
+
+    '''
+    import numpy
+    from dials.model.data import PixelListLabeller
+
+    # If an image is missing all the open spots are finished. The spots on
+    # this image are then all still open.
+    frame = pixel_list.frame()
+    if len(self.window) > 0 and self.window[-1].frame != frame - 1:
+      finished = self.flush()
+      self.add(pixel_list)
+      return finished
+
+    # Label the pixels in 2D with new ids
+    index = pixel_list.index().as_numpy_array().astype(numpy.int64)
+    value = pixel_list.value().as_numpy_array()
+    if len(index) > 0:
+      labeller = PixelListLabeller()
+      labeller.add(pixel_list)
+      ids = labeller.labels_2d().as_numpy_array().astype(numpy.int64)
+      ids += self.next_id
+      self.next_id = int(ids.max()) + 1
+    else:
+      ids = numpy.zeros(0, dtype=numpy.int64)
+
+    # Join the spots to those with pixels at the same position on the previous
+    # image. Both lists of pixels are sorted by index.
+    if len(self.window) > 0 and len(index) > 0:
+      previous = self.window[-1]
+      if len(previous.index) > 0:
+        position = numpy.searchsorted(previous.index, index)
+        position[position == len(previous.index)] = 0
+        match = previous.index[position] == index
+        pairs = set(zip(
+          previous.ids[position[match]].tolist(),
+          ids[match].tolist()))
+        for a, b in pairs:
+          discarded = (self.find(a) in self.discarded or
+                       self.find(b) in self.discarded)
+          root = self.union(a, b)
+          if discarded:
+            self.discarded.add(root)
+    self.window.append(LabelledFrame(frame, index, value, ids))
+
+    # Discard the spots which have been open for too long
+    if (self.max_window is not None and
+        frame - self.window[0].frame + 1 > self.max_window):
+      roots = self.roots(self.window[0].ids)
+      active = set(self.roots(ids).tolist())
+      for root in set(roots.tolist()) & active:
+        if root not in self.discarded:
+          self.discarded.add(root)
+          self.num_discarded += 1
+    if len(self.discarded) > 0:
+      self.remove(self.discarded, newest=False)
+
+    # Spots which have no pixels on this image are finished. The labels of
+    # the discarded spots which are now closed are forgotten.
+    active = self.roots(self.window[-1].ids)
+    result = self.finish(active, invert=True)
+    closed = self.discarded - set(active.tolist())
+    if len(closed) > 0:
+      self.prune(closed)
+      self.discarded -= closed
+    return result
+
+  def flush(self):
+    '''
+    Finish all the open spots.
+
+    :return: The pixel lists and labels of the finished spots, or None
+
+    '''
+    import numpy
+    if len(self.discarded) > 0:
+      self.remove(self.discarded, newest=True)
+      self.prune(self.discarded)
+      self.discarded = set()
+    result = self.finish(numpy.zeros(0, dtype=numpy.int64), invert=True)
+    self.window = []
+    return result
+
+  def roots(self, ids):
+    '''
+    Get the root label for each pixel
+
+    '''
+    import numpy
+    if len(ids) == 0:
+      return ids
+    unique, inverse = numpy.unique(ids, return_inverse=True)
+    roots = numpy.array(
+      [self.find(i) for i in unique.tolist()],
+      dtype=numpy.int64)
+    return roots[inverse]
+
+  def prune(self, roots):
+    '''
+    Forget the labels joined into the given spots. This must only be done
+    once no pixels of the spots are left in the window.
+
+    '''
+    labels = [i for i in list(self.parent) if self.find(i) in roots]
+    for i in labels:
+      del self.parent[i]
+
+  def remove(self, roots, newest=False):
+    '''
+    Remove the pixels of the given spots. The pixels on the newest image are
+    kept unless requested, so that the spots on the next image are still
+    joined to them.
+
+    '''
+    import numpy
+    roots = numpy.array(sorted(roots), dtype=numpy.int64)
+    num_kept = 0 if newest else 1
+    self.window = [
+      f.select(~numpy.in1d(self.roots(f.ids), roots))
+      for f in self.window[:len(self.window)-num_kept]
+    ] + self.window[len(self.window)-num_kept:]
+
+  def finish(self, roots, invert=False):
+    '''
+    Finish the given spots (or all except the given spots) and remove their
+    pixels from the window.
+
+    :param roots: The root labels of the spots
+    :param invert: Finish all spots except those given
+    :return: The pixel lists and labels of the finished spots, or None
+
+    '''
+    import numpy
+    from dials.array_family import flex
+    from dials.model.data import PixelList
+    finished = []
+    remaining = []
+    for f in self.window:
+      selection = numpy.in1d(self.roots(f.ids), roots, invert=invert)
+      if selection.any():
+        finished.append(f.select(selection))
+      remaining.append(f.select(~selection))
+
+    # Drop the images with no open spots, except the newest which is needed
+    # to join the spots on the next image
+    self.window = [
+      f for f in remaining[:-1] if len(f.index) > 0] + remaining[-1:]
+    if len(finished) == 0:
+      return None
+
+    # Create the pixel lists for the finished spots on consecutive images
+    by_frame = dict((f.frame, f) for f in finished)
+    pixel_lists = []
+    labels = []
+    for frame in range(finished[0].frame, finished[-1].frame + 1):
+      f = by_frame.get(frame)
+      if f is None:
+        pixel_lists.append(PixelList(
+          frame, self.size, flex.double(), flex.size_t()))
+      else:
+        pixel_lists.append(PixelList(
+          frame,
+          self.size,
+          flex.double(f.value),
+          flex.size_t(f.index.astype(numpy.uint64))))
+        labels.append(self.roots(f.ids))
+    labels = numpy.concatenate(labels)
+    for i in numpy.unique(numpy.concatenate([f.ids for f in finished])):
+      self.parent.pop(int(i), None)
+    unique, labels = numpy.unique(labels, return_inverse=True)
+    return pixel_lists, flex.int(labels.astype(numpy.int32))
+
+
+class IncrementalSpotFinder(object):
+  '''
+  A class to find the spots on the images of a sweep as they arrive. The
+  strong pixels of each image are given in order and the reflections of the
+  spots which are finished are returned.
+
+  '''
+
+  def __init__(self,
+               imageset,
+               min_spot_size=1,
+               max_spot_size=20,
+               filter_spots=None,
+               max_window=None):
+    '''
+    Initialise the spot finder
+
+    :param imageset: The imageset
+    :param min_spot_size: The minimum number of pixels in a spot
+    :param max_spot_size: The maximum number of pixels in a spot
+    :param filter_spots: The spot filter
+    :param max_window: The maximum number of images spanned by a spot
+
+    '''
+    self.imageset = imageset
+    self.min_spot_size = min_spot_size
+    self.max_spot_size = max_spot_size
+    self.filter_spots = filter_spots
+    self.labellers = [
+      IncrementalLabeller(panel.get_image_size()[::-1], max_window)
+      for panel in imageset.get_detector()]
+    self.statistics = []
+    self.num_spots = 0
+
+  def add(self, pixel_list):
+    '''
+    Add the strong pixels on the next image
+
+    :param pixel_list: The list of pixel lists for each panel
+    :return: The reflections of the spots which are finished
+
+    '''
+    assert len(pixel_list) == len(self.labellers), "Inconsistent size"
+    finished = [l.add(p) for l, p in zip(self.labellers, pixel_list)]
+    reflections = self.create_reflections(finished)
+    self.num_spots += len(reflections)
+    frame = pixel_list[0].frame()
+    self.statistics.append({
+      'image'         : frame + 1,
+      'strong_pixels' : sum(len(p) for p in pixel_list),
+      'finished'      : len(reflections),
+      'total'         : self.num_spots })
+    logger.debug(
+      'Image %d: %d strong pixels, %d spots finished, %d in total' % (
+        frame + 1,
+        self.statistics[-1]['strong_pixels'],
+        len(reflections),
+        self.num_spots))
+    return reflections
+
+  def flush(self):
+    '''
+    Finish all the open spots
+
+    :return: The reflections of the spots
+
+    '''
+    reflections = self.create_reflections(
+      [l.flush() for l in self.labellers])
+    self.num_spots += len(reflections)
+    num_discarded = sum(l.num_discarded for l in self.labellers)
+    if num_discarded > 0:
+      logger.info('Discarded %d spots open on too many images' % num_discarded)
+    return reflections
+
+  def create_reflections(self, finished):
+    '''
+    Create the reflections from the finished spots on each panel
+
+    '''
+    from dials.array_family import flex
+    from dials.model.data import PixelListLabeller
+    shoeboxes = flex.shoebox()
+    for panel, spots in enumerate(finished):
+      if spots is None:
+        continue
+      pixel_lists, labels = spots
+      labeller = PixelListLabeller()
+      for plist in pixel_lists:
+        labeller.add(plist)
+      creator = flex.PixelListShoeboxCreator(
+        labeller,
+        labels,
+        panel,
+        0,
+        self.min_spot_size,
+        self.max_spot_size,
+        False)
+      shoeboxes.extend(creator.result())
+    shoeboxes = shoeboxes.select(shoeboxes.is_allocated())
+    if len(shoeboxes) == 0:
+      return flex.reflection_table()
+
+    # Compute the centroids and intensities and filter the spots
+    centroid = shoeboxes.centroid_valid()
+    intensity = shoeboxes.summed_intensity()
+    observed = flex.observation(shoeboxes.panels(), centroid, intensity)
+    if self.filter_spots is not None:
+      flags = self.filter_spots(None,
+        sweep=self.imageset,
+        observations=observed,
+        shoeboxes=shoeboxes)
+      observed = observed.select(flags)
+      shoeboxes = shoeboxes.select(flags)
+    return flex.reflection_table(observed, shoeboxes)
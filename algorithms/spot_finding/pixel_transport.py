@@ -0,0 +1,312 @@
+#
+# pixel_transport.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+'''
+Pass the strong pixels found in worker processes back to the main process.
+
+By default the results of each worker are pickled and sent back through a
+pipe, which for noisy images on large detectors is a large fraction of the
+spot finding time. Instead, the workers can write the pixel indices and
+values as raw arrays to a file in shared memory (/dev/shm on linux) and only
+send back a small descriptor of the file. The workers can also label the
+pixels of each chunk of images themselves, in which case the main process
+only has to merge the spots crossing the boundaries between chunks.
+
+'''
+
+from __future__ import absolute_import, division
+
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def shared_memory_directory():
+  '''
+  Get a directory in which to create the files shared between processes. On
+  linux, /dev/shm is backed by memory; otherwise the temporary directory is
+  used.
+
+  :return: The directory
+
+  '''
+  import tempfile
+  if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+    return '/dev/shm'
+  return tempfile.gettempdir()
+
+
+class PixelListChunk(object):
+  '''
+  A class to hold the pixel lists for a chunk of consecutive images.
+
+  '''
+
+  def __init__(self, pixel_lists, labels=None):
+    '''
+    Initialise the chunk
+
+    :param pixel_lists: The list of pixel lists for each panel for each image
+    :param labels: The spot labels of the pixels on each panel (optional)
+
+    '''
+    self.pixel_lists = pixel_lists
+    self.labels = labels
+
+  def write(self, directory):
+    '''
+    Write the chunk to a file.
+
+    :param directory: The directory to write to
+    :return: The descriptor of the file or None if it could not be written
+
+    '''
+    import numpy
+    import tempfile
+    fd, filename = tempfile.mkstemp(
+      prefix='pixels_', suffix='.bin', dir=directory)
+    try:
+      with os.fdopen(fd, 'wb') as outfile:
+        for image in self.pixel_lists:
+          for plist in image:
+            if len(plist) > 0:
+              plist.index().as_numpy_array().astype(numpy.uint64).tofile(outfile)
+              plist.value().as_numpy_array().tofile(outfile)
+        if self.labels is not None:
+          for labels in self.labels:
+            if len(labels) > 0:
+              labels.as_numpy_array().astype(numpy.int32).tofile(outfile)
+    except (IOError, OSError) as e:
+      logger.debug('Unable to write pixels to %s: %s' % (filename, e))
+      os.remove(filename)
+      return None
+    first = self.pixel_lists[0]
+    return SharedPixelLists(
+      filename = filename,
+      frames   = [image[0].frame() for image in self.pixel_lists],
+      sizes    = [tuple(plist.size()) for plist in first],
+      counts   = [[len(plist) for plist in image] for image in self.pixel_lists],
+      labelled = self.labels is not None)
+
+
+class SharedPixelLists(object):
+  '''
+  A descriptor of a chunk of pixel lists written to a file. Only this is
+  pickled and sent between processes.
+
+  '''
+
+  def __init__(self, filename, frames, sizes, counts, labelled):
+    '''
+    Initialise the descriptor
+
+    :param filename: The file containing the pixels
+    :param frames: The frame number of each image
+    :param sizes: The image size of each panel
+    :param counts: The number of pixels on each panel for each image
+    :param labelled: True if the file contains the spot labels
+
+    '''
+    self.filename = filename
+    self.frames = frames
+    self.sizes = sizes
+    self.counts = counts
+    self.labelled = labelled
+
+  def read(self):
+    '''
+    Read the pixel lists and remove the file.
+
+    :return: The chunk of pixel lists
+
+    '''
+    import numpy
+    from dials.array_family import flex
+    from dials.model.data import PixelList
+    pixel_lists = []
+    labels = None
+    with open(self.filename, 'rb') as infile:
+      for frame, counts in zip(self.frames, self.counts):
+        image = []
+        for size, count in zip(self.sizes, counts):
+          if count > 0:
+            index = numpy.fromfile(infile, dtype=numpy.uint64, count=count)
+            value = numpy.fromfile(infile, dtype=numpy.float64, count=count)
+            index = flex.size_t(index)
+            value = flex.double(value)
+          else:
+            index = flex.size_t()
+            value = flex.double()
+          image.append(PixelList(frame, size, value, index))
+        pixel_lists.append(image)
+      if self.labelled:
+        labels = []
+        for count in (sum(c) for c in zip(*self.counts)):
+          if count > 0:
+            labels.append(flex.int(
+              numpy.fromfile(infile, dtype=numpy.int32, count=count)))
+          else:
+            labels.append(flex.int())
+    os.remove(self.filename)
+    return PixelListChunk(pixel_lists, labels)
+
+
+class ExtractPixelsFromChunk(object):
+  '''
+  A class to extract the strong pixels from a chunk of consecutive images in
+  a worker process and pass them back through shared memory.
+
+  '''
+
+  def __init__(self, function, directory=None, label=False, twod=False):
+    '''
+    Initialise the class
+
+    :param function: The function to extract pixels from a single image
+    :param directory: The shared directory (or None to return the pixels)
+    :param label: Label the spots on the chunk of images
+    :param twod: Label the spots in 2D
+
+    '''
+    self.function = function
+    self.directory = directory
+    self.label = label
+    self.twod = twod
+
+  def __call__(self, task):
+    '''
+    Extract the strong pixels
+
+    :param task: The index of an image or a range of image indices
+    :return: The chunk of pixel lists or a descriptor of the shared file
+
+    '''
+    from dials.model.data import PixelListLabeller
+    if isinstance(task, tuple):
+      indices = range(*task)
+    else:
+      indices = [task]
+    pixel_lists = [self.function(index).pixel_list for index in indices]
+    labels = None
+    if self.label:
+      labellers = [PixelListLabeller() for plist in pixel_lists[0]]
+      for image in pixel_lists:
+        for labeller, plist in zip(labellers, image):
+          labeller.add(plist)
+      if self.twod:
+        labels = [labeller.labels_2d() for labeller in labellers]
+      else:
+        labels = [labeller.labels_3d() for labeller in labellers]
+    chunk = PixelListChunk(pixel_lists, labels)
+    if self.directory is not None:
+      shared = chunk.write(self.directory)
+      if shared is not None:
+        return shared
+    return chunk
+
+
+class UnionFind(object):
+  '''
+  A class to keep track of spot labels which have been joined. Only labels
+  which have been joined to another are stored.
+
+  '''
+
+  def __init__(self):
+    self.parent = {}
+
+  def find(self, label):
+    '''
+    Find the root label of the spot
+
+    '''
+    root = label
+    while root in self.parent:
+      root = self.parent[root]
+    while label != root:
+      parent = self.parent[label]
+      self.parent[label] = root
+      label = parent
+    return root
+
+  def union(self, a, b):
+    '''
+    Join two spots
+
+    '''
+    a = self.find(a)
+    b = self.find(b)
+    if a != b:
+      self.parent[max(a, b)] = min(a, b)
+    return min(a, b)
+
+
+class ChunkLabelMerger(UnionFind):
+  '''
+  A class to merge the spot labels of one panel computed on separate chunks
+  of images. Spots which are connected across the boundary between two
+  chunks are joined, and the labels renumbered so they are consecutive.
+
+  '''
+
+  def __init__(self, twod=False):
+    '''
+    Initialise the merger
+
+    :param twod: The labels are 2D so spots do not cross chunks
+
+    '''
+    super(ChunkLabelMerger, self).__init__()
+    self.twod = twod
+    self.labels = []
+    self.num_labels = 0
+    self.last = None
+
+  def add(self, pixel_lists, labels):
+    '''
+    Add the labels for the next chunk of images
+
+    :param pixel_lists: The pixel lists on this panel for each image
+    :param labels: The labels of the pixels
+
+    '''
+    labels = labels.as_numpy_array().astype('int64') + self.num_labels
+    if len(labels) > 0:
+      self.num_labels = int(labels.max()) + 1
+    first = pixel_lists[0]
+    last = pixel_lists[-1]
+    if (not self.twod and self.last is not None and
+        self.last[0] + 1 == first.frame()):
+      previous = self.last[1]
+      for index, label in zip(first.index(), labels[:len(first)]):
+        other = previous.get(index)
+        if other is not None:
+          self.union(other, int(label))
+    self.last = (
+      last.frame(),
+      dict(zip(last.index(), (int(l) for l in labels[len(labels)-len(last):]))))
+    self.labels.append(labels)
+
+  def labels_after_merge(self):
+    '''
+    Get the merged labels of all the pixels
+
+    :return: The labels
+
+    '''
+    import numpy
+    from dials.array_family import flex
+    if self.num_labels == 0:
+      return flex.int()
+    roots = numpy.arange(self.num_labels)
+    for label in list(self.parent.keys()):
+      roots[label] = self.find(label)
+    unique, renumbered = numpy.unique(roots, return_inverse=True)
+    labels = renumbered[numpy.concatenate(self.labels)]
+    return flex.int(labels.astype(numpy.int32))
@@ -15,6 +15,8 @@
 from scitbx.array_family import flex
 from dials_refinement_helpers_ext import maha_dist_sq as maha_dist_sq_cpp
 from dials_refinement_helpers_ext import mcd_consistency
+from dials_refinement_helpers_ext import mcd_initial_estimate
+from dials_refinement_helpers_ext import mcd_concentration_steps
 
 def sample_covariance(a, b):
   """Calculate sample covariance of two vectors"""
@@ -39,21 +41,25 @@ def cov(*args):
   cov.matrix_copy_upper_to_lower_triangle_in_place()
   return cov
 
-def maha_dist_sq(cols, center, cov):
-  """Calculate squared Mahalanobis distance of all observations (rows in the
-  vectors contained in the list cols) from the center vector with respect to
-  the covariance matrix cov"""
+def observation_matrix(cols):
+  """Return the observation matrix, with one row per observation, from the
+  vectors contained in the list cols"""
 
   n = len(cols[0])
   p = len(cols)
-  assert len(center) == p
 
-  # observation matrix
   obs = flex.double(flex.grid(n, p))
   for i, col in enumerate(cols):
     obs.matrix_paste_column_in_place(col, i)
+  return obs
+
+def maha_dist_sq(cols, center, cov):
+  """Calculate squared Mahalanobis distance of all observations (rows in the
+  vectors contained in the list cols) from the center vector with respect to
+  the covariance matrix cov"""
 
-  d2 = maha_dist_sq_cpp(obs, flex.double(center), cov)
+  assert len(center) == len(cols)
+  d2 = maha_dist_sq_cpp(observation_matrix(cols), flex.double(center), cov)
   return d2
 
 def mcd_finite_sample(p, n, alpha):
@@ -118,12 +124,16 @@ def mcd_finite_sample(p, n, alpha):
 
 class FastMCD(object):
   """Experimental implementation of the FAST-MCD algorithm of Rousseeuw and
-  van Driessen"""
+  van Driessen. The concentration steps are performed in compiled code. The
+  random subsets are drawn from a generator owned by this object, so that the
+  result depends only on the data and the seed."""
 
   def __init__(self, data, alpha=0.5, max_n_groups=5, min_group_size=300,
-    n_trials=500, k1=2, k2=2, k3=100):
+    n_trials=500, k1=2, k2=2, k3=100, seed=None):
     """data expected to be a list of flex.double arrays of the same length,
-    representing the vectors of observations in each dimension"""
+    representing the vectors of observations in each dimension. If seed is
+    None, a seed is taken from the flex random number generator, so that
+    flex.set_random_seed still gives reproducible results"""
 
     # the full dataset as separate vectors
     self._data = data
@@ -142,6 +152,9 @@ def __init__(self, data, alpha=0.5, max_n_groups=5, min_group_size=300,
     # some input checks
     assert self._n > self._p
 
+    # the full dataset as an observation matrix
+    self._obs = observation_matrix(self._data)
+
     # default initial subset size
     self._alpha = alpha
     n2 = (self._n + self._p + 1) // 2
@@ -161,6 +174,11 @@ def __init__(self, data, alpha=0.5, max_n_groups=5, min_group_size=300,
     self._k2 = k2
     self._k3 = k3
 
+    # random number generator for drawing subsets
+    if seed is None:
+      seed = flex.random_size_t(1, 2**31)[0]
+    self._rng = flex.mersenne_twister(seed=seed)
+
     # correction factors
     self._consistency_fac = mcd_consistency(self._p, self._h / self._n)
     self._finite_samp_fac = mcd_finite_sample(self._p, self._n, self._alpha)
@@ -199,24 +217,12 @@ def get_corrected_T_and_S(self):
     fac = self._consistency_fac * self._finite_samp_fac
     return self._T_raw, self._S_raw * fac
 
-  @staticmethod
-  def means_and_covariance(vecs):
-    """Prepare a dataset of equal length vectors for Mahalanobis distance
-    squared calculation. The maha_dist_sq function requires the vectors,
-    the vector of their means and their covariance matrix. Given the vectors,
-    return the latter pair as a tuple"""
-
-    center = flex.double([flex.mean(e) for e in vecs])
-    covmat = cov(*vecs)
-    return (center, covmat)
-
-  @staticmethod
-  def sample_data(data, sample_size):
+  def sample_data(self, data, sample_size):
     """sample (without replacement) the data vectors to select the same
     sample_size rows from each."""
 
     n = len(data[0])
-    rows = flex.random_selection(n, sample_size)
+    rows = self._rng.random_selection(n, sample_size)
     cols = [e.select(rows) for e in data]
     return cols
 
@@ -228,7 +234,7 @@ def split_into_groups(self, sample, ngroups):
     sample_size = len(sample[0])
 
     # random permutation
-    p = flex.random_permutation(sample_size)
+    p = self._rng.random_permutation(sample_size)
     permuted = [col.select(p) for col in sample]
 
     # determine groups
@@ -250,81 +256,31 @@ def split_into_groups(self, sample, ngroups):
 
     return groups
 
-  def form_initial_subset(self, h, data):
-    """Method 2 of subsection 3.1 of R&vD"""
-
-    # permutation of input data for sampling
-    p = flex.random_permutation(len(data[0]))
-    permuted = [col.select(p) for col in data]
+  def initial_estimate(self, h, obs):
+    """Form an initial subset by method 2 of subsection 3.1 of R&vD from a
+    random permutation of the observations, then take k1 concentration steps
+    from it. Return the resulting MCDEstimate"""
 
-    # draw random p+1 subset J (or larger if required)
-    detS0 = 0.0
-    i = 0
-    while not detS0 > 0.0:
-      subset_size = self._p + 1 + i
-      J = [e[0:subset_size] for e in permuted]
-      i += 1
-      T0, S0 = self.means_and_covariance(J)
-      detS0 = S0.matrix_determinant_via_lu()
-
-    H1 = self.concentration_step(h, data, T0, S0)
-    return H1
-
-  @staticmethod
-  def concentration_step(h, data, T, S):
-    """Practical application of Theorem 1 of R&vD"""
-
-    d2s = maha_dist_sq(data, T, S)
-    p = flex.sort_permutation(d2s)
-    H1 = [col.select(p)[0:h] for col in data]
-    return H1
+    p = self._rng.random_permutation(obs.all()[0])
+    return mcd_initial_estimate(obs, h, p, self._k1)
 
   def small_dataset_estimate(self):
     """When a dataset is small, perform the initial trials directly on the
     whole dataset"""
 
-    trials = []
-    for i in xrange(self._n_trials):
-
-      H1 = self.form_initial_subset(h=self._h, data=self._data)
-      T1, S1 = self.means_and_covariance(H1)
-      detS1 = S1.matrix_determinant_via_lu()
-
-      # perform concentration steps
-      detScurr, Tcurr, Scurr = detS1, T1, S1
-      for j in xrange(self._k1): # take maximum of k1 steps
-
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
-        Tnew, Snew = self.means_and_covariance(Hnew)
-        detSnew = Snew.matrix_determinant_via_lu()
-
-        # detS3 < detS2 < detS1 by Theorem 1. In practice (rounding errors?)
-        # this is not always the case here. Ensure that detScurr is no smaller than
-        # one billionth the value of detSnew less than detSnew
-        assert detScurr > (detSnew - detSnew/1.e9)
-        detScurr, Tcurr, Scurr = detSnew, Tnew, Snew
-
-      trials.append((detSnew, Tnew, Snew))
-
-    # choose 10 trials with the lowest detS3
-    trials.sort(key=lambda x: x[0])
-    best_trials = []
-    for i in xrange(10):
-      detCurr, Tcurr, Scurr = trials[i]
-      for j in xrange(self._k3): # take maximum of k3 steps
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
-        Tnew, Snew = self.means_and_covariance(Hnew)
-        detNew = Snew.matrix_determinant_via_lu()
-        if detNew == detCurr:
-          #print "trial {0}; iteration {1}; convergence".format(i,j)
-          break
-        detCurr, Tcurr, Scurr = detNew, Tnew, Snew
-      best_trials.append((detNew, Tnew, Snew))
+    trials = [self.initial_estimate(self._h, self._obs)
+              for i in xrange(self._n_trials)]
+
+    # choose 10 trials with the lowest detS3 and take a maximum of k3
+    # concentration steps from each
+    trials.sort(key=lambda x: x.get_determinant())
+    best_trials = [mcd_concentration_steps(self._obs, self._h, trial,
+      max_steps=self._k3, stop_at_convergence=True) for trial in trials[0:10]]
 
     # Find the minimum covariance determinant from that set of 10
-    best_trials.sort(key=lambda x: x[0])
-    _, Tbest, Sbest = best_trials[0]
-    return Tbest, Sbest
+    best_trials.sort(key=lambda x: x.get_determinant())
+    best = best_trials[0]
+    return best.get_location(), best.get_covariance()
 
   def large_dataset_estimate(self):
     """When a dataset is large, construct disjoint subsets of the full data
@@ -350,51 +306,23 @@ def large_dataset_estimate(self):
     for group in groups:
 
       h_sub = int(len(group[0]) * h_frac)
-      gp_trials = []
-      for i in xrange(n_trials):
-
-        H1 = self.form_initial_subset(h=h_sub, data=group)
-        T1, S1 = self.means_and_covariance(H1)
-        detS1 = S1.matrix_determinant_via_lu()
-
-        # perform concentration steps
-        detScurr, Tcurr, Scurr = detS1, T1, S1
-        for j in xrange(self._k1): # take k1 steps
-
-          Hnew = self.concentration_step(h_sub, group, Tcurr, Scurr)
-          Tnew, Snew = self.means_and_covariance(Hnew)
-          detSnew = Snew.matrix_determinant_via_lu()
-
-          # detS3 < detS2 < detS1 by Theorem 1. In practice (rounding errors?)
-          # this is not always the case here. Ensure that detScurr is no smaller than
-          # one billionth the value of detSnew less than detSnew
-          assert detScurr > (detSnew - detSnew/1.e9)
-          detScurr, Tcurr, Scurr = detSnew, Tnew, Snew
-
-        gp_trials.append((detSnew, Tnew, Snew))
+      obs = observation_matrix(group)
+      gp_trials = [self.initial_estimate(h_sub, obs)
+                   for i in xrange(n_trials)]
 
       # choose 10 trials with the lowest determinant and put in the outer list
-      gp_trials.sort(key=lambda x: x[0])
+      gp_trials.sort(key=lambda x: x.get_determinant())
       trials.extend(gp_trials[0:10])
 
     # now have 10 best trials from each group. Work with the merged (==sampled)
-    # set
-    mrgd_trials = []
+    # set, taking k2 steps from each
     h_mrgd = int(sample_size * h_frac)
-    for trial in trials:
-
-      detScurr, Tcurr, Scurr = trial
-      for j in xrange(self._k2): # take k2 steps
-
-        Hnew = self.concentration_step(h_mrgd, sampled, Tcurr, Scurr)
-        Tnew, Snew = self.means_and_covariance(Hnew)
-        detSnew = Snew.matrix_determinant_via_lu()
-        detScurr, Tcurr, Scurr = detSnew, Tnew, Snew
-
-      mrgd_trials.append((detSnew, Tnew, Snew))
+    obs = observation_matrix(sampled)
+    mrgd_trials = [mcd_concentration_steps(obs, h_mrgd, trial,
+      max_steps=self._k2, stop_at_convergence=False) for trial in trials]
 
     # sort trials by the lowest detS3 and work with the whole dataset now
-    mrgd_trials.sort(key=lambda x: x[0])
+    mrgd_trials.sort(key=lambda x: x.get_determinant())
 
     # choose number of steps to iterate based on dataset size (ugly)
     size = self._n * self._p
@@ -413,24 +341,12 @@ def large_dataset_estimate(self):
     # choose number of trials to look at based on number of obs (ugly)
     n_reps = 1 if self._n > 5000 else 10
 
-    best_trials = []
-    for i in xrange(n_reps):
-      detCurr, Tcurr, Scurr = mrgd_trials[i]
-      for j in xrange(k4): # take maximum of k4 steps
-        Hnew = self.concentration_step(self._h, self._data, Tcurr, Scurr)
-        Tnew, Snew = self.means_and_covariance(Hnew)
-        detNew = Snew.matrix_determinant_via_lu()
-        if detNew == detCurr:
-          #print "trial {0}; iteration {1}; convergence".format(i,j)
-          break
-        detCurr, Tcurr, Scurr = detNew, Tnew, Snew
-      #print "determinant", detNew
-      #print "location:", list(Tnew)
-      #print "covariance:"
-      #print Snew.as_scitbx_matrix()
-      best_trials.append((detNew, Tnew, Snew))
+    # take a maximum of k4 steps from each
+    best_trials = [mcd_concentration_steps(self._obs, self._h, trial,
+      max_steps=k4, stop_at_convergence=True)
+      for trial in mrgd_trials[0:n_reps]]
 
     # Find the minimum covariance determinant from that set of 10
-    best_trials.sort(key=lambda x: x[0])
-    _, Tbest, Sbest = best_trials[0]
-    return Tbest, Sbest
+    best_trials.sort(key=lambda x: x.get_determinant())
+    best = best_trials[0]
+    return best.get_location(), best.get_covariance()
@@ -0,0 +1,94 @@
+/*
+ * flex_column_buffer.cc
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include <cstring>
+#include <string>
+#include <scitbx/array_family/shared.h>
+#include <scitbx/array_family/ref.h>
+#include <scitbx/vec2.h>
+#include <scitbx/vec3.h>
+#include <scitbx/mat3.h>
+#include <cctbx/miller.h>
+#include <dials/array_family/reflection_table.h>
+#include <dials/error.h>
+
+namespace dials { namespace af { namespace boost_python {
+
+  using namespace boost::python;
+  using scitbx::vec2;
+  using scitbx::vec3;
+  using scitbx::mat3;
+
+  /**
+   * Copy the raw contents of a column into a python string
+   * @param data The column
+   * @returns The bytes
+   */
+  template <typename T>
+  object column_as_bytes(const af::const_ref<T> &data) {
+    return object(handle<>(PyString_FromStringAndSize(
+      (const char *)data.begin(),
+      data.size() * sizeof(T))));
+  }
+
+  /**
+   * Create a column from the raw contents of a python buffer, such as a
+   * memory mapped file. The data are copied into the column with a single
+   * memcpy.
+   * @param buffer The buffer
+   * @param offset The offset of the column in bytes
+   * @param size The number of elements
+   * @returns The column
+   */
+  template <typename T>
+  af::shared<T> column_from_buffer(
+      object buffer,
+      std::size_t offset,
+      std::size_t size) {
+    const void *data = NULL;
+    Py_ssize_t length = 0;
+    if (PyObject_AsReadBuffer(buffer.ptr(), &data, &length) != 0) {
+      throw_error_already_set();
+    }
+    DIALS_ASSERT(offset + size * sizeof(T) <= (std::size_t)length);
+    af::shared<T> result(size, af::init_functor_null<T>());
+    if (size > 0) {
+      std::memcpy(&result[0], (const char *)data + offset, size * sizeof(T));
+    }
+    return result;
+  }
+
+  /**
+   * Export the functions for a single type
+   * @param name The name of the type
+   */
+  template <typename T>
+  void export_column_buffer_functions(const char *name) {
+    def("column_as_bytes", &column_as_bytes<T>);
+    def((std::string(name) + "_from_buffer").c_str(),
+        &column_from_buffer<T>, (
+          arg("buffer"),
+          arg("offset"),
+          arg("size")));
+  }
+
+  void export_flex_column_buffer() {
+    export_column_buffer_functions<bool>("bool");
+    export_column_buffer_functions<int>("int");
+    export_column_buffer_functions<std::size_t>("size_t");
+    export_column_buffer_functions<double>("double");
+    export_column_buffer_functions< vec2<double> >("vec2_double");
+    export_column_buffer_functions< vec3<double> >("vec3_double");
+    export_column_buffer_functions< mat3<double> >("mat3_double");
+    export_column_buffer_functions<int6>("int6");
+    export_column_buffer_functions< cctbx::miller::index<> >("miller_index");
+  }
+
+}}} // namespace dials::af::boost_python
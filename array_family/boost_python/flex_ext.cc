@@ -32,6 +32,10 @@ namespace dials { namespace af { namespace boost_python {
   void export_flex_unit_cell();
   void export_flex_shoebox_extractor();
   void export_flex_binner();
+  void export_flex_reference_matcher();
+  void export_flex_overlap_fraction();
+  void export_flex_lexicographic_sort();
+  void export_flex_column_buffer();
 
   template <typename FloatType>
   std::string get_real_type();
@@ -58,6 +62,10 @@ namespace dials { namespace af { namespace boost_python {
     export_flex_unit_cell();
     export_flex_shoebox_extractor();
     export_flex_binner();
+    export_flex_reference_matcher();
+    export_flex_overlap_fraction();
+    export_flex_lexicographic_sort();
+    export_flex_column_buffer();
 
     def("get_real_type", &get_real_type<ProfileFloatType>);
 
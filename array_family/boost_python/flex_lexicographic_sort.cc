@@ -0,0 +1,86 @@
+/*
+ * flex_lexicographic_sort.cc
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include <scitbx/vec2.h>
+#include <scitbx/vec3.h>
+#include <scitbx/mat3.h>
+#include <scitbx/array_family/tiny_types.h>
+#include <cctbx/miller.h>
+#include <dials/array_family/lexicographic_sort.h>
+
+namespace dials { namespace af { namespace boost_python {
+
+  using namespace boost::python;
+  using scitbx::vec2;
+  using scitbx::vec3;
+  using scitbx::mat3;
+  using scitbx::af::int6;
+
+  template <typename T>
+  void add_key(
+      LexicographicSorter &self,
+      const af::const_ref<T> &values,
+      bool reverse) {
+    self.add_key(values, reverse);
+  }
+
+  template <typename T, typename ValueType, std::size_t N>
+  void add_component_key(
+      LexicographicSorter &self,
+      const af::const_ref<T> &values,
+      std::size_t component,
+      bool reverse) {
+    self.add_component_key<T, ValueType, N>(values, component, reverse);
+  }
+
+  template <typename T>
+  void add_run_key(
+      LexicographicSorter &self,
+      const af::const_ref<T> &values) {
+    self.add_run_key(values);
+  }
+
+  void export_flex_lexicographic_sort() {
+
+    class_<LexicographicSorter>("LexicographicSorter", no_init)
+      .def(init<std::size_t>())
+      .def("add_key", &add_key<double>, (
+            arg("values"), arg("reverse") = false))
+      .def("add_key", &add_key<int>, (
+            arg("values"), arg("reverse") = false))
+      .def("add_key", &add_key<std::size_t>, (
+            arg("values"), arg("reverse") = false))
+      .def("add_key", &add_key<bool>, (
+            arg("values"), arg("reverse") = false))
+      .def("add_key", &add_component_key<vec2<double>, double, 2>, (
+            arg("values"), arg("component"), arg("reverse") = false))
+      .def("add_key", &add_component_key<vec3<double>, double, 3>, (
+            arg("values"), arg("component"), arg("reverse") = false))
+      .def("add_key", &add_component_key<mat3<double>, double, 9>, (
+            arg("values"), arg("component"), arg("reverse") = false))
+      .def("add_key", &add_component_key<int6, int, 6>, (
+            arg("values"), arg("component"), arg("reverse") = false))
+      .def("add_key", &add_component_key<cctbx::miller::index<>, int, 3>, (
+            arg("values"), arg("component"), arg("reverse") = false))
+      .def("add_run_key", &add_run_key<double>)
+      .def("add_run_key", &add_run_key<int>)
+      .def("add_run_key", &add_run_key<std::size_t>)
+      .def("add_run_key", &add_run_key<bool>)
+      .def("add_run_key", &add_run_key< vec2<double> >)
+      .def("add_run_key", &add_run_key< vec3<double> >)
+      .def("add_run_key", &add_run_key< mat3<double> >)
+      .def("add_run_key", &add_run_key<int6>)
+      .def("add_run_key", &add_run_key< cctbx::miller::index<> >)
+      .def("num_keys", &LexicographicSorter::num_keys)
+      .def("permutation", &LexicographicSorter::permutation)
+      ;
+  }
+
+}}} // namespace dials::af::boost_python
@@ -0,0 +1,35 @@
+/*
+ * flex_overlap_fraction.cc
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include <dials/array_family/overlap_fraction.h>
+
+namespace dials { namespace af { namespace boost_python {
+
+  using namespace boost::python;
+
+  /**
+   * Compute the fraction of each shoebox overlapped by its neighbours
+   * @returns The overlap fractions
+   */
+  scitbx::af::shared<double> shoebox_overlap_fraction(
+      const AdjacencyList &overlaps,
+      const scitbx::af::const_ref<int6> &bbox,
+      std::size_t nthreads) {
+    return ShoeboxOverlapFraction(overlaps, bbox, nthreads).result();
+  }
+
+  void export_flex_overlap_fraction() {
+    def("shoebox_overlap_fraction", &shoebox_overlap_fraction, (
+        arg("overlaps"),
+        arg("bbox"),
+        arg("nthreads") = 1));
+  }
+
+}}} // namespace dials::af::boost_python
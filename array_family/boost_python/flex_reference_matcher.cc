@@ -0,0 +1,57 @@
+/*
+ * flex_reference_matcher.cc
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#include <boost/python.hpp>
+#include <boost/python/def.hpp>
+#include <dials/array_family/reference_matcher.h>
+
+namespace dials { namespace af { namespace boost_python {
+
+  using namespace boost::python;
+
+  /**
+   * Match predicted and reference reflections
+   * @returns A tuple of the predicted and reference indices
+   */
+  boost::python::tuple match_reference_indices(
+      const af::const_ref<cctbx::miller::index<> > &h1,
+      const af::const_ref<bool> &e1,
+      const af::const_ref<int> &i1,
+      const af::const_ref<std::size_t> &p1,
+      const af::const_ref< vec3<double> > &x1,
+      const af::const_ref<cctbx::miller::index<> > &h2,
+      const af::const_ref<bool> &e2,
+      const af::const_ref<int> &i2,
+      const af::const_ref<std::size_t> &p2,
+      const af::const_ref< vec3<double> > &x2,
+      std::size_t nthreads) {
+    ReferenceMatcher matcher(
+        h1, e1, i1, p1, x1,
+        h2, e2, i2, p2, x2,
+        nthreads);
+    return boost::python::make_tuple(
+        matcher.self_indices(),
+        matcher.other_indices());
+  }
+
+  void export_flex_reference_matcher() {
+    def("match_reference_indices", &match_reference_indices, (
+        arg("h1"),
+        arg("e1"),
+        arg("i1"),
+        arg("p1"),
+        arg("x1"),
+        arg("h2"),
+        arg("e2"),
+        arg("i2"),
+        arg("p2"),
+        arg("x2"),
+        arg("nthreads") = 1));
+  }
+
+}}} // namespace dials::af::boost_python
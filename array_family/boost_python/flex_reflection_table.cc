@@ -483,7 +483,6 @@ namespace dials { namespace af { namespace boost_python {
   template <typename T>
   boost::python::list split_indices_by_experiment_id(
       T self, std::size_t num_expr) {
-    DIALS_ASSERT(self.size() > 0);
     DIALS_ASSERT(num_expr > 0);
     DIALS_ASSERT(self.contains("id"));
 
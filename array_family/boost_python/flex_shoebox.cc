@@ -10,6 +10,7 @@
  */
 #include <boost/python.hpp>
 #include <boost/python/def.hpp>
+#include <algorithm>
 #include <cmath>
 #include <scitbx/array_family/boost_python/flex_wrapper.h>
 #include <scitbx/array_family/ref_reductions.h>
@@ -86,13 +87,61 @@ namespace dials { namespace af { namespace boost_python {
         std::size_t min_pixels,
         std::size_t max_pixels,
         bool find_hot_pixels) {
+      af::shared<int> labels = twod ? pixel.labels_2d() : pixel.labels_3d();
+      create(pixel, labels, panel, zstart, min_pixels, max_pixels,
+          find_hot_pixels);
+    }
+
+    /**
+     * Construct the shoeboxes from pixels which have already been labelled;
+     * for example, in chunks of images in different processes.
+     */
+    PixelListShoeboxCreator(
+        const PixelListLabeller &pixel,
+        const af::const_ref<int> &labels,
+        std::size_t panel,
+        std::size_t zstart,
+        std::size_t min_pixels,
+        std::size_t max_pixels,
+        bool find_hot_pixels) {
+      DIALS_ASSERT(labels.size() == pixel.num_pixels());
+      DIALS_ASSERT(labels.size() > 0);
+      DIALS_ASSERT(af::min(labels) >= 0);
+      af::shared<int> labels_copy(labels.begin(), labels.end());
+      create(pixel, labels_copy, panel, zstart, min_pixels, max_pixels,
+          find_hot_pixels);
+    }
+
+    af::shared< Shoebox<FloatType> > result() const {
+      DIALS_ASSERT(result_.size() == spot_size_.size());
+      return result_;
+    }
+
+    af::shared<std::size_t> spot_size() const {
+      DIALS_ASSERT(result_.size() == spot_size_.size());
+      return spot_size_;
+    }
+
+    af::shared<std::size_t> hot_pixels() const {
+      return hot_pixels_;
+    }
+
+  private:
+
+    void create(
+        const PixelListLabeller &pixel,
+        af::shared<int> labels,
+        std::size_t panel,
+        std::size_t zstart,
+        std::size_t min_pixels,
+        std::size_t max_pixels,
+        bool find_hot_pixels) {
 
       // Check the input
       DIALS_ASSERT(min_pixels > 0);
       DIALS_ASSERT(max_pixels > min_pixels);
 
       // Get the stuff from the label struct
-      af::shared<int> labels = twod ? pixel.labels_2d() : pixel.labels_3d();
       af::shared<double> values = pixel.values();
       af::shared< vec3<int> > coords = pixel.coords();
       DIALS_ASSERT(labels.size() == values.size());
@@ -191,22 +240,6 @@ namespace dials { namespace af { namespace boost_python {
       }
     }
 
-    af::shared< Shoebox<FloatType> > result() const {
-      DIALS_ASSERT(result_.size() == spot_size_.size());
-      return result_;
-    }
-
-    af::shared<std::size_t> spot_size() const {
-      DIALS_ASSERT(result_.size() == spot_size_.size());
-      return spot_size_;
-    }
-
-    af::shared<std::size_t> hot_pixels() const {
-      return hot_pixels_;
-    }
-
-  private:
-
     af::shared< Shoebox<FloatType> > result_;
     af::shared< std::size_t > spot_size_;
     af::shared< std::size_t > hot_pixels_;
@@ -707,6 +740,73 @@ namespace dials { namespace af { namespace boost_python {
     }
   }
 
+  /**
+   * Concatenate the pixels of all the shoeboxes into contiguous arrays
+   * @returns A tuple of (flat, offsets, data, mask, background) where the
+   * pixels of shoebox i are in the range offsets[i] to offsets[i+1]
+   */
+  template <typename FloatType>
+  boost::python::tuple concatenate_pixels(
+      const const_ref< Shoebox<FloatType> > &self) {
+    shared<bool> flat(self.size(), af::init_functor_null<bool>());
+    shared<std::size_t> offsets(self.size() + 1, af::init_functor_null<std::size_t>());
+    offsets[0] = 0;
+    for (std::size_t i = 0; i < self.size(); ++i) {
+      DIALS_ASSERT(self[i].is_consistent());
+      flat[i] = self[i].flat;
+      offsets[i+1] = offsets[i] + self[i].data.size();
+    }
+    std::size_t size = offsets[self.size()];
+    shared<FloatType> data(size, af::init_functor_null<FloatType>());
+    shared<int> mask(size, af::init_functor_null<int>());
+    shared<FloatType> background(size, af::init_functor_null<FloatType>());
+    for (std::size_t i = 0; i < self.size(); ++i) {
+      std::copy(self[i].data.begin(), self[i].data.end(),
+                data.begin() + offsets[i]);
+      std::copy(self[i].mask.begin(), self[i].mask.end(),
+                mask.begin() + offsets[i]);
+      std::copy(self[i].background.begin(), self[i].background.end(),
+                background.begin() + offsets[i]);
+    }
+    return boost::python::make_tuple(flat, offsets, data, mask, background);
+  }
+
+  /**
+   * Set the pixels of all the shoeboxes from contiguous arrays, as returned
+   * by concatenate_pixels. Shoeboxes with no pixels are left unallocated.
+   */
+  template <typename FloatType>
+  void set_pixels(
+      ref< Shoebox<FloatType> > self,
+      const const_ref<bool> &flat,
+      const const_ref<std::size_t> &offsets,
+      const const_ref<FloatType> &data,
+      const const_ref<int> &mask,
+      const const_ref<FloatType> &background) {
+    DIALS_ASSERT(flat.size() == self.size());
+    DIALS_ASSERT(offsets.size() == self.size() + 1);
+    DIALS_ASSERT(offsets[self.size()] == data.size());
+    DIALS_ASSERT(mask.size() == data.size());
+    DIALS_ASSERT(background.size() == data.size());
+    for (std::size_t i = 0; i < self.size(); ++i) {
+      DIALS_ASSERT(offsets[i+1] >= offsets[i]);
+      std::size_t size = offsets[i+1] - offsets[i];
+      self[i].flat = flat[i];
+      if (size == 0) {
+        self[i].deallocate();
+        continue;
+      }
+      self[i].allocate();
+      DIALS_ASSERT(self[i].data.size() == size);
+      std::copy(data.begin() + offsets[i], data.begin() + offsets[i+1],
+                self[i].data.begin());
+      std::copy(mask.begin() + offsets[i], mask.begin() + offsets[i+1],
+                self[i].mask.begin());
+      std::copy(background.begin() + offsets[i], background.begin() + offsets[i+1],
+                self[i].background.begin());
+    }
+  }
+
   /**
    * Apply the shoebox mask to the background mask
    */
@@ -1095,6 +1195,13 @@ namespace dials { namespace af { namespace boost_python {
         .def("mean_modelled_background",
           &mean_modelled_background<FloatType>)
         .def("flatten", &flatten<FloatType>)
+        .def("concatenate_pixels", &concatenate_pixels<FloatType>)
+        .def("set_pixels", &set_pixels<FloatType>, (
+            boost::python::arg("flat"),
+            boost::python::arg("offsets"),
+            boost::python::arg("data"),
+            boost::python::arg("mask"),
+            boost::python::arg("background")))
         .def("apply_background_mask", &apply_background_mask<FloatType>)
         .def("apply_pixel_data", &apply_pixel_data<FloatType>)
         .def("mask_neighbouring", &mask_neighbouring<FloatType>)
@@ -1121,6 +1228,20 @@ namespace dials { namespace af { namespace boost_python {
             boost::python::arg("min_pixels") = 1,
             boost::python::arg("max_pixels") = 20,
             boost::python::arg("find_hot_pixels") = false)))
+      .def(init<const PixelListLabeller&,
+                const af::const_ref<int>&,
+                std::size_t,
+                std::size_t,
+                std::size_t,
+                std::size_t,
+                bool>((
+            boost::python::arg("pixel"),
+            boost::python::arg("labels"),
+            boost::python::arg("panel") = 0,
+            boost::python::arg("zstart") = 0,
+            boost::python::arg("min_pixels") = 1,
+            boost::python::arg("max_pixels") = 20,
+            boost::python::arg("find_hot_pixels") = false)))
       .def("result", &PixelListShoeboxCreator<ProfileFloatType>::result)
       .def("spot_size", &PixelListShoeboxCreator<ProfileFloatType>::spot_size)
       .def("hot_pixels", &PixelListShoeboxCreator<ProfileFloatType>::hot_pixels)
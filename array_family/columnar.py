@@ -0,0 +1,309 @@
+#
+# columnar.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+'''
+A binary columnar file format for reflection tables.
+
+The file starts with an 8 byte magic string and the 8 byte little endian offset
+of a JSON footer describing the contents. Each column is stored as one
+contiguous buffer of its raw elements, aligned to 64 bytes. Columns with
+variable length elements (strings) are stored as pickles. The shoeboxes are
+stored in a separate section of pickled chunks indexed by offset, so they can
+be skipped entirely when they are not needed.
+
+The file is memory mapped when read and the columns are only read when they
+are requested. Since flex arrays own their memory, each column is copied from
+the map with a single memcpy rather than being unpickled.
+
+'''
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+MAGIC = b'DIALSCOL'
+VERSION = 1
+ALIGNMENT = 64
+SHOEBOX_CHUNK_SIZE = 10000
+
+# The column types that can be stored as raw buffers
+RAW_TYPES = (
+  'bool',
+  'int',
+  'size_t',
+  'double',
+  'vec2_double',
+  'vec3_double',
+  'mat3_double',
+  'int6',
+  'miller_index',
+)
+
+
+def column_type_name(column):
+  '''
+  Get the name of the type of a column
+
+  :param column: The column
+  :return: The type name
+
+  '''
+  from dials.array_family import flex
+  for name in RAW_TYPES + ('shoebox', 'std_string'):
+    if isinstance(column, getattr(flex, name)):
+      return name
+  raise TypeError('Unknown column type: %s' % type(column))
+
+
+def is_columnar_file(filename):
+  '''
+  Check if a file is a columnar reflection file
+
+  :param filename: The filename
+  :return: True/False
+
+  '''
+  try:
+    with open(filename, 'rb') as infile:
+      return infile.read(len(MAGIC)) == MAGIC
+  except IOError:
+    return False
+
+
+class ColumnarWriter(object):
+  '''
+  A class to write a reflection table to a columnar file
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Initialise the writer
+
+    :param filename: The output filename
+
+    '''
+    self.filename = filename
+
+  def write(self, reflections, shoeboxes=True):
+    '''
+    Write the reflection table
+
+    :param reflections: The reflection table
+    :param shoeboxes: Write the shoeboxes if present
+
+    '''
+    import json
+    import struct
+    import sys
+    import cPickle as pickle
+    from dials.array_family import flex
+    header = {
+      'version'   : VERSION,
+      'byteorder' : sys.byteorder,
+      'nrows'     : len(reflections),
+      'columns'   : [],
+      'shoeboxes' : [],
+    }
+    with open(self.filename, 'wb') as outfile:
+      outfile.write(MAGIC)
+      outfile.write(struct.pack('<Q', 0))
+      for name, column in reflections.cols():
+        type_name = column_type_name(column)
+        if type_name == 'shoebox':
+          if not shoeboxes:
+            continue
+          header['shoeboxes'].append({
+            'name'   : name,
+            'chunks' : self._write_shoeboxes(outfile, column),
+          })
+          continue
+        if type_name in RAW_TYPES:
+          data = flex.column_as_bytes(column)
+          storage = 'raw'
+        else:
+          data = pickle.dumps(column, pickle.HIGHEST_PROTOCOL)
+          storage = 'pickle'
+        offset = self._write_aligned(outfile, data)
+        header['columns'].append({
+          'name'    : name,
+          'type'    : type_name,
+          'storage' : storage,
+          'offset'  : offset,
+          'nbytes'  : len(data),
+        })
+        del data
+      footer = outfile.tell()
+      outfile.write(json.dumps(header).encode('utf-8'))
+      outfile.seek(len(MAGIC))
+      outfile.write(struct.pack('<Q', footer))
+
+  def _write_aligned(self, outfile, data):
+    '''
+    Write the data at the next aligned offset
+
+    :param outfile: The output file
+    :param data: The bytes to write
+    :return: The offset of the data
+
+    '''
+    offset = outfile.tell()
+    padding = (-offset) % ALIGNMENT
+    outfile.write(b'\0' * padding)
+    outfile.write(data)
+    return offset + padding
+
+  def _write_shoeboxes(self, outfile, column):
+    '''
+    Write the shoeboxes as pickled chunks
+
+    :param outfile: The output file
+    :param column: The shoebox column
+    :return: A list of (offset, nbytes, nrows) for each chunk
+
+    '''
+    import cPickle as pickle
+    from dials.array_family import flex
+    chunks = []
+    for first in range(0, len(column), SHOEBOX_CHUNK_SIZE):
+      last = min(first + SHOEBOX_CHUNK_SIZE, len(column))
+      chunk = column.select(flex.size_t_range(first, last))
+      data = pickle.dumps(chunk, pickle.HIGHEST_PROTOCOL)
+      chunks.append((self._write_aligned(outfile, data), len(data), len(chunk)))
+    return chunks
+
+
+class ColumnarReader(object):
+  '''
+  A class to read a columnar reflection file. The file is memory mapped and
+  columns are only read when they are requested.
+
+  '''
+
+  def __init__(self, filename):
+    '''
+    Open the file and read the footer
+
+    :param filename: The input filename
+
+    '''
+    import json
+    import mmap
+    import struct
+    import sys
+    from collections import OrderedDict
+    self.filename = filename
+    with open(filename, 'rb') as infile:
+      if infile.read(len(MAGIC)) != MAGIC:
+        raise RuntimeError('%s is not a columnar reflection file' % filename)
+      footer, = struct.unpack('<Q', infile.read(8))
+      infile.seek(footer)
+      header = json.loads(infile.read().decode('utf-8'))
+      if header['version'] != VERSION:
+        raise RuntimeError('Unsupported columnar file version %d' %
+                           header['version'])
+      if header['byteorder'] != sys.byteorder:
+        raise RuntimeError('Columnar file %s has %s endian byte order' %
+                           (filename, header['byteorder']))
+      self._map = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+    self.nrows = header['nrows']
+    self._columns = OrderedDict(
+      (column['name'], column) for column in header['columns'])
+    self._shoeboxes = OrderedDict(
+      (column['name'], column['chunks']) for column in header['shoeboxes'])
+
+  def __len__(self):
+    '''
+    :return: The number of rows
+
+    '''
+    return self.nrows
+
+  def keys(self):
+    '''
+    :return: The column names, excluding the shoeboxes
+
+    '''
+    return list(self._columns.keys())
+
+  def shoebox_keys(self):
+    '''
+    :return: The names of the shoebox columns
+
+    '''
+    return list(self._shoeboxes.keys())
+
+  def __contains__(self, name):
+    return name in self._columns or name in self._shoeboxes
+
+  def __getitem__(self, name):
+    '''
+    Read a column
+
+    :param name: The column name
+    :return: The column
+
+    '''
+    import cPickle as pickle
+    from dials.array_family import flex
+    if name in self._shoeboxes:
+      return self._read_shoeboxes(self._shoeboxes[name])
+    column = self._columns[name]
+    offset, nbytes = column['offset'], column['nbytes']
+    if column['storage'] == 'pickle':
+      return pickle.loads(self._map[offset:offset+nbytes])
+    from_buffer = getattr(flex, '%s_from_buffer' % column['type'])
+    return from_buffer(self._map, offset, self.nrows)
+
+  def _read_shoeboxes(self, chunks):
+    '''
+    Read the shoeboxes from the pickled chunks
+
+    :param chunks: The list of (offset, nbytes, nrows) for each chunk
+    :return: The shoebox column
+
+    '''
+    import cPickle as pickle
+    from dials.array_family import flex
+    result = flex.shoebox()
+    for offset, nbytes, nrows in chunks:
+      chunk = pickle.loads(self._map[offset:offset+nbytes])
+      assert len(chunk) == nrows
+      result.extend(chunk)
+    return result
+
+  def read(self, columns=None, shoeboxes=True):
+    '''
+    Read a reflection table
+
+    :param columns: The names of the columns to read (None for all)
+    :param shoeboxes: Read the shoeboxes if present
+    :return: The reflection table
+
+    '''
+    from dials.array_family import flex
+    if columns is None:
+      columns = self.keys()
+      if shoeboxes:
+        columns += self.shoebox_keys()
+    reflections = flex.reflection_table(self.nrows)
+    for name in columns:
+      reflections[name] = self[name]
+    return reflections
+
+  def close(self):
+    '''
+    Close the memory map
+
+    '''
+    self._map.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
@@ -17,6 +17,14 @@
 import logging
 logger = logging.getLogger(__name__)
 
+# The number of components of the multi element column types
+_sort_components = {
+  vec2_double : 2,
+  vec3_double : 3,
+  mat3_double : 9,
+  int6 : 6,
+  miller_index : 3 }
+
 # Set the 'real' type to either float or double
 if get_real_type() == "float":
   real = flex.float
@@ -201,6 +209,35 @@ def from_pickle(filename):
       assert(isinstance(result, reflection_table))
       return result
 
+  @staticmethod
+  def from_columnar(filename, columns=None, shoeboxes=True):
+    '''
+    Read the reflection table from a columnar binary file.
+
+    :param filename: The columnar filename
+    :param columns: The names of the columns to read (None for all)
+    :param shoeboxes: Read the shoeboxes if present
+    :return: The reflection table
+
+    '''
+    from dials.array_family.columnar import ColumnarReader
+    with ColumnarReader(filename) as reader:
+      return reader.read(columns=columns, shoeboxes=shoeboxes)
+
+  @staticmethod
+  def from_file(filename):
+    '''
+    Read the reflection table from either a pickle or a columnar binary file.
+
+    :param filename: The filename
+    :return: The reflection table
+
+    '''
+    from dials.array_family.columnar import is_columnar_file
+    if is_columnar_file(filename):
+      return reflection_table.from_columnar(filename)
+    return reflection_table.from_pickle(filename)
+
   @staticmethod
   def from_h5(filename):
     '''
@@ -316,16 +353,29 @@ def as_pickle(self, filename):
     with smart_open.for_writing(filename, 'wb') as outfile:
       pickle.dump(self, outfile, protocol=pickle.HIGHEST_PROTOCOL)
 
-  def as_h5(self, filename):
+  def as_columnar(self, filename, shoeboxes=True):
+    '''
+    Write the reflection table as a columnar binary file.
+
+    :param filename: The output filename
+    :param shoeboxes: Write the shoeboxes if present
+
+    '''
+    from dials.array_family.columnar import ColumnarWriter
+    ColumnarWriter(filename).write(self, shoeboxes=shoeboxes)
+
+  def as_h5(self, filename, chunks=None, compression=None):
     '''
     Write the reflection table as a HDF5 file.
 
     :param filename: The output filename
+    :param chunks: The number of rows per chunk (None for contiguous storage)
+    :param compression: The compression filter (e.g. gzip or lzf)
 
     '''
     from dials.util.nexus_old import NexusFile
     handle = NexusFile(filename, 'w')
-    handle.set_reflections(self)
+    handle.set_reflections(self, chunks=chunks, compression=compression)
     handle.close()
 
   def copy(self):
@@ -342,40 +392,57 @@ def sort(self, name, reverse=False, order=None):
     '''
     Sort the reflection table by a key.
 
-    :param name: The name of the column
+    The name may also be a list of keys to sort on in turn. Each key is a
+    column name, a tuple of (name, component) or a tuple of (name, component,
+    reverse). A component of None sorts on all the components of a multi
+    element column in order.
+
+    :param name: The name of the column, or a list of keys
     :param reverse: Reverse the sort order
     :param order: For multi element items specify order
 
     '''
-    import __builtin__
-    if type(self[name]) in [
-        vec2_double,
-        vec3_double,
-        mat3_double,
-        int6,
-        miller_index ]:
-      data = self[name]
-      if order is None:
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            reverse=reverse))
+    if isinstance(name, str):
+      if type(self[name]) in _sort_components:
+        if order is None:
+          order = range(_sort_components[type(self[name])])
+        else:
+          assert len(order) == _sort_components[type(self[name])]
+        keys = [(name, i, reverse) for i in order]
       else:
-        assert len(order) == len(data[0])
-        def compare(x, y):
-          a = tuple(x[i] for i in order)
-          b = tuple(y[i] for i in order)
-          return cmp(a, b)
-        perm = flex.size_t(
-          __builtin__.sorted(
-            range(len(self)),
-            key=lambda x: data[x],
-            cmp=compare,
-            reverse=reverse))
+        self.reorder(flex.sort_permutation(self[name], reverse=reverse))
+        return
     else:
-      perm = flex.sort_permutation(self[name], reverse=reverse)
-    self.reorder(perm)
+      assert order is None
+      keys = name
+    self.reorder(self.sort_permutation(keys))
+
+  def sort_permutation(self, keys):
+    '''
+    Compute the stable sort permutation for a list of keys.
+
+    :param keys: A list of column names, (name, component) or (name,
+                 component, reverse) tuples
+    :return: The sort permutation
+
+    '''
+    sorter = LexicographicSorter(len(self))
+    for key in keys:
+      if isinstance(key, str):
+        key = (key,)
+      name, component, reverse = tuple(key) + (None, False)[len(key)-1:]
+      data = self[name]
+      if type(data) in _sort_components:
+        if component is None:
+          components = range(_sort_components[type(data)])
+        else:
+          components = [component]
+        for i in components:
+          sorter.add_key(data, i, reverse)
+      else:
+        assert component is None
+        sorter.add_key(data, reverse)
+    return sorter.permutation()
 
   """
   Sorting the reflection table within an already sorted column
@@ -384,17 +451,22 @@ def subsort(self, key0, key1, reverse=False):
     '''
     Sort the reflection based on key1 within a constant key0.
 
+    The runs of equal key0 values stay in place, and the sort within each run
+    is stable.
+
     :param key0: The name of the column values to sort within
     :param key1: The sorting key name within the selected column
 
     '''
-    import copy
-    uniq_values = self[key0]
-    for ii in set(uniq_values):
-      val = (uniq_values == ii).iselection()
-      ref_tmp = copy.deepcopy(self[min(val):(max(val)+1)])
-      ref_tmp.sort(key1,reverse)
-      self[min(val):(max(val)+1)] = ref_tmp
+    sorter = LexicographicSorter(len(self))
+    sorter.add_run_key(self[key0])
+    data = self[key1]
+    if type(data) in _sort_components:
+      for i in range(_sort_components[type(data)]):
+        sorter.add_key(data, i, reverse)
+    else:
+      sorter.add_key(data, reverse)
+    self.reorder(sorter.permutation())
 
   def match(self, other):
     '''
@@ -410,204 +482,63 @@ def match(self, other):
     oind, sind = match(other, self)
     return sind, oind
 
-  def match_with_reference_without_copying_columns(self, other):
+  def match_with_reference_without_copying_columns(self, other, nthreads=1):
     '''
     Match reflections with another set of reflections.
 
     :param other: The reflection table to match against
+    :param nthreads: The number of threads to use
     :return: The matches
 
     '''
-    from collections import defaultdict
-    import __builtin__
-    logger.info("Matching reference spots with predicted reflections")
-    logger.info(' %d observed reflections input' % len(other))
-    logger.info(' %d reflections predicted' % len(self))
+    return self._match_with_reference(other, nthreads, copy_columns=False)
 
-    # Get the miller index, entering flag and turn number for
-    # Both sets of reflections
-    i1 = self['id']
-    h1 = self['miller_index']
-    e1 = self['entering'].as_int()
-    x1, y1, z1 = self['xyzcal.px'].parts()
-    p1 = self['panel']
-
-    i2 = other['id']
-    h2 = other['miller_index']
-    e2 = other['entering'].as_int()
-    x2, y2, z2 = other['xyzcal.px'].parts()
-    p2 = other['panel']
-
-    class Match(object):
-      def __init__(self):
-        self.a = []
-        self.b = []
-
-    # Create the match lookup
-    lookup = defaultdict(Match)
-    for i in range(len(self)):
-      item = h1[i] + (e1[i], i1[i], p1[i])
-      lookup[item].a.append(i)
-
-    # Add matches from input reflections
-    for i in range(len(other)):
-      item = h2[i] + (e2[i], i2[i], p2[i])
-      if item in lookup:
-        lookup[item].b.append(i)
-
-    # Create the list of matches
-    match1 = []
-    match2 = []
-    for item, value in lookup.iteritems():
-      if len(value.b) == 0:
-        continue
-      elif len(value.a) == 1 and len(value.b) == 1:
-        match1.append(value.a[0])
-        match2.append(value.b[0])
-      else:
-        matched = {}
-        for i in value.a:
-          d = []
-          for j in value.b:
-            dx = x1[i]-x2[j]
-            dy = y1[i]-y2[j]
-            dz = z1[i]-z2[j]
-            d.append((i,j,dx**2 + dy**2 + dz**2))
-          i, j, d = __builtin__.min(d, key=lambda x: x[2])
-          if j not in matched:
-            matched[j] = (i, d)
-          elif d < matched[j][1]:
-            matched[j] = (i, d)
-        for key1, value1 in matched.iteritems():
-          match1.append(value1[0])
-          match2.append(key1)
-
-    # Select everything which matches
-    sind = flex.size_t(match1)
-    oind = flex.size_t(match2)
-
-    # Sort by self index
-    sort_index = flex.size_t(__builtin__.sorted(range(len(sind)), key=lambda x: sind[x]))
-    sind = sind.select(sort_index)
-    oind = oind.select(sort_index)
+  def match_with_reference(self, other, nthreads=1):
+    '''
+    Match reflections with another set of reflections.
 
-    s2 = self.select(sind)
-    o2 = other.select(oind)
-    h1 = s2['miller_index']
-    h2 = o2['miller_index']
-    e1 = s2['entering']
-    e2 = o2['entering']
-    assert(h1 == h2).all_eq(True)
-    assert(e1 == e2).all_eq(True)
-    x1, y1, z1 = s2['xyzcal.px'].parts()
-    x2, y2, z2 = o2['xyzcal.px'].parts()
-    distance = flex.sqrt((x1-x2)**2+(y1-y2)**2+(z1-z2)**2)
-    mask = distance < 2
-    logger.info(' %d reflections matched' % len(o2))
-    logger.info(' %d reflections accepted' % mask.count(True))
-    self.set_flags(
-      sind.select(mask),
-      self.flags.reference_spot)
-    self.set_flags(
-      sind.select(o2.get_flags(self.flags.strong)),
-      self.flags.strong)
-    self.set_flags(
-      sind.select(o2.get_flags(self.flags.indexed)),
-      self.flags.indexed)
-    self.set_flags(
-      sind.select(o2.get_flags(self.flags.used_in_refinement)),
-      self.flags.used_in_refinement)
-    other_matched_indices = oind.select(mask)
-    other_unmatched_mask = flex.bool(len(other), True)
-    other_unmatched_mask.set_selected(
-      other_matched_indices,
-      flex.bool(len(other_matched_indices), False))
-    other_matched = other.select(other_matched_indices)
-    other_unmatched = other.select(other_unmatched_mask)
-    mask2 = flex.bool(len(self),False)
-    mask2.set_selected(sind.select(mask), True)
-    return mask2, other_matched, other_unmatched
+    :param other: The reflection table to match against
+    :param nthreads: The number of threads to use
+    :return: The matches
+
+    '''
+    return self._match_with_reference(other, nthreads, copy_columns=True)
 
-  def match_with_reference(self, other):
+  def _match_with_reference(self, other, nthreads=1, copy_columns=True):
     '''
     Match reflections with another set of reflections.
 
+    Reflections are matched on miller index, entering flag, experiment id and
+    panel. Where there is more than one candidate, the nearest reflections are
+    matched. Matches are accepted if the predicted positions are within 2
+    pixels.
+
     :param other: The reflection table to match against
-    :return: The matches
+    :param nthreads: The number of threads to use
+    :param copy_columns: Copy the columns of the matched reflections in this
+                         table to the matched reflections from the other
+    :return: The mask of accepted matches in this table, the matched and the
+             unmatched reflections from the other table
 
     '''
-    from collections import defaultdict
-    import __builtin__
     logger.info("Matching reference spots with predicted reflections")
     logger.info(' %d observed reflections input' % len(other))
     logger.info(' %d reflections predicted' % len(self))
 
-    # Get the miller index, entering flag and turn number for
-    # Both sets of reflections
-    i1 = self['id']
-    h1 = self['miller_index']
-    e1 = self['entering'].as_int()
-    x1, y1, z1 = self['xyzcal.px'].parts()
-    p1 = self['panel']
-
-    i2 = other['id']
-    h2 = other['miller_index']
-    e2 = other['entering'].as_int()
-    x2, y2, z2 = other['xyzcal.px'].parts()
-    p2 = other['panel']
-
-    class Match(object):
-      def __init__(self):
-        self.a = []
-        self.b = []
-
-    # Create the match lookup
-    lookup = defaultdict(Match)
-    for i in range(len(self)):
-      item = h1[i] + (e1[i], i1[i], p1[i])
-      lookup[item].a.append(i)
-
-    # Add matches from input reflections
-    for i in range(len(other)):
-      item = h2[i] + (e2[i], i2[i], p2[i])
-      if item in lookup:
-        lookup[item].b.append(i)
-
-    # Create the list of matches
-    match1 = []
-    match2 = []
-    for item, value in lookup.iteritems():
-      if len(value.b) == 0:
-        continue
-      elif len(value.a) == 1 and len(value.b) == 1:
-        match1.append(value.a[0])
-        match2.append(value.b[0])
-      else:
-        matched = {}
-        for i in value.a:
-          d = []
-          for j in value.b:
-            dx = x1[i]-x2[j]
-            dy = y1[i]-y2[j]
-            dz = z1[i]-z2[j]
-            d.append((i,j,dx**2 + dy**2 + dz**2))
-          i, j, d = __builtin__.min(d, key=lambda x: x[2])
-          if j not in matched:
-            matched[j] = (i, d)
-          elif d < matched[j][1]:
-            matched[j] = (i, d)
-        for key1, value1 in matched.iteritems():
-          match1.append(value1[0])
-          match2.append(key1)
-
-    # Select everything which matches
-    sind = flex.size_t(match1)
-    oind = flex.size_t(match2)
-
-    # Sort by self index
-    sort_index = flex.size_t(__builtin__.sorted(range(len(sind)), key=lambda x: sind[x]))
-    sind = sind.select(sort_index)
-    oind = oind.select(sort_index)
+    # Match on the miller index, entering flag, experiment id and panel,
+    # sorted by self index
+    sind, oind = match_reference_indices(
+      self['miller_index'],
+      self['entering'],
+      self['id'],
+      self['panel'],
+      self['xyzcal.px'],
+      other['miller_index'],
+      other['entering'],
+      other['id'],
+      other['panel'],
+      other['xyzcal.px'],
+      nthreads=nthreads)
 
     s2 = self.select(sind)
     o2 = other.select(oind)
@@ -642,8 +573,9 @@ def __init__(self):
       flex.bool(len(other_matched_indices), False))
     other_matched = other.select(other_matched_indices)
     other_unmatched = other.select(other_unmatched_mask)
-    for key, column in self.select(sind.select(mask)).cols():
-      other_matched[key] = column
+    if copy_columns:
+      for key, column in self.select(sind.select(mask)).cols():
+        other_matched[key] = column
     mask2 = flex.bool(len(self),False)
     mask2.set_selected(sind.select(mask), True)
     return mask2, other_matched, other_unmatched
@@ -1033,47 +965,16 @@ def find_overlaps(self, experiments=None, border=0):
     # Return the overlaps
     return overlaps
 
-  def compute_shoebox_overlap_fraction(self, overlaps):
+  def compute_shoebox_overlap_fraction(self, overlaps, nthreads=1):
     '''
     Compute the fraction of shoebox overlapping.
 
     :param overlaps: The list of overlaps
+    :param nthreads: The number of threads to use
     :return: The fraction of shoebox overlapped with other reflections
 
     '''
-    from dials.array_family import flex
-    result = flex.double(len(self))
-    bbox = self['bbox']
-    for i in range(len(self)):
-      b1 = bbox[i]
-      xs = b1[1] - b1[0]
-      ys = b1[3] - b1[2]
-      zs = b1[5] - b1[4]
-      assert(xs > 0)
-      assert(ys > 0)
-      assert(zs > 0)
-      mask = flex.bool(flex.grid(zs,ys,xs),False)
-      for edge in overlaps.adjacent_vertices(i):
-        b2 = bbox[edge]
-        x0 = b2[0]-b1[0]
-        x1 = b2[1]-b1[0]
-        y0 = b2[2]-b1[2]
-        y1 = b2[3]-b1[2]
-        z0 = b2[4]-b1[4]
-        z1 = b2[5]-b1[4]
-        if x0 < 0: x0 = 0
-        if y0 < 0: y0 = 0
-        if z0 < 0: z0 = 0
-        if x1 > xs: x1 = xs
-        if y1 > ys: y1 = ys
-        if z1 > zs: z1 = zs
-        assert(x1 > x0)
-        assert(y1 > y0)
-        assert(z1 > z0)
-        m2 = flex.bool(flex.grid(z1-z0,y1-y0,x1-x0),True)
-        mask[z0:z1,y0:y1,x0:x1] = m2
-      result[i] = (1.0*mask.count(True)) / mask.size()
-    return result
+    return shoebox_overlap_fraction(overlaps, self['bbox'], nthreads=nthreads)
 
 
 class reflection_table_selector(object):
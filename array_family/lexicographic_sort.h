@@ -0,0 +1,164 @@
+/*
+ * lexicographic_sort.h
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#ifndef DIALS_ARRAY_FAMILY_LEXICOGRAPHIC_SORT_H
+#define DIALS_ARRAY_FAMILY_LEXICOGRAPHIC_SORT_H
+
+#include <algorithm>
+#include <vector>
+#include <boost/shared_ptr.hpp>
+#include <dials/array_family/scitbx_shared_and_versa.h>
+#include <dials/error.h>
+
+namespace dials { namespace af {
+
+  /**
+   * A class to compute the stable sort permutation of a table by a list of
+   * keys. Each key is a scalar column, a single component of a tuple-like
+   * column, or the runs of equal values in a column, and may be sorted in
+   * either direction. Rows are ordered by the first key, then ties are
+   * broken by the second key and so on. Rows which are equal on all keys
+   * keep their original order.
+   */
+  class LexicographicSorter {
+  public:
+
+    /**
+     * Initialize with the number of rows
+     */
+    LexicographicSorter(std::size_t size)
+      : size_(size) {}
+
+    /**
+     * Add a scalar key
+     * @param values The key values
+     * @param reverse Sort in descending order
+     */
+    template <typename T>
+    void add_key(const af::const_ref<T> &values, bool reverse) {
+      DIALS_ASSERT(values.size() == size_);
+      af::shared<T> key(values.begin(), values.end());
+      keys_.push_back(boost::shared_ptr<KeyBase>(new Key<T>(key, reverse)));
+    }
+
+    /**
+     * Add a single component of a tuple-like column as a key
+     * @param values The column values
+     * @param component The component to sort on
+     * @param reverse Sort in descending order
+     */
+    template <typename T, typename ValueType, std::size_t N>
+    void add_component_key(
+        const af::const_ref<T> &values,
+        std::size_t component,
+        bool reverse) {
+      DIALS_ASSERT(values.size() == size_);
+      DIALS_ASSERT(component < N);
+      af::shared<ValueType> key(values.size());
+      for (std::size_t i = 0; i < values.size(); ++i) {
+        key[i] = values[i][component];
+      }
+      keys_.push_back(boost::shared_ptr<KeyBase>(
+            new Key<ValueType>(key, reverse)));
+    }
+
+    /**
+     * Add a key numbering the runs of equal adjacent values, so that the
+     * rows stay in their runs and the runs stay in their current order.
+     * @param values The column values
+     */
+    template <typename T>
+    void add_run_key(const af::const_ref<T> &values) {
+      DIALS_ASSERT(values.size() == size_);
+      af::shared<std::size_t> key(values.size());
+      for (std::size_t i = 1; i < values.size(); ++i) {
+        key[i] = key[i-1] + (values[i] == values[i-1] ? 0 : 1);
+      }
+      keys_.push_back(boost::shared_ptr<KeyBase>(
+            new Key<std::size_t>(key, false)));
+    }
+
+    /**
+     * @returns The number of keys
+     */
+    std::size_t num_keys() const {
+      return keys_.size();
+    }
+
+    /**
+     * @returns The sort permutation
+     */
+    af::shared<std::size_t> permutation() const {
+      af::shared<std::size_t> index(size_);
+      for (std::size_t i = 0; i < size_; ++i) {
+        index[i] = i;
+      }
+      std::stable_sort(index.begin(), index.end(), Compare(keys_));
+      return index;
+    }
+
+  private:
+
+    /**
+     * Interface to compare two rows on a key
+     */
+    struct KeyBase {
+      virtual ~KeyBase() {}
+      virtual int compare(std::size_t a, std::size_t b) const = 0;
+    };
+
+    /**
+     * A key with values of a given type
+     */
+    template <typename T>
+    struct Key : public KeyBase {
+      af::shared<T> values;
+      bool reverse;
+
+      Key(af::shared<T> values_, bool reverse_)
+        : values(values_),
+          reverse(reverse_) {}
+
+      int compare(std::size_t a, std::size_t b) const {
+        int result = 0;
+        if (values[a] < values[b]) {
+          result = -1;
+        } else if (values[b] < values[a]) {
+          result = 1;
+        }
+        return reverse ? -result : result;
+      }
+    };
+
+    /**
+     * Compare two rows on each key in turn
+     */
+    struct Compare {
+      const std::vector< boost::shared_ptr<KeyBase> > &keys;
+
+      Compare(const std::vector< boost::shared_ptr<KeyBase> > &keys_)
+        : keys(keys_) {}
+
+      bool operator()(std::size_t a, std::size_t b) const {
+        for (std::size_t k = 0; k < keys.size(); ++k) {
+          int result = keys[k]->compare(a, b);
+          if (result != 0) {
+            return result < 0;
+          }
+        }
+        return false;
+      }
+    };
+
+    std::size_t size_;
+    std::vector< boost::shared_ptr<KeyBase> > keys_;
+  };
+
+}} // namespace dials::af
+
+#endif // DIALS_ARRAY_FAMILY_LEXICOGRAPHIC_SORT_H
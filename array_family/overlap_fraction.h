@@ -0,0 +1,192 @@
+/*
+ * overlap_fraction.h
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#ifndef DIALS_ARRAY_FAMILY_OVERLAP_FRACTION_H
+#define DIALS_ARRAY_FAMILY_OVERLAP_FRACTION_H
+
+#include <algorithm>
+#include <vector>
+#include <boost/bind.hpp>
+#include <boost/thread.hpp>
+#include <scitbx/array_family/shared.h>
+#include <scitbx/array_family/ref.h>
+#include <scitbx/array_family/tiny_types.h>
+#include <dials/model/data/adjacency_list.h>
+#include <dials/error.h>
+
+namespace dials { namespace af {
+
+  using scitbx::af::int6;
+  using dials::model::AdjacencyList;
+
+  /**
+   * Compute the fraction of each shoebox which is overlapped by the
+   * shoeboxes of its neighbours in the adjacency list.
+   *
+   * The overlapped volume is the volume of the union of the neighbouring
+   * bounding boxes clipped to the shoebox. Rather than painting each
+   * neighbour into a mask the size of the shoebox, the union is computed on
+   * the grid of cells formed by the distinct box edges along each axis, so
+   * the work depends on the number of neighbours and not on the size of the
+   * shoebox. The voxel count is exact, so the fractions are the same as
+   * those from a full mask. Each reflection is independent and the
+   * reflections may be processed by several threads.
+   */
+  class ShoeboxOverlapFraction {
+  public:
+
+    /**
+     * Compute the overlap fractions
+     * @param overlaps The adjacency list of overlapping reflections
+     * @param bbox The bounding boxes
+     * @param nthreads The number of threads
+     */
+    ShoeboxOverlapFraction(
+          const AdjacencyList &overlaps,
+          const scitbx::af::const_ref<int6> &bbox,
+          std::size_t nthreads)
+        : overlaps_(overlaps),
+          bbox_(bbox),
+          result_(bbox.size(), 0.0) {
+      DIALS_ASSERT(nthreads > 0);
+      DIALS_ASSERT(overlaps.num_vertices() >= bbox.size());
+      nthreads = std::min(nthreads, std::max(bbox.size(), (std::size_t)1));
+      if (nthreads > 1) {
+        boost::thread_group threads;
+        std::size_t chunk = (bbox.size() + nthreads - 1) / nthreads;
+        for (std::size_t first = 0; first < bbox.size(); first += chunk) {
+          std::size_t last = std::min(first + chunk, bbox.size());
+          threads.create_thread(boost::bind(
+                &ShoeboxOverlapFraction::process, this, first, last));
+        }
+        threads.join_all();
+      } else {
+        process(0, bbox.size());
+      }
+    }
+
+    /**
+     * @returns The overlap fraction of each shoebox
+     */
+    scitbx::af::shared<double> result() const {
+      return result_;
+    }
+
+  private:
+
+    /**
+     * Process a range of reflections. The threads write to distinct elements
+     * of the result array.
+     */
+    void process(std::size_t first, std::size_t last) {
+      std::vector<int6> boxes;
+      std::vector<int> xc, yc, zc;
+      std::vector<bool> cells;
+      for (std::size_t i = first; i < last; ++i) {
+        const int6 &b1 = bbox_[i];
+        int xs = b1[1] - b1[0];
+        int ys = b1[3] - b1[2];
+        int zs = b1[5] - b1[4];
+        DIALS_ASSERT(xs > 0);
+        DIALS_ASSERT(ys > 0);
+        DIALS_ASSERT(zs > 0);
+
+        // Clip the neighbouring boxes to the shoebox
+        boxes.clear();
+        AdjacencyList::edge_iterator_range edges = overlaps_.edges(i);
+        for (AdjacencyList::edge_iterator it = edges.first;
+             it != edges.second; ++it) {
+          const int6 &b2 = bbox_[overlaps_.target(*it)];
+          int6 b;
+          b[0] = std::max(b2[0] - b1[0], 0);
+          b[1] = std::min(b2[1] - b1[0], xs);
+          b[2] = std::max(b2[2] - b1[2], 0);
+          b[3] = std::min(b2[3] - b1[2], ys);
+          b[4] = std::max(b2[4] - b1[4], 0);
+          b[5] = std::min(b2[5] - b1[4], zs);
+          DIALS_ASSERT(b[1] > b[0]);
+          DIALS_ASSERT(b[3] > b[2]);
+          DIALS_ASSERT(b[5] > b[4]);
+          boxes.push_back(b);
+        }
+        if (boxes.empty()) {
+          continue;
+        }
+
+        // The grid of cells between distinct box edges
+        edge_coordinates(boxes, 0, xc);
+        edge_coordinates(boxes, 2, yc);
+        edge_coordinates(boxes, 4, zc);
+        std::size_t nx = xc.size() - 1;
+        std::size_t ny = yc.size() - 1;
+        std::size_t nz = zc.size() - 1;
+        cells.assign(nx * ny * nz, false);
+        for (std::size_t j = 0; j < boxes.size(); ++j) {
+          const int6 &b = boxes[j];
+          std::size_t x0 = index_of(xc, b[0]), x1 = index_of(xc, b[1]);
+          std::size_t y0 = index_of(yc, b[2]), y1 = index_of(yc, b[3]);
+          std::size_t z0 = index_of(zc, b[4]), z1 = index_of(zc, b[5]);
+          for (std::size_t z = z0; z < z1; ++z) {
+            for (std::size_t y = y0; y < y1; ++y) {
+              for (std::size_t x = x0; x < x1; ++x) {
+                cells[(z * ny + y) * nx + x] = true;
+              }
+            }
+          }
+        }
+
+        // Count the voxels in the covered cells
+        std::size_t count = 0;
+        for (std::size_t z = 0; z < nz; ++z) {
+          for (std::size_t y = 0; y < ny; ++y) {
+            for (std::size_t x = 0; x < nx; ++x) {
+              if (cells[(z * ny + y) * nx + x]) {
+                count += (std::size_t)(xc[x+1] - xc[x])
+                       * (std::size_t)(yc[y+1] - yc[y])
+                       * (std::size_t)(zc[z+1] - zc[z]);
+              }
+            }
+          }
+        }
+        std::size_t size = (std::size_t)xs * (std::size_t)ys * (std::size_t)zs;
+        result_[i] = (1.0 * count) / size;
+      }
+    }
+
+    /**
+     * Get the sorted distinct coordinates of the box edges along an axis
+     */
+    static void edge_coordinates(
+          const std::vector<int6> &boxes,
+          std::size_t axis,
+          std::vector<int> &coords) {
+      coords.clear();
+      for (std::size_t j = 0; j < boxes.size(); ++j) {
+        coords.push_back(boxes[j][axis]);
+        coords.push_back(boxes[j][axis+1]);
+      }
+      std::sort(coords.begin(), coords.end());
+      coords.erase(std::unique(coords.begin(), coords.end()), coords.end());
+    }
+
+    /**
+     * Get the index of a coordinate in the list of edge coordinates
+     */
+    static std::size_t index_of(const std::vector<int> &coords, int value) {
+      return std::lower_bound(coords.begin(), coords.end(), value)
+        - coords.begin();
+    }
+
+    const AdjacencyList &overlaps_;
+    scitbx::af::const_ref<int6> bbox_;
+    scitbx::af::shared<double> result_;
+  };
+
+}} // namespace dials::af
+
+#endif // DIALS_ARRAY_FAMILY_OVERLAP_FRACTION_H
@@ -0,0 +1,297 @@
+/*
+ * reference_matcher.h
+ *
+ *  Copyright (C) 2018 Diamond Light Source
+ *
+ *  This code is distributed under the BSD license, a copy of which is
+ *  included in the root directory of this package.
+ */
+#ifndef DIALS_ARRAY_FAMILY_REFERENCE_MATCHER_H
+#define DIALS_ARRAY_FAMILY_REFERENCE_MATCHER_H
+
+#include <algorithm>
+#include <vector>
+#include <utility>
+#include <boost/bind.hpp>
+#include <boost/thread.hpp>
+#include <scitbx/array_family/shared.h>
+#include <scitbx/array_family/ref.h>
+#include <scitbx/vec3.h>
+#include <cctbx/miller.h>
+#include <dials/error.h>
+
+namespace dials { namespace af {
+
+  using scitbx::vec3;
+
+  /**
+   * Match predicted reflections to reference reflections. Reflections match
+   * if they have the same miller index, entering flag, experiment id and
+   * panel. Where a key is shared by more than one reflection in either set,
+   * each predicted reflection is paired with its nearest reference reflection
+   * and each reference reflection keeps only its nearest predicted reflection.
+   *
+   * The reflections are sorted by key and the groups of equal keys are found
+   * by walking through both sorted lists, so the matching is O(N log N). The
+   * groups are independent and may be processed by several threads.
+   */
+  class ReferenceMatcher {
+  public:
+
+    typedef cctbx::miller::index<> miller_index;
+
+    /**
+     * The key on which reflections are matched
+     */
+    struct Key {
+      miller_index h;
+      bool entering;
+      int id;
+      std::size_t panel;
+
+      bool operator<(const Key &other) const {
+        if (h[0] != other.h[0]) return h[0] < other.h[0];
+        if (h[1] != other.h[1]) return h[1] < other.h[1];
+        if (h[2] != other.h[2]) return h[2] < other.h[2];
+        if (entering != other.entering) return entering < other.entering;
+        if (id != other.id) return id < other.id;
+        return panel < other.panel;
+      }
+
+      bool operator==(const Key &other) const {
+        return h == other.h
+            && entering == other.entering
+            && id == other.id
+            && panel == other.panel;
+      }
+    };
+
+    /**
+     * Do the matching
+     * @param h1 The predicted miller indices
+     * @param e1 The predicted entering flags
+     * @param i1 The predicted experiment ids
+     * @param p1 The predicted panels
+     * @param x1 The predicted positions
+     * @param h2 The reference miller indices
+     * @param e2 The reference entering flags
+     * @param i2 The reference experiment ids
+     * @param p2 The reference panels
+     * @param x2 The reference positions
+     * @param nthreads The number of threads
+     */
+    ReferenceMatcher(
+          const scitbx::af::const_ref<miller_index> &h1,
+          const scitbx::af::const_ref<bool> &e1,
+          const scitbx::af::const_ref<int> &i1,
+          const scitbx::af::const_ref<std::size_t> &p1,
+          const scitbx::af::const_ref< vec3<double> > &x1,
+          const scitbx::af::const_ref<miller_index> &h2,
+          const scitbx::af::const_ref<bool> &e2,
+          const scitbx::af::const_ref<int> &i2,
+          const scitbx::af::const_ref<std::size_t> &p2,
+          const scitbx::af::const_ref< vec3<double> > &x2,
+          std::size_t nthreads)
+        : x1_(x1),
+          x2_(x2),
+          match_(h1.size(), npos()) {
+      DIALS_ASSERT(nthreads > 0);
+      DIALS_ASSERT(e1.size() == h1.size());
+      DIALS_ASSERT(i1.size() == h1.size());
+      DIALS_ASSERT(p1.size() == h1.size());
+      DIALS_ASSERT(x1.size() == h1.size());
+      DIALS_ASSERT(e2.size() == h2.size());
+      DIALS_ASSERT(i2.size() == h2.size());
+      DIALS_ASSERT(p2.size() == h2.size());
+      DIALS_ASSERT(x2.size() == h2.size());
+
+      // Create the keys
+      std::vector<Key> k1 = make_keys(h1, e1, i1, p1);
+      std::vector<Key> k2 = make_keys(h2, e2, i2, p2);
+
+      // Sort the indices by key. The sort is stable so that reflections with
+      // the same key stay in their input order.
+      std::vector<std::size_t> s1;
+      std::vector<std::size_t> s2;
+      if (nthreads > 1) {
+        boost::thread thread(boost::bind(&sort_by_key,
+              boost::cref(k1), boost::ref(s1)));
+        sort_by_key(k2, s2);
+        thread.join();
+      } else {
+        sort_by_key(k1, s1);
+        sort_by_key(k2, s2);
+      }
+
+      // Find the groups of equal keys in both sets
+      std::size_t a = 0, b = 0;
+      while (a < s1.size() && b < s2.size()) {
+        const Key &ka = k1[s1[a]];
+        const Key &kb = k2[s2[b]];
+        if (ka < kb) {
+          a++;
+        } else if (kb < ka) {
+          b++;
+        } else {
+          std::size_t a1 = a, b1 = b;
+          while (a1 < s1.size() && k1[s1[a1]] == ka) a1++;
+          while (b1 < s2.size() && k2[s2[b1]] == kb) b1++;
+          groups_.push_back(Group(a, a1, b, b1));
+          a = a1;
+          b = b1;
+        }
+      }
+      s1_.swap(s1);
+      s2_.swap(s2);
+
+      // Process the groups
+      nthreads = std::min(nthreads, std::max(groups_.size(), (std::size_t)1));
+      if (nthreads > 1) {
+        boost::thread_group threads;
+        std::size_t chunk = (groups_.size() + nthreads - 1) / nthreads;
+        for (std::size_t first = 0; first < groups_.size(); first += chunk) {
+          std::size_t last = std::min(first + chunk, groups_.size());
+          threads.create_thread(boost::bind(
+                &ReferenceMatcher::process_groups, this, first, last));
+        }
+        threads.join_all();
+      } else {
+        process_groups(0, groups_.size());
+      }
+    }
+
+    /**
+     * @returns The indices of the matched predictions in increasing order
+     */
+    scitbx::af::shared<std::size_t> self_indices() const {
+      scitbx::af::shared<std::size_t> result;
+      for (std::size_t i = 0; i < match_.size(); ++i) {
+        if (match_[i] != npos()) {
+          result.push_back(i);
+        }
+      }
+      return result;
+    }
+
+    /**
+     * @returns The indices of the matching reference reflections
+     */
+    scitbx::af::shared<std::size_t> other_indices() const {
+      scitbx::af::shared<std::size_t> result;
+      for (std::size_t i = 0; i < match_.size(); ++i) {
+        if (match_[i] != npos()) {
+          result.push_back(match_[i]);
+        }
+      }
+      return result;
+    }
+
+  protected:
+
+    /**
+     * A range of equal keys in both sorted lists
+     */
+    struct Group {
+      std::size_t a0, a1, b0, b1;
+      Group(std::size_t a0_, std::size_t a1_, std::size_t b0_, std::size_t b1_)
+        : a0(a0_), a1(a1_), b0(b0_), b1(b1_) {}
+    };
+
+    static std::size_t npos() {
+      return (std::size_t)-1;
+    }
+
+    static std::vector<Key> make_keys(
+          const scitbx::af::const_ref<miller_index> &h,
+          const scitbx::af::const_ref<bool> &e,
+          const scitbx::af::const_ref<int> &i,
+          const scitbx::af::const_ref<std::size_t> &p) {
+      std::vector<Key> keys(h.size());
+      for (std::size_t j = 0; j < keys.size(); ++j) {
+        keys[j].h = h[j];
+        keys[j].entering = e[j];
+        keys[j].id = i[j];
+        keys[j].panel = p[j];
+      }
+      return keys;
+    }
+
+    struct KeyLess {
+      const std::vector<Key> &keys;
+      KeyLess(const std::vector<Key> &keys_) : keys(keys_) {}
+      bool operator()(std::size_t a, std::size_t b) const {
+        return keys[a] < keys[b];
+      }
+    };
+
+    static void sort_by_key(const std::vector<Key> &keys,
+                            std::vector<std::size_t> &index) {
+      index.resize(keys.size());
+      for (std::size_t i = 0; i < index.size(); ++i) {
+        index[i] = i;
+      }
+      std::stable_sort(index.begin(), index.end(), KeyLess(keys));
+    }
+
+    double distance_sq(std::size_t i, std::size_t j) const {
+      double dx = x1_[i][0] - x2_[j][0];
+      double dy = x1_[i][1] - x2_[j][1];
+      double dz = x1_[i][2] - x2_[j][2];
+      return dx*dx + dy*dy + dz*dz;
+    }
+
+    /**
+     * Process a range of groups. Each prediction is in exactly one group so
+     * the threads write to distinct elements of the match array.
+     */
+    void process_groups(std::size_t first, std::size_t last) {
+      std::vector<std::size_t> best_i;
+      std::vector<double> best_d;
+      for (std::size_t g = first; g < last; ++g) {
+        const Group &group = groups_[g];
+        std::size_t na = group.a1 - group.a0;
+        std::size_t nb = group.b1 - group.b0;
+        if (na == 1 && nb == 1) {
+          match_[s1_[group.a0]] = s2_[group.b0];
+          continue;
+        }
+
+        // Find the nearest reference for each prediction and keep the
+        // nearest prediction for each reference
+        best_i.assign(nb, npos());
+        best_d.assign(nb, 0.0);
+        for (std::size_t a = group.a0; a < group.a1; ++a) {
+          std::size_t i = s1_[a];
+          std::size_t jmin = 0;
+          double dmin = distance_sq(i, s2_[group.b0]);
+          for (std::size_t b = 1; b < nb; ++b) {
+            double d = distance_sq(i, s2_[group.b0 + b]);
+            if (d < dmin) {
+              dmin = d;
+              jmin = b;
+            }
+          }
+          if (best_i[jmin] == npos() || dmin < best_d[jmin]) {
+            best_i[jmin] = i;
+            best_d[jmin] = dmin;
+          }
+        }
+        for (std::size_t b = 0; b < nb; ++b) {
+          if (best_i[b] != npos()) {
+            match_[best_i[b]] = s2_[group.b0 + b];
+          }
+        }
+      }
+    }
+
+    scitbx::af::const_ref< vec3<double> > x1_;
+    scitbx::af::const_ref< vec3<double> > x2_;
+    std::vector<std::size_t> s1_;
+    std::vector<std::size_t> s2_;
+    std::vector<Group> groups_;
+    std::vector<std::size_t> match_;
+  };
+
+}}
+
+#endif // DIALS_ARRAY_FAMILY_REFERENCE_MATCHER_H
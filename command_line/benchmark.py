@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+#
+# dials.command_line.benchmark.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+# LIBTBX_SET_DISPATCHER_NAME dev.dials.benchmark
+
+from __future__ import absolute_import, division, print_function
+
+import json
+import logging
+import sys
+
+logger = logging.getLogger('dials.command_line.benchmark')
+
+help_message = '''
+
+Run the main stages of processing on a reproducible synthetic data set and
+record the wall time, CPU time and peak memory use of each stage as JSON. The
+scale of the data set (images, panels, spots per image and crystal lattices)
+is configurable, and the same seed always gives the same data.
+
+A previous result can be given with compare.reference= to flag stages that
+have become slower or use more memory; the program then exits with a non-zero
+status if there are any regressions. Two existing results can also be compared
+without running anything by giving both compare.reference= and
+compare.result=.
+
+Examples::
+
+  dev.dials.benchmark scale.n_images=100 scale.spots_per_image=200
+
+  dev.dials.benchmark scale.n_panels=4 scale.n_experiments=2 nproc=4
+
+  dev.dials.benchmark stages=fft3d fft3d.n_points=128,256,384 fft3d.nthreads=1,4
+
+  dev.dials.benchmark compare.reference=baseline.json
+
+  dev.dials.benchmark compare.reference=old.json compare.result=new.json
+
+'''
+
+from libtbx.phil import parse
+
+phil_scope = parse('''
+  include scope dials.util.benchmark.phil_scope
+
+  compare {
+    reference = None
+      .type = path
+      .help = "A previous benchmark result to compare against"
+    result = None
+      .type = path
+      .help = "An existing benchmark result to compare, instead of running"
+              "the benchmark"
+    tolerance = 0.1
+      .type = float(value_min=0)
+      .help = "The fractional increase in wall time flagged as a regression"
+    memory_tolerance = 0.1
+      .type = float(value_min=0)
+      .help = "The fractional increase in memory flagged as a regression. The"
+              "memory compared is the increase in peak memory during each"
+              "stage, which is run in its own process."
+    min_time = 0.05
+      .type = float(value_min=0)
+      .help = "Ignore increases in wall time smaller than this (seconds)"
+    min_memory = 10
+      .type = float(value_min=0)
+      .help = "Ignore increases in memory smaller than this (MB)"
+  }
+
+  output {
+    json = benchmark.json
+      .type = path
+    log = dials.benchmark.log
+      .type = path
+    debug_log = dials.benchmark.debug.log
+      .type = path
+  }
+''', process_includes=True)
+
+
+class Script(object):
+  ''' A class for running the script. '''
+
+  def __init__(self):
+    ''' Initialise the script. '''
+    from dials.util.options import OptionParser
+    import libtbx.load_env
+
+    usage = "usage: %s [options] [param.phil]" % libtbx.env.dispatcher_name
+
+    self.parser = OptionParser(
+      usage=usage,
+      phil=phil_scope,
+      epilog=help_message)
+
+  def run(self):
+    ''' Run the benchmark. '''
+    from dials.util import log
+    from dials.util.benchmark import Benchmark
+
+    params, options = self.parser.parse_args(show_diff_phil=False)
+
+    log.config(
+      info=params.output.log,
+      debug=params.output.debug_log)
+
+    from dials.util.version import dials_version
+    logger.info(dials_version())
+
+    diff_phil = self.parser.diff_phil.as_str()
+    if diff_phil != '':
+      logger.info('The following parameters have been modified:\n')
+      logger.info(diff_phil)
+
+    if params.compare.result is not None:
+      if params.compare.reference is None:
+        from libtbx.utils import Sorry
+        raise Sorry('compare.result requires compare.reference')
+      with open(params.compare.result) as infile:
+        result = json.load(infile)
+    else:
+      result = Benchmark(params).run()
+      self.show_result(result)
+      logger.info('Saving results to %s' % params.output.json)
+      with open(params.output.json, 'w') as outfile:
+        json.dump(result, outfile, indent=2, sort_keys=True)
+
+    if params.compare.reference is not None:
+      with open(params.compare.reference) as infile:
+        reference = json.load(infile)
+      if not self.show_comparison(reference, result, params.compare):
+        sys.exit(1)
+
+  def show_result(self, result):
+    ''' Show a table of the stage timings. '''
+    from libtbx.table_utils import simple_table
+    from dials.util.benchmark import sort_stage_names
+    rows = []
+    for name in sort_stage_names(result['results']):
+      r = result['results'][name]
+      if r['status'] == 'ok':
+        rows.append([name, r['status'],
+                     '%.2f' % r['wall_time'],
+                     '%.2f' % r['cpu_time'],
+                     '%.1f' % r['peak_rss_mb'],
+                     '%.1f' % r.get('peak_rss_increase_mb', 0)])
+      else:
+        rows.append([name, r['status'], '', '', '', ''])
+    header = ['Stage', 'Status', 'Wall time (s)', 'CPU time (s)',
+              'Peak RSS (MB)', 'Peak increase (MB)']
+    logger.info(simple_table(rows, header).format())
+
+  def show_comparison(self, reference, result, params):
+    ''' Show the comparison with the reference and return False on any
+    regressions. '''
+    from libtbx.table_utils import simple_table
+    from dials.util.benchmark import compare
+    comparison = compare(
+      reference, result,
+      tolerance=params.tolerance,
+      memory_tolerance=params.memory_tolerance,
+      min_time=params.min_time,
+      min_memory=params.min_memory)
+    rows = []
+    n_regressions = 0
+    for name, t0, t1, ratio, regressions in comparison:
+      fmt = lambda t: '%.2f' % t if t is not None else ''
+      rows.append([name, fmt(t0), fmt(t1), fmt(ratio),
+                   ', '.join(regressions)])
+      if regressions:
+        n_regressions += 1
+    header = ['Stage', 'Reference (s)', 'Result (s)', 'Ratio', 'Regression']
+    logger.info(simple_table(rows, header).format())
+    if n_regressions > 0:
+      logger.info('%d stages have regressed' % n_regressions)
+      return False
+    logger.info('No regressions')
+    return True
+
+
+if __name__ == '__main__':
+  from dials.util import halraiser
+  try:
+    script = Script()
+    script.run()
+  except Exception as e:
+    halraiser(e)
@@ -11,6 +11,9 @@
 '''
 
 phil_scope= libtbx.phil.parse("""
+nproc = 1
+  .type = int(value_min=1)
+  .help = "The number of processes to use for the shadow calculation"
 """)
 
 
@@ -44,7 +47,8 @@ def run(args):
 
   imagesets = experiments.imagesets()
   reflections = reflections[0]
-  shadowed = filter_shadowed_reflections(experiments, reflections)
+  shadowed = filter_shadowed_reflections(experiments, reflections,
+                                         nproc=params.nproc)
 
   print "# shadowed reflections: %i/%i (%.2f%%)" %(
     shadowed.count(True), shadowed.size(),
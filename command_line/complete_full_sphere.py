@@ -21,6 +21,9 @@
 shadow = True
   .type = bool
   .help = "Consider shadowing in calculating overall completeness"
+nproc = 1
+  .type = int(value_min=1)
+  .help = "The number of processes to use for the shadow calculation"
 
 ''')
 
@@ -104,7 +107,8 @@ def run(self):
       d_min=resolution)
 
     if model_shadow:
-      obs, shadow = self.predict_to_miller_set_with_shadow(expt, resolution)
+      obs, shadow = self.predict_to_miller_set_with_shadow(
+        expt, resolution, params.nproc)
     else:
       obs = self.predict_to_miller_set(expt, resolution)
 
@@ -155,7 +159,8 @@ def run(self):
     for j, s in enumerate(solutions):
       expt.goniometer.set_angles(s)
       if model_shadow:
-        obs, shadow = self.predict_to_miller_set_with_shadow(expt, resolution)
+        obs, shadow = self.predict_to_miller_set_with_shadow(
+          expt, resolution, params.nproc)
       else:
         obs = self.predict_to_miller_set(expt, resolution)
       new = missing.common_set(obs)
@@ -202,7 +207,7 @@ def predict_to_miller_set(self, expt, resolution):
 
     return obs
 
-  def predict_to_miller_set_with_shadow(self, expt, resolution):
+  def predict_to_miller_set_with_shadow(self, expt, resolution, nproc=1):
     from dials.array_family import flex
     from dials.algorithms.shadowing.filter import filter_shadowed_reflections
     predicted = flex.reflection_table.from_predictions(expt, dmin=resolution)
@@ -213,7 +218,8 @@ def predict_to_miller_set_with_shadow(self, expt, resolution):
     experiments.append(expt)
     predicted['id'] = flex.int(predicted.size(), 0)
     shadowed = filter_shadowed_reflections(experiments, predicted,
-                                           experiment_goniometer=True)
+                                           experiment_goniometer=True,
+                                           nproc=nproc)
     predicted = predicted.select(~shadowed)
 
     hkl = predicted['miller_index']
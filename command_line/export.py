@@ -48,6 +48,11 @@
 XDS format exports an experiments.json file as XDS.INP and XPARM.XDS files. If a
 reflection pickle is given it will be exported as a SPOT.XDS file.
 
+COLUMNAR format exports a reflection table as a columnar binary file, which can
+be read by any dials program in place of a reflection pickle. The columns are
+read on demand from a memory mapped file and the shoeboxes are stored in a
+separate section which is skipped if they are not needed.
+
 Examples::
 
   # Export to mtz
@@ -71,11 +76,15 @@
   dials.export experiments.json format=xds
   dials.export experiments.json indexed.pickle format=xds
 
+  # Export to a columnar binary reflection file
+  dials.export integrated.pickle format=columnar
+  dials.export integrated.pickle format=columnar columnar.shoeboxes=False
+
 '''
 
 phil_scope = parse('''
 
-  format = *mtz sadabs nxs mmcif mosflm xds best xds_ascii json
+  format = *mtz sadabs nxs mmcif mosflm xds best xds_ascii json columnar
     .type = choice
     .help = "The output file format"
 
@@ -214,6 +223,18 @@
               "reciprocal lattice points."
   }
 
+  columnar {
+
+    filename = reflections.refl
+      .type = path
+      .help = "The output columnar reflection file"
+
+    shoeboxes = True
+      .type = bool
+      .help = "Write the shoeboxes, if present"
+
+  }
+
   output {
 
     log = dials.export.log
@@ -225,7 +246,9 @@
       .help = "The debug log filename"
 
   }
-''')
+
+  include scope dials.util.trace.phil_scope
+''', process_includes=True)
 
 
 class MTZExporter(object):
@@ -626,6 +649,41 @@ def export(self):
       n_digits=params.json.n_digits, datablocks=datablocks)
 
 
+class ColumnarExporter(object):
+  '''
+  A class to export reflections in columnar binary format
+
+  '''
+
+  def __init__(self, params, reflections):
+    '''
+    Initialise the exporter
+
+    :param params: The phil parameters
+    :param reflections: The reflection tables
+
+    '''
+
+    # Check the input
+    if len(reflections) != 1:
+      raise Sorry('Columnar exporter requires 1 reflection table')
+
+    # Save the stuff
+    self.params = params
+    self.reflections = reflections[0]
+
+  def export(self):
+    '''
+    Export the files
+
+    '''
+    logger.info('Saving %d reflections to %s' % (
+      len(self.reflections), self.params.columnar.filename))
+    self.reflections.as_columnar(
+      self.params.columnar.filename,
+      shoeboxes=self.params.columnar.shoeboxes)
+
+
 if __name__ == '__main__':
   import libtbx.load_env
   from dials.util.options import OptionParser
@@ -634,6 +692,7 @@ def export(self):
   from dials.util.options import flatten_reflections
   from dials.util.version import dials_version
   from dials.util import log
+  from dials.util import trace
   from libtbx.utils import Sorry
   import os
 
@@ -666,6 +725,7 @@ def export(self):
   log.config(
     info=params.output.log,
     debug=params.output.debug_log)
+  trace.configure(params.trace)
 
   # Print the version number
   logger.info(dials_version())
@@ -705,8 +765,11 @@ def export(self):
   elif params.format == 'json':
     exporter = JsonExporter(
       params, reflections, datablocks=datablocks, experiments=experiments)
+  elif params.format == 'columnar':
+    exporter = ColumnarExporter(params, reflections)
   else:
     raise Sorry('Unknown format: %s' % params.format)
 
   # Export the data
-  exporter.export()
+  with trace.span('export', 'export', format=params.format):
+    exporter.export()
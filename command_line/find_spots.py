@@ -81,6 +81,7 @@
     .help = "The verbosity level"
 
   include scope dials.algorithms.spot_finding.factory.phil_scope
+  include scope dials.util.trace.phil_scope
 
 ''', process_includes=True)
 
@@ -112,6 +113,7 @@ def run(self):
     from dials.util.options import flatten_datablocks
     from time import time
     from dials.util import log
+    from dials.util import trace
     from libtbx.utils import Sorry
     start_time = time()
 
@@ -123,6 +125,7 @@ def run(self):
       params.verbosity,
       info=params.output.log,
       debug=params.output.debug_log)
+    trace.configure(params.trace)
 
     from dials.util.version import dials_version
     logger.info(dials_version())
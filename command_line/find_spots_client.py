@@ -1,19 +1,87 @@
 from __future__ import absolute_import, division
 import socket as pysocket
 
-def work(host, port, filename, params):
-  import httplib
-  conn = httplib.HTTPConnection(host, port)
-  path = filename
-  for param in params:
-    path += ';%s' % param
-  conn.request('GET', path)
-  return conn.getresponse().read()
+class Client(object):
+  '''
+  A client for dials.find_spots_server which keeps its connection open
+  between requests.
+
+  '''
+
+  def __init__(self, host, port):
+    self.host = host
+    self.port = port
+    self.conn = None
+
+  def _request(self, method, path, body=None, headers=None):
+    '''
+    Send a request, reconnecting once if the server closed the connection
+
+    '''
+    import httplib
+    if headers is None:
+      headers = {}
+    for attempt in range(2):
+      if self.conn is None:
+        self.conn = httplib.HTTPConnection(self.host, self.port)
+      try:
+        self.conn.request(method, path, body, headers)
+        return self.conn.getresponse()
+      except (httplib.HTTPException, pysocket.error):
+        self.close()
+        if attempt > 0:
+          raise
+
+  def work(self, filename, params):
+    '''
+    Process a single image
+
+    :param filename: The image filename
+    :param params: The list of parameters
+    :return: The JSON response
+
+    '''
+    path = filename
+    for param in params:
+      path += ';%s' % param
+    return self._request('GET', path).read()
 
-def _nproc():
-  from libtbx.introspection import number_of_processors
-  return number_of_processors(return_value_if_unknown=-1)
+  def work_batch(self, filenames, params):
+    '''
+    Process a batch of images. The results are returned as each image is
+    processed, which may not be in the order of the filenames.
 
+    :param filenames: The image filenames
+    :param params: The list of parameters
+    :return: An iterator over the dictionaries of results
+
+    '''
+    import json
+    body = json.dumps({'filenames': list(filenames), 'params': list(params)})
+    response = self._request('POST', '/batch', body,
+                             {'Content-Type': 'application/json'})
+    while True:
+      length = ''
+      while True:
+        c = response.read(1)
+        if c == '' or c == '\n':
+          break
+        length += c
+      if length == '':
+        break
+      yield json.loads(response.read(int(length)))
+
+  def close(self):
+    if self.conn is not None:
+      self.conn.close()
+      self.conn = None
+
+def work(host, port, filename, params):
+  client = Client(host, port)
+  try:
+    return client.work(filename, params)
+  finally:
+    client.close()
 
 def response_to_xml(d):
 
@@ -51,21 +119,30 @@ def response_to_xml(d):
   return '<response>\n%s\n</response>' %response
 
 def work_all(host, port, filenames, params, plot=False, table=False,
-             json_file=None, grid=None, nproc=None):
+             json_file=None, grid=None, benchmark=False, repeat=1):
   import json
-  from multiprocessing.pool import ThreadPool as thread_pool
-  if nproc is None:
-    nproc=_nproc()
-  pool = thread_pool(processes=nproc)
-  threads = { }
-  for filename in filenames:
-    threads[filename] = pool.apply_async(work, (host, port, filename, params))
-  results = []
-  for filename in filenames:
-    response = threads[filename].get()
-    d = json.loads(response)
-    results.append(d)
-    print response_to_xml(d)
+  import time
+  client = Client(host, port)
+  requested = list(filenames) * repeat
+  results = {}
+  first = None
+  st = time.time()
+  try:
+    for i, d in enumerate(client.work_batch(requested, params)):
+      if i == 0:
+        first = time.time() - st
+      results[d['image']] = d
+      if not benchmark:
+        print response_to_xml(d)
+  finally:
+    client.close()
+  elapsed = time.time() - st
+  results = [results[filename] for filename in filenames]
+
+  if benchmark and len(requested) > 0:
+    print 'Processed %d images in %.2f seconds' % (len(requested), elapsed)
+    print 'First result after %.2f seconds' % first
+    print 'Sustained rate: %.1f images/s' % (len(requested) / elapsed)
 
   if json_file is not None:
     'Writing results to %s' %json_file
@@ -128,8 +205,10 @@ def stop(host, port, nproc):
     try:
       url_request = urllib2.Request("http://%s:%s/Ctrl-C" % (host, port))
       socket = urllib2.urlopen(url_request, None, 3)
-      if socket.getcode() == '200':
+      if socket.getcode() == 200:
+        # A single server process dispatches to all the workers
         stopped = stopped + 1
+        break
       else:
         print "socket returned code", socket.getcode()
     except (pysocket.timeout, urllib2.HTTPError) as e:
@@ -161,6 +240,13 @@ def stop(host, port, nproc):
   .type = path
 grid = None
   .type = ints(size=2, value_min=1)
+benchmark = False
+  .type = bool
+  .help = "Report the time taken and the sustained number of images"
+          "processed per second, rather than the results for each image"
+repeat = 1
+  .type = int(value_min=1)
+  .help = "Send the list of images this many times (for benchmarking)"
 """)
 
 if __name__ == '__main__':
@@ -184,10 +270,7 @@ def stop(host, port, nproc):
   params = params.extract()
 
   if params.nproc is libtbx.Auto:
-    nproc = None
     params.nproc = 1024
-  else:
-    nproc = params.nproc
 
   if len(unhandled) and unhandled[0] == 'stop':
     stopped = stop(params.host, params.port, params.nproc)
@@ -210,4 +293,5 @@ def stop(host, port, nproc):
     else:
       work_all(params.host, params.port, filenames, unhandled, plot=params.plot,
                table=params.table, json_file=params.json,
-               grid=params.grid, nproc=nproc)
+               grid=params.grid, benchmark=params.benchmark,
+               repeat=params.repeat)
@@ -1,8 +1,7 @@
 from __future__ import absolute_import, division
 import time
 import BaseHTTPServer as server_base
-from multiprocessing import Process
-from multiprocessing import current_process
+import SocketServer
 import os
 import sys
 
@@ -53,19 +52,22 @@
 
   dials.find_spots_client /path/to/image.cbf min_spot_size=2 d_min=2
 
+When given more than one image, the client sends them to the server in a
+single request and the results are returned as each image is processed. The
+server keeps a pool of worker processes running, each of which caches the
+parsed parameters, image format, spot finding kernels and masks between
+requests. To measure the sustained throughput of the server::
+
+  dials.find_spots_client benchmark=True repeat=10 /path/to/images*.cbf
+
 To stop the server::
 
   dials.find_spots_client stop [host=hostname] [port=1234]
 
 '''
 
-stop = False
-
-def work(filename, cl=None):
-  if cl is None:
-    cl = []
-  import libtbx.phil
-  phil_scope = libtbx.phil.parse('''\
+import libtbx.phil
+options_phil_scope = libtbx.phil.parse('''\
 filter_ice = True
   .type = bool
 index = False
@@ -75,30 +77,212 @@ def work(filename, cl=None):
 indexing_min_spots = 10
   .type = int(value_min=1)
 ''')
+
+
+class LRUCache(object):
+  '''
+  A dictionary holding at most a fixed number of items, discarding the least
+  recently used item when full. The numbers of hits and misses are counted.
+
+  '''
+
+  def __init__(self, size):
+    from collections import OrderedDict
+    self.size = size
+    self.items = OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key, create):
+    '''
+    Get an item, creating it if it is not in the cache
+
+    :param key: The key
+    :param create: A function to create the item
+    :return: The item
+
+    '''
+    try:
+      item = self.items.pop(key)
+      self.hits += 1
+    except KeyError:
+      self.misses += 1
+      item = create()
+      if len(self.items) >= self.size:
+        self.items.popitem(last=False)
+    self.items[key] = item
+    return item
+
+
+class CachedMaskGenerator(object):
+  '''
+  A mask generator which caches the static part of the mask (border,
+  untrusted regions and resolution masks) for each geometry. The trusted range
+  part of the mask depends on the image data so is recomputed for each image.
+
+  '''
+
+  def __init__(self, params, size=8):
+    '''
+    :param params: The spotfinder.filter parameters
+    :param size: The number of geometries to cache
+
+    '''
+    import copy
+    from dials.util.masking import MaskGenerator
+    self.use_trusted_range = params.use_trusted_range
+    params = copy.deepcopy(params)
+    params.use_trusted_range = False
+    self.generator = MaskGenerator(params)
+    self.cache = LRUCache(size)
+
+  def generate(self, imageset):
+    '''
+    Generate the mask
+
+    :param imageset: The imageset
+    :return: The mask for each panel
+
+    '''
+    import json
+    detector = imageset.get_detector()
+    key = json.dumps((detector.to_dict(), imageset.get_beam().to_dict()),
+                     sort_keys=True)
+    mask = self.cache.get(key, lambda: self.generator.generate(imageset))
+    if self.use_trusted_range:
+      image = imageset.get_raw_data(0)
+      masks = []
+      for m, im, panel in zip(mask, image, detector):
+        low, high = panel.get_trusted_range()
+        imd = im.as_double()
+        masks.append(m & (imd > low) & (imd < high))
+      mask = tuple(masks)
+    return mask
+
+
+class SpotFindingCache(object):
+  '''
+  State kept between requests by each server worker process: the parsed
+  parameters for each set of command line arguments, the format class for each
+  file template and the configured spot finder (holding the threshold kernels,
+  lookup mask and geometry masks) for each set of parameters and detector.
+  Each worker process handles one image at a time, so the cache is never used
+  concurrently.
+
+  '''
+
+  def __init__(self, size=32):
+    self.parameters = LRUCache(size)
+    self.format_classes = LRUCache(size)
+    self.spot_finders = LRUCache(size)
+
+  def parse(self, cl):
+    '''
+    Parse the command line arguments
+
+    :param cl: The command line arguments
+    :return: The (options, find_spots parameters, unhandled arguments). These
+             are shared between requests so must not be modified.
+
+    '''
+    def create():
+      from dials.command_line.find_spots import phil_scope as find_spots_phil_scope
+      interp = options_phil_scope.command_line_argument_interpreter()
+      options, unhandled = interp.process_and_fetch(
+        cl, custom_processor='collect_remaining')
+      interp = find_spots_phil_scope.command_line_argument_interpreter()
+      phil_scope, unhandled = interp.process_and_fetch(
+        unhandled, custom_processor='collect_remaining')
+      logger.info('The following spotfinding parameters have been modified:')
+      logger.info(find_spots_phil_scope.fetch_diff(source=phil_scope).as_str())
+      return options.extract(), phil_scope.extract(), unhandled
+    return self.parameters.get(tuple(cl), create)
+
+  def datablock(self, filename):
+    '''
+    Create a datablock for a single image, reusing the format class found for
+    previous images with the same template
+
+    :param filename: The image filename
+    :return: The datablock
+
+    '''
+    from dxtbx.datablock import DataBlockFactory
+    from dxtbx.format.Registry import Registry
+    from dxtbx.model.scan_helpers import template_regex
+    template = template_regex(filename)[0]
+    if template is None:
+      template = filename
+    format_class = self.format_classes.get(
+      template, lambda: Registry.find(filename))
+    if not format_class.understand(filename):
+      return DataBlockFactory.from_filenames([filename])[0]
+    imageset = format_class.get_imageset([filename])
+    return DataBlockFactory.from_imageset(imageset)[0]
+
+  def spot_finder(self, cl, params, datablock):
+    '''
+    Get the spot finder for the parameters and the detector
+
+    :param cl: The command line arguments
+    :param params: The find_spots parameters
+    :param datablock: The datablock
+    :return: The spot finder
+
+    '''
+    import json
+    from dxtbx.imageset import ImageSweep
+    imageset = datablock.extract_imagesets()[0]
+    detector = imageset.get_detector()
+    key = (tuple(cl),
+           json.dumps(detector.to_dict(), sort_keys=True),
+           isinstance(imageset, ImageSweep))
+    def create():
+      import copy
+      from libtbx import Auto
+      from dials.algorithms.spot_finding.factory import SpotFinderFactory
+      p = copy.deepcopy(params)
+      # no need to write the hot mask in the server/client
+      p.spotfinder.write_hot_mask = False
+      if p.spotfinder.filter.min_spot_size is Auto:
+        if detector[0].get_type() == 'SENSOR_PAD':
+          # smaller default value for pixel array detectors
+          p.spotfinder.filter.min_spot_size = 3
+        else:
+          p.spotfinder.filter.min_spot_size = 6
+      finder = SpotFinderFactory.from_parameters(params=p, datablock=datablock)
+      finder.mask_generator = CachedMaskGenerator(p.spotfinder.filter)
+      return finder
+    return self.spot_finders.get(key, create)
+
+
+# The cache in each server worker process
+cache = None
+
+def init_worker():
+  '''Initialise the cache in a server worker process'''
+  global cache
+  cache = SpotFindingCache()
+
+def work(filename, cl=None):
+  if cl is None:
+    cl = []
   if not os.access(filename, os.R_OK):
     raise RuntimeError("Server does not have read access to file %s" %filename)
-  interp = phil_scope.command_line_argument_interpreter()
-  params, unhandled = interp.process_and_fetch(
-    cl, custom_processor='collect_remaining')
-  filter_ice = params.extract().filter_ice
-  index = params.extract().index
-  integrate = params.extract().integrate
-  indexing_min_spots = params.extract().indexing_min_spots
-
-  from dials.command_line.find_spots import phil_scope as find_spots_phil_scope
-  from dxtbx.datablock import DataBlockFactory
+  if cache is None:
+    init_worker()
+  options, params, unhandled = cache.parse(cl)
+  filter_ice = options.filter_ice
+  index = options.index
+  integrate = options.integrate
+  indexing_min_spots = options.indexing_min_spots
+
   from dials.array_family import flex
-  interp = find_spots_phil_scope.command_line_argument_interpreter()
-  phil_scope, unhandled = interp.process_and_fetch(
-    unhandled, custom_processor='collect_remaining')
-  logger.info('The following spotfinding parameters have been modified:')
-  logger.info(find_spots_phil_scope.fetch_diff(source=phil_scope).as_str())
-  params = phil_scope.extract()
-  # no need to write the hot mask in the server/client
-  params.spotfinder.write_hot_mask = False
-  datablock = DataBlockFactory.from_filenames([filename])[0]
+  datablock = cache.datablock(filename)
   t0 = time.time()
-  reflections = flex.reflection_table.from_observations(datablock, params)
+  hits = cache.spot_finders.hits
+  reflections = cache.spot_finder(cl, params, datablock)(datablock)
+  spot_finder_cached = cache.spot_finders.hits > hits
   t1 = time.time()
   logger.info('Spotfinding took %.2f seconds' %(t1-t0))
   from dials.algorithms.spot_finding import per_image_analysis
@@ -111,6 +295,7 @@ def work(filename, cl=None):
   stats = per_image_analysis.stats_single_image(
     imageset, reflections, i=i, plot=False, filter_ice=filter_ice)
   stats = stats.__dict__
+  stats['spot_finder_cached'] = spot_finder_cached
   t2 = time.time()
   logger.info('Resolution analysis took %.2f seconds' %(t2-t1))
 
@@ -229,45 +414,117 @@ def work(filename, cl=None):
 
   return stats
 
+def work_safely(filename, cl=None):
+  '''
+  Process an image, returning the error message in the result rather than
+  raising an exception
+
+  :param filename: The image filename
+  :param cl: The command line arguments
+  :return: The dictionary of results
+
+  '''
+  d = {'image': filename}
+  try:
+    d.update(work(filename, cl))
+  except Exception as e:
+    d['error'] = str(e)
+  return d
+
+def _work_safely_star(args):
+  return work_safely(*args)
+
+
 class handler(server_base.BaseHTTPRequestHandler):
-  def do_GET(s):
-    '''Respond to a GET request.'''
+
+  # Keep connections open between requests
+  protocol_version = 'HTTP/1.1'
+
+  def send_json(s, d):
+    '''Send a dictionary as the JSON response.'''
+    import json
+    response = json.dumps(d)
     s.send_response(200)
     s.send_header('Content-type', 'text/xml')
+    s.send_header('Content-Length', str(len(response)))
     s.end_headers()
+    s.wfile.write(response)
+
+  def do_GET(s):
+    '''Respond to a GET request.'''
     if s.path == '/Ctrl-C':
-      global stop
-      stop = True
+      s.send_json({})
+      s.close_connection = 1
+      s.server.shutdown()
       return
     filename = s.path.split(';')[0]
     params = s.path.split(';')[1:]
-    proc = current_process().name
+    s.send_json(s.server.process(filename, params))
 
-    d = {'image': filename}
+  def do_POST(s):
+    '''
+    Respond to a batch request. The body is a JSON object with a list of
+    filenames and a list of parameters. The results are streamed back as each
+    image is processed, using chunked encoding with one record per image. Each
+    record is the length of the JSON result, a newline and the JSON result.
 
-    try:
-      stats = work(filename, params)
-      d.update(stats)
+    '''
+    import json
+    length = int(s.headers.getheader('Content-Length', 0))
+    request = json.loads(s.rfile.read(length))
+    s.send_response(200)
+    s.send_header('Content-type', 'application/octet-stream')
+    s.send_header('Transfer-Encoding', 'chunked')
+    s.end_headers()
+    results = s.server.process_batch(
+      request['filenames'], request.get('params', []))
+    for d in results:
+      record = json.dumps(d)
+      record = '%d\n%s' % (len(record), record)
+      s.wfile.write('%x\r\n%s\r\n' % (len(record), record))
+    s.wfile.write('0\r\n\r\n')
 
-    except Exception as e:
-      d['error'] = str(e)
+  def log_message(s, format, *args):
+    logger.debug('%s - %s' % (s.address_string(), format % args))
 
-    import json
-    response = json.dumps(d)
-    s.wfile.write(response)
 
-    return
+class SpotFindingServer(SocketServer.ThreadingMixIn, server_base.HTTPServer):
+  '''
+  A HTTP server handling each connection in a thread and dispatching the
+  images to a pool of worker processes. The workers are started once and keep
+  their caches between requests.
 
-def serve(httpd):
-  try:
-    while not stop:
-      httpd.handle_request()
-  except KeyboardInterrupt:
-    pass
-  return
+  The handler threads only share the pool, whose methods may be called from
+  several threads; the caches are in the worker processes, each processing one
+  image at a time. Handling connections in threads lets a client hold its
+  connection open without blocking others, and lets a request stop the server
+  (shutdown waits for serve_forever, so cannot be called from its thread).
+
+  '''
+
+  daemon_threads = True
+
+  def __init__(self, address, nproc):
+    from multiprocessing import Pool
+    # Start the workers before opening the socket so they do not inherit it
+    self.pool = Pool(processes=nproc, initializer=init_worker)
+    server_base.HTTPServer.__init__(self, address, handler)
+
+  def process(self, filename, params):
+    '''Process a single image'''
+    return self.pool.apply(work_safely, (filename, params))
+
+  def process_batch(self, filenames, params):
+    '''Process a batch of images, returning the results as they complete'''
+    return self.pool.imap_unordered(
+      _work_safely_star, [(filename, params) for filename in filenames])
+
+  def server_close(self):
+    server_base.HTTPServer.server_close(self)
+    self.pool.terminate()
+    self.pool.join()
 
 
-import libtbx.phil
 phil_scope = libtbx.phil.parse('''\
 nproc = Auto
   .type = int(value_min=1)
@@ -277,16 +534,14 @@ def serve(httpd):
 
 
 def main(nproc, port):
-  server_class = server_base.HTTPServer
-  httpd = server_class(('', port), handler)
+  httpd = SpotFindingServer(('', port), nproc)
   print time.asctime(), 'Serving %d processes on port %d' % (nproc, port)
-
-  for j in range(nproc - 1):
-    proc = Process(target=serve, args=(httpd,))
-    proc.daemon = True
-    proc.start()
-  serve(httpd)
-  httpd.server_close()
+  try:
+    httpd.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    httpd.server_close()
   print time.asctime(), 'done'
 
 if __name__ == '__main__':
@@ -0,0 +1,251 @@
+#!/usr/bin/env python
+#
+# find_spots_stream.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+# LIBTBX_SET_DISPATCHER_NAME dials.find_spots_stream
+
+from __future__ import absolute_import, division
+
+import logging
+
+logger = logging.getLogger('dials.command_line.find_spots_stream')
+
+help_message = '''
+
+This program finds strong spots on the images of a sweep while it is being
+collected. The images are either received from a ZMQ stream (as with
+dials.import_stream) or, if no host is given, read from the files of the
+input datablock as they are written. Each image is thresholded as soon as it
+arrives and the spots are labelled in 3D one image at a time, so that each
+spot is finished as soon as it can no longer grow.
+
+Examples::
+
+  dials.find_spots_stream input.host=detector-server nproc=8
+
+  dials.find_spots_stream datablock.json watch.timeout=120
+
+'''
+
+# Set the phil scope
+from libtbx.phil import parse
+phil_scope = parse('''
+
+  input {
+    host = None
+      .type = str
+      .help = "The host of the ZMQ stream. If not set, the images of the"
+              "input datablock are processed as their files are written."
+
+    port = 9999
+      .type = int
+      .help = "The port of the ZMQ stream"
+  }
+
+  watch {
+    poll_interval = 0.5
+      .type = float(value_min=0)
+      .help = "The time between checks for new image files (seconds)"
+
+    timeout = 60
+      .type = float(value_min=0)
+      .help = "Stop if the next image file has not been written after this"
+              "time (seconds)"
+  }
+
+  max_window = 50
+    .type = int(value_min=1)
+    .help = "Discard spots which are still open after this many images"
+
+  output {
+    reflections = 'strong.pickle'
+      .type = str
+      .help = "The output filename"
+
+    shoeboxes = True
+      .type = bool
+      .help = "Save the raw pixel values inside the reflection shoeboxes."
+
+    directory = auto
+      .type = str
+      .help = "The output directory for the streamed images"
+
+    image_template = "%05d.image"
+      .type = str
+      .help = "The template of the streamed images"
+
+    datablock = None
+      .type = str
+      .help = "Save the datablock of the streamed images"
+
+    log = 'dials.find_spots_stream.log'
+      .type = str
+      .help = "The log filename"
+
+    debug_log = 'dials.find_spots_stream.debug.log'
+      .type = str
+      .help = "The debug log filename"
+  }
+
+  per_image_statistics = False
+    .type = bool
+    .help = "Whether or not to print a table of per-image statistics."
+
+  verbosity = 1
+    .type = int(value_min=0)
+    .help = "The verbosity level"
+
+  include scope dials.algorithms.spot_finding.factory.phil_scope
+  include scope dials.util.trace.phil_scope
+
+''', process_includes=True)
+
+
+class Script(object):
+  '''A class for running the script.'''
+
+  def __init__(self):
+    '''Initialise the script.'''
+    from dials.util.options import OptionParser
+    import libtbx.load_env
+
+    # The script usage
+    usage = "usage: %s [options] [param.phil] [datablock.json]" \
+            % libtbx.env.dispatcher_name
+
+    # Initialise the base class
+    self.parser = OptionParser(
+      usage=usage,
+      phil=phil_scope,
+      epilog=help_message,
+      read_datablocks=True)
+
+  def run(self):
+    '''Execute the script.'''
+    from dials.algorithms.spot_finding.factory import SpotFinderFactory
+    from dials.util.options import flatten_datablocks
+    from dials.util import log
+    from dials.util import trace
+    from libtbx.utils import Sorry
+    from time import time
+    start_time = time()
+
+    # Parse the command line
+    params, options = self.parser.parse_args(show_diff_phil=False)
+
+    # Configure the logging
+    log.config(
+      params.verbosity,
+      info=params.output.log,
+      debug=params.output.debug_log)
+    trace.configure(params.trace)
+
+    from dials.util.version import dials_version
+    logger.info(dials_version())
+
+    # Log the diff phil
+    diff_phil = self.parser.diff_phil.as_str()
+    if diff_phil != '':
+      logger.info('The following parameters have been modified:\n')
+      logger.info(diff_phil)
+
+    # Get the source of the images
+    datablocks = flatten_datablocks(params.input.datablock)
+    stream = None
+    if params.input.host is not None:
+      if len(datablocks) != 0:
+        raise Sorry('Either a stream or a datablock can be given, not both')
+      stream, source = self.connect(params)
+      imageset = source.imageset()
+      if params.output.datablock:
+        from dxtbx.datablock import DataBlock, DataBlockDumper
+        DataBlockDumper([DataBlock([imageset])]).as_file(
+          params.output.datablock)
+    elif len(datablocks) == 1:
+      from dials.util.stream import DirectoryWatcher
+      imagesets = datablocks[0].extract_imagesets()
+      if len(imagesets) != 1:
+        raise Sorry('Only 1 imageset can be processed at a time')
+      imageset = imagesets[0]
+      source = DirectoryWatcher(
+        imageset,
+        poll_interval = params.watch.poll_interval,
+        timeout       = params.watch.timeout)
+    elif len(datablocks) == 0:
+      self.parser.print_help()
+      return
+    else:
+      raise Sorry('Only 1 datablock can be processed at a time')
+
+    # Find the spots as the images arrive
+    spot_finder = SpotFinderFactory.from_parameters(params=params)
+    try:
+      with trace.span('find_spots_stream', 'spot_finding'):
+        reflections, statistics = spot_finder.find_spots_incrementally(
+          imageset,
+          source,
+          max_window = params.max_window)
+    finally:
+      if stream is not None:
+        stream.close()
+
+    # Delete the shoeboxes
+    if not params.output.shoeboxes and 'shoebox' in reflections:
+      del reflections['shoebox']
+
+    # Save the reflections to file
+    logger.info('\n' + '-' * 80)
+    reflections.as_pickle(params.output.reflections)
+    logger.info('Saved {0} reflections to {1}'.format(
+        len(reflections), params.output.reflections))
+
+    # Print some per image statistics
+    if params.per_image_statistics:
+      from libtbx.table_utils import simple_table
+      rows = [[str(s['image']),
+               str(s['strong_pixels']),
+               str(s['finished']),
+               str(s['total'])] for s in statistics]
+      header = ['Image', '# strong pixels', '# spots finished', '# spots total']
+      logger.info(simple_table(rows, header).format())
+
+    # Print the time
+    logger.info("Time Taken: %f" % (time() - start_time))
+
+  def connect(self, params):
+    '''
+    Connect to the stream and create the output directory.
+
+    '''
+    from dials.util.stream import ZMQStream, Decoder, StreamImageSource
+    from libtbx.utils import Sorry
+    from uuid import uuid4
+    from os.path import exists
+    import libtbx
+    import os
+    if params.output.directory is None:
+      raise Sorry("An output directory needs to be given")
+    elif params.output.directory is libtbx.Auto:
+      params.output.directory = "/dev/shm/dials-%s" % uuid4()
+    if exists(params.output.directory):
+      raise Sorry('Directory "%s" already exists' % (params.output.directory))
+    os.mkdir(params.output.directory)
+    stream = ZMQStream(params.input.host, params.input.port)
+    decoder = Decoder(
+      params.output.directory,
+      params.output.image_template)
+    return stream, StreamImageSource(stream, decoder)
+
+
+if __name__ == '__main__':
+  from dials.util import halraiser
+  try:
+    script = Script()
+    script.run()
+  except Exception as e:
+    halraiser(e)
@@ -96,9 +96,9 @@ def run(self):
     import libtbx
     from uuid import uuid4
     from dials.util.stream import ZMQStream, Decoder
-    from os.path import join, exists
+    from dials.util.stream import write_header, write_image
+    from os.path import exists
     import os
-    import json
     from dxtbx.datablock import DataBlock
 
     # Parse the command line arguments in two passes to set up logging early
@@ -154,24 +154,16 @@ def run(self):
 
       # Process the object
       if obj.is_header():
-        filename = join(params.output.directory, "metadata.json")
-        with open(filename, "w") as outfile:
-          json.dump(obj.header, outfile)
+        filename = write_header(params.output.directory, obj)
         imageset = obj.as_imageset(filename)
         datablocks = [DataBlock([imageset])]
         self.write_datablocks(datablocks, params)
       elif obj.is_image():
         assert imageset is not None
-        filename = join(
+        write_image(
           params.output.directory,
-          params.output.image_template % obj.count)
-        with open(filename, "wb") as outfile:
-          outfile.write(obj.data)
-        filename = join(
-          params.output.directory,
-          "%s.info" % (params.output.image_template % obj.count))
-        with open(filename, "w") as outfile:
-          json.dump(obj.info, outfile)
+          params.output.image_template,
+          obj)
       elif obj.is_endofseries():
         assert imageset is not None
         break
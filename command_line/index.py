@@ -73,6 +73,8 @@
 verbosity = 1
   .type = int(value_min=0)
   .help = "The verbosity level"
+
+include scope dials.util.trace.phil_scope
 """, process_includes=True)
 
 
@@ -80,6 +82,7 @@ def run(args):
   import libtbx.load_env
   from libtbx.utils import Sorry
   from dials.util import log
+  from dials.util import trace
   usage = "%s [options] datablock.json strong.pickle" %libtbx.env.dispatcher_name
 
   parser = OptionParser(
@@ -98,6 +101,7 @@ def run(args):
     params.verbosity,
     info=params.output.log,
     debug=params.output.debug_log)
+  trace.configure(params.trace)
 
   from dials.util.version import dials_version
   logger.info(dials_version())
@@ -155,7 +159,8 @@ def run(args):
     reflections, imagesets,
     known_crystal_models=known_crystal_models,
     params=params)
-  idxr.index()
+  with trace.span('index', 'indexing', method=params.indexing.method):
+    idxr.index()
   refined_experiments = idxr.refined_experiments
   reflections = copy.deepcopy(idxr.refined_reflections)
   reflections.extend(idxr.unindexed_reflections)
@@ -126,6 +126,7 @@
   include scope dials.algorithms.spot_prediction.reflection_predictor.phil_scope
   include scope dials.algorithms.integration.stills_significance_filter.phil_scope
   include scope dials.algorithms.integration.kapton_correction.absorption_phil_scope
+  include scope dials.util.trace.phil_scope
 
 ''', process_includes=True)
 
@@ -154,6 +155,7 @@ def run(self):
     from dials.util.command_line import heading
     from dials.util.options import flatten_reflections, flatten_experiments
     from dials.util import log
+    from dials.util import trace
     from time import time
     from libtbx.utils import Sorry
 
@@ -186,6 +188,7 @@ def run(self):
       params.verbosity,
       info=params.output.log,
       debug=params.output.debug_log)
+    trace.configure(params.trace)
 
     from dials.util.version import dials_version
     logger.info(dials_version())
@@ -338,7 +341,9 @@ def refl_extend(src, dest, eid):
     integrator = IntegratorFactory.create(params, experiments, predicted)
 
     # Integrate the reflections
-    reflections = integrator.integrate()
+    with trace.span('integrate', 'integration',
+                    integrator=params.integration.integrator):
+      reflections = integrator.integrate()
 
     # Append rubbish data onto the end
     if rubbish is not None and params.output.include_bad_reference:
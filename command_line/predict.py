@@ -40,6 +40,10 @@
     .type = bool
     .help = "Ignore dynamic shadowing"
 
+  nproc = 1
+    .type = int(value_min=1)
+    .help = "The number of processes to use for the shadow calculation"
+
   buffer_size = 0
     .type = int
     .help = "Calculate predictions within a buffer zone of n images either"
@@ -119,7 +123,8 @@ def run(self):
       from dials.algorithms.shadowing.filter import filter_shadowed_reflections
 
       shadowed = filter_shadowed_reflections(experiments, predicted_all,
-                                             experiment_goniometer=True)
+                                             experiment_goniometer=True,
+                                             nproc=params.nproc)
       predicted_all = predicted_all.select(~shadowed)
 
     try:
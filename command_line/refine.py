@@ -112,6 +112,7 @@
   }
 
   include scope dials.algorithms.refinement.refiner.phil_scope
+  include scope dials.util.trace.phil_scope
 ''', process_includes=True)
 
 # local overrides for refiner.phil_scope
@@ -201,6 +202,7 @@ def run(self):
     from time import time
     import cPickle as pickle
     from dials.util import log
+    from dials.util import trace
     from dials.algorithms.refinement import RefinerFactory
     from dials.util.options import flatten_reflections, flatten_experiments
 
@@ -230,6 +232,7 @@ def run(self):
     # Configure the logging
     log.config(info=params.output.log,
       debug=params.output.debug_log)
+    trace.configure(params.trace)
     from dials.util.version import dials_version
     logger.info(dials_version())
 
@@ -243,12 +246,6 @@ def run(self):
     if params.output.correlation_plot.filename is not None:
       params.refinement.refinery.journal.track_parameter_correlation = True
 
-    # Warn about potentially unhelpful options
-    if params.refinement.mp.nproc > 1:
-      logger.warning("WARNING: setting nproc > 1 is only helpful in rare "
-        "circumstances. It is not recommended for typical data processing "
-        "tasks.\n")
-
     # Get the refiner
     logger.info('Configuring refiner')
     refiner = RefinerFactory.from_parameters_data_experiments(params,
@@ -51,6 +51,11 @@
 wide_search_binning = 2
   .help = "Modify the coarseness of the wide grid search for the beam centre."
   .type = float(value_min=0)
+coarse_search_binning = None
+  .help = "If set, first run the wide grid search with this (larger) binning,"
+          "then search at wide_search_binning only around the best coarse"
+          "grid cells."
+  .type = float(value_min=0)
 n_macro_cycles = 1
   .type = int
   .help = "Number of macro cycles for an iterative beam centre search."
@@ -79,11 +84,144 @@
 ''', process_includes=True)
 
 
+class origin_offset_scorer(object):
+  """Score trial detector origin offsets for the spots of one imageset.
+
+  The lab coordinates of the spots on the current detector are computed
+  once. Shifting the detector origin by an offset shifts every lab
+  coordinate by the same offset, so the spots are mapped to reciprocal
+  space for a whole array of trial offsets at once with numpy. As in
+  get_origin_offset_score, the fixed rotation of the goniometer is ignored.
+  """
+
+  def __init__(self, spots_mm, imageset, solutions, amax):
+    import numpy
+    detector = imageset.get_detector()
+    beam = imageset.get_beam()
+    goniometer = imageset.get_goniometer()
+    lab = flex.vec3_double(len(spots_mm))
+    panel_numbers = flex.size_t(spots_mm['panel'])
+    x, y, rot_angle = spots_mm['xyzobs.mm.value'].parts()
+    for i_panel in range(len(detector)):
+      sel = (panel_numbers == i_panel)
+      lab.set_selected(sel, detector[i_panel].get_lab_coord(
+        flex.vec2_double(x.select(sel), y.select(sel))))
+    self.lab = lab.as_double().as_numpy_array().reshape(-1, 3)
+    self.wavelength = beam.get_wavelength()
+    self.s0 = numpy.array(beam.get_s0())
+    if goniometer is None:
+      self.setting_rotation_inverse = None
+    else:
+      self.setting_rotation_inverse = numpy.array(
+        matrix.sqr(goniometer.get_setting_rotation()).inverse()).reshape(3, 3)
+      self.rotation_axis = numpy.array(
+        matrix.col(goniometer.get_rotation_axis_datum()).normalize())
+      angle = -rot_angle.as_numpy_array()
+      self.cos_angle = numpy.cos(angle)[:,numpy.newaxis]
+      self.sin_angle = numpy.sin(angle)[:,numpy.newaxis]
+    self.solutions = solutions
+    self.amax = amax
+
+  def reciprocal_lattice_points(self, offsets):
+    """Return an (n_offsets, n_spots, 3) array of the reciprocal lattice
+    points of the spots for each trial origin offset."""
+    import numpy
+    offsets = numpy.asarray(offsets, dtype=numpy.float64).reshape(-1, 3)
+    s1 = self.lab[numpy.newaxis,:,:] + offsets[:,numpy.newaxis,:]
+    s1 /= (numpy.sqrt((s1 * s1).sum(axis=2))[:,:,numpy.newaxis] *
+           self.wavelength)
+    S = s1 - self.s0
+    if self.setting_rotation_inverse is None:
+      return S
+    S = numpy.dot(S, self.setting_rotation_inverse.T)
+    # Rodrigues' rotation of each spot about the axis by minus its angle
+    k = self.rotation_axis
+    k_dot_S = numpy.dot(S, k)[:,:,numpy.newaxis]
+    return (S * self.cos_angle + numpy.cross(k, S) * self.sin_angle +
+            k * k_dot_S * (1 - self.cos_angle))
+
+  def scores(self, offsets, block_size=16):
+    """Return a list of the score of each trial origin offset."""
+    scores = []
+    for i in range(0, len(offsets), block_size):
+      for rlp in self.reciprocal_lattice_points(offsets[i:i+block_size]):
+        scores.append(sum_score_detail(
+          flex.vec3_double(flex.double(rlp.ravel().tolist())),
+          self.solutions, amax=self.amax))
+    return scores
+
+
+def sum_origin_offset_scores(args):
+  """Sum the scores of some trial origin offsets over several imagesets."""
+  scorers, offsets = args
+  total = [0.0] * len(offsets)
+  for scorer in scorers:
+    total = [t + s for t, s in zip(total, scorer.scores(offsets))]
+  return total
+
+
+def select_high_scores(scores, fraction=0.9):
+  """Select the scores above the given fraction of the maximum score. If no
+  score passes, as when the maximum is not positive, select the best one."""
+  sel = scores > (fraction*flex.max(scores))
+  if sel.count(True) == 0:
+    sel[flex.max_index(scores)] = True
+  return sel
+
+
 class better_experimental_model_discovery(object):
   def __init__(self, imagesets, spot_lists, solution_lists,
-               amax_lists, horizon_phil, wide_search_binning=1):
-    from libtbx import adopt_init_args
+               amax_lists, horizon_phil, wide_search_binning=1,
+               coarse_search_binning=None, nproc=1):
+    from libtbx import adopt_init_args, easy_mp
     adopt_init_args(self, locals())
+    self.nproc = easy_mp.get_processes(nproc)
+    self.scorers = [
+      origin_offset_scorer(spots, imageset, solutions, amax)
+      for spots, imageset, solutions, amax in zip(
+        spot_lists, imagesets, solution_lists, amax_lists)]
+
+  def score_origin_offsets(self, offsets):
+    """Return a flex.double of the total score of each trial origin offset,
+    splitting the offsets between nproc processes."""
+    offsets = [tuple(o) for o in offsets]
+    if self.nproc <= 1 or len(offsets) < 2:
+      return flex.double(sum_origin_offset_scores((self.scorers, offsets)))
+    chunk_size = int(math.ceil(len(offsets) / (4 * self.nproc)))
+    chunks = [offsets[i:i+chunk_size]
+              for i in range(0, len(offsets), chunk_size)]
+    from libtbx import easy_mp
+    results = easy_mp.parallel_map(
+      func=sum_origin_offset_scores,
+      iterable=[(self.scorers, chunk) for chunk in chunks],
+      processes=self.nproc,
+      method="multiprocessing",
+      preserve_order=True,
+      preserve_exception_message=True)
+    scores = flex.double()
+    for result in results:
+      scores.extend(flex.double(result))
+    return scores
+
+  def score_grid(self, grid, step, beamr1, beamr2, centres=None, radius=None):
+    """Score the (2*grid+1)^2 grid of offsets along beamr1 (fast) and beamr2
+    (slow). If centres, a list of (x, y) offsets in mm, is given then only
+    the grid points within radius mm of a centre along both directions are
+    scored, and the rest are given a score of -inf."""
+    offsets = []
+    evaluated = flex.size_t()
+    for y in xrange(-grid,grid+1):
+      for x in xrange(-grid,grid+1):
+        if centres is not None and not any(
+            abs(x*step - cx) <= radius and abs(y*step - cy) <= radius
+            for cx, cy in centres):
+          continue
+        evaluated.append((y+grid)*(2*grid+1) + (x+grid))
+        offsets.append((x*step*beamr1 + y*step*beamr2).elems)
+    logger.debug("Scoring %i trial origin offsets" %len(offsets))
+    scores = flex.double((2*grid+1)**2, float('-inf'))
+    scores.set_selected(evaluated, self.score_origin_offsets(offsets))
+    return scores
 
   def optimize_origin_offset_local_scope(self):
     """Local scope: find the optimal origin-offset closest to the current overall detector position
@@ -112,18 +250,24 @@ def optimize_origin_offset_local_scope(self):
       plot_px_sz *= self.wide_search_binning
       grid = max(1,int(scope/plot_px_sz))
       widegrid = 2 * grid + 1
-      scores = flex.double()
-      for y in xrange(-grid,grid+1):
-        for x in xrange(-grid,grid+1):
-          new_origin_offset = x*plot_px_sz*beamr1 + y*plot_px_sz*beamr2
-          score = 0
-          for i in range(len(self.imagesets)):
-            score += self.get_origin_offset_score(new_origin_offset,
-                                                  self.solution_lists[i],
-                                                  self.amax_lists[i],
-                                                  self.spot_lists[i],
-                                                  self.imagesets[i])
-          scores.append(score)
+      centres = coarse_px_sz = None
+      if (self.coarse_search_binning is not None and
+          self.coarse_search_binning > self.wide_search_binning):
+        coarse_px_sz = self.imagesets[0].get_detector()[0].get_pixel_size()[0]
+        coarse_px_sz *= self.coarse_search_binning
+        coarse_grid = max(1,int(scope/coarse_px_sz))
+        coarse_scores = self.score_grid(coarse_grid, coarse_px_sz,
+                                        beamr1, beamr2)
+        coarse_widegrid = 2 * coarse_grid + 1
+        sel = select_high_scores(coarse_scores)
+        centres = [
+          ((i%coarse_widegrid - coarse_grid)*coarse_px_sz,
+           (i//coarse_widegrid - coarse_grid)*coarse_px_sz)
+          for i in sel.iselection()]
+        logger.info("Refining the wide search around %i of %i coarse cells" %(
+          len(centres), len(coarse_scores)))
+      scores = self.score_grid(grid, plot_px_sz, beamr1, beamr2,
+                               centres=centres, radius=coarse_px_sz)
 
       def igrid(x): return x - (widegrid//2)
 
@@ -132,7 +276,7 @@ def igrid(x): return x - (widegrid//2)
       # if there are several similarly high scores, then choose the closest
       # one to the current beam centre
       potential_offsets = flex.vec3_double()
-      sel = scores > (0.9*flex.max(scores))
+      sel = select_high_scores(scores)
       for i in sel.iselection():
         offset = (idxs[i%widegrid])*beamr1 + (idxs[i//widegrid])*beamr2
         potential_offsets.append(offset.elems)
@@ -169,14 +313,8 @@ def target(selfOO, vector):
         trial_origin_offset = vector[0]*0.2*beamr1 + vector[1]*0.2*beamr2
         if selfOO.wide_search_offset is not None:
           trial_origin_offset += selfOO.wide_search_offset
-        target = 0
-        for i in range(len(self.imagesets)):
-          target -= self.get_origin_offset_score(trial_origin_offset,
-                                                 self.solution_lists[i],
-                                                 self.amax_lists[i],
-                                                 self.spot_lists[i],
-                                                 self.imagesets[i])
-        return target
+        return -sum_origin_offset_scores(
+          (self.scorers, [trial_origin_offset.elems]))[0]
 
     MIN = test_simplex_method(wide_search_offset=wide_search_offset)
     new_offset = MIN.offset
@@ -185,18 +323,7 @@ def target(selfOO, vector):
       scope = self.horizon_phil.indexing.mm_search_scope
       plot_px_sz = self.imagesets[0].get_detector()[0].get_pixel_size()[0]
       grid = max(1,int(scope/plot_px_sz))
-      scores = flex.double()
-      for y in xrange(-grid,grid+1):
-        for x in xrange(-grid,grid+1):
-          new_origin_offset = x*plot_px_sz*beamr1 + y*plot_px_sz*beamr2
-          score = 0
-          for i in range(len(self.imagesets)):
-            score += self.get_origin_offset_score(new_origin_offset,
-                                                  self.solution_lists[i],
-                                                  self.amax_lists[i],
-                                                  self.spot_lists[i],
-                                                  self.imagesets[i])
-          scores.append(score)
+      scores = self.score_grid(grid, plot_px_sz, beamr1, beamr2)
 
       def show_plot(widegrid,excursi):
         excursi.reshape(flex.grid(widegrid, widegrid))
@@ -246,38 +373,43 @@ def get_origin_offset_score(self, trial_origin_offset, solutions, amax, spots_mm
     return self.sum_score_detail(spots_mm['rlp'], solutions, amax=amax)
 
   def sum_score_detail(self, reciprocal_space_vectors, solutions, granularity=None, amax=None):
-    """Evaluates the probability that the trial value of (S0_vector | origin_offset) is correct,
-       given the current estimate and the observations.  The trial value comes through the
-       reciprocal space vectors, and the current estimate comes through the short list of
-       DPS solutions. Actual return value is a sum of NH terms, one for each DPS solution, each ranging
-       from -1.0 to 1.0"""
-    import cmath
-    from rstbx.dps_core import Direction, Directional_FFT
-    nh = min(solutions.size(), 20) # extended API
-    sum_score = 0.0
-    for t in xrange(nh):
-      #if t!=unique:continue
-      dfft = Directional_FFT(
-        angle=Direction(solutions[t]), xyzdata=reciprocal_space_vectors,
-        granularity=5.0, amax=amax, # extended API XXX These values have to come from somewhere!
-        F0_cutoff = 11)
-      kval = dfft.kval();
-      kmax = dfft.kmax();
-      #kval_cutoff = self.raw_spot_input.size()/4.0; # deprecate record
-      kval_cutoff = reciprocal_space_vectors.size()/4.0; # deprecate record
-      if kval > kval_cutoff:
-        ff=dfft.fft_result;
-        kbeam = ((-dfft.pmin)/dfft.delta_p) + 0.5;
-        Tkmax = cmath.phase(ff[kmax]);
-        backmax = math.cos(Tkmax+(2*math.pi*kmax*kbeam/(2*ff.size()-1)));
-        ### Here it should be possible to calculate a gradient.
-        ### Then minimize with respect to two coordinates.  Use lbfgs?  Have second derivatives?
-        ### can I do something local to model the cosine wave?
-        ### direction of wave travel.  Period. phase.
-        sum_score += backmax;
-      #if t == unique:
-      #  print t, kmax, dfft.pmin, dfft.delta_p, Tkmax,(2*math.pi*kmax*kbeam/(2*ff.size()-1))
-    return sum_score
+    return sum_score_detail(reciprocal_space_vectors, solutions,
+                            granularity=granularity, amax=amax)
+
+
+def sum_score_detail(reciprocal_space_vectors, solutions, granularity=None, amax=None):
+  """Evaluates the probability that the trial value of (S0_vector | origin_offset) is correct,
+     given the current estimate and the observations.  The trial value comes through the
+     reciprocal space vectors, and the current estimate comes through the short list of
+     DPS solutions. Actual return value is a sum of NH terms, one for each DPS solution, each ranging
+     from -1.0 to 1.0"""
+  import cmath
+  from rstbx.dps_core import Direction, Directional_FFT
+  nh = min(solutions.size(), 20) # extended API
+  sum_score = 0.0
+  for t in xrange(nh):
+    #if t!=unique:continue
+    dfft = Directional_FFT(
+      angle=Direction(solutions[t]), xyzdata=reciprocal_space_vectors,
+      granularity=5.0, amax=amax, # extended API XXX These values have to come from somewhere!
+      F0_cutoff = 11)
+    kval = dfft.kval();
+    kmax = dfft.kmax();
+    #kval_cutoff = self.raw_spot_input.size()/4.0; # deprecate record
+    kval_cutoff = reciprocal_space_vectors.size()/4.0; # deprecate record
+    if kval > kval_cutoff:
+      ff=dfft.fft_result;
+      kbeam = ((-dfft.pmin)/dfft.delta_p) + 0.5;
+      Tkmax = cmath.phase(ff[kmax]);
+      backmax = math.cos(Tkmax+(2*math.pi*kmax*kbeam/(2*ff.size()-1)));
+      ### Here it should be possible to calculate a gradient.
+      ### Then minimize with respect to two coordinates.  Use lbfgs?  Have second derivatives?
+      ### can I do something local to model the cosine wave?
+      ### direction of wave travel.  Period. phase.
+      sum_score += backmax;
+    #if t == unique:
+    #  print t, kmax, dfft.pmin, dfft.delta_p, Tkmax,(2*math.pi*kmax*kbeam/(2*ff.size()-1))
+  return sum_score
 
 
 def run_dps(args):
@@ -335,7 +467,8 @@ def run_dps(args):
 
 
 def discover_better_experimental_model(
-  imagesets, spot_lists, params, dps_params, nproc=1, wide_search_binning=1):
+  imagesets, spot_lists, params, dps_params, nproc=1, wide_search_binning=1,
+  coarse_search_binning=None):
   assert len(imagesets) == len(spot_lists)
   assert len(imagesets) > 0
   # XXX should check that all the detector and beam objects are the same
@@ -418,7 +551,8 @@ def discover_better_experimental_model(
   if dps_params.indexing.improve_local_scope == "origin_offset":
     discoverer = better_experimental_model_discovery(
       imagesets, spot_lists_mm, solution_lists, amax_list, dps_params,
-      wide_search_binning=wide_search_binning)
+      wide_search_binning=wide_search_binning,
+      coarse_search_binning=coarse_search_binning, nproc=nproc)
     new_detector = discoverer.optimize_origin_offset_local_scope()
     old_panel, old_beam_centre = detector.get_ray_intersection(beam.get_s0())
     new_panel, new_beam_centre = new_detector.get_ray_intersection(beam.get_s0())
@@ -497,7 +631,8 @@ def run(args):
       logger.info('Starting macro cycle %i' %(i+1))
     new_detector, new_beam = discover_better_experimental_model(
       imagesets, reflections, params, dps_params, nproc=params.nproc,
-      wide_search_binning=params.wide_search_binning)
+      wide_search_binning=params.wide_search_binning,
+      coarse_search_binning=params.coarse_search_binning)
     for imageset in imagesets:
       imageset.set_detector(new_detector)
       imageset.set_beam(new_beam)
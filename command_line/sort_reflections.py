@@ -36,9 +36,10 @@ def __init__(self):
     phil_scope = parse('''
 
       key = 'miller_index'
-        .type = str
+        .type = strings
         .help = "The chosen sort key. This should be a column of "
-                "the reflection table."
+                "the reflection table. If several columns are given then "
+                "ties are broken by the later columns."
 
       reverse = False
         .type = bool
@@ -63,12 +64,6 @@ def __init__(self):
       read_reflections=True,
       epilog=help_message)
 
-  @staticmethod
-  def sort_permutation(column, reverse=False):
-    indices = flex.size_t_range(len(column))
-    perm = sorted(indices, key=lambda k: column[k], reverse=reverse)
-    return flex.size_t(perm)
-
   def run(self):
     '''Execute the script.'''
     from dials.array_family import flex # import dependency
@@ -86,11 +81,14 @@ def run(self):
     reflections = reflections[0]
 
     # Check the key is valid
-    assert(params.key in reflections)
+    for key in params.key:
+      assert(key in reflections)
 
     # Sort the reflections
-    print "Sorting by %s with reverse=%r" % (params.key, params.reverse)
-    perm = self.sort_permutation(reflections[params.key], params.reverse)
+    print "Sorting by %s with reverse=%r" % (
+      ", ".join(params.key), params.reverse)
+    perm = reflections.sort_permutation(
+      [(key, None, params.reverse) for key in params.key])
     reflections = reflections.select(perm)
 
     if options.verbose > 0:
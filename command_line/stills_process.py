@@ -13,7 +13,7 @@
 
 help_message = '''
 DIALS script for processing still images. Import, index, refine, and integrate are all done for each image
-seperately.
+seperately. Files containing no images are skipped with a warning.
 '''
 
 from libtbx.phil import parse
@@ -89,6 +89,29 @@
       .type = str
       .help = For MPI, for multifile data, mandatory blobs giving file paths
       .multiple = True
+    scheduler = *static dynamic
+      .type = choice
+      .help = "How to share the images between processes. static: split the"
+              "images between the processes before starting. dynamic: each"
+              "process requests small batches of images from a coordinator"
+              "(the parent process, or MPI rank 0) whenever it becomes free,"
+              "so that expensive images do not hold up the other processes."
+    dynamic
+      .expert_level = 2
+    {
+      batch_size = 1
+        .type = int(value_min=1)
+        .help = "The number of images given to a process at once"
+      timeout = None
+        .type = float(value_min=0)
+        .help = "The time limit in seconds for processing a single image"
+      max_retries = 0
+        .type = int(value_min=0)
+        .help = "The number of times to retry an image which fails or"
+                "exceeds the time limit. With dispatch.squash_errors=True an"
+                "image fails when any processing step fails, and the output"
+                "already added for it is discarded before it is retried."
+    }
   }
 '''
 
@@ -326,11 +349,8 @@ def run(self):
           tags.append(basename)
 
       # Wrapper function
-      def do_work(i, item_list):
-        processor = Processor(copy.deepcopy(params), composite_tag = "%04d"%i)
-        for item in item_list:
-          processor.process_datablock(item[0], item[1])
-        processor.finalize()
+      def process_item(processor, item):
+        return processor.process_datablock(item[0], item[1])
 
       iterable = zip(tags, split_datablocks)
 
@@ -344,34 +364,70 @@ def do_work(i, item_list):
           tags.append(basename)
 
       # Wrapper function
-      def do_work(i, item_list):
-        processor = Processor(copy.deepcopy(params), composite_tag = "%04d"%i)
-        for item in item_list:
-          tag, filename = item
-
-          datablock = do_import(filename)
-          imagesets = datablock.extract_imagesets()
-          if len(imagesets) == 0 or len(imagesets[0]) == 0:
-            logger.info("Zero length imageset in file: %s"%filename)
-            return
-          if len(imagesets) > 1:
-            raise Abort("Found more than one imageset in file: %s"%filename)
-          if len(imagesets[0]) > 1:
-            raise Abort("Found a multi-image file. Run again with pre_import=True")
-
-          if self.reference_detector is not None:
-            from dxtbx.model import Detector
-            imagesets[0].set_detector(Detector.from_dict(self.reference_detector.to_dict()))
-
-          update_geometry(imagesets[0])
-
-          processor.process_datablock(tag, datablock)
-        processor.finalize()
+      def process_item(processor, item):
+        tag, filename = item
+
+        datablock = do_import(filename)
+        imagesets = datablock.extract_imagesets()
+        if len(imagesets) == 0 or len(imagesets[0]) == 0:
+          # Skip the file, but still process the rest of the files and
+          # finalize the output
+          logger.warning("Zero length imageset in file: %s, skipping"%filename)
+          return
+        if len(imagesets) > 1:
+          raise Abort("Found more than one imageset in file: %s"%filename)
+        if len(imagesets[0]) > 1:
+          raise Abort("Found a multi-image file. Run again with pre_import=True")
+
+        if self.reference_detector is not None:
+          from dxtbx.model import Detector
+          imagesets[0].set_detector(Detector.from_dict(self.reference_detector.to_dict()))
+
+        update_geometry(imagesets[0])
+
+        return processor.process_datablock(tag, datablock)
 
       iterable = zip(tags, all_paths)
 
+    def do_work(i, item_list):
+      processor = Processor(copy.deepcopy(params), composite_tag = "%04d"%i)
+      for item in item_list:
+        process_item(processor, item)
+      processor.finalize()
+
+    def make_worker(i):
+      processor = Processor(copy.deepcopy(params), composite_tag = "%04d"%i)
+      def process(index):
+        state = processor.composite_state()
+        try:
+          status = process_item(processor, iterable[index])
+        except BaseException:
+          # An image stopped by the time limit may have added part of its
+          # composite output. Discard it before the next image is processed.
+          processor.restore_composite_state(state)
+          raise
+        if status is False and params.mp.dynamic.max_retries > 0:
+          # Report the failure so that the image is retried, discarding any
+          # composite output already added for it
+          processor.restore_composite_state(state)
+          raise RuntimeError("Processing failed for %s" % iterable[index][0])
+      return process, processor.finalize
+
     # Process the data
-    if params.mp.method == 'mpi':
+    if params.mp.scheduler == 'dynamic':
+      from dials.util import work_scheduler
+      kwargs = dict(
+        batch_size  = params.mp.dynamic.batch_size,
+        timeout     = params.mp.dynamic.timeout,
+        max_retries = params.mp.dynamic.max_retries)
+      if params.mp.method == 'mpi':
+        from mpi4py import MPI
+        work_scheduler.run_mpi(MPI.COMM_WORLD, len(iterable), make_worker,
+          **kwargs)
+      else:
+        work_scheduler.run_multiprocessing(len(iterable), make_worker,
+          nproc=params.mp.nproc, **kwargs)
+    elif params.mp.method == 'mpi':
       from mpi4py import MPI
       comm = MPI.COMM_WORLD
       rank = comm.Get_rank() # each process in MPI has a unique id, 0-indexed
@@ -442,7 +498,44 @@ def setup_filenames(self, tag):
     if self.integrated_experiments_filename_template is not None and "%s" in self.integrated_experiments_filename_template:
       self.params.output.integrated_experiments_filename = os.path.join(self.params.output.output_dir, self.integrated_experiments_filename_template%("idx-" + tag))
 
+  def composite_state(self):
+    '''
+    Get the sizes of the composite output, so that the output added for an
+    image can be discarded with restore_composite_state.
+    '''
+    if not self.params.output.composite_output:
+      return None
+    return (len(self.all_indexed_experiments),
+            len(self.all_indexed_reflections),
+            len(self.all_integrated_experiments),
+            len(self.all_integrated_reflections),
+            len(self.all_int_pickles))
+
+  def restore_composite_state(self, state):
+    '''
+    Discard the composite output added since composite_state was called.
+    '''
+    if state is None:
+      return
+    from dxtbx.model.experiment_list import ExperimentList
+    n_idx_expts, n_idx_refls, n_int_expts, n_int_refls, n_int_pickles = state
+    self.all_indexed_experiments = ExperimentList(
+      list(self.all_indexed_experiments)[:n_idx_expts])
+    self.all_indexed_reflections = self.all_indexed_reflections[:n_idx_refls]
+    self.all_integrated_experiments = ExperimentList(
+      list(self.all_integrated_experiments)[:n_int_expts])
+    self.all_integrated_reflections = \
+      self.all_integrated_reflections[:n_int_refls]
+    del self.all_int_pickle_filenames[n_int_pickles:]
+    del self.all_int_pickles[n_int_pickles:]
+
   def process_datablock(self, tag, datablock):
+    '''
+    Process an image.
+
+    :return: False if processing failed and the error was squashed, True if
+             it succeeded
+    '''
     import os
 
     if not self.params.output.composite_output:
@@ -460,25 +553,26 @@ def process_datablock(self, tag, datablock):
     except Exception as e:
       print "Error spotfinding", tag, str(e)
       if not self.params.dispatch.squash_errors: raise
-      return
+      return False
     try:
       experiments, indexed = self.index(datablock, observed)
     except Exception as e:
       print "Couldn't index", tag, str(e)
       if not self.params.dispatch.squash_errors: raise
-      return
+      return False
     try:
       experiments, indexed = self.refine(experiments, indexed)
     except Exception as e:
       print "Error refining", tag, str(e)
       if not self.params.dispatch.squash_errors: raise
-      return
+      return False
     try:
       integrated = self.integrate(experiments, indexed)
     except Exception as e:
       print "Error integrating", tag, str(e)
       if not self.params.dispatch.squash_errors: raise
-      return
+      return False
+    return True
 
   def find_spots(self, datablock):
     from time import time
@@ -104,6 +104,11 @@ def assign_work(self):
           tags.append(basename)
     iterable = zip(tags, all_paths)
 
+    if self.params.mp.scheduler == 'dynamic':
+      # Work is requested from rank 0 as each rank becomes free
+      self.iterable = iterable
+      return
+
     self.subset = [item for i, item in enumerate(iterable) if (i+self.rank)%self.size == 0]
     print("DELEGATE %d of %d: %s"%( self.rank, self.size, self.subset[0:10]))
 
@@ -119,34 +124,65 @@ def run(self):
     if True:
 
       # Wrapper function
-      def do_work(i, item_list):
-        processor = Processor(copy.deepcopy(self.params), composite_tag = "%04d"%i)
-        for item in item_list:
-          tag, filename = item
+      def process_item(processor, item):
+        tag, filename = item
+
+        datablock = do_import(filename)
+        imagesets = datablock.extract_imagesets()
+        if len(imagesets) == 0 or len(imagesets[0]) == 0:
+          # Skip the file, but still process the rest of the files and
+          # finalize the output
+          logger.warning("Zero length imageset in file: %s, skipping"%filename)
+          return
+        if len(imagesets) > 1:
+          raise Abort("Found more than one imageset in file: %s"%filename)
+        if len(imagesets[0]) > 1:
+          raise Abort("Found a multi-image file. Run again with pre_import=True")
 
-          datablock = do_import(filename)
-          imagesets = datablock.extract_imagesets()
-          if len(imagesets) == 0 or len(imagesets[0]) == 0:
-            logger.info("Zero length imageset in file: %s"%filename)
-            return
-          if len(imagesets) > 1:
-            raise Abort("Found more than one imageset in file: %s"%filename)
-          if len(imagesets[0]) > 1:
-            raise Abort("Found a multi-image file. Run again with pre_import=True")
+        if self.reference_detector is not None:
+          from dxtbx.model import Detector
+          imagesets[0].set_detector(Detector.from_dict(self.reference_detector.to_dict()))
 
-          if self.reference_detector is not None:
-            from dxtbx.model import Detector
-            imagesets[0].set_detector(Detector.from_dict(self.reference_detector.to_dict()))
+        update_geometry(imagesets[0])
 
-          update_geometry(imagesets[0])
+        return processor.process_datablock(tag, datablock)
 
-          processor.process_datablock(tag, datablock)
+      def do_work(i, item_list):
+        processor = Processor(copy.deepcopy(self.params), composite_tag = "%04d"%i)
+        for item in item_list:
+          process_item(processor, item)
         processor.finalize()
 
+      def make_worker(i):
+        processor = Processor(copy.deepcopy(self.params), composite_tag = "%04d"%i)
+        def process(index):
+          state = processor.composite_state()
+          try:
+            status = process_item(processor, self.iterable[index])
+          except BaseException:
+            # An image stopped by the time limit may have added part of its
+            # composite output. Discard it before the next image is processed.
+            processor.restore_composite_state(state)
+            raise
+          if status is False and self.params.mp.dynamic.max_retries > 0:
+            # Report the failure so that the image is retried, discarding any
+            # composite output already added for it
+            processor.restore_composite_state(state)
+            raise RuntimeError(
+              "Processing failed for %s" % self.iterable[index][0])
+        return process, processor.finalize
+
     # Process the data
     assert self.params.mp.method == 'mpi'
 
-    do_work(self.rank, self.subset)
+    if self.params.mp.scheduler == 'dynamic':
+      from dials.util import work_scheduler
+      work_scheduler.run_mpi(self.comm, len(self.iterable), make_worker,
+        batch_size  = self.params.mp.dynamic.batch_size,
+        timeout     = self.params.mp.dynamic.timeout,
+        max_retries = self.params.mp.dynamic.max_retries)
+    else:
+      do_work(self.rank, self.subset)
 
     # Total Time
     logger.info("")
@@ -0,0 +1,61 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+import random
+
+import pytest
+
+def random_rlp(n, seed=0):
+  from scitbx.array_family import flex
+  random.seed(seed)
+  return flex.vec3_double(
+    [tuple(random.uniform(-0.4, 0.4) for j in range(3)) for i in range(n)])
+
+def test_map_centroids_threads():
+  from scitbx.array_family import flex
+  from dials.algorithms.indexing import map_centroids_to_reciprocal_space_grid
+  rlp = random_rlp(2000)
+  grids = []
+  selections = []
+  for nthreads in (1, 4):
+    grid = flex.double(flex.grid(32, 32, 32), 0)
+    selection = flex.bool(len(rlp), True)
+    map_centroids_to_reciprocal_space_grid(
+      grid, rlp, selection, 2.5, b_iso=10, nthreads=nthreads)
+    grids.append(grid)
+    selections.append(selection)
+  assert list(grids[0]) == list(grids[1])
+  assert list(selections[0]) == list(selections[1])
+  assert 0 < selections[0].count(True) < len(rlp)
+
+@pytest.mark.parametrize('gridding', [(30, 30, 30), (12, 10, 9)])
+def test_fft3d_real_squared(gridding):
+  from scitbx import fftpack
+  from scitbx.array_family import flex
+  from dials.algorithms.indexing import fft3d_real_squared
+  random.seed(1)
+  grid = flex.double(flex.grid(gridding), 0)
+  for i in random.sample(range(grid.size()), 100):
+    grid[i] = random.random()
+
+  # the same as the squared real part of the complex-to-complex transform
+  fft = fftpack.complex_to_complex_3d(gridding)
+  expected = flex.pow2(flex.real(fft.forward(flex.complex_double(
+    reals=grid, imags=flex.double(grid.size(), 0)))))
+  for nthreads in (1, 3):
+    grid_real = fft3d_real_squared(grid, nthreads=nthreads)
+    assert grid_real.all() == gridding
+    assert list(grid_real) == pytest.approx(list(expected), abs=1e-8)
+
+def test_threshold_map_by_rmsd():
+  from scitbx.array_family import flex
+  from dials.algorithms.indexing import threshold_map_by_rmsd
+  random.seed(2)
+  data = flex.double([random.expovariate(1) for i in range(16**3)])
+  data.reshape(flex.grid(16, 16, 16))
+  rmsd = math.sqrt(flex.mean(flex.pow2(data - flex.mean(data))))
+  expected = (data >= 2 * rmsd).as_int()
+  for nthreads in (1, 4):
+    mask = threshold_map_by_rmsd(data, 2, nthreads=nthreads)
+    assert mask.all() == data.all()
+    assert list(mask) == list(expected)
@@ -0,0 +1,57 @@
+from __future__ import absolute_import, division, print_function
+
+import math
+import random
+
+import pytest
+
+def test_batched_functional_matches_per_vector_sum():
+  from scitbx import matrix
+  from scitbx.array_family import flex
+  from dials.algorithms.indexing.real_space_grid_search import \
+    batched_functional
+
+  random.seed(0)
+  rlp = flex.vec3_double(
+    [tuple(random.uniform(-0.5, 0.5) for j in range(3)) for i in range(200)])
+  vectors = [tuple(random.uniform(-50, 50) for j in range(3)) for i in range(37)]
+  expected = [flex.sum(flex.cos(2 * math.pi * rlp.dot(v))) for v in vectors]
+  for nproc in (1, 3):
+    f = batched_functional(rlp, block_size=5, nproc=nproc)
+    assert list(f(vectors)) == pytest.approx(expected)
+    assert list(f(flex.vec3_double(vectors))) == pytest.approx(expected)
+  assert len(f([])) == 0
+
+def test_search_vectors_order():
+  import numpy
+  from dials.algorithms.indexing.real_space_grid_search import search_vectors
+  directions = numpy.array([[1, 0, 0], [0, 1, 0]], dtype=float)
+  vectors = search_vectors(directions, [10, 20])
+  assert vectors.tolist() == [
+    [10, 0, 0], [20, 0, 0], [0, 10, 0], [0, 20, 0]]
+
+def test_unique_vector_indices_matches_pairwise_filter():
+  import numpy
+  from scitbx import matrix
+  from dials.algorithms.indexing.indexer import is_approximate_integer_multiple
+  from dials.algorithms.indexing.real_space_grid_search import \
+    unique_vector_indices
+
+  random.seed(1)
+  base = [matrix.col((random.gauss(0, 1), random.gauss(0, 1),
+                      random.gauss(0, 1))).normalize() * random.uniform(5, 20)
+          for i in range(10)]
+  vectors = [v * random.choice((-3, -2, -1, 1, 2, 3)) for v in base
+             for j in range(20)]
+  random.shuffle(vectors)
+
+  expected = []
+  for i, v in enumerate(vectors):
+    if len(expected) == 30:
+      break
+    if not any(is_approximate_integer_multiple(v, vectors[j]) for j in expected):
+      expected.append(i)
+
+  array = numpy.array([v.elems for v in vectors])
+  for chunk_size in (1, 7, 1024):
+    assert unique_vector_indices(array, 30, chunk_size=chunk_size) == expected
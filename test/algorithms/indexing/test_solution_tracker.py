@@ -0,0 +1,43 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+def make_solutions(n_indexed):
+  from dxtbx.model import Crystal
+  from dials.algorithms.indexing.indexer import Solution
+  random.seed(0)
+  solutions = []
+  for n in n_indexed:
+    a, b, c = [random.uniform(40, 80) for i in range(3)]
+    crystal = Crystal((a, 0, 0), (0, b, 0), (0, 0, c), space_group_symbol='P1')
+    solutions.append(Solution(
+      model_likelihood=random.uniform(0.5, 1), crystal=crystal,
+      rmsds=(0.1, 0.1, 0.001), n_indexed=n, fraction_indexed=n/2000,
+      hkl_offset=(0, 0, 0)))
+  return solutions
+
+def test_filter_rejected_solutions_cannot_be_best():
+  from dials.algorithms.indexing.indexer import SolutionTrackerFilter
+  solutions = make_solutions([1000, 40, 1200, 55, 1100, 70])
+  tracker = SolutionTrackerFilter()
+  for s in solutions:
+    tracker.append(s)
+  best = tracker.best_solution()
+
+  # the solutions that may be rejected given the largest number indexed are
+  # those filtered out, and the best solution is the same without them
+  max_n_indexed = max(s.n_indexed for s in solutions)
+  rejected = [s for s in solutions
+              if tracker.is_rejected(s.n_indexed, max_n_indexed)]
+  assert [s.n_indexed for s in rejected] == [40, 55]
+  assert not any(s in tracker.filtered_solutions for s in rejected)
+  reduced = SolutionTrackerFilter()
+  for s in solutions:
+    if s not in rejected:
+      reduced.append(s)
+  assert reduced.best_solution() is best
+
+def test_weighted_solutions_are_never_rejected():
+  from dials.algorithms.indexing.indexer import SolutionTrackerWeighted
+  tracker = SolutionTrackerWeighted()
+  assert not tracker.is_rejected(1, 10000)
@@ -0,0 +1,57 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from dials.algorithms.integration.block_planner import \
+  BlockPlanner, block_boundaries, jobs_from_boundaries, split_jobs
+
+@pytest.mark.parametrize("frame_range,block_size", [
+  ((0, 100), 10), ((0, 100), 7), ((5, 12), 3), ((0, 100), 200), ((0, 1), 5),
+  ((0, 20), 1)])
+def test_block_boundaries_match_job_list(frame_range, block_size):
+  from dials.algorithms.integration.integrator import JobList
+  job_list = JobList()
+  job_list.add((0, 1), frame_range, block_size)
+  expected = [tuple(job_list[i].frames()) for i in range(len(job_list))]
+  jobs = jobs_from_boundaries(
+    frame_range, block_boundaries(frame_range, block_size))
+  assert jobs == expected
+
+def test_split_jobs():
+  boundaries = [0, 5, 10, 15, 20]
+  assert jobs_from_boundaries((0, 20), boundaries) == [
+    (0, 10), (5, 15), (10, 20)]
+  boundaries = split_jobs(boundaries, [1])
+  assert boundaries == [0, 5, 7, 10, 12, 15, 20]
+  assert jobs_from_boundaries((0, 20), boundaries) == [
+    (0, 7), (5, 10), (7, 12), (10, 15), (12, 20)]
+  assert split_jobs([0, 1, 2], [0]) == [0, 1, 2]
+
+def frame_memory(bytes_per_frame):
+  '''A memory model where each job needs a fixed amount per frame.'''
+  def job_memory(jobs):
+    return [[(f1 - f0) * bytes_per_frame for f0, f1 in group]
+            for group in jobs]
+  return job_memory
+
+def test_planner_keeps_jobs_which_fit():
+  planner = BlockPlanner(frame_memory(10), budget=1000, nproc=4)
+  jobs, memory, nproc = planner.plan([((0, 100), 20)])
+  assert jobs == [jobs_from_boundaries((0, 100), block_boundaries((0, 100), 20))]
+  assert nproc == 4
+
+def test_planner_splits_jobs_to_fit_budget():
+  planner = BlockPlanner(frame_memory(10), budget=400, nproc=4)
+  jobs, memory, nproc = planner.plan([((0, 100), 20), ((0, 50), 50)])
+  assert nproc == 4
+  for group in memory:
+    assert max(group) <= 100
+  for (f0, f1), group in zip([(0, 100), (0, 50)], jobs):
+    assert group[0][0] == f0
+    assert group[-1][1] == f1
+
+def test_planner_reduces_processes_when_jobs_cannot_be_split():
+  planner = BlockPlanner(frame_memory(100), budget=400, nproc=4)
+  jobs, memory, nproc = planner.plan([((0, 10), 10)])
+  assert max(max(m) for m in memory) == 200
+  assert nproc == 2
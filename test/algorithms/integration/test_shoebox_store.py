@@ -0,0 +1,51 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+from dials.array_family import flex
+
+def make_reflections(n, offset):
+  reflections = flex.reflection_table()
+  reflections['panel'] = flex.size_t(n, 0)
+  reflections['bbox'] = flex.int6(
+    [(0, 5, 0, 5, i, i + 2) for i in range(n)])
+  reflections['value'] = flex.double(range(offset, offset + n))
+  reflections['shoebox'] = flex.shoebox(
+    reflections['panel'],
+    reflections['bbox'],
+    allocate=True)
+  return reflections
+
+def test_shoebox_memory():
+  from dials.algorithms.integration.shoebox_store import shoebox_memory
+  reflections = make_reflections(10, 0)
+  assert shoebox_memory(reflections) == 10 * 5 * 5 * 2 * 12
+  assert shoebox_memory(flex.reflection_table()) == 0
+
+def test_shoebox_store_spills_to_disk(tmpdir):
+  from dials.algorithms.integration.shoebox_store import ShoeboxStore
+  from dials.algorithms.integration.shoebox_store import shoebox_memory
+  tables = [make_reflections(10, 10 * i) for i in range(4)]
+  store = ShoeboxStore(
+    max_memory=2 * shoebox_memory(tables[0]),
+    directory=tmpdir.strpath)
+  for table in tables:
+    store.append(table)
+  assert len(store) == 4
+  assert store.num_spilled == 2
+  assert store.tempdir is not None
+  for table, stored in zip(tables, store):
+    assert list(stored['value']) == list(table['value'])
+    assert stored['shoebox'].is_allocated().all_eq(True)
+  tempdir = store.tempdir
+  store.clear()
+  assert len(store) == 0
+  assert not os.path.exists(tempdir)
+
+def test_shoebox_store_without_limit():
+  from dials.algorithms.integration.shoebox_store import ShoeboxStore
+  store = ShoeboxStore()
+  for i in range(4):
+    store.append(make_reflections(10, 10 * i))
+  assert store.num_spilled == 0
+  assert store.tempdir is None
@@ -0,0 +1,70 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+
+@pytest.fixture(scope="module")
+def data(dials_regression):
+  from math import pi
+  from dxtbx.model.experiment_list import ExperimentListFactory
+  from dials.algorithms.profile_model.gaussian_rs import Model
+  from dials.array_family import flex
+  experiments = ExperimentListFactory.from_json_file(os.path.join(
+    dials_regression, "centroid_test_data", "experiments.json"))
+  experiments[0].profile = Model(
+    None,
+    n_sigma=3,
+    sigma_b=0.024*pi/180.0,
+    sigma_m=0.044*pi/180.0)
+  reflections = flex.reflection_table.from_predictions(experiments[0])
+  reflections['id'] = flex.int(len(reflections), 0)
+
+  # Use every third reflection to model the profiles
+  reference = flex.size_t_range(len(reflections)) % 3 == 0
+  reflections.set_flags(reference, reflections.flags.reference_spot)
+  return experiments, reflections
+
+def integrate(data, options):
+  from dials.algorithms.integration.integrator import Integrator3D
+  from dials.algorithms.integration.integrator import phil_scope
+  from libtbx.phil import parse
+  experiments, reflections = data
+  params = phil_scope.fetch(parse(options)).extract()
+  integrator = Integrator3D(experiments, reflections.copy(), params)
+  return integrator.integrate()
+
+@pytest.mark.parametrize("nproc,block,max_memory_usage", [
+  (1, "auto", 0.25),
+  (1, "auto", 0),
+  (2, "3", 0),
+])
+def test_single_pass_matches_separate_passes(
+    data, tmpdir, caplog, nproc, block, max_memory_usage):
+  options = '''
+    integration.mp.nproc=%d
+    integration.block.size=%s
+    integration.block.units=frames
+  ''' % (nproc, block)
+  expected = integrate(data, options)
+  result = integrate(data, options + '''
+    integration.single_pass.enable=True
+    integration.single_pass.max_memory_usage=%g
+    integration.single_pass.directory=%s
+  ''' % (max_memory_usage, tmpdir.strpath))
+
+  # Without memory every shoebox is spilled, and nothing is left behind
+  assert ('Spilled' in caplog.text) == (max_memory_usage == 0)
+  assert tmpdir.listdir() == []
+
+  assert expected.get_flags(expected.flags.integrated_prf).count(True) > 0
+  assert len(result) == len(expected)
+  assert list(result['miller_index']) == list(expected['miller_index'])
+  assert list(result['flags']) == list(expected['flags'])
+  columns = [key for key in expected.keys()
+             if key.startswith('intensity.') or key.startswith('profile.')]
+  assert 'intensity.prf.value' in columns
+  assert 'profile.correlation' in columns
+  for key in columns:
+    assert key in result, key
+    assert list(result[key]) == pytest.approx(list(expected[key])), key
@@ -0,0 +1,103 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+def make_experiments():
+  from scitbx import matrix
+  from dxtbx.model import BeamFactory, DetectorFactory, Crystal, \
+    MosaicCrystalSauter2014
+  from dxtbx.model.experiment_list import ExperimentList, Experiment
+  beam = BeamFactory.make_beam(unit_s0=matrix.col((0, 0, 1)), wavelength=1.0)
+  dir1 = matrix.col((1, 0, 0))
+  dir2 = matrix.col((0, -1, 0))
+  origin = matrix.col((0, 0, 200)) - 0.5 * 1000 * 0.2 * (dir1 + dir2)
+  detector = DetectorFactory.make_detector("PAD", dir1, dir2, origin,
+    (0.2, 0.2), (1000, 1000), (0, 1.e6))
+
+  experiments = ExperimentList()
+  for i, length in enumerate((80, 90, 100)):
+    a = matrix.col((length, 0, 0))
+    b = matrix.col((0, length + 5, 0))
+    c = matrix.col((0, 0, length + 10))
+    if i == 2:
+      crystal = MosaicCrystalSauter2014(a, b, c, space_group_symbol="P 1")
+      crystal.set_half_mosaicity_deg(0.1)
+      crystal.set_domain_size_ang(500)
+    else:
+      crystal = Crystal(a, b, c, space_group_symbol="P 1")
+    experiments.append(Experiment(beam=beam, detector=detector,
+      crystal=crystal, goniometer=None, scan=None, imageset=None))
+  return experiments
+
+def make_reflections(experiments):
+  from dials.array_family import flex
+  from dials.algorithms.spot_prediction import ReekeIndexGenerator
+  reflections = flex.reflection_table()
+  for i, e in enumerate(experiments):
+    UB = e.crystal.get_A()
+    hkl = ReekeIndexGenerator(UB, UB, e.crystal.get_space_group().type(),
+      (1, 0, 0), e.beam.get_s0(), dmin=2.0, margin=1).to_array()
+    nref = len(hkl)
+    table = flex.reflection_table()
+    table['id'] = flex.int(nref, i)
+    table['panel'] = flex.size_t(nref, 0)
+    table['miller_index'] = flex.miller_index(hkl)
+    table['entering'] = flex.bool(nref, True)
+    table['s1'] = flex.vec3_double(nref)
+    table['xyzcal.mm'] = flex.vec3_double(nref)
+    table['xyzcal.px'] = flex.vec3_double(nref)
+    table['delpsical.rad'] = flex.double(nref)
+    reflections.extend(table)
+
+  # reflections with ids that do not refer to an experiment
+  invalid = reflections[:10]
+  invalid['id'] = flex.int([-1] * 5 + [len(experiments)] * 5)
+  reflections.extend(invalid)
+  return reflections
+
+def columns(reflections):
+  result = {}
+  for key in ('s1', 'xyzcal.mm', 'xyzcal.px', 'delpsical.rad'):
+    column = reflections[key]
+    if key != 'delpsical.rad':
+      column = column.as_double()
+    result[key] = list(column)
+  return result
+
+def assert_predictions_equal(r1, r2):
+  c1 = columns(r1)
+  c2 = columns(r2)
+  for key in c1:
+    assert c1[key] == pytest.approx(c2[key]), key
+
+def test_cached_predictors_follow_model_changes():
+  from dials.algorithms.refinement.prediction import ExperimentsPredictor
+  from scitbx import matrix
+  experiments = make_experiments()
+  reflections = make_reflections(experiments)
+  invalid = (reflections['id'] < 0) | (reflections['id'] >= len(experiments))
+  unpredicted = reflections.select(invalid)
+
+  predictor = ExperimentsPredictor(experiments)
+  first = predictor(reflections.copy())
+  assert_predictions_equal(first,
+    ExperimentsPredictor(experiments)(reflections.copy()))
+
+  # rotate the crystal of one experiment and change the mosaic parameters
+  # of another
+  R = matrix.col((1, 1, 0)).normalize().axis_and_angle_as_r3_rotation_matrix(
+    0.5, deg=True)
+  crystal = experiments[0].crystal
+  crystal.set_U(R * matrix.sqr(crystal.get_U()))
+  crystal = experiments[2].crystal
+  crystal.set_half_mosaicity_deg(0.5)
+  crystal.set_domain_size_ang(200)
+
+  second = predictor(reflections.copy())
+  fresh = ExperimentsPredictor(experiments)(reflections.copy())
+  assert_predictions_equal(second, fresh)
+  sel = reflections['id'] == 0
+  assert columns(second.select(sel)) != columns(first.select(sel))
+
+  # reflections with invalid ids are left as they were
+  assert_predictions_equal(second.select(invalid), unpredicted)
@@ -0,0 +1,100 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+from dials.array_family import flex
+from scitbx import matrix
+
+def make_reflections(nref=300, nblock=10, npanel=3):
+  random.seed(0)
+  blocks = flex.size_t([random.randrange(nblock) for i in range(nref)])
+  reflections = flex.reflection_table()
+  reflections['id'] = flex.int([random.randrange(2) for i in range(nref)])
+  reflections['panel'] = flex.size_t([random.randrange(npanel)
+                                      for i in range(nref)])
+  reflections['block'] = blocks
+  reflections['block_centre'] = blocks.as_double() * 2 + 0.5
+  return reflections
+
+def test_block_segments():
+  from dials.algorithms.refinement.parameterisation.\
+    scan_varying_prediction_parameters import BlockSegments
+  reflections = make_reflections()
+  isel = (reflections['id'] == 1).iselection()
+  segments = BlockSegments(reflections, isel)
+  assert sorted(segments.order) == list(isel)
+
+  blocks = reflections['block'].select(isel)
+  for i, block in enumerate(segments.blocks):
+    subsel = segments.order[block.start:block.end]
+    expected = isel.select(blocks == reflections['block'][subsel[0]])
+    assert sorted(subsel) == list(expected)
+    assert block.frame == int(reflections['block_centre'][subsel[0]])
+    assert block.panels == sorted(set(reflections['panel'].select(subsel)))
+    assert segments.block_index[block.start:block.end].all_eq(i)
+
+  # each panel segment covers reflections of one block on one panel
+  panels = reflections['panel'].select(segments.order)
+  for i in set(segments.panel_index):
+    sel = segments.panel_index == i
+    assert len(set(panels.select(sel))) == 1
+    assert len(set(segments.block_index.select(sel))) == 1
+
+def test_build_gradients():
+  from dials.algorithms.refinement.parameterisation.\
+    scan_varying_prediction_parameters import StateDerivativeCache
+
+  class Parameterisation(object):
+    def num_free(self):
+      return 2
+
+  random.seed(1)
+  nref = 200
+  p = Parameterisation()
+  cache = StateDerivativeCache([p])
+  cache.nref = nref
+  full = [flex.vec3_double(nref, (0, 0, 0)) for j in range(2)]
+  for j in range(2):
+    for k in range(5):
+      iselection = flex.size_t(sorted(random.sample(range(nref), 40)))
+      derivative = matrix.col((j, k, random.random()))
+      cache.append(p, j, derivative, iselection)
+      full[j].set_selected(iselection, derivative)
+
+  # the gradients are the same as those selected from full length arrays
+  imatch = flex.size_t(sorted(random.sample(range(nref), 120)))
+  isel = flex.size_t(sorted(random.sample(range(120), 50)))
+  for sel, match in [(None, None), (isel, None), (None, imatch),
+                     (isel, imatch)]:
+    for grad, expected in zip(cache.build_gradients(p, sel, match), full):
+      if match is not None: expected = expected.select(match)
+      if sel is not None: expected = expected.select(sel)
+      assert list(grad) == list(expected)
+
+def test_smoothed_frames():
+  from dxtbx.model import Beam, Goniometer
+  from dials.algorithms.refinement.parameterisation.\
+    scan_varying_beam_parameters import ScanVaryingBeamParameterisation
+  random.seed(2)
+  bp = ScanVaryingBeamParameterisation(Beam((0, 0, -1)), (1, 100), 5,
+    Goniometer((1, 0, 0)))
+  bp.set_param_vals([v + random.gauss(0, 0.01) for v in bp.get_param_vals()])
+
+  frames = list(range(1, 101, 7))
+  expected = []
+  for t in frames:
+    bp.compose(t)
+    expected.append((bp.get_state(), bp.get_ds_dp()))
+
+  # compose with the smoother evaluated at all frames at once
+  bp.set_smoothed_frames(frames)
+  for t, (state, ds_dp) in zip(frames, expected):
+    bp.compose(t)
+    assert (bp.get_state() - state).length() < 1e-12
+    for a, b in zip(bp.get_ds_dp(), ds_dp):
+      assert (a - b).length() < 1e-12
+
+  # new parameter values are used, rather than the stored values
+  bp.set_param_vals([v + 0.01 for v in bp.get_param_vals()])
+  bp.compose(frames[0])
+  assert (bp.get_state() - expected[0][0]).length() > 1e-6
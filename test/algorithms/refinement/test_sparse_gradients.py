@@ -0,0 +1,55 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+from dials.array_family import flex
+
+def make_gradients(nref, nparam):
+  from dials.algorithms.refinement.parameterisation.prediction_parameters \
+    import BlockSparseGradient
+  random.seed(1)
+  sparse_grads = []
+  dense_grads = []
+  for i in range(nparam):
+    grads = []
+    for key in range(3):
+      grad = BlockSparseGradient(nref)
+      dense = flex.double(nref, 0.)
+      # disjoint blocks, as for the panels of a detector
+      rows = flex.size_t(random.sample(range(nref), 20))
+      for indices in (rows[:5], rows[5:20]):
+        values = flex.double([random.random() for j in indices])
+        grad.set_selected(indices, values)
+        dense.set_selected(indices, values)
+      grads.append((grad, dense))
+    sparse_grads.append([g[0] for g in grads])
+    dense_grads.append([g[1] for g in grads])
+  return sparse_grads, dense_grads
+
+def test_block_sparse_gradients():
+  from dials.algorithms.refinement.target import Target, SparseGradientsMixin
+  nref, nparam = 50, 4
+  sparse_grads, dense_grads = make_gradients(nref, nparam)
+  for sgrads, dgrads in zip(sparse_grads, dense_grads):
+    for sgrad, dgrad in zip(sgrads, dgrads):
+      assert sgrad.non_zeroes() == 20
+      assert list(sgrad.as_dense_vector()) == list(dgrad)
+
+  # the Jacobian is the same as the dense version
+  reshaped = [[g[k] for g in sparse_grads] for k in range(3)]
+  jacobian = SparseGradientsMixin._build_jacobian(*reshaped,
+    nelem=3*nref, nparam=nparam)
+  reshaped = [[g[k] for g in dense_grads] for k in range(3)]
+  dense_jacobian = Target._build_jacobian(*reshaped,
+    nelem=3*nref, nparam=nparam)
+  assert jacobian.as_dense_matrix().all_eq(dense_jacobian)
+
+  # the gradient of the target and curvatures are the same
+  w_resid = flex.double([random.random() for i in range(3*nref)])
+  weights = flex.double([random.random() for i in range(3*nref)])
+  for sgrads, dgrads in zip(sparse_grads, dense_grads):
+    dL_dp, curv = SparseGradientsMixin._gradient_sums(*sgrads,
+      w_resid=w_resid, weights=weights)
+    grads = Target._concatenate_gradients(*dgrads)
+    assert abs(dL_dp - flex.sum(w_resid * grads)) < 1e-10
+    assert abs(curv - flex.sum(weights * grads * grads)) < 1e-10
@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+
+def make_refiner(dials_regression, nproc):
+  from dxtbx.model.experiment_list import ExperimentListFactory
+  from dials.array_family import flex
+  from dials.algorithms.refinement.refiner import phil_scope, RefinerFactory
+  data_dir = os.path.join(dials_regression, "refinement_test_data", "centroid")
+  experiments = ExperimentListFactory.from_json_file(
+    os.path.join(data_dir, "experiments_XPARM_REGULARIZED.json"),
+    check_format=False)
+  reflections = flex.reflection_table.from_pickle(
+    os.path.join(data_dir, "spot_1000_xds.pickle"))
+  params = phil_scope.extract()
+  params.refinement.refinery.engine = "GaussNewton"
+  params.refinement.reflections.outlier.algorithm = "null"
+  params.refinement.mp.nproc = nproc
+  return RefinerFactory.from_parameters_data_experiments(
+    params, reflections, experiments)
+
+def assert_equations_equal(r1, r2):
+  assert r1.objective() == pytest.approx(r2.objective())
+  assert list(r1.normal_matrix_packed_u()) == \
+    pytest.approx(list(r2.normal_matrix_packed_u()))
+  assert list(r1.step_equations().right_hand_side()) == \
+    pytest.approx(list(r2.step_equations().right_hand_side()))
+
+def test_worker_pool_matches_serial(dials_regression):
+  from dials.array_family import flex
+  serial = make_refiner(dials_regression, 1)
+  pooled = make_refiner(dials_regression, 2)
+  s = serial._refinery
+  p = pooled._refinery
+
+  def compare_steps(nsteps):
+    for step in range(nsteps):
+      p.x = s.x.deep_copy()
+      s.build_up()
+      p.build_up()
+      assert p._worker_pool is not None
+      assert_equations_equal(p, s)
+      s.solve()
+      s.step_forward()
+
+  try:
+    compare_steps(3)
+    first_pool = p._worker_pool
+
+    # remove every other observation, as when a refiner filters the
+    # reflections for parameters it has fixed
+    for refiner in (serial, pooled):
+      nobs = len(refiner._refman.get_obs())
+      refiner._refman.filter_obs(
+        flex.bool([i % 2 == 0 for i in range(nobs)]))
+    compare_steps(3)
+
+    # the workers were restarted with the remaining observations
+    assert p._worker_pool is not first_pool
+  finally:
+    p.close_worker_pool()
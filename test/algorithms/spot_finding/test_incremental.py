@@ -0,0 +1,102 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+from dials.array_family import flex
+
+def make_pixel_lists(frames, size=(8, 8), hot=None, seed=0):
+  from dials.model.data import PixelList
+  random.seed(seed)
+  pixel_lists = []
+  for frame in frames:
+    data = flex.double(flex.grid(size), 0)
+    mask = flex.bool(flex.grid(size), False)
+    for i in range(10):
+      y, x = random.randrange(size[0]), random.randrange(size[1])
+      data[y, x] = random.random() * 100
+      mask[y, x] = True
+    if hot is not None:
+      data[hot] = 1000
+      mask[hot] = True
+    pixel_lists.append(PixelList(frame, data, mask))
+  return pixel_lists
+
+def spots_from_labels(pixel_lists, labels):
+  pixels = []
+  for plist in pixel_lists:
+    pixels.extend((plist.frame(), i) for i in plist.index())
+  assert len(pixels) == len(labels)
+  spots = {}
+  for pixel, label in zip(pixels, labels):
+    spots.setdefault(label, set()).add(pixel)
+  assert sorted(spots.keys()) == list(range(len(spots)))
+  return [frozenset(s) for s in spots.values()]
+
+def as_set(spots):
+  assert len(set(spots)) == len(spots)
+  return set(spots)
+
+def label_incrementally(labeller, pixel_lists):
+  spots = []
+  for plist in pixel_lists:
+    finished = labeller.add(plist)
+    if finished is not None:
+      spots.extend(spots_from_labels(*finished))
+  finished = labeller.flush()
+  if finished is not None:
+    spots.extend(spots_from_labels(*finished))
+  return spots
+
+def label_all(pixel_lists):
+  from dials.model.data import PixelListLabeller
+  labeller = PixelListLabeller()
+  for plist in pixel_lists:
+    labeller.add(plist)
+  return spots_from_labels(pixel_lists, labeller.labels_3d())
+
+def test_incremental_labelling_matches_3d_labelling():
+  from dials.algorithms.spot_finding.incremental import IncrementalLabeller
+  pixel_lists = make_pixel_lists(range(20))
+  labeller = IncrementalLabeller((8, 8))
+  spots = label_incrementally(labeller, pixel_lists)
+  assert as_set(spots) == as_set(label_all(pixel_lists))
+  assert labeller.window == []
+  assert labeller.parent == {}
+
+def test_incremental_labelling_with_missing_image():
+  from dials.algorithms.spot_finding.incremental import IncrementalLabeller
+  pixel_lists = make_pixel_lists(list(range(5)) + list(range(6, 12)))
+  spots = label_incrementally(IncrementalLabeller((8, 8)), pixel_lists)
+  expected = label_all(pixel_lists[:5]) + label_all(pixel_lists[5:])
+  assert as_set(spots) == as_set(expected)
+
+def test_incremental_labelling_forgets_closed_spots():
+  from dials.algorithms.spot_finding.incremental import IncrementalLabeller
+  pixel_lists = make_pixel_lists(range(30), hot=(3, 4), seed=1)
+  pixel_lists[12:15] = make_pixel_lists(range(12, 15), seed=2)
+  labeller = IncrementalLabeller((8, 8), max_window=5)
+  for plist in pixel_lists:
+    labeller.add(plist)
+
+    # only the labels of spots which are still open are kept
+    open_spots = set()
+    for f in labeller.window:
+      open_spots.update(labeller.roots(f.ids).tolist())
+    assert set(labeller.find(i) for i in labeller.parent) <= open_spots
+    assert labeller.discarded <= open_spots
+  labeller.flush()
+  assert labeller.parent == {}
+
+def test_incremental_labelling_discards_hot_pixels():
+  from dials.algorithms.spot_finding.incremental import IncrementalLabeller
+  pixel_lists = make_pixel_lists(range(30), hot=(3, 4))
+  labeller = IncrementalLabeller((8, 8), max_window=5)
+  spots = label_incrementally(labeller, pixel_lists)
+  assert labeller.num_discarded > 0
+  assert labeller.window == []
+  assert labeller.parent == {}
+  hot = 3 * 8 + 4
+  span = lambda s: max(f for f, i in s) - min(f for f, i in s) + 1
+  expected = [s for s in label_all(pixel_lists)
+              if (0, hot) not in s and span(s) <= 5]
+  assert as_set(spots) == as_set(expected)
@@ -0,0 +1,93 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+from dials.array_family import flex
+
+def make_pixel_lists(num_frames, num_panels=2, size=(20, 30), seed=0):
+  from dials.model.data import PixelList
+  random.seed(seed)
+  pixel_lists = []
+  for frame in range(num_frames):
+    image = []
+    for panel in range(num_panels):
+      data = flex.double(flex.grid(size), 0)
+      mask = flex.bool(flex.grid(size), False)
+      for i in range(40):
+        y, x = random.randrange(size[0]), random.randrange(size[1])
+        data[y, x] = random.random() * 100
+        mask[y, x] = True
+      image.append(PixelList(frame, data, mask))
+    pixel_lists.append(image)
+  return pixel_lists
+
+def partition(labels):
+  groups = {}
+  for i, l in enumerate(labels):
+    groups.setdefault(l, []).append(i)
+  return sorted(groups.values())
+
+def test_shared_pixel_lists_round_trip(tmpdir):
+  from dials.algorithms.spot_finding.pixel_transport import PixelListChunk
+  pixel_lists = make_pixel_lists(3)
+  labels = [flex.int(range(sum(len(p[i]) for p in pixel_lists)))
+            for i in range(2)]
+  shared = PixelListChunk(pixel_lists, labels).write(tmpdir.strpath)
+  assert shared is not None
+  chunk = shared.read()
+  assert tmpdir.listdir() == []
+  for image1, image2 in zip(pixel_lists, chunk.pixel_lists):
+    for p1, p2 in zip(image1, image2):
+      assert p1.frame() == p2.frame()
+      assert p1.size() == p2.size()
+      assert list(p1.index()) == list(p2.index())
+      assert list(p1.value()) == list(p2.value())
+  for l1, l2 in zip(labels, chunk.labels):
+    assert list(l1) == list(l2)
+
+def test_labels_merged_across_chunks():
+  from dials.model.data import PixelListLabeller
+  from dials.algorithms.spot_finding.pixel_transport import ChunkLabelMerger
+  pixel_lists = [image[:1] for image in make_pixel_lists(10, size=(8, 8))]
+
+  # Label all the frames together
+  labeller = PixelListLabeller()
+  for image in pixel_lists:
+    labeller.add(image[0])
+  expected = labeller.labels_3d()
+
+  # Label in chunks and merge
+  merger = ChunkLabelMerger()
+  for i0, i1 in [(0, 3), (3, 4), (4, 8), (8, 10)]:
+    chunk = [image[0] for image in pixel_lists[i0:i1]]
+    chunk_labeller = PixelListLabeller()
+    for plist in chunk:
+      chunk_labeller.add(plist)
+    merger.add(chunk, chunk_labeller.labels_3d())
+  labels = merger.labels_after_merge()
+  assert partition(labels) == partition(expected)
+  assert flex.max(labels) + 1 == len(set(labels))
+
+  # The shoeboxes are the same
+  creator1 = flex.PixelListShoeboxCreator(labeller, 0, 0, False, 1, 100, False)
+  creator2 = flex.PixelListShoeboxCreator(labeller, labels, 0, 0, 1, 100, False)
+  bbox1 = sorted(s.bbox for s in creator1.result())
+  bbox2 = sorted(s.bbox for s in creator2.result())
+  assert bbox1 == bbox2
+
+def test_extract_pixels_from_chunk(tmpdir):
+  from dials.algorithms.spot_finding.finder import Result
+  from dials.algorithms.spot_finding.pixel_transport import \
+    ExtractPixelsFromChunk, SharedPixelLists
+  pixel_lists = make_pixel_lists(5)
+  function = lambda index: Result(pixel_lists[index])
+  extract = ExtractPixelsFromChunk(function, tmpdir.strpath, label=True)
+  shared = extract((1, 4))
+  assert isinstance(shared, SharedPixelLists)
+  assert shared.frames == [1, 2, 3]
+  chunk = shared.read()
+  assert len(chunk.labels) == 2
+  assert len(chunk.labels[0]) == sum(len(p[0]) for p in pixel_lists[1:4])
+  chunk = ExtractPixelsFromChunk(function)(2)
+  assert chunk.labels is None
+  assert chunk.pixel_lists == [pixel_lists[2]]
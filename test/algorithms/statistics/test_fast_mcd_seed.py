@@ -0,0 +1,80 @@
+from __future__ import absolute_import, division, print_function
+
+import random
+
+from dials.array_family import flex
+
+def make_residuals(n, seed=0, noutlier=20):
+  random.seed(seed)
+  cols = [flex.double([random.gauss(0, 1) for i in range(n)])
+          for j in range(3)]
+  for col in cols:
+    for i in range(noutlier):
+      col[i] += 10
+  return cols
+
+def test_concentration_steps():
+  from libtbx.test_utils import approx_equal
+  from dials.algorithms.statistics.fast_mcd import (cov, maha_dist_sq,
+    observation_matrix)
+  from dials_refinement_helpers_ext import (mcd_initial_estimate,
+    mcd_concentration_steps)
+  cols = make_residuals(200)
+  obs = observation_matrix(cols)
+  h = 101
+
+  # the first p + 1 rows are a non-singular subset
+  estimate = mcd_initial_estimate(obs, h, flex.size_t_range(200), 0)
+  T = flex.double([flex.mean(c[0:4]) for c in cols])
+  S = cov(*[c[0:4] for c in cols])
+
+  # compare with a concentration step done here
+  H = flex.sort_permutation(maha_dist_sq(cols, T, S))[0:h]
+  subset = [c.select(H) for c in cols]
+  T = flex.double([flex.mean(c) for c in subset])
+  S = cov(*subset)
+  assert approx_equal(list(estimate.get_location()), list(T))
+  assert approx_equal(list(estimate.get_covariance()), list(S))
+  assert approx_equal(estimate.get_determinant(),
+    S.matrix_determinant_via_lu())
+
+  # concentration steps do not increase the determinant, and none of the
+  # outliers remain in the converged subset
+  final = mcd_concentration_steps(obs, h, estimate, max_steps=100,
+    stop_at_convergence=True)
+  assert final.get_determinant() <= estimate.get_determinant()
+  d2 = maha_dist_sq(cols, final.get_location(), final.get_covariance())
+  assert flex.min(d2[0:20]) > flex.max(d2[20:])
+
+def test_fast_mcd_reproducible():
+  from dials.algorithms.statistics.fast_mcd import FastMCD
+  for n in (300, 1000):
+    cols = make_residuals(n)
+    T1, S1 = FastMCD(cols, n_trials=50, seed=42).get_raw_T_and_S()
+    flex.set_random_seed(0)
+    T2, S2 = FastMCD(cols, n_trials=50, seed=42).get_raw_T_and_S()
+    assert list(T1) == list(T2)
+    assert list(S1) == list(S2)
+
+def test_parallel_outlier_rejection():
+  from dials.algorithms.refinement.outlier_detection.mcd import MCD
+  n = 400
+  cols = make_residuals(n)
+  reflections = flex.reflection_table()
+  reflections['id'] = flex.int(n, 0)
+  reflections['panel'] = flex.size_t([i % 4 for i in range(n)])
+  reflections['x_resid'], reflections['y_resid'], reflections['phi_resid'] = \
+    cols
+  reflections['xyzobs.mm.value'] = flex.vec3_double(n, (0, 0, 0))
+  reflections.set_flags(flex.bool(n, True),
+    reflections.flags.used_in_refinement)
+
+  flags = []
+  for nproc in (1, 2):
+    table = reflections.copy()
+    detector = MCD(n_trials=50, random_seed=42)
+    detector.set_nproc(nproc)
+    assert detector(table)
+    flags.append(table.get_flags(table.flags.centroid_outlier))
+  assert list(flags[0]) == list(flags[1])
+  assert flags[0][0:20].all_eq(True)
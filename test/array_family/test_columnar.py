@@ -0,0 +1,56 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+from dials.array_family import flex
+
+def make_reflections(n):
+  reflections = flex.reflection_table()
+  reflections['id'] = flex.int(range(n))
+  reflections['panel'] = flex.size_t(n, 0)
+  reflections['entering'] = flex.bool([i % 2 == 0 for i in range(n)])
+  reflections['miller_index'] = flex.miller_index(
+    [(i, -i, 2 * i) for i in range(n)])
+  reflections['intensity.sum.value'] = flex.double(range(n)) * 0.5
+  reflections['xyzcal.px'] = flex.vec3_double(
+    [(i, i + 0.5, i + 0.25) for i in range(n)])
+  reflections['d_matrix'] = flex.mat3_double(n, (1, 2, 3, 4, 5, 6, 7, 8, 9))
+  reflections['bbox'] = flex.int6([(0, 3, 0, 4, i, i + 1) for i in range(n)])
+  reflections['name'] = flex.std_string(['r%d' % i for i in range(n)])
+  reflections['shoebox'] = flex.shoebox(
+    reflections['panel'], reflections['bbox'], allocate=True)
+  return reflections
+
+def test_columnar_round_trip(tmpdir):
+  from dials.array_family.columnar import ColumnarReader, is_columnar_file
+  filename = os.path.join(tmpdir.strpath, 'reflections.refl')
+  reflections = make_reflections(25)
+  reflections.as_columnar(filename)
+  assert is_columnar_file(filename)
+
+  result = flex.reflection_table.from_file(filename)
+  assert len(result) == len(reflections)
+  assert sorted(result.keys()) == sorted(reflections.keys())
+  for key in reflections.keys():
+    if key == 'shoebox':
+      continue
+    assert list(result[key]) == list(reflections[key])
+  assert list(result['shoebox'].bounding_boxes()) == list(reflections['bbox'])
+
+  # Columns are read on demand and the shoeboxes can be skipped
+  with ColumnarReader(filename) as reader:
+    assert reader.shoebox_keys() == ['shoebox']
+    assert list(reader['id']) == list(reflections['id'])
+    subset = reader.read(columns=['miller_index'])
+    assert subset.keys() == ['miller_index']
+  result = flex.reflection_table.from_columnar(filename, shoeboxes=False)
+  assert 'shoebox' not in result
+
+def test_from_file_reads_pickles(tmpdir):
+  from dials.array_family.columnar import is_columnar_file
+  filename = os.path.join(tmpdir.strpath, 'reflections.pickle')
+  reflections = make_reflections(5)
+  reflections.as_pickle(filename)
+  assert not is_columnar_file(filename)
+  result = flex.reflection_table.from_file(filename)
+  assert list(result['id']) == list(reflections['id'])
@@ -33,6 +33,8 @@ def run(self):
     self.tst_split_partials()
     self.tst_split_partials_with_shoebox()
     self.tst_find_overlapping()
+    self.tst_match_with_reference()
+    self.tst_compute_shoebox_overlap_fraction()
 
   def tst_init(self):
     from dials.array_family import flex
@@ -682,6 +684,36 @@ def tst_sort(self):
     table.sort("c", order=(1,2,0))
     assert list(table['c']) == [(1, 1, 1), (2, 1, 1), (3, 1, 1), (3, 2, 1), (2, 4, 2)]
 
+    table.sort("b", reverse=True)
+    assert list(table['b']) == [(4,5), (4,3), (3,2), (3,1), (1,3)]
+
+    # Sort on several keys compared with a python sort
+    from random import randint, seed
+    seed(0)
+    N = 1000
+    table = flex.reflection_table()
+    table['a'] = flex.int([randint(0, 3) for i in range(N)])
+    table['b'] = flex.vec3_double([(randint(0, 2), randint(0, 2), 0)
+                                   for i in range(N)])
+    table['c'] = flex.miller_index([(randint(-2, 2), randint(-2, 2), 0)
+                                    for i in range(N)])
+    table['i'] = flex.size_t_range(N)
+    rows = [(table['a'][i], table['b'][i], table['c'][i]) for i in range(N)]
+    expected = sorted(range(N), key=lambda i: (
+      -rows[i][0], rows[i][2][1], rows[i][1]))
+    table.sort([('a', None, True), ('c', 1), 'b'])
+    assert list(table['i']) == expected
+
+    # Sub-sort keeps the runs in place and is stable within them
+    table.sort('a')
+    runs = list(table['a'])
+    perm = list(table['i'])
+    table.subsort('a', 'c', reverse=True)
+    assert list(table['a']) == runs
+    expected = sorted(range(N), key=lambda i: (
+      runs[i], tuple(-h for h in rows[perm[i]][2])))
+    assert list(table['i']) == [perm[i] for i in expected]
+
     print "OK"
 
   def tst_flags(self):
@@ -947,6 +979,12 @@ def tst_split_indices_by_experiment_id(self):
         [100, 100, 100, 100, 0, 100]):
       assert(len(index) == num)
       assert(r.select(index)['id'].count(exp) == num)
+
+    # An empty table gives an empty list of indices for each experiment
+    r = flex.reflection_table()
+    r['id'] = flex.int()
+    index_list = r.split_indices_by_experiment_id(3)
+    assert([len(index) for index in index_list] == [0, 0, 0])
     print 'OK'
 
   def tst_split_partials(self):
@@ -1125,6 +1163,113 @@ def is_overlap(b0, b1, border):
 
     print 'OK'
 
+  def tst_match_with_reference(self):
+    from dials.array_family import flex
+    from random import randint, uniform, seed
+    seed(0)
+
+    def make_table(n):
+      r = flex.reflection_table()
+      r['miller_index'] = flex.miller_index(
+        [(randint(0, 5), randint(0, 5), randint(0, 5)) for i in range(n)])
+      r['entering'] = flex.bool([randint(0, 1) == 1 for i in range(n)])
+      r['id'] = flex.int([randint(0, 1) for i in range(n)])
+      r['panel'] = flex.size_t([randint(0, 1) for i in range(n)])
+      r['xyzcal.px'] = flex.vec3_double(
+        [(uniform(0, 4), uniform(0, 4), uniform(0, 4)) for i in range(n)])
+      r.set_flags(flex.bool(n, False), r.flags.strong)
+      return r
+
+    def reference_match(r1, r2):
+      # The matching as originally done in python
+      lookup = {}
+      for i in range(len(r1)):
+        key = r1['miller_index'][i] + (
+          r1['entering'][i], r1['id'][i], r1['panel'][i])
+        lookup.setdefault(key, ([], []))[0].append(i)
+      for j in range(len(r2)):
+        key = r2['miller_index'][j] + (
+          r2['entering'][j], r2['id'][j], r2['panel'][j])
+        if key in lookup:
+          lookup[key][1].append(j)
+      pairs = []
+      for a, b in lookup.values():
+        if len(b) == 0:
+          continue
+        if len(a) == 1 and len(b) == 1:
+          pairs.append((a[0], b[0]))
+          continue
+        matched = {}
+        for i in a:
+          x1 = r1['xyzcal.px'][i]
+          d = [(j, sum((p - q)**2 for p, q in zip(x1, r2['xyzcal.px'][j])))
+               for j in b]
+          j, dmin = min(d, key=lambda x: x[1])
+          if j not in matched or dmin < matched[j][1]:
+            matched[j] = (i, dmin)
+        pairs.extend((i, j) for j, (i, dmin) in matched.items())
+      return sorted(pairs)
+
+    r1 = make_table(2000)
+    r2 = make_table(1000)
+    expected = reference_match(r1, r2)
+    for nthreads in [1, 4]:
+      sind, oind = flex.match_reference_indices(
+        r1['miller_index'], r1['entering'], r1['id'], r1['panel'],
+        r1['xyzcal.px'], r2['miller_index'], r2['entering'], r2['id'],
+        r2['panel'], r2['xyzcal.px'], nthreads=nthreads)
+      assert list(zip(sind, oind)) == expected
+
+    # Check the table methods agree with each other
+    mask1, matched1, unmatched1 = r1.copy().match_with_reference(
+      r2, nthreads=2)
+    mask2, matched2, unmatched2 = \
+      r1.copy().match_with_reference_without_copying_columns(r2)
+    assert list(mask1) == list(mask2)
+    assert len(matched1) == len(matched2) == mask1.count(True)
+    assert len(unmatched1) == len(unmatched2) == len(r2) - len(matched1)
+    print 'OK'
+
+
+  def tst_compute_shoebox_overlap_fraction(self):
+    from dials.array_family import flex
+    from random import randint, seed
+    seed(0)
+    N = 2000
+    r = flex.reflection_table(N)
+    r['bbox'] = flex.int6(N)
+    r['panel'] = flex.size_t(N)
+    r['id'] = flex.int(N)
+    r['imageset_id'] = flex.int(N)
+    for i in range(N):
+      x0 = randint(0, 100)
+      y0 = randint(0, 100)
+      z0 = randint(0, 20)
+      r['bbox'][i] = (x0, x0 + randint(1, 10), y0, y0 + randint(1, 10),
+                      z0, z0 + randint(1, 5))
+    overlaps = r.find_overlaps()
+
+    def reference_fraction(i):
+      # The fraction as originally computed in python with a mask
+      b1 = r['bbox'][i]
+      xs, ys, zs = b1[1] - b1[0], b1[3] - b1[2], b1[5] - b1[4]
+      mask = flex.bool(flex.grid(zs, ys, xs), False)
+      for j in overlaps.adjacent_vertices(i):
+        b2 = r['bbox'][j]
+        x0, x1 = max(b2[0] - b1[0], 0), min(b2[1] - b1[0], xs)
+        y0, y1 = max(b2[2] - b1[2], 0), min(b2[3] - b1[2], ys)
+        z0, z1 = max(b2[4] - b1[4], 0), min(b2[5] - b1[4], zs)
+        mask[z0:z1,y0:y1,x0:x1] = flex.bool(
+          flex.grid(z1 - z0, y1 - y0, x1 - x0), True)
+      return (1.0 * mask.count(True)) / mask.size()
+
+    expected = [reference_fraction(i) for i in range(N)]
+    assert max(expected) > 0
+    for nthreads in [1, 4]:
+      fraction = r.compute_shoebox_overlap_fraction(overlaps, nthreads=nthreads)
+      assert list(fraction) == expected
+    print 'OK'
+
 
 if __name__ == '__main__':
   from dials.test import cd_auto
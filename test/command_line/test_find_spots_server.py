@@ -0,0 +1,58 @@
+from __future__ import absolute_import, division, print_function
+
+import glob
+import os
+import threading
+
+def test_second_request_is_served_from_cache(dials_regression):
+  from dials.command_line.find_spots_client import Client
+  from dials.command_line.find_spots_server import SpotFindingServer
+  filenames = sorted(glob.glob(os.path.join(
+    dials_regression, 'centroid_test_data', '*.cbf')))[:3]
+  assert len(filenames) == 3
+
+  # One worker process, so that every request uses the same cache
+  server = SpotFindingServer(('127.0.0.1', 0), 1)
+  thread = threading.Thread(target=server.serve_forever)
+  thread.daemon = True
+  thread.start()
+  client = Client('127.0.0.1', server.server_address[1])
+  try:
+    params = ['min_spot_size=3']
+    first = dict((d['image'], d)
+                 for d in client.work_batch(filenames, params))
+    second = dict((d['image'], d)
+                  for d in client.work_batch(filenames, params))
+  finally:
+    client.close()
+    server.shutdown()
+    server.server_close()
+
+  assert sorted(first) == sorted(second) == filenames
+  assert [first[f]['spot_finder_cached'] for f in filenames] == \
+    [False, True, True]
+  for f in filenames:
+    assert 'error' not in second[f]
+    assert second[f]['spot_finder_cached']
+    assert second[f]['n_spots_total'] == first[f]['n_spots_total']
+
+def test_spot_finder_is_cached_for_each_detector(dials_regression):
+  from dxtbx.model import Detector
+  from scitbx import matrix
+  from dials.command_line.find_spots_server import SpotFindingCache
+  filename = os.path.join(
+    dials_regression, 'centroid_test_data', 'centroid_0001.cbf')
+  cache = SpotFindingCache()
+  options, params, unhandled = cache.parse([])
+  finder = cache.spot_finder([], params, cache.datablock(filename))
+  assert cache.spot_finder([], params, cache.datablock(filename)) is finder
+
+  # The same detector type moved by a millimetre gets its own spot finder
+  datablock = cache.datablock(filename)
+  imageset = datablock.extract_imagesets()[0]
+  detector = Detector.from_dict(imageset.get_detector().to_dict())
+  panel = detector[0]
+  panel.set_frame(panel.get_fast_axis(), panel.get_slow_axis(),
+    matrix.col(panel.get_origin()) + matrix.col((1, 0, 0)))
+  imageset.set_detector(detector)
+  assert cache.spot_finder([], params, datablock) is not finder
@@ -142,3 +142,78 @@ def test_thing_3(tmpdir, dials_regression):
   shift = (scitbx.matrix.col(detector_1[0].get_origin()) -
            scitbx.matrix.col(detector_2[0].get_origin()))
   assert shift.elems == pytest.approx((-0.976, 2.497, 0.0), abs=1e-1)
+
+def test_origin_offset_scorer_matches_shifted_detector(dials_regression):
+  import copy
+  from dxtbx.serialize import load
+  from rstbx.indexing_api import dps_extended
+  from dials.algorithms.indexing.indexer import indexer_base
+  from dials.array_family import flex
+  from dials.command_line.search_beam_position import origin_offset_scorer
+
+  data_dir = os.path.join(dials_regression, "indexing_test_data", "trypsin")
+  datablocks = load.datablock(
+    os.path.join(data_dir, "datablock_P1_X6_1.json"), check_format=False)
+  imageset = datablocks[0].extract_imagesets()[0]
+  spots = flex.reflection_table.from_pickle(
+    os.path.join(data_dir, "strong_P1_X6_1_0-1.pickle"))
+  spots_mm = indexer_base.map_spots_pixel_to_mm_rad(
+    spots, imageset.get_detector(), imageset.get_scan())
+
+  scorer = origin_offset_scorer(spots_mm, imageset, None, None)
+  offsets = [(0, 0, 0), (0.3, -0.2, 0), (-1.0, 0.5, 0)]
+  rlps = scorer.reciprocal_lattice_points(offsets)
+
+  gonio = copy.deepcopy(imageset.get_goniometer())
+  gonio.set_fixed_rotation((1, 0, 0, 0, 1, 0, 0, 0, 1))
+  for offset, rlp in zip(offsets, rlps):
+    detector = dps_extended.get_new_detector(
+      imageset.get_detector(), scitbx.matrix.col(offset))
+    indexer_base.map_centroids_to_reciprocal_space(
+      spots_mm, detector, imageset.get_beam(), gonio)
+    expected = spots_mm['rlp'].as_double().as_numpy_array().reshape(-1, 3)
+    assert rlp == pytest.approx(expected, abs=1e-10)
+
+def test_coarse_search_finds_same_origin(tmpdir, dials_regression):
+  data_dir = os.path.join(dials_regression, "indexing_test_data", "trypsin")
+  pickle_path1 = os.path.join(data_dir, "strong_P1_X6_1_0-1.pickle")
+  pickle_path2 = os.path.join(data_dir, "strong_P1_X6_2_0-1.pickle")
+  datablock_path1 = os.path.join(data_dir, "datablock_P1_X6_1.json")
+  datablock_path2 = os.path.join(data_dir, "datablock_P1_X6_2.json")
+
+  tmpdir.chdir()
+
+  # As test_thing_1, scoring the wide grid only around the best coarse cells
+  args = ["dials.search_beam_position",
+          datablock_path1,
+          datablock_path2,
+          pickle_path1,
+          pickle_path2,
+          "coarse_search_binning=8"]
+  print(args)
+  result = libtbx.procrunner.run_process(args)
+  assert result['stderr'] == '' and result['exitcode'] == 0
+  assert os.path.exists('optimized_datablock.json')
+
+  from dxtbx.serialize import load
+  datablocks = load.datablock(datablock_path1, check_format=False)
+  original_imageset = datablocks[0].extract_imagesets()[0]
+  optimized_datablock = load.datablock('optimized_datablock.json',
+                                       check_format=False)
+  detector_1 = original_imageset.get_detector()
+  detector_2 = optimized_datablock[0].unique_detectors()[0]
+  shift = (scitbx.matrix.col(detector_1[0].get_origin()) -
+           scitbx.matrix.col(detector_2[0].get_origin()))
+  assert shift.elems == pytest.approx((0.037, 0.061, 0.0), abs=1e-1)
+
+def test_select_high_scores():
+  from dials.array_family import flex
+  from dials.command_line.search_beam_position import select_high_scores
+  scores = flex.double([1.0, 9.5, float('-inf'), 10.0, 8.0])
+  assert list(select_high_scores(scores).iselection()) == [1, 3]
+
+  # No score passes when the maximum is not positive
+  scores = flex.double([-3.0, float('-inf'), -1.0, -2.0])
+  assert list(select_high_scores(scores).iselection()) == [2]
+  scores = flex.double([0.0, float('-inf'), 0.0])
+  assert list(select_high_scores(scores).iselection()) == [0]
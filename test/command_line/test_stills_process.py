@@ -0,0 +1,35 @@
+from __future__ import absolute_import, division, print_function
+
+def test_restore_composite_state(tmpdir):
+  from dials.array_family import flex
+  from dials.command_line.stills_process import phil_scope, Processor
+  from dxtbx.model.experiment_list import Experiment
+  from libtbx.phil import parse
+  params = phil_scope.fetch(parse('''
+    output.composite_output=True
+    output.output_dir=%s
+  ''' % tmpdir.strpath)).extract()
+  processor = Processor(params, composite_tag="0000")
+
+  def add_image(n):
+    for i in range(n):
+      processor.all_indexed_experiments.append(Experiment())
+      processor.all_integrated_experiments.append(Experiment())
+    reflections = flex.reflection_table()
+    reflections['id'] = flex.int(range(n))
+    processor.all_indexed_reflections.extend(reflections)
+    processor.all_integrated_reflections.extend(reflections)
+    processor.all_int_pickle_filenames.append('int-%d.pickle' % n)
+    processor.all_int_pickles.append({})
+
+  add_image(2)
+  state = processor.composite_state()
+  add_image(3)
+  processor.restore_composite_state(state)
+  assert processor.composite_state() == state == (2, 2, 2, 2, 1)
+  assert list(processor.all_indexed_reflections['id']) == [0, 1]
+  assert processor.all_int_pickle_filenames == ['int-2.pickle']
+
+  # Without composite output there is nothing to restore
+  params.output.composite_output = False
+  assert Processor(params).composite_state() is None
@@ -0,0 +1,104 @@
+from __future__ import absolute_import, division, print_function
+
+from dials.util.benchmark import StageTimer, compare, sort_stage_names
+
+def record(**stages):
+  results = {}
+  for name, (wall_time, peak_rss_mb) in stages.items():
+    if wall_time is None:
+      results[name] = { 'status' : 'failed' }
+    else:
+      results[name] = {
+        'status' : 'ok',
+        'wall_time' : wall_time,
+        'cpu_time' : wall_time,
+        'peak_rss_mb' : peak_rss_mb }
+  return { 'results' : results }
+
+def test_sort_stage_names():
+  names = ['export', 'integration_3d_threaded', 'indexing', 'integration_3d',
+           'simulation', 'spot_finding', 'refinement']
+  assert sort_stage_names(names) == [
+    'simulation', 'spot_finding', 'indexing', 'refinement', 'integration_3d',
+    'integration_3d_threaded', 'export']
+  names = ['refinement', 'fft3d_n256_t1_transform', 'fft3d_n128_t1_sampling',
+           'indexing']
+  assert sort_stage_names(names) == [
+    'indexing', 'fft3d_n128_t1_sampling', 'fft3d_n256_t1_transform',
+    'refinement']
+
+def test_compare_flags_regressions():
+  reference = record(
+    spot_finding=(10.0, 100), indexing=(5.0, 100), refinement=(0.01, 100),
+    export=(1.0, 100), integration_3d=(20.0, 200))
+  result = record(
+    spot_finding=(10.5, 100), indexing=(6.0, 100), refinement=(0.04, 100),
+    export=(None, None), integration_3d=(19.0, 300))
+  comparison = dict(
+    (name, regressions) for name, t0, t1, ratio, regressions
+    in compare(reference, result, tolerance=0.1, memory_tolerance=0.1,
+               min_time=0.05))
+  assert comparison['spot_finding'] == []
+  assert comparison['indexing'] == ['time']
+  assert comparison['refinement'] == []
+  assert comparison['export'] == ['status failed']
+  assert comparison['integration_3d'] == ['memory']
+
+def test_compare_ignores_missing_stages():
+  reference = record(spot_finding=(1.0, 100), indexing=(1.0, 100))
+  result = record(spot_finding=(1.0, 100))
+  comparison = compare(reference, result)
+  assert [row[0] for row in comparison] == ['spot_finding']
+  assert comparison[0][3] == 1.0
+
+def test_compare_uses_stage_memory_increase():
+  reference = record(spot_finding=(1.0, 500), indexing=(1.0, 500))
+  result = record(spot_finding=(1.0, 900), indexing=(1.0, 500))
+  reference['results']['spot_finding']['peak_rss_increase_mb'] = 50
+  result['results']['spot_finding']['peak_rss_increase_mb'] = 52
+  reference['results']['indexing']['peak_rss_increase_mb'] = 50
+  result['results']['indexing']['peak_rss_increase_mb'] = 100
+  comparison = dict(
+    (name, regressions) for name, t0, t1, ratio, regressions
+    in compare(reference, result))
+  assert comparison['spot_finding'] == []
+  assert comparison['indexing'] == ['memory']
+
+def test_run_in_process():
+  import pytest
+  from dials.util.benchmark import run_in_process
+  assert run_in_process(sum, range(1000)) == sum(range(1000))
+  with pytest.raises(RuntimeError) as e:
+    run_in_process(int, 'x')
+  assert 'ValueError' in str(e.value)
+
+def test_stage_timer_records_failures():
+  with StageTimer('ok') as timer:
+    sum(range(1000))
+  assert timer.result['status'] == 'ok'
+  assert timer.result['wall_time'] >= 0
+  assert timer.result['peak_rss_mb'] > 0
+  assert timer.result['peak_rss_increase_mb'] >= 0
+  with StageTimer('failed') as timer:
+    raise RuntimeError('Failure')
+  assert timer.result['status'] == 'failed'
+  assert 'Failure' in timer.result['error']
+
+def test_synthetic_sweep_is_reproducible():
+  from dials.util.benchmark import phil_scope, SyntheticSweep
+  params = phil_scope.extract()
+  params.scale.n_images = 5
+  params.scale.spots_per_image = 20
+  params.scale.panel_size = (256, 256)
+  sweeps = [SyntheticSweep(params) for i in range(2)]
+  shoeboxes = [s.reflections['shoebox'] for s in sweeps]
+  assert len(shoeboxes[0]) == len(shoeboxes[1]) > 0
+  for sbox1, sbox2 in zip(*shoeboxes):
+    assert sbox1.bbox == sbox2.bbox
+    assert list(sbox1.data) == list(sbox2.data)
+  # the profiles are simulated, not left empty
+  assert sum(sum(sbox.data) for sbox in shoeboxes[0]) > 0
+  for i in range(params.scale.n_images):
+    image1 = sweeps[0].imageset.get_raw_data(i)[0]
+    image2 = sweeps[1].imageset.get_raw_data(i)[0]
+    assert list(image1) == list(image2)
@@ -82,3 +82,42 @@ def test_calculate_batch_ranges(self):
       assert all(isinstance(x, int) for x in itertools.chain(*self._run_ranges(data))), "Not all true integers"
       assert all([x > 0 for x in self._run_ranges_to_set([(0,0)])]), "Should be no zeroth/negative batch"
       assert not has_consecutive_ranges(self._run_ranges(data))
+
+
+def _partial_reflections():
+  """A reflection table of partials: a full reflection, a two part and a three
+  part reflection with interleaved parts, and a two part reflection with too
+  little total partiality"""
+  from dials.array_family import flex
+  table = flex.reflection_table()
+  table['partial_id'] = flex.size_t([0, 1, 2, 1, 2, 3, 2, 3])
+  table['partiality'] = flex.double([1.0, 0.4, 0.3, 0.6, 0.3, 0.1, 0.3, 0.2])
+  table['intensity.sum.value'] = flex.double([10, 4, 3, 6, 2, 1, 5, 2])
+  table['intensity.sum.variance'] = flex.double([10, 4, 3, 6, 2, 1, 5, 2])
+  table['intensity.prf.value'] = flex.double([11, 5, 2, 7, 3, 1, 4, 3])
+  table['intensity.prf.variance'] = flex.double([11, 5, 2, 7, 3, 1, 4, 3])
+  return table
+
+def test_sum_partial_reflections():
+  table = export_mtz.sum_partial_reflections(_partial_reflections())
+  assert list(table['partial_id']) == [0, 1, 2]
+  assert list(table['intensity.sum.value']) == [10, 10, 10]
+  assert list(table['intensity.sum.variance']) == [10, 10, 10]
+  assert table['partiality'][1] == 0.4 + 0.6
+  assert table['partiality'][2] == 0.3 + 0.3 + 0.3
+  w = [5 * 5 / 5, 7 * 7 / 7]
+  assert table['intensity.prf.value'][1] == pytest.approx(
+    (w[0] * 5 + w[1] * 7) / sum(w))
+  w = [2 * 2 / 2, 3 * 3 / 3, 4 * 4 / 4]
+  assert table['intensity.prf.value'][2] == pytest.approx(
+    (w[0] * 2 + w[1] * 3 + w[2] * 4) / sum(w))
+
+def test_scale_partial_reflections():
+  from dials.array_family import flex
+  table = flex.reflection_table()
+  table['partiality'] = flex.double([1.0, 0.5, 0.25, 0.8])
+  table['intensity.sum.value'] = flex.double([1, 2, 3, 4])
+  table['intensity.sum.variance'] = flex.double([1, 2, 3, 4])
+  table = export_mtz.scale_partial_reflections(table)
+  assert list(table['intensity.sum.value']) == [1, 4, 5]
+  assert list(table['intensity.sum.variance']) == [1, 4, 5]
@@ -0,0 +1,63 @@
+from __future__ import absolute_import, division, print_function
+
+import os
+
+import pytest
+
+from dials.array_family import flex
+
+def make_reflections(n):
+  # A scalar, a vector and a miller index column, and shoeboxes with data
+  reflections = flex.reflection_table()
+  reflections['id'] = flex.int(range(n))
+  reflections['miller_index'] = flex.miller_index(
+    [(i, -i, 2 * i) for i in range(n)])
+  reflections['xyzcal.px'] = flex.vec3_double(
+    [(i, i + 0.5, i + 0.25) for i in range(n)])
+  reflections['bbox'] = flex.int6([(0, 3, 0, 4, i, i + 1) for i in range(n)])
+  reflections['shoebox'] = flex.shoebox(
+    flex.size_t(n, 0), reflections['bbox'], allocate=True)
+  for i, sbox in enumerate(reflections['shoebox']):
+    sbox.data.set_selected(flex.bool(sbox.data.size(), True), float(i))
+  return reflections
+
+@pytest.mark.parametrize("chunks,compression", [(None, None), (7, 'gzip')])
+def test_h5_round_trip(tmpdir, chunks, compression):
+  pytest.importorskip('h5py')
+  filename = os.path.join(tmpdir.strpath, 'reflections.h5')
+  reflections = make_reflections(25)
+  reflections.as_h5(filename, chunks=chunks, compression=compression)
+
+  result = flex.reflection_table.from_h5(filename)
+  assert len(result) == len(reflections)
+  assert sorted(result.keys()) == sorted(reflections.keys())
+  for key in reflections.keys():
+    if key == 'shoebox':
+      continue
+    assert list(result[key]) == list(reflections[key])
+  for sbox1, sbox2 in zip(reflections['shoebox'], result['shoebox']):
+    assert sbox1.bbox == sbox2.bbox
+    assert list(sbox1.data) == list(sbox2.data)
+    assert list(sbox1.mask) == list(sbox2.mask)
+
+def test_h5_empty_table(tmpdir):
+  pytest.importorskip('h5py')
+  filename = os.path.join(tmpdir.strpath, 'empty.h5')
+  reflections = make_reflections(0)
+  reflections.as_h5(filename, chunks=10, compression='gzip')
+  result = flex.reflection_table.from_h5(filename)
+  assert len(result) == 0
+
+def test_nx_reflections_write_miller_index(tmpdir):
+  h5py = pytest.importorskip('h5py')
+  from dials.util.nexus import nx_reflections
+  filename = os.path.join(tmpdir.strpath, 'miller_index.h5')
+  miller_index = flex.miller_index([(i, -i, 2 * i) for i in range(25)])
+  with h5py.File(filename, 'w') as handle:
+    nx_reflections.write(handle, 'miller_index', miller_index)
+  with h5py.File(filename, 'r') as handle:
+    assert list(handle['h'][:]) == list(range(25))
+    assert list(handle['k'][:]) == [-i for i in range(25)]
+    assert list(handle['l'][:]) == [2 * i for i in range(25)]
+    result = nx_reflections.read(handle, 'miller_index')
+  assert list(result) == list(miller_index)
@@ -0,0 +1,34 @@
+from __future__ import absolute_import, division, print_function
+
+import pytest
+
+from dials.util.prefetch import Prefetcher
+
+@pytest.mark.parametrize("nthreads", [0, 1, 4])
+def test_prefetcher_returns_items_in_order(nthreads):
+  prefetcher = Prefetcher(lambda i: i * i, range(50), nthreads=nthreads, depth=3)
+  assert list(prefetcher) == [i * i for i in range(50)]
+  assert prefetcher.read_time >= 0
+  assert prefetcher.wait_time >= 0
+
+def test_prefetcher_does_not_read_beyond_depth():
+  import threading
+  lock = threading.Lock()
+  read = []
+  def read_item(i):
+    with lock:
+      read.append(i)
+    return i
+  prefetcher = Prefetcher(read_item, range(20), nthreads=2, depth=2)
+  for i in prefetcher:
+    with lock:
+      assert max(read) < i + 1 + 2
+
+def test_prefetcher_raises_read_errors():
+  def read_item(i):
+    if i == 3:
+      raise RuntimeError("Bad image")
+    return i
+  prefetcher = Prefetcher(read_item, range(10), nthreads=2)
+  with pytest.raises(RuntimeError):
+    list(prefetcher)
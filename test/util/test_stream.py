@@ -0,0 +1,71 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+import os
+import time
+
+import pytest
+
+def push_series(socket, num_images, shape=(4, 5)):
+  socket.send_multipart([
+    json.dumps({'htype': 'dheader-1.0', 'header_detail': 'basic'}),
+    json.dumps({'x_pixels_in_detector': shape[1],
+                'y_pixels_in_detector': shape[0]})])
+  for i in range(num_images):
+    data = b'\0' * (shape[0] * shape[1] * 4)
+    socket.send_multipart([
+      json.dumps({'htype': 'dimage-1.0', 'frame': i}),
+      json.dumps({'htype': 'dimage_d-1.0', 'shape': [shape[0], shape[1]],
+                  'type': 'uint32', 'encoding': '<', 'size': len(data)}),
+      data,
+      json.dumps({'htype': 'dconfig-1.0', 'start_time': i, 'stop_time': i + 1,
+                  'real_time': 1})])
+  socket.send_multipart([json.dumps({'htype': 'dseries_end-1.0'})])
+
+def test_stream_image_source(tmpdir):
+  zmq = pytest.importorskip('zmq')
+  from dials.util.stream import ZMQStream, Decoder, StreamImageSource
+
+  # A local stand-in for the detector stream
+  context = zmq.Context()
+  socket = context.socket(zmq.PUSH)
+  port = socket.bind_to_random_port('tcp://127.0.0.1')
+  try:
+    stream = ZMQStream('127.0.0.1', port)
+    push_series(socket, 3)
+    source = StreamImageSource(
+      stream, Decoder(tmpdir.strpath, '%05d.image'))
+    header = source.receive_header()
+    assert header.header['configuration']['x_pixels_in_detector'] == 5
+    assert list(source) == [0, 1, 2]
+    stream.close()
+  finally:
+    socket.close()
+  filenames = sorted(os.listdir(tmpdir.strpath))
+  assert filenames == [
+    '00000.image', '00000.image.info',
+    '00001.image', '00001.image.info',
+    '00002.image', '00002.image.info',
+    'metadata.json']
+  with open(tmpdir.join('metadata.json').strpath) as infile:
+    assert json.load(infile)['htype'] == 'eiger-stream'
+
+class FakeImageSet(object):
+  def __init__(self, paths):
+    self.paths = paths
+  def __len__(self):
+    return len(self.paths)
+  def get_path(self, index):
+    return self.paths[index]
+
+def test_directory_watcher(tmpdir):
+  from dials.util.stream import DirectoryWatcher
+  paths = [tmpdir.join('image_%d.cbf' % i).strpath for i in range(3)]
+  for path in paths[:2]:
+    with open(path, 'w') as outfile:
+      outfile.write('data')
+  watcher = DirectoryWatcher(
+    FakeImageSet(paths), poll_interval=0.01, timeout=0.1)
+  start = time.time()
+  assert list(watcher) == [0, 1]
+  assert time.time() - start >= 0.1
@@ -0,0 +1,68 @@
+from __future__ import absolute_import, division, print_function
+
+import json
+
+import pytest
+
+from dials.util import trace
+
+@pytest.fixture
+def tracer():
+  tracer = trace.Tracer()
+  tracer.enable()
+  return tracer
+
+def test_disabled_tracer_records_nothing():
+  tracer = trace.Tracer()
+  with tracer.span('span', 'stage') as args:
+    args['value'] = 1
+  tracer.counter('counter', 'stage', value=1)
+  assert tracer.collect() == []
+
+def test_span_and_counter_events(tracer):
+  with tracer.span('job', 'integration', job=3, image_range=(0, 10)) as args:
+    args['reflections'] = 100
+  tracer.counter('rss_mb', 'memory', rss_mb=12.5)
+  span, counter = tracer.collect()
+  assert span['name'] == 'job'
+  assert span['cat'] == 'integration'
+  assert span['ph'] == 'X'
+  assert span['dur'] >= 0
+  assert span['args'] == { 'job' : 3, 'image_range' : (0, 10),
+                           'reflections' : 100 }
+  assert counter['ph'] == 'C'
+  assert counter['args'] == { 'rss_mb' : 12.5 }
+  assert tracer.collect() == []
+
+def test_span_records_errors(tracer):
+  with pytest.raises(RuntimeError):
+    with tracer.span('job', 'integration'):
+      raise RuntimeError('Failure')
+  event, = tracer.collect()
+  assert event['args']['error'] == 'RuntimeError'
+
+def test_memory_sampler():
+  tracer = trace.Tracer()
+  tracer.enable(memory_sampling_interval=0.01)
+  tracer.disable()
+  events = tracer.collect()
+  assert len(events) >= 1
+  assert all(e['name'] == 'rss_mb' for e in events)
+
+@pytest.mark.parametrize("format", ["chrome", "json"])
+def test_write(tracer, tmpdir, format):
+  with tracer.span('extract_spots', 'spot_finding', image_range=(0, 5)):
+    pass
+  tracer.counter('spots', 'spot_finding', spots=10)
+  filename = tmpdir.join('trace.json').strpath
+  tracer.write(filename, format)
+  with open(filename) as infile:
+    output = json.load(infile)
+  if format == 'chrome':
+    assert len(output['traceEvents']) == 2
+  else:
+    span, = output['spans']
+    assert span['stage'] == 'spot_finding'
+    assert span['args']['image_range'] == [0, 5]
+    counter, = output['counters']
+    assert counter['values'] == { 'spots' : 10 }
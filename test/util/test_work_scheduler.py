@@ -0,0 +1,76 @@
+from __future__ import absolute_import, division, print_function
+
+import signal
+
+from dials.util import work_scheduler
+
+def make_worker_factory(processed, finalized):
+  def make_worker(worker):
+    def process(index):
+      if index == 3:
+        raise RuntimeError("Bad item")
+      if index == 5:
+        # wait for the time limit to interrupt the item
+        signal.pause()
+      processed.append(index)
+    def finalize():
+      finalized.append(worker)
+    return process, finalize
+  return make_worker
+
+def test_work_queue_batches_and_retries():
+  queue = work_scheduler.WorkQueue(5, batch_size=2, max_retries=1)
+  assert queue.next_batch(0) == [0, 1]
+  assert queue.next_batch(1) == [2, 3]
+  queue.record(0, [(0, None, 0.1), (1, "error", 0.1)])
+  assert queue.next_batch(0) == [4, 1]
+  queue.worker_lost(1)
+  assert queue.next_batch(0) == [2, 3]
+  queue.record(0, [(4, None, 0.1), (1, "error", 0.1)])
+  queue.record(0, [(2, None, 0.1), (3, None, 0.1)])
+  assert queue.finished()
+  assert [index for index, error in queue.failed] == [1]
+  assert queue.stats[0].processed == 4
+  assert queue.stats[0].failed == 2
+
+def test_run_serial_with_timeout_and_retries():
+  processed, finalized = [], []
+  queue = work_scheduler.run_serial(
+    8, make_worker_factory(processed, finalized),
+    batch_size=3, timeout=0.5, max_retries=1)
+  assert sorted(processed) == [0, 1, 2, 4, 6, 7]
+  assert sorted(index for index, error in queue.failed) == [3, 5]
+  assert finalized == [0]
+
+def test_run_multiprocessing():
+  processed, finalized = [], []
+  queue = work_scheduler.run_multiprocessing(
+    12, make_worker_factory(processed, finalized), nproc=3,
+    batch_size=2, timeout=0.5)
+  assert sorted(index for index, error in queue.failed) == [3, 5]
+  assert sum(stats.processed for stats in queue.stats.values()) == 10
+
+def test_run_multiprocessing_balances_work():
+  import multiprocessing
+  nitems = 8
+  count = multiprocessing.Value('i', 0)
+  others_done = multiprocessing.Event()
+
+  # The worker given item 0 is held until every other item has been processed,
+  # so the other worker must take all of them
+  def make_worker(worker):
+    def process(index):
+      if index == 0:
+        others_done.wait()
+      else:
+        with count.get_lock():
+          count.value += 1
+          if count.value == nitems - 1:
+            others_done.set()
+    return process, lambda: None
+
+  queue = work_scheduler.run_multiprocessing(
+    nitems, make_worker, nproc=2, batch_size=1)
+  assert queue.failed == []
+  assert sorted(stats.processed for stats in queue.stats.values()) == \
+    [1, nitems - 1]
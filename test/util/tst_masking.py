@@ -115,6 +115,9 @@ def exercise_filter_shadowed_reflections():
       experiments, predicted, experiment_goniometer=experiment_goniometer)
     assert shadowed.count(True) == 17
     assert shadowed.count(False) == 674
+    assert filter_shadowed_reflections(
+      experiments, predicted, experiment_goniometer=experiment_goniometer,
+      nproc=2).all_eq(shadowed)
 
 def run():
   exercise_polygon()
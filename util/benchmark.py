@@ -0,0 +1,836 @@
+#!/usr/bin/env python
+#
+# dials.util.benchmark.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+'''
+Synthetic end-to-end performance benchmarks.
+
+A reproducible synthetic data set is generated in memory from a random seed
+using the reciprocal space simulation code: a rotation sweep on a tiled
+detector with one or more crystal lattices. The main stages of processing are
+then run and timed on it, and the wall time, CPU time and peak resident set
+size of each stage are recorded as JSON. Two such records can be compared to
+flag regressions.
+
+The peak resident set size of a process never decreases, so each stage is run
+in a new process forked from the one holding the synthetic data. The increase
+in peak memory over the memory in use at the start of the stage
+(peak_rss_increase_mb) is then the stage's own, and is the figure compared.
+
+The fft3d stage times the sampling, transform and peak search steps of FFT3D
+indexing on the simulated spots separately, at a range of grid sizes and
+thread counts. Each grid size and thread count is run in a new process so
+that its peak memory use is recorded on its own.
+
+'''
+
+from __future__ import absolute_import, division
+
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+from libtbx.phil import parse
+from dials.util.trace import resident_set_size
+
+#: The stages of processing, in the order they are run
+stages = ['spot_finding', 'indexing', 'fft3d', 'refinement', 'integration',
+          'export']
+
+phil_scope = parse('''
+  scale {
+    n_images = 50
+      .type = int(value_min=1)
+      .help = "The number of images in the sweep"
+    n_panels = 1
+      .type = int(value_min=1)
+      .help = "The number of detector panels, tiled in a square grid"
+    panel_size = 512 512
+      .type = ints(size=2, value_min=1)
+      .help = "The size of each panel in pixels"
+    spots_per_image = 100
+      .type = int(value_min=1)
+      .help = "The number of simulated reflections per image, over all the"
+              "experiments"
+    n_experiments = 1
+      .type = int(value_min=1)
+      .help = "The number of crystal lattices in the sweep"
+  }
+  simulation {
+    seed = 42
+      .type = int(value_min=0)
+    unit_cell = 60 70 80 90 90 90
+      .type = unit_cell
+    wavelength = 1.0
+      .type = float(value_min=0)
+    distance = 200
+      .type = float(value_min=0)
+    pixel_size = 0.172
+      .type = float(value_min=0)
+    oscillation = 0.5
+      .type = float(value_min=0)
+    intensity = 1000
+      .type = int(value_min=1)
+      .help = "The maximum simulated intensity of a reflection"
+    background = 10
+      .type = float(value_min=0)
+      .help = "The mean background counts per pixel"
+    sigma_b = 0.06
+      .type = float(value_min=0)
+      .help = "The beam divergence (degrees)"
+    sigma_m = 0.3
+      .type = float(value_min=0)
+      .help = "The mosaicity (degrees)"
+    n_sigma = 3
+      .type = float(value_min=0)
+  }
+  stages = *spot_finding *indexing fft3d *refinement *integration *export
+    .type = choice(multi=True)
+    .help = "The stages to run. Refinement and integration start from the"
+            "simulated models, so each stage can be timed on its own."
+  fft3d {
+    n_points = 128 256
+      .type = ints(value_min=8)
+      .help = "The reciprocal space grid sizes (as"
+              "indexing.fft3d.reciprocal_space_grid.n_points) at which to"
+              "time the steps of FFT3D indexing"
+    nthreads = 1
+      .type = ints(value_min=1)
+      .help = "The numbers of threads to time at each grid size"
+  }
+  integrator = *3d *3d_threaded
+    .type = choice(multi=True)
+    .help = "The integrators to time"
+  nproc = 1
+    .type = int(value_min=1)
+    .help = "The number of processors used by each stage"
+''')
+
+
+class StageTimer(object):
+  '''
+  Time a block of code and record its resource usage. The increase in peak
+  memory is only that of the block if nothing earlier in the process used
+  more, so blocks are timed in a new process where that matters.
+
+  '''
+
+  def __init__(self, name):
+    self.name = name
+    self.result = { 'status' : 'ok' }
+
+  def __enter__(self):
+    logger.info('Running stage %s' % self.name)
+    self._rss_start = resident_set_size()[0]
+    self._times = os.times()
+    self._start = time.time()
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    wall_time = time.time() - self._start
+    times = os.times()
+    cpu_time = sum(times[:4]) - sum(self._times[:4])
+    current, peak = resident_set_size()
+    self.result.update({
+      'wall_time'   : wall_time,
+      'cpu_time'    : cpu_time,
+      'rss_mb'      : current,
+      'peak_rss_mb' : peak })
+    if self._rss_start is not None and current is not None:
+      self.result['rss_increase_mb'] = current - self._rss_start
+      self.result['peak_rss_increase_mb'] = peak - self._rss_start
+    if exc_type is not None:
+      self.result['status'] = 'failed'
+      self.result['error'] = '%s: %s' % (exc_type.__name__, exc_value)
+      logger.warning('Stage %s failed: %s' % (self.name, self.result['error']))
+      logger.debug('', exc_info=(exc_type, exc_value, traceback))
+      return True
+    logger.info('Stage %s took %.2f s' % (self.name, wall_time))
+    return False
+
+
+class SyntheticImageFormat(object):
+  '''
+  Get the in-memory format class for the synthetic images. The class is
+  created on first use so that dxtbx is only imported when needed.
+
+  '''
+  _cls = None
+
+  @classmethod
+  def get(cls):
+    if cls._cls is None:
+      from dxtbx.format.Format import Format
+
+      class FormatSyntheticInMemory(Format):
+        '''
+        An image held in memory, for use with a dxtbx MemReader.
+
+        '''
+
+        def __init__(self, raw_data, beam, detector, goniometer, scan):
+          self._image_file = 'synthetic'
+          self._raw_data = raw_data
+          self._beam_instance = beam
+          self._detector_instance = detector
+          self._goniometer_instance = goniometer
+          self._scan_instance = scan
+
+        @staticmethod
+        def understand(image_file):
+          return False
+
+        def get_raw_data(self, index=None):
+          return self._raw_data
+
+      cls._cls = FormatSyntheticInMemory
+    return cls._cls
+
+
+class SyntheticSweep(object):
+  '''
+  Generate a reproducible synthetic rotation sweep.
+
+  '''
+
+  def __init__(self, params):
+    '''
+    Initialise the models and simulate the reflections and images.
+
+    :param params: The benchmark parameters
+
+    '''
+    import random
+    import scitbx.random
+    from dials.array_family import flex
+    random.seed(params.simulation.seed)
+    flex.set_random_seed(params.simulation.seed)
+    scitbx.random.set_random_seed(params.simulation.seed)
+    self.params = params
+    self.beam = self._make_beam()
+    self.detector = self._make_detector()
+    self.goniometer = self._make_goniometer()
+    self.scan = self._make_scan()
+    self.crystals = [
+      self._make_crystal(random) for i in range(params.scale.n_experiments)]
+    self.reflections = self._simulate_reflections()
+    self.imageset = self._make_imageset(self._render_images())
+    self.experiments = self.make_experiments()
+
+  def _make_beam(self):
+    from dxtbx.model import BeamFactory
+    return BeamFactory.simple(self.params.simulation.wavelength)
+
+  def _make_detector(self):
+    '''
+    Tile the panels in a square grid, centred on the beam.
+
+    '''
+    from dxtbx.model import Detector
+    from scitbx import matrix
+    sim = self.params.simulation
+    n_panels = self.params.scale.n_panels
+    nx, ny = self.params.scale.panel_size
+    n_columns = int(math.ceil(math.sqrt(n_panels)))
+    n_rows = int(math.ceil(n_panels / n_columns))
+    gap = 10 * sim.pixel_size
+    width = nx * sim.pixel_size + gap
+    height = ny * sim.pixel_size + gap
+    fast = matrix.col((1, 0, 0))
+    slow = matrix.col((0, -1, 0))
+    detector = Detector()
+    for i in range(n_panels):
+      row, column = divmod(i, n_columns)
+      origin = (
+        fast * ((column - n_columns / 2) * width + gap / 2) +
+        slow * ((row - n_rows / 2) * height + gap / 2) +
+        matrix.col((0, 0, -sim.distance)))
+      panel = detector.add_panel()
+      panel.set_name('panel%d' % i)
+      panel.set_type('SENSOR_PAD')
+      panel.set_frame(fast.elems, slow.elems, origin.elems)
+      panel.set_image_size((nx, ny))
+      panel.set_pixel_size((sim.pixel_size, sim.pixel_size))
+      panel.set_trusted_range((-1, 1e6))
+    return detector
+
+  def _make_goniometer(self):
+    from dxtbx.model import GoniometerFactory
+    return GoniometerFactory.known_axis((1, 0, 0))
+
+  def _make_scan(self):
+    from dxtbx.model import ScanFactory
+    n_images = self.params.scale.n_images
+    return ScanFactory.make_scan(
+      image_range=(1, n_images),
+      exposure_times=0.1,
+      oscillation=(0, self.params.simulation.oscillation),
+      epochs=list(range(n_images)),
+      deg=True)
+
+  def _make_crystal(self, random):
+    from dxtbx.model import Crystal
+    from scitbx import matrix
+    from scitbx.math import euler_angles_as_matrix
+    uc = self.params.simulation.unit_cell
+    B = matrix.sqr(uc.fractionalization_matrix()).transpose()
+    U = matrix.sqr(euler_angles_as_matrix(
+      [random.uniform(0, 360) for i in range(3)], deg=True))
+    direct = (U * B).inverse()
+    return Crystal(direct[0:3], direct[3:6], direct[6:9],
+                   space_group_symbol='P 1')
+
+  def make_experiments(self):
+    '''
+    Make a fresh list of experiments with the simulated models.
+
+    '''
+    from dxtbx.model.experiment_list import Experiment, ExperimentList
+    from dials.algorithms.profile_model.gaussian_rs import Model
+    import copy
+    sim = self.params.simulation
+    experiments = ExperimentList()
+    for crystal in self.crystals:
+      experiments.append(Experiment(
+        imageset=self.imageset,
+        beam=self.beam,
+        detector=self.detector,
+        goniometer=self.goniometer,
+        scan=self.scan,
+        crystal=copy.deepcopy(crystal),
+        profile=Model(None, sim.n_sigma, sim.sigma_b, sim.sigma_m,
+                      deg=True)))
+    return experiments
+
+  def _simulate_reflections(self):
+    '''
+    Simulate the signal of a random sample of the predicted reflections.
+
+    '''
+    from dials.algorithms.simulation import simulate_reciprocal_space_gaussian
+    from dials.algorithms.profile_model.gaussian_rs import Model
+    from dxtbx.model.experiment_list import Experiment, ExperimentList
+    from dials.algorithms.shoebox import MaskCode
+    from dials.algorithms import filtering
+    from dials.array_family import flex
+    sim = self.params.simulation
+    n_total = self.params.scale.spots_per_image * self.params.scale.n_images
+    n_each = int(math.ceil(n_total / len(self.crystals)))
+    nx, ny = self.params.scale.panel_size
+    z0, z1 = self.scan.get_array_range()
+    reflections = flex.reflection_table()
+    for i, crystal in enumerate(self.crystals):
+      experiment = Experiment(
+        beam=self.beam,
+        detector=self.detector,
+        goniometer=self.goniometer,
+        scan=self.scan,
+        crystal=crystal,
+        profile=Model(None, sim.n_sigma, sim.sigma_b, sim.sigma_m, deg=True))
+      refl = flex.reflection_table.from_predictions(experiment)
+      refl['id'] = flex.int(len(refl), i)
+      refl = refl.select(filtering.by_zeta(
+        self.goniometer, self.beam, refl['s1'], 0.05))
+      refl.compute_bbox(ExperimentList([experiment]))
+      x0, x1, y0, y1, bz0, bz1 = refl['bbox'].parts()
+      inside = ((x0 >= 0) & (x1 <= nx) & (y0 >= 0) & (y1 <= ny) &
+                (bz0 >= z0) & (bz1 <= z1))
+      refl = refl.select(inside)
+      if len(refl) < n_each:
+        logger.warning('Only %d reflections can be simulated for experiment %d'
+                       % (len(refl), i))
+      else:
+        refl = refl.select(flex.random_selection(len(refl), n_each))
+
+      # Simulate the signal only; the background is added to whole images
+      refl['shoebox'] = flex.shoebox(refl['panel'], refl['bbox'])
+      refl['shoebox'].allocate_with_value(MaskCode.Valid)
+      s1 = refl['s1']
+      phi = refl['xyzcal.mm'].parts()[2]
+      bbox = refl['bbox']
+      shoebox = refl['shoebox']
+      intensity = flex.random_size_t(len(refl), sim.intensity).as_int() + 1
+      # Seed the simulation of each profile from the seeded generator, so
+      # that the same seed gives the same shoebox data
+      seeds = flex.random_size_t(len(refl), 2**31)
+      for j in range(len(refl)):
+        data = shoebox[j].data.as_double()
+        simulate_reciprocal_space_gaussian(
+          self.beam, self.detector, self.goniometer, self.scan,
+          experiment.profile.sigma_b(deg=False),
+          experiment.profile.sigma_m(deg=False),
+          s1[j], phi[j], bbox[j], intensity[j], data, shoebox[j].mask,
+          seeds[j])
+        shoebox[j].data = data.as_float()
+      refl['intensity.sim'] = intensity
+      reflections.extend(refl)
+
+    reflections.set_flags(
+      flex.bool(len(reflections), True), reflections.flags.indexed)
+    logger.info('Simulated %d reflections' % len(reflections))
+    return reflections
+
+  def _render_images(self):
+    '''
+    Render the images: Poisson background plus the simulated shoeboxes.
+
+    '''
+    from dials.array_family import flex
+    from scitbx.random import variate, poisson_distribution
+    sim = self.params.simulation
+    nx, ny = self.params.scale.panel_size
+    z0, z1 = self.scan.get_array_range()
+    n_panels = len(self.detector)
+    if sim.background > 0:
+      background = variate(poisson_distribution(mean=sim.background))
+    images = []
+    for z in range(z0, z1):
+      panels = []
+      for p in range(n_panels):
+        if sim.background > 0:
+          image = background(nx * ny).as_int()
+        else:
+          image = flex.int(nx * ny, 0)
+        image.reshape(flex.grid(ny, nx))
+        panels.append(image)
+      images.append(panels)
+
+    for shoebox in self.reflections['shoebox']:
+      bx0, bx1, by0, by1, bz0, bz1 = shoebox.bbox
+      data = shoebox.data.as_double().iround().as_1d()
+      frame_size = (by1 - by0) * (bx1 - bx0)
+      for k, z in enumerate(range(bz0, bz1)):
+        image = images[z - z0][shoebox.panel]
+        block = data[k*frame_size:(k+1)*frame_size]
+        block.reshape(flex.grid(by1 - by0, bx1 - bx0))
+        block += image.matrix_copy_block(by0, bx0, by1 - by0, bx1 - bx0)
+        image.matrix_paste_block_in_place(block, by0, bx0)
+    return images
+
+  def _make_imageset(self, images):
+    from dxtbx.imageset import ImageSetData, ImageSweep, MemReader, MemMasker
+    FormatClass = SyntheticImageFormat.get()
+    formats = [
+      FormatClass(tuple(panels), self.beam, self.detector, self.goniometer,
+                  self.scan)
+      for panels in images]
+    return ImageSweep(
+      ImageSetData(MemReader(formats), MemMasker(formats)),
+      beam=self.beam,
+      detector=self.detector,
+      goniometer=self.goniometer,
+      scan=self.scan)
+
+  def observed_reflections(self):
+    '''
+    Get the simulated reflections as indexed observations, with the centroids
+    perturbed by a small random error.
+
+    '''
+    from dials.array_family import flex
+    from dials.algorithms.indexing.indexer import indexer_base
+    refl = self.reflections.copy()
+    del refl['shoebox']
+    x, y, z = refl['xyzcal.px'].parts()
+    n = len(refl)
+    sigma = 0.3
+    x += (flex.random_double(n) - 0.5) * sigma
+    y += (flex.random_double(n) - 0.5) * sigma
+    z += (flex.random_double(n) - 0.5) * sigma
+    refl['xyzobs.px.value'] = flex.vec3_double(x, y, z)
+    refl['xyzobs.px.variance'] = flex.vec3_double(n, (sigma**2 / 12,) * 3)
+    refl = indexer_base.map_spots_pixel_to_mm_rad(
+      refl, self.detector, self.scan)
+    refl.set_flags(flex.bool(n, True), refl.flags.strong)
+    return refl
+
+
+class Benchmark(object):
+  '''
+  Run and time each stage on a synthetic sweep.
+
+  '''
+
+  def __init__(self, params):
+    self.params = params
+    self.results = {}
+
+  def run(self):
+    '''
+    Run the benchmark.
+
+    :return: A dictionary of the configuration, environment and results
+
+    '''
+    with StageTimer('simulation') as timer:
+      data = SyntheticSweep(self.params)
+    self.results['simulation'] = timer.result
+    if timer.result['status'] != 'ok':
+      return self.record()
+
+    strong = None
+    if 'spot_finding' in self.params.stages:
+      strong = self.run_stage('spot_finding', self.run_spot_finding, data)
+    if 'indexing' in self.params.stages:
+      self.run_stage('indexing', self.run_indexing, data, strong)
+    if 'fft3d' in self.params.stages:
+      self.run_fft3d(data)
+    if 'refinement' in self.params.stages:
+      self.run_stage('refinement', self.run_refinement, data)
+    integrated = None
+    if 'integration' in self.params.stages:
+      integrated = self.run_stage(
+        'integration', self.run_integration, data)
+    if 'export' in self.params.stages:
+      self.run_stage('export', self.run_export, data, integrated)
+    return self.record()
+
+  def run_stage(self, name, method, *args):
+    '''
+    Run a stage in a new process, so that its peak memory is not that of an
+    earlier stage, and add its results to those of the benchmark.
+
+    :param name: The name of the stage, used if the process fails
+    :param method: The method running the stage
+    :return: The return value of the method, or None if the process failed
+
+    '''
+    def stage():
+      self.results = {}
+      value = method(*args)
+      return self.results, value
+    try:
+      results, value = run_in_process(stage)
+    except RuntimeError as e:
+      logger.warning('Stage %s failed: %s' % (name, e))
+      self.results[name] = { 'status' : 'failed', 'error' : str(e) }
+      return None
+    self.results.update(results)
+    return value
+
+  def record(self):
+    import platform
+    config = phil_scope.format(self.params).as_str()
+    return {
+      'config' : config,
+      'environment' : {
+        'hostname' : platform.node(),
+        'platform' : platform.platform(),
+        'python' : platform.python_version(),
+        'time' : time.strftime('%Y-%m-%dT%H:%M:%S'),
+      },
+      'results' : self.results,
+    }
+
+  def run_spot_finding(self, data):
+    from dxtbx.datablock import DataBlockFactory
+    from dials.command_line.find_spots import phil_scope as find_spots_phil
+    from dials.algorithms.spot_finding.factory import SpotFinderFactory
+    params = find_spots_phil.extract()
+    params.spotfinder.mp.nproc = self.params.nproc
+    params.spotfinder.write_hot_mask = False
+    datablock = DataBlockFactory.from_imageset(data.imageset)[0]
+    with StageTimer('spot_finding') as timer:
+      finder = SpotFinderFactory.from_parameters(
+        params=params, datablock=datablock)
+      strong = finder(datablock)
+      timer.result['n_reflections'] = len(strong)
+    self.results['spot_finding'] = timer.result
+    if timer.result['status'] != 'ok':
+      return None
+    return strong
+
+  def run_indexing(self, data, strong):
+    from dials.command_line.index import phil_scope as index_phil
+    from dials.algorithms.indexing.indexer import indexer_base
+    from dials.array_family import flex
+    if strong is None:
+      strong = data.observed_reflections()
+      del strong['miller_index']
+      strong['id'] = flex.int(len(strong), -1)
+    params = index_phil.extract()
+    params.indexing.method = 'fft3d'
+    params.indexing.nproc = self.params.nproc
+    params.indexing.known_symmetry.unit_cell = \
+      self.params.simulation.unit_cell
+    params.indexing.known_symmetry.space_group = None
+    params.indexing.multiple_lattice_search.max_lattices = \
+      self.params.scale.n_experiments
+    with StageTimer('indexing') as timer:
+      idxr = indexer_base.from_parameters(
+        strong, [data.imageset], params=params)
+      idxr.index()
+      timer.result['n_experiments'] = len(idxr.refined_experiments)
+      timer.result['n_reflections'] = len(idxr.refined_reflections)
+    self.results['indexing'] = timer.result
+
+  def run_fft3d(self, data):
+    import math
+    from scitbx import fftpack
+    from dials.command_line.index import phil_scope as index_phil
+    from dials.algorithms.indexing.indexer import indexer_base
+    from dials.array_family import flex
+    params = index_phil.extract().indexing
+    reflections = data.observed_reflections()
+    indexer_base.map_centroids_to_reciprocal_space(
+      reflections, data.detector, data.beam, data.goniometer)
+    rlp = reflections['rlp']
+
+    # Choose d_min and b_iso for each grid size as the indexer does, for a
+    # maximum cell a little larger than the simulated one
+    max_cell = params.max_cell_estimation.multiplier * max(
+      self.params.simulation.unit_cell.parameters()[:3])
+    min_d_spacing = flex.min(1 / rlp.norms())
+    for n_points in self.params.fft3d.n_points:
+      d_min = max(5 * max_cell / n_points, min_d_spacing)
+      b_iso = -4 * d_min**2 * math.log(0.05)
+      n_points = fftpack.adjust_gridding_triple(
+        (n_points, n_points, n_points), max_prime=5)[0]
+      for nthreads in self.params.fft3d.nthreads:
+        prefix = 'fft3d_n%d_t%d' % (n_points, nthreads)
+        with StageTimer(prefix) as timer:
+          results = run_in_process(
+            time_fft3d_steps, rlp, n_points, d_min, b_iso,
+            params.rmsd_cutoff, nthreads)
+        if timer.result['status'] != 'ok':
+          self.results[prefix] = timer.result
+          continue
+        for step, result in results.items():
+          result.update({ 'n_points' : n_points, 'nthreads' : nthreads })
+          self.results['%s_%s' % (prefix, step)] = result
+
+  def run_refinement(self, data):
+    from dials.command_line.refine import phil_scope as refine_phil
+    from dials.algorithms.refinement import RefinerFactory
+    from scitbx import matrix
+    import random
+    params = refine_phil.extract()
+    params.refinement.mp.nproc = self.params.nproc
+    experiments = data.make_experiments()
+    reflections = data.observed_reflections()
+
+    # Start from a slightly misset crystal orientation
+    for experiment in experiments:
+      crystal = experiment.crystal
+      R = matrix.col((random.gauss(0, 1), random.gauss(0, 1),
+                      random.gauss(0, 1))).normalize(
+        ).axis_and_angle_as_r3_rotation_matrix(0.1, deg=True)
+      crystal.set_U(R * matrix.sqr(crystal.get_U()))
+    with StageTimer('refinement') as timer:
+      refiner = RefinerFactory.from_parameters_data_experiments(
+        params, reflections, experiments)
+      history = refiner.run()
+      timer.result['n_reflections'] = len(refiner.get_matches())
+      timer.result['n_steps'] = history.get_nrows()
+    self.results['refinement'] = timer.result
+
+  def run_integration(self, data):
+    from dials.command_line.integrate import phil_scope as integrate_phil
+    from dials.algorithms.integration.integrator import IntegratorFactory
+    from dials.array_family import flex
+    integrated = None
+    for method in self.params.integrator:
+      name = 'integration_%s' % method
+      params = integrate_phil.extract()
+      params.integration.integrator = method
+      params.integration.mp.nproc = self.params.nproc
+      experiments = data.make_experiments()
+      reference = data.reflections.copy()
+      with StageTimer(name) as timer:
+        predicted = flex.reflection_table.from_predictions_multi(experiments)
+        predicted.match_with_reference(reference)
+        predicted.compute_bbox(experiments)
+        integrator = IntegratorFactory.create(params, experiments, predicted)
+        integrated = integrator.integrate()
+        timer.result['n_reflections'] = len(integrated)
+        timer.result['n_integrated'] = integrated.get_flags(
+          integrated.flags.integrated).count(True)
+      self.results[name] = timer.result
+      if timer.result['status'] != 'ok':
+        integrated = None
+    return integrated
+
+  def run_export(self, data, integrated):
+    import tempfile
+    import shutil
+    from dials.util.export_mtz import export_mtz
+    if integrated is None:
+      self.results['export'] = { 'status' : 'skipped' }
+      return
+    # Integration does not change the simulated models
+    experiments = data.make_experiments()
+    directory = tempfile.mkdtemp()
+    try:
+      with StageTimer('export') as timer:
+        export_mtz(
+          integrated, experiments, os.path.join(directory, 'benchmark.mtz'))
+      self.results['export'] = timer.result
+    finally:
+      shutil.rmtree(directory)
+
+
+def time_fft3d_steps(rlp, n_points, d_min, b_iso, rmsd_cutoff, nthreads):
+  '''
+  Time the sampling, transform and peak search steps of FFT3D indexing.
+
+  :param rlp: The reciprocal lattice points of the spots
+  :param n_points: The size of the reciprocal space grid
+  :param d_min: The resolution limit of the grid
+  :param b_iso: The isotropic B-factor applied to the grid points
+  :param rmsd_cutoff: The peak search cutoff, in units of the map rmsd
+  :param nthreads: The number of threads for each step
+  :return: A dictionary of the StageTimer results of each step. Since the
+           steps run in one process, the increase in peak memory of each is
+           recorded over the memory in use at the start of the first.
+
+  '''
+  from cctbx import uctbx
+  from dials.array_family import flex
+  from dials.algorithms.indexing import map_centroids_to_reciprocal_space_grid
+  from dials.algorithms.indexing.fft3d import fft3d_real_squared, \
+    flood_fill_peaks
+  rss_start = resident_set_size()[0]
+  results = {}
+  with StageTimer('sampling') as timer:
+    grid = flex.double(flex.grid(n_points, n_points, n_points), 0)
+    selection = flex.bool(len(rlp), True)
+    map_centroids_to_reciprocal_space_grid(
+      grid, rlp, selection, d_min, b_iso=b_iso, nthreads=nthreads)
+    timer.result['n_reflections'] = selection.count(True)
+  results['sampling'] = timer.result
+  if timer.result['status'] == 'ok':
+    with StageTimer('transform') as timer:
+      grid_real = fft3d_real_squared(grid, nthreads=nthreads)
+    results['transform'] = timer.result
+  if timer.result['status'] == 'ok':
+    with StageTimer('peak_search') as timer:
+      fft_cell = uctbx.unit_cell([n_points * d_min / 2] * 3 + [90] * 3)
+      flood_fill = flood_fill_peaks(
+        grid_real, fft_cell, rmsd_cutoff, nthreads=nthreads)
+      timer.result['n_peaks'] = flood_fill.n_voids()
+    results['peak_search'] = timer.result
+  if rss_start is not None:
+    for result in results.values():
+      result['peak_rss_increase_mb'] = result['peak_rss_mb'] - rss_start
+  return results
+
+
+def run_in_process(func, *args):
+  '''
+  Call a function in a new process and return its result, so that the peak
+  resident set size measured in the function is not that of an earlier stage.
+  The process is forked, so the arguments are not copied, but the result is
+  pickled.
+
+  :raises RuntimeError: If the function raises or the process dies
+
+  '''
+  import multiprocessing
+  import Queue
+  queue = multiprocessing.Queue()
+
+  def target():
+    try:
+      queue.put((True, func(*args)))
+    except Exception as e:
+      queue.put((False, '%s: %s' % (type(e).__name__, e)))
+
+  process = multiprocessing.Process(target=target)
+  process.start()
+  try:
+    # Read the result before joining, since a large result blocks the child
+    # until it is read
+    while True:
+      try:
+        ok, result = queue.get(timeout=1)
+        break
+      except Queue.Empty:
+        if process.is_alive():
+          continue
+        try:
+          ok, result = queue.get(timeout=1)
+          break
+        except Queue.Empty:
+          raise RuntimeError(
+            'Process exited with code %s' % process.exitcode)
+  finally:
+    process.join()
+  if not ok:
+    raise RuntimeError(result)
+  return result
+
+
+def sort_stage_names(names):
+  '''
+  Sort result names by the order in which the stages are run.
+
+  '''
+  def stage_order(name):
+    for i, stage in enumerate(['simulation'] + stages):
+      if name.startswith(stage):
+        return (i, name)
+    return (len(stages) + 1, name)
+  return sorted(names, key=stage_order)
+
+
+def compare(reference, result, tolerance=0.1, memory_tolerance=0.1,
+            min_time=0.05, min_memory=10):
+  '''
+  Compare two benchmark records and flag regressions.
+
+  A stage has regressed if its wall time has increased by more than
+  tolerance (as a fraction) and by more than min_time seconds, or if its
+  memory use has increased by more than memory_tolerance and by more than
+  min_memory MB. A stage that succeeded in the reference but not in the result
+  is also a regression.
+
+  The memory use compared is the stage's own increase in peak resident set
+  size (peak_rss_increase_mb). Records without it for a stage are compared
+  by the peak resident set size of the process (peak_rss_mb) instead.
+
+  :param reference: The reference benchmark record
+  :param result: The new benchmark record
+  :param tolerance: The fractional wall time increase allowed
+  :param memory_tolerance: The fractional memory increase allowed
+  :param min_time: The absolute wall time increase to ignore (seconds)
+  :param min_memory: The absolute memory increase to ignore (MB)
+  :return: A list of (stage, reference time, time, ratio, regressions) tuples
+
+  '''
+  rows = []
+  old_results = reference['results']
+  new_results = result['results']
+  names = [name for name in old_results if name in new_results]
+  for name in sort_stage_names(names):
+    old = old_results[name]
+    new = new_results[name]
+    regressions = []
+    if old['status'] == 'ok' and new['status'] != 'ok':
+      regressions.append('status %s' % new['status'])
+    if old['status'] != 'ok' or new['status'] != 'ok':
+      rows.append((name, old.get('wall_time'), new.get('wall_time'), None,
+                   regressions))
+      continue
+    t0 = old['wall_time']
+    t1 = new['wall_time']
+    ratio = t1 / t0 if t0 > 0 else None
+    if t1 - t0 > min_time and t1 > t0 * (1 + tolerance):
+      regressions.append('time')
+    key = 'peak_rss_increase_mb'
+    if key not in old or key not in new:
+      key = 'peak_rss_mb'
+    m0 = old.get(key)
+    m1 = new.get(key)
+    if m0 is not None and m1 is not None and m1 - m0 > min_memory and \
+        m1 > m0 * (1 + memory_tolerance):
+      regressions.append('memory')
+    rows.append((name, t0, t1, ratio, regressions))
+  return rows
@@ -2,7 +2,6 @@
 
 from __future__ import absolute_import, division, print_function
 
-from collections import defaultdict
 from math import floor, ceil, sqrt, sin, cos, pi, log
 import time
 
@@ -65,81 +64,105 @@ def sum_partial_reflections(integrated_data, min_total_partiality=0.5):
   if len(isel) == 0:
     return integrated_data
 
-  delete = flex.size_t()
-  partial_map = defaultdict(list)
-
-  # create map of partial_id to reflections j
-
-  for j in isel:
-    partial_map[integrated_data['partial_id'][j]].append(j)
-
-  # now work through this map - get total partiality for every reflection;
-  # here only consider reflections with > 1 component; if total partiality
-  # less than min_total_partiality discard all parts.
-
-  partial_ids = []
-
-  for p_id in partial_map:
-    if len(partial_map[p_id]) > 1:
-      partial_ids.append(p_id)
+  # sort the partial reflections by partial_id, keeping reflections with the
+  # same partial_id in their original order, and find the groups of parts
+  # with more than one component
+
+  partial_id = integrated_data['partial_id'].select(isel)
+  perm = flex.sort_permutation(partial_id, stable=True)
+  rows = isel.select(perm)
+  partial_id = partial_id.select(perm)
+
+  first = flex.bool(len(rows), True)
+  if len(rows) > 1:
+    first.set_selected(flex.size_t_range(1, len(rows)),
+                       partial_id[1:] != partial_id[:-1])
+  starts = first.iselection()
+  ends = starts[1:]
+  ends.append(len(rows))
+  sizes = ends - starts
+  multipart = sizes > 1
+  starts = starts.select(multipart)
+  sizes = sizes.select(multipart)
+
+  if len(starts) == 0:
+    return integrated_data
 
   # work through multipart partials; compute those weighted values I need
-  # if total partiality less than min, delete. if summing, delete extra parts
+  # if total partiality less than min, delete. if summing, delete extra parts.
+  # the k'th part of every group is accumulated at once, so the sums are made
+  # in the same order as summing each group in turn.
 
   we_got_profiles = 'intensity.prf.value' in integrated_data
   logger.info('Profile fitted reflections: %s' % we_got_profiles)
 
-  for p_id in partial_ids:
-    p_tot = sum([integrated_data['partiality'][j] for j in partial_map[p_id]])
-    if p_tot < min_total_partiality:
-      for j in partial_map[p_id]:
-        delete.append(j)
-      continue
+  def parts(k):
+    groups = (sizes > k).iselection()
+    return groups, rows.select(starts.select(groups) + k)
+
+  partiality = integrated_data['partiality']
+  sum_value = integrated_data['intensity.sum.value']
+  sum_variance = integrated_data['intensity.sum.variance']
+  if we_got_profiles:
+    prf_value = integrated_data['intensity.prf.value']
+    prf_variance = integrated_data['intensity.prf.variance']
+
+  j0 = rows.select(starts)
+
+  # FIXME revisiting this calculation am not sure it is correct - why
+  # weighting by (I/sig(I))^2 not just 1/variance?
+  if we_got_profiles:
+    _prf_value = prf_value.select(j0)
+    _prf_variance = prf_variance.select(j0)
+    weight = _prf_value * _prf_value / _prf_variance
+    total_prf_value = _prf_value * weight
+    total_prf_variance = _prf_variance * weight
+    total_weight = weight
+  total_sum_value = sum_value.select(j0)
+  total_sum_variance = sum_variance.select(j0)
+  p_tot = partiality.select(j0)
+
+  # weight profile fitted intensity and variance computed from weights
+  # proportional to (I/sig(I))^2; schedule for deletion spare parts
+
+  delete = flex.bool(len(integrated_data), False)
+  for k in range(1, flex.max(sizes)):
+    groups, j = parts(k)
+    delete.set_selected(j, True)
+
+    p_tot.set_selected(groups, p_tot.select(groups) + partiality.select(j))
+    total_sum_value.set_selected(groups,
+      total_sum_value.select(groups) + sum_value.select(j))
+    total_sum_variance.set_selected(groups,
+      total_sum_variance.select(groups) + sum_variance.select(j))
 
-    j0 = partial_map[p_id][0]
-    jrest = partial_map[p_id][1:]
-
-    # FIXME revisiting this calculation am not sure it is correct - why
-    # weighting by (I/sig(I))^2 not just 1/variance?
-    if we_got_profiles:
-      prf_value = integrated_data['intensity.prf.value'][j0]
-      prf_variance = integrated_data['intensity.prf.variance'][j0]
-      weight = prf_value * prf_value / prf_variance
-      prf_value *= weight
-      prf_variance *= weight
-      total_weight = weight
-    sum_value = integrated_data['intensity.sum.value'][j0]
-    sum_variance = integrated_data['intensity.sum.variance'][j0]
-    partiality = integrated_data['partiality'][j0]
-
-    # weight profile fitted intensity and variance computed from weights
-    # proportional to (I/sig(I))^2; schedule for deletion spare parts
-
-    for j in jrest:
-      delete.append(j)
-
-      sum_value += integrated_data['intensity.sum.value'][j]
-      sum_variance += integrated_data['intensity.sum.variance'][j]
-      partiality += integrated_data['partiality'][j]
-
-      if we_got_profiles:
-        _prf_value = integrated_data['intensity.prf.value'][j]
-        _prf_variance = integrated_data['intensity.prf.variance'][j]
-
-        _weight = _prf_value * _prf_value / _prf_variance
-        prf_value += _weight * _prf_value
-        prf_variance += _weight * _prf_variance
-        total_weight += _weight
-
-    # now write these back into original reflection
     if we_got_profiles:
-      prf_value /= total_weight
-      prf_variance /= total_weight
-      integrated_data['intensity.prf.value'][j0] = prf_value
-      integrated_data['intensity.prf.variance'][j0] = prf_variance
-    integrated_data['intensity.sum.value'][j0] = sum_value
-    integrated_data['intensity.sum.variance'][j0] = sum_variance
-    integrated_data['partiality'][j0] = partiality
+      _prf_value = prf_value.select(j)
+      _prf_variance = prf_variance.select(j)
+      _weight = _prf_value * _prf_value / _prf_variance
+      total_prf_value.set_selected(groups,
+        total_prf_value.select(groups) + _weight * _prf_value)
+      total_prf_variance.set_selected(groups,
+        total_prf_variance.select(groups) + _weight * _prf_variance)
+      total_weight.set_selected(groups, total_weight.select(groups) + _weight)
+
+  # if total partiality less than min_total_partiality discard all parts
+  # (the extra parts are already scheduled for deletion), otherwise write the
+  # summed values back into the first part
+
+  discard = p_tot < min_total_partiality
+  delete.set_selected(j0.select(discard), True)
+
+  keep = (~discard).iselection()
+  j0 = j0.select(keep)
+  if we_got_profiles:
+    total_weight = total_weight.select(keep)
+    prf_value.set_selected(j0, total_prf_value.select(keep) / total_weight)
+    prf_variance.set_selected(j0,
+      total_prf_variance.select(keep) / total_weight)
+  sum_value.set_selected(j0, total_sum_value.select(keep))
+  sum_variance.set_selected(j0, total_sum_variance.select(keep))
+  partiality.set_selected(j0, p_tot.select(keep))
 
   integrated_data.del_selected(delete)
 
@@ -158,21 +181,21 @@ def scale_partial_reflections(integrated_data, min_partiality=0.5):
   if not 'partiality' in integrated_data:
     return integrated_data
 
-  isel = (integrated_data['partiality'] < 1.0).iselection()
+  partiality = integrated_data['partiality']
+  isel = (partiality < 1.0).iselection()
 
   if len(isel) == 0:
     return integrated_data
 
-  delete = flex.size_t()
+  delete = partiality.select(isel) < min_partiality
+  scale = isel.select(~delete)
+  delete = isel.select(delete)
 
-  for j in isel:
-    if integrated_data['partiality'][j] < min_partiality:
-      delete.append(j)
-      continue
-    inv_p = 1.0 / integrated_data['partiality'][j]
-    integrated_data['intensity.sum.value'][j] *= inv_p
-    integrated_data['intensity.sum.variance'][j] *= inv_p
-    integrated_data['partiality'][j] *= 1.0
+  inv_p = 1.0 / partiality.select(scale)
+  sum_value = integrated_data['intensity.sum.value']
+  sum_variance = integrated_data['intensity.sum.variance']
+  sum_value.set_selected(scale, sum_value.select(scale) * inv_p)
+  sum_variance.set_selected(scale, sum_variance.select(scale) * inv_p)
 
   integrated_data.del_selected(delete)
 
@@ -203,6 +226,14 @@ def dials_u_to_mosflm(dials_U, uc):
   return mosflm_U
 
 
+def _flag_for_removal(remove, selection):
+  """Add a selection to the reflections flagged for removal, returning the
+  number of reflections that were not already flagged"""
+  selection = selection & ~remove
+  remove.set_selected(selection, True)
+  return selection.count(True)
+
+
 def _apply_data_filters(integrated_data,
                         ignore_profile_fitting, filter_ice_rings, min_isigi,
                         include_partials, keep_partials, scale_partials):
@@ -236,41 +267,46 @@ def _apply_data_filters(integrated_data,
       raise Sorry("No profile fitted reflections, "
                   "please try ignore_profile_fitting=True")
 
+  # flag the reflections to remove and delete them all at once, counting only
+  # those not already flagged by an earlier filter
+
+  remove = flex.bool(len(integrated_data), False)
+
   selection = integrated_data['intensity.sum.variance'] <= 0
-  if selection.count(True) > 0:
-    integrated_data.del_selected(selection)
-    logger.info('Removing %d reflections with negative variance' % \
-          selection.count(True))
+  count = _flag_for_removal(remove, selection)
+  if count > 0:
+    logger.info('Removing %d reflections with negative variance' % count)
 
   if 'intensity.prf.variance' in integrated_data:
     selection = integrated_data['intensity.prf.variance'] <= 0
-    if selection.count(True) > 0:
-      integrated_data.del_selected(selection)
+    count = _flag_for_removal(remove, selection)
+    if count > 0:
       logger.info('Removing %d profile reflections with negative variance' % \
-            selection.count(True))
+            count)
 
   if filter_ice_rings:
     selection = integrated_data.get_flags(integrated_data.flags.in_powder_ring)
-    integrated_data.del_selected(selection)
-    logger.info("Removing %d reflections in ice ring resolutions" %
-                selection.count(True))
+    count = _flag_for_removal(remove, selection)
+    logger.info("Removing %d reflections in ice ring resolutions" % count)
 
   if min_isigi is not None:
 
     selection = (
       integrated_data['intensity.sum.value']/
       flex.sqrt(integrated_data['intensity.sum.variance'])) < min_isigi
-    integrated_data.del_selected(selection)
+    count = _flag_for_removal(remove, selection)
     logger.info('Removing %d reflections with I/Sig(I) < %s' %(
-      selection.count(True), min_isigi))
+      count, min_isigi))
 
     if 'intensity.prf.variance' in integrated_data:
       selection = (
         integrated_data['intensity.prf.value'] /
         flex.sqrt(integrated_data['intensity.prf.variance'])) < min_isigi
-      integrated_data.del_selected(selection)
+      count = _flag_for_removal(remove, selection)
       logger.info('Removing %d profile reflections with I/Sig(I) < %s' %(
-        selection.count(True), min_isigi))
+        count, min_isigi))
+
+  integrated_data.del_selected(remove)
 
   # FIXME in here work on including partial reflections => at this stage best
   # to split off the partial refections into a different selection & handle
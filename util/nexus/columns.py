@@ -0,0 +1,227 @@
+'''
+Bulk conversion of reflection table columns to and from HDF5 datasets.
+
+Each column is converted to a contiguous numpy array (with one row per
+reflection and one column per component for vector types) and written as a
+single dataset, optionally chunked and compressed. Shoeboxes are written as
+one concatenated array for each of the data, mask and background pixels plus
+an array of offsets giving the range of pixels for each reflection.
+
+'''
+
+from __future__ import absolute_import, division
+
+# The number of components of the flex types stored as 2D arrays
+COMPONENTS = {
+  'vec2_double'  : 2,
+  'vec3_double'  : 3,
+  'mat3_double'  : 9,
+  'int6'         : 6,
+  'miller_index' : 3,
+}
+
+# The flex types stored as 1D arrays
+SCALAR_TYPES = ('bool', 'int', 'size_t', 'double', 'float')
+
+
+def flex_type_name(data):
+  '''
+  Get the name of the flex type of a column
+
+  :param data: The column
+  :return: The name of the flex type
+
+  '''
+  return type(data).__name__
+
+
+def column_to_numpy(data):
+  '''
+  Convert a column to a contiguous numpy array
+
+  :param data: The column
+  :return: The numpy array
+
+  '''
+  import numpy as np
+  name = flex_type_name(data)
+  if name in SCALAR_TYPES:
+    return data.as_numpy_array()
+  elif name in ('vec2_double', 'vec3_double', 'mat3_double'):
+    return data.as_double().as_numpy_array().reshape(len(data), COMPONENTS[name])
+  elif name == 'int6':
+    return data.as_int().as_numpy_array().reshape(len(data), 6)
+  elif name == 'miller_index':
+    array = data.as_vec3_double().as_double().as_numpy_array()
+    return array.astype(np.int32).reshape(len(data), 3)
+  elif name == 'std_string':
+    return np.array(list(data), dtype=object)
+  raise TypeError('Unable to convert column of type %s' % name)
+
+
+def numpy_to_column(name, array):
+  '''
+  Convert a numpy array to a column
+
+  :param name: The name of the flex type
+  :param array: The numpy array
+  :return: The column
+
+  '''
+  import numpy as np
+  from dials.array_family import flex
+  if name == 'bool':
+    return flex.bool(np.ascontiguousarray(array, dtype=np.bool_))
+  elif name == 'int':
+    return flex.int(np.ascontiguousarray(array, dtype=np.int32))
+  elif name == 'size_t':
+    return flex.size_t(np.ascontiguousarray(array, dtype=np.uint64))
+  elif name == 'double':
+    return flex.double(np.ascontiguousarray(array, dtype=np.float64))
+  elif name == 'float':
+    return flex.float(np.ascontiguousarray(array, dtype=np.float32))
+  elif name in ('vec2_double', 'vec3_double', 'mat3_double'):
+    data = flex.double(np.ascontiguousarray(array, dtype=np.float64).ravel())
+    return getattr(flex, name)(data)
+  elif name == 'int6':
+    data = flex.int(np.ascontiguousarray(array, dtype=np.int32).ravel())
+    return flex.int6(data)
+  elif name == 'miller_index':
+    array = np.ascontiguousarray(array, dtype=np.int32).reshape(-1, 3)
+    return flex.miller_index(
+      flex.int(np.ascontiguousarray(array[:,0])),
+      flex.int(np.ascontiguousarray(array[:,1])),
+      flex.int(np.ascontiguousarray(array[:,2])))
+  elif name == 'std_string':
+    return flex.std_string([str(s) for s in array])
+  raise TypeError('Unable to convert column of type %s' % name)
+
+
+def create_dataset(group, name, array, chunks=None, compression=None):
+  '''
+  Create a dataset from a numpy array
+
+  :param group: The HDF5 group
+  :param name: The dataset name
+  :param array: The numpy array
+  :param chunks: The number of rows per chunk (None for contiguous storage)
+  :param compression: The compression filter (e.g. gzip or lzf)
+  :return: The dataset
+
+  '''
+  import h5py
+  kwargs = {}
+  if len(array) > 0:
+    if chunks is not None:
+      kwargs['chunks'] = (max(1, min(chunks, len(array))),) + array.shape[1:]
+    if compression is not None:
+      kwargs['compression'] = compression
+  if array.dtype == object:
+    kwargs['dtype'] = h5py.special_dtype(vlen=str)
+  return group.create_dataset(name, data=array, **kwargs)
+
+
+def write_column(group, name, data, chunks=None, compression=None):
+  '''
+  Write a column as a single dataset
+
+  :param group: The HDF5 group
+  :param name: The dataset name
+  :param data: The column
+  :param chunks: The number of rows per chunk (None for contiguous storage)
+  :param compression: The compression filter (e.g. gzip or lzf)
+  :return: The dataset
+
+  '''
+  dataset = create_dataset(group, name, column_to_numpy(data),
+    chunks=chunks, compression=compression)
+  dataset.attrs['flex_type'] = flex_type_name(data)
+  return dataset
+
+
+def read_column(dataset):
+  '''
+  Read a column from a dataset written by write_column
+
+  :param dataset: The dataset
+  :return: The column
+
+  '''
+  return numpy_to_column(str(dataset.attrs['flex_type']), dataset[()])
+
+
+def write_shoeboxes(group, name, data, chunks=None, compression=None):
+  '''
+  Write a column of shoeboxes as concatenated pixel arrays with an index of
+  offsets
+
+  :param group: The HDF5 group
+  :param name: The name of the group to create
+  :param data: The shoebox column
+  :param chunks: The number of rows per chunk (None for contiguous storage)
+  :param compression: The compression filter (e.g. gzip or lzf)
+  :return: The shoebox group
+
+  '''
+  flat, offsets, pixels, mask, background = data.concatenate_pixels()
+  shoebox = group.create_group(name)
+  shoebox.attrs['flex_type'] = flex_type_name(data)
+  write_column(shoebox, 'panel', data.panels(), chunks, compression)
+  write_column(shoebox, 'bbox', data.bounding_boxes(), chunks, compression)
+  write_column(shoebox, 'flat', flat, chunks, compression)
+  write_column(shoebox, 'offsets', offsets, chunks, compression)
+  write_column(shoebox, 'data', pixels, chunks, compression)
+  write_column(shoebox, 'mask', mask, chunks, compression)
+  write_column(shoebox, 'background', background, chunks, compression)
+  return shoebox
+
+
+def read_shoeboxes(group):
+  '''
+  Read a column of shoeboxes written by write_shoeboxes
+
+  :param group: The shoebox group
+  :return: The shoebox column
+
+  '''
+  from dials.array_family import flex
+  shoebox = flex.shoebox(
+    read_column(group['panel']),
+    read_column(group['bbox']))
+  shoebox.set_pixels(
+    flat=read_column(group['flat']),
+    offsets=read_column(group['offsets']),
+    data=read_column(group['data']),
+    mask=read_column(group['mask']),
+    background=read_column(group['background']))
+  return shoebox
+
+
+def is_shoebox_group(item):
+  '''
+  Check if an item was written by write_shoeboxes
+
+  :param item: The HDF5 group or dataset
+  :return: True/False
+
+  '''
+  import h5py
+  return isinstance(item, h5py.Group) and 'offsets' in item
+
+
+def write_table(group, reflections, chunks=None, compression=None):
+  '''
+  Write all the columns of a reflection table
+
+  :param group: The HDF5 group
+  :param reflections: The reflection table
+  :param chunks: The number of rows per chunk (None for contiguous storage)
+  :param compression: The compression filter (e.g. gzip or lzf)
+
+  '''
+  from dials.array_family import flex
+  for key, data in reflections.cols():
+    if isinstance(data, flex.shoebox):
+      write_shoeboxes(group, key, data, chunks, compression)
+    else:
+      write_column(group, key, data, chunks, compression)
@@ -4,11 +4,11 @@
 schema_url = 'https://github.com/nexusformat/definitions/blob/master/contributed_definitions/NXreflections.nxdl.xml'
 
 def make_dataset(handle, name, dtype, data, description, units=None):
-  dset = handle.create_dataset(
+  from dials.util.nexus.columns import create_dataset
+  dset = create_dataset(
+    handle,
     name,
-    data.focus(),
-    dtype=dtype,
-    data=data.as_numpy_array().astype(dtype))
+    data.as_numpy_array().astype(dtype))
   dset.attrs['description'] = description
   if units is not None:
     dset.attrs['units'] = units
@@ -41,11 +41,11 @@ def make_vlen_uint(handle, name, data, description, units=None):
 
 def write(handle, key, data):
   from dials.array_family import flex
+  from dials.util.nexus import columns
+  import numpy as np
   if   key == 'miller_index':
-    col1, col2, col3 = zip(*list(data))
-    col1 = flex.int(col1)
-    col2 = flex.int(col2)
-    col3 = flex.int(col3)
+    col1, col2, col3 = [flex.int(np.ascontiguousarray(c))
+                        for c in columns.column_to_numpy(data).T]
     dsc1 = 'The h component of the miller index'
     dsc2 = 'The k component of the miller index'
     dsc3 = 'The l component of the miller index'
@@ -180,6 +180,9 @@ def write(handle, key, data):
     col = data
     dsc = 'Profile rmsd'
     make_float(handle, 'prf_rmsd', col, dsc)
+  elif key == 'shoebox':
+    group = columns.write_shoeboxes(handle, 'shoebox', data)
+    group.attrs['description'] = 'The reflection shoeboxes'
   else:
     raise KeyError('Column %s not written to file' % key)
 
@@ -263,6 +266,9 @@ def read(handle, key):
     return flex.int(handle['num_valid'][:].astype(np.int32))
   elif key == 'profile.rmsd':
     return flex.double(handle['prf_rmsd'][:])
+  elif key == 'shoebox':
+    from dials.util.nexus.columns import read_shoeboxes
+    return read_shoeboxes(handle['shoebox'])
   else:
     raise KeyError('Column %s not read from file' % key)
 
@@ -367,6 +373,7 @@ def load(entry):
     'num_pixels.background_used',
     'num_pixels.valid',
     'profile.rmsd',
+    'shoebox',
   ]
 
   # The reflection table
@@ -31,6 +31,11 @@ def decode(self, handle):
 class ReflectionListEncoder(H5PYEncoder):
   '''Encoder for the reflection data.'''
 
+  def __init__(self, chunks=None, compression=None):
+    '''Set the number of rows per chunk and the compression filter.'''
+    self.chunks = chunks
+    self.compression = compression
+
   def encode(self, reflections, handle):
     '''Encode the reflection data.'''
 
@@ -45,23 +50,18 @@ def encode(self, reflections, handle):
   def encode_column(self, group, key, data):
     ''' Encode a column of data. '''
     from dials.array_family import flex
+    from dials.util.nexus import columns
     if isinstance(data, flex.shoebox):
       self.encode_shoebox(group, key, data)
     else:
-      group[key] = list(data)
-      group[key].attrs['flex_type'] = type(data).__name__
+      columns.write_column(group, key, data,
+        chunks=self.chunks, compression=self.compression)
 
   def encode_shoebox(self, group, key, sb_data):
     ''' Encode a column of shoeboxes. '''
-    shoebox = group.create_group('shoebox')
-    shoebox.attrs['flex_type'] = type(sb_data).__name__
-    data = shoebox.create_group('data')
-    mask = shoebox.create_group('mask')
-    background = shoebox.create_group('background')
-    for i, sb in enumerate(sb_data):
-      data['%d' % i] = sb.data.as_numpy_array()
-      mask['%d' % i] = sb.mask.as_numpy_array()
-      background['%d' % i] = sb.background.as_numpy_array()
+    from dials.util.nexus import columns
+    columns.write_shoeboxes(group, key, sb_data,
+      chunks=self.chunks, compression=self.compression)
 
 
 class ReflectionListDecoder(H5PYDecoder):
@@ -70,6 +70,7 @@ class ReflectionListDecoder(H5PYDecoder):
   def decode(self, handle):
     '''Decode the reflection data.'''
     from dials.array_family import flex
+    from dials.util.nexus import columns
 
     # Get the group containing the reflection data
     g = handle['entry/data_processing']
@@ -82,46 +83,29 @@ def decode(self, handle):
       item = g[key]
       name = item.attrs['flex_type']
       if name == 'shoebox':
-        flex_type = getattr(flex, name)
-        data = item['data']
-        mask = item['mask']
-        background = item['background']
-        col = flex_type(len(rl))
-        for i in range(len(rl)):
-          dd = data['%d' % i].value
-          col[i].data = flex.double(data['%d' % i].value)
-          col[i].mask = flex.int(mask['%d' % i].value)
-          col[i].background = flex.double(background['%d' % i].value)
-
+        if columns.is_shoebox_group(item):
+          col = columns.read_shoeboxes(item)
+        else:
+          col = self.decode_legacy_shoebox(item, len(rl))
       else:
-        flex_type = getattr(flex, name)
-        col = self.decode_column(flex_type, item)
+        col = columns.read_column(item)
       rl[str(key)] = col
 
     # Return the list of reflections
     return rl
 
-  def decode_column(self, flex_type, data):
-    ''' Decode a column for various flex types. '''
+  def decode_legacy_shoebox(self, item, num_reflections):
+    ''' Decode shoeboxes written with one dataset per reflection. '''
     from dials.array_family import flex
-    if flex_type == flex.int:
-      return flex_type(int(d) for d in list(data))
-    elif flex_type == flex.double:
-      return flex_type(float(d) for d in list(data))
-    elif flex_type == flex.vec3_double:
-      return flex_type(map(float, d) for d in list(data))
-    elif flex_type == flex.vec2_double:
-      return flex_type(map(float, d) for d in list(data))
-    elif flex_type == flex.int6:
-      return flex_type(map(int, d) for d in list(data))
-    elif flex_type == flex.miller_index:
-      return flex_type(map(int, d) for d in list(data))
-    elif flex_type == flex.bool:
-      return flex_type(bool(d) for d in list(data))
-    elif flex_type == flex.size_t:
-      return flex_type(int(d) for d in list(data))
-    else:
-      return flex_type(list(data))
+    data = item['data']
+    mask = item['mask']
+    background = item['background']
+    col = flex.shoebox(num_reflections)
+    for i in range(num_reflections):
+      col[i].data = flex.double(data['%d' % i].value)
+      col[i].mask = flex.int(mask['%d' % i].value)
+      col[i].background = flex.double(background['%d' % i].value)
+    return col
 
 class NexusFile(object):
   '''Interface to Nexus file.'''
@@ -144,9 +128,10 @@ def get_data(self, decoder):
     '''Get the model data using the supplied decoder.'''
     return decoder.decode(self._handle)
 
-  def set_reflections(self, reflections):
+  def set_reflections(self, reflections, chunks=None, compression=None):
     '''Set the reflection data.'''
-    self.set_data(reflections, ReflectionListEncoder())
+    self.set_data(reflections, ReflectionListEncoder(
+      chunks=chunks, compression=compression))
 
   def get_reflections(self):
     '''Get the reflection data.'''
@@ -347,7 +347,7 @@ def try_read_experiments(self, args, check_format, verbose):
     return unhandled
 
   def try_read_reflections(self, args, verbose):
-    ''' Try to import reflections.
+    ''' Try to import reflections from pickle or columnar binary files.
 
     :param args: The input arguments
     :param verbose: Print verbose output
@@ -0,0 +1,132 @@
+#
+# prefetch.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+from __future__ import absolute_import, division
+
+
+class Prefetcher(object):
+  '''
+  A class to read items ahead of processing in background threads.
+
+  The read function is called for each index by a number of reader threads.
+  At most depth items are held ahead of the item being processed. The items
+  are returned in order by iterating over the prefetcher. If the number of
+  threads is zero then each item is read when it is requested.
+
+  The time spent in the read function (summed over threads) and the time the
+  consumer spent waiting for items are recorded in read_time and wait_time.
+
+  '''
+
+  def __init__(self, read, indices, nthreads=0, depth=4):
+    '''
+    Initialise the prefetcher
+
+    :param read: The function to read an item given an index
+    :param indices: The indices to read
+    :param nthreads: The number of reader threads
+    :param depth: The maximum number of items to read ahead
+
+    '''
+    import threading
+    assert nthreads >= 0, "Number of threads must be >= 0"
+    assert depth > 0, "Prefetch depth must be > 0"
+    self.read = read
+    self.indices = list(indices)
+    self.nthreads = nthreads
+    self.depth = depth
+    self.read_time = 0.0
+    self.wait_time = 0.0
+    self._next_read = 0
+    self._next = 0
+    self._items = {}
+    self._stop = False
+    self._condition = threading.Condition()
+    self._threads = []
+
+  def __iter__(self):
+    '''
+    Iterate through the items in order
+
+    '''
+    from time import time
+    if self.nthreads == 0:
+      for index in self.indices:
+        st = time()
+        item = self.read(index)
+        self.read_time += time() - st
+        self.wait_time += time() - st
+        self._next += 1
+        yield item
+      return
+    self._start()
+    try:
+      while self._next < len(self.indices):
+        st = time()
+        with self._condition:
+          while self._next not in self._items:
+            self._condition.wait()
+          item, error = self._items.pop(self._next)
+          self._next += 1
+          self._condition.notify_all()
+        self.wait_time += time() - st
+        if error is not None:
+          raise error
+        yield item
+    finally:
+      self._join()
+
+  def _start(self):
+    '''
+    Start the reader threads
+
+    '''
+    import threading
+    for i in range(self.nthreads):
+      thread = threading.Thread(target=self._read_loop)
+      thread.daemon = True
+      thread.start()
+      self._threads.append(thread)
+
+  def _join(self):
+    '''
+    Stop and join the reader threads
+
+    '''
+    with self._condition:
+      self._stop = True
+      self._condition.notify_all()
+    for thread in self._threads:
+      thread.join()
+    self._threads = []
+
+  def _read_loop(self):
+    '''
+    The function run by each reader thread
+
+    '''
+    from time import time
+    while True:
+      with self._condition:
+        while (not self._stop and
+               self._next_read < len(self.indices) and
+               self._next_read >= self._next + self.depth):
+          self._condition.wait()
+        if self._stop or self._next_read >= len(self.indices):
+          return
+        position = self._next_read
+        self._next_read += 1
+      st = time()
+      try:
+        item, error = self.read(self.indices[position]), None
+      except Exception as e:
+        item, error = None, e
+      with self._condition:
+        self.read_time += time() - st
+        self._items[position] = (item, error)
+        self._condition.notify_all()
@@ -279,3 +279,146 @@ def decode_endofseries(self, frames):
 
     '''
     return EndOfSeries()
+
+
+def write_header(directory, header):
+  '''
+  Write the header metadata to the directory
+
+  :param directory: The output directory
+  :param header: The header object
+  :return: The metadata filename
+
+  '''
+  from os.path import join
+  import json
+  filename = join(directory, "metadata.json")
+  with open(filename, "w") as outfile:
+    json.dump(header.header, outfile)
+  return filename
+
+
+def write_image(directory, image_template, image):
+  '''
+  Write the image data and info to the directory
+
+  :param directory: The output directory
+  :param image_template: The image template
+  :param image: The image object
+  :return: The image filename
+
+  '''
+  from os.path import join
+  import json
+  filename = join(directory, image_template % image.count)
+  with open("%s.info" % filename, "w") as outfile:
+    json.dump(image.info, outfile)
+  with open(filename, "wb") as outfile:
+    outfile.write(image.data)
+  return filename
+
+
+class StreamImageSource(object):
+  '''
+  A class to receive the images from a stream, writing them to the output
+  directory, and give the index of each image as it arrives.
+
+  '''
+
+  def __init__(self, stream, decoder):
+    '''
+    Initialise the source
+
+    :param stream: The stream to receive from
+    :param decoder: The decoder of the stream messages
+
+    '''
+    self.stream = stream
+    self.decoder = decoder
+    self.header = None
+    self.filename = None
+
+  def receive_header(self):
+    '''
+    Wait for the header of the series
+
+    :return: The header
+
+    '''
+    while self.header is None:
+      obj = self.decoder.decode(self.stream.receive())
+      if obj.is_header():
+        self.filename = write_header(self.decoder.directory, obj)
+        self.header = obj
+      else:
+        logger.warn("Ignoring message received before the header")
+    return self.header
+
+  def imageset(self):
+    '''
+    Get the imageset of the series
+
+    '''
+    return self.receive_header().as_imageset(self.filename)
+
+  def __iter__(self):
+    '''
+    Iterate through the image indices as the images arrive, until the end of
+    the series
+
+    '''
+    self.receive_header()
+    while True:
+      obj = self.decoder.decode(self.stream.receive())
+      if obj.is_image():
+        write_image(self.decoder.directory, self.decoder.image_template, obj)
+        yield obj.count
+      elif obj.is_endofseries():
+        break
+      else:
+        raise RuntimeError("Unexpected header in series")
+
+
+class DirectoryWatcher(object):
+  '''
+  A class to give the index of each image in an imageset once its file has
+  been written. A file is taken to be complete when its size has not changed
+  for one polling interval.
+
+  '''
+
+  def __init__(self, imageset, poll_interval=0.5, timeout=60):
+    '''
+    Initialise the watcher
+
+    :param imageset: The imageset
+    :param poll_interval: The time between checks of the files (seconds)
+    :param timeout: The time to wait for each image (seconds)
+
+    '''
+    self.imageset = imageset
+    self.poll_interval = poll_interval
+    self.timeout = timeout
+
+  def __iter__(self):
+    '''
+    Iterate through the image indices as the files are written. Stop if an
+    image does not appear before the timeout.
+
+    '''
+    import os
+    import time
+    for index in range(len(self.imageset)):
+      path = self.imageset.get_path(index)
+      start = time.time()
+      last_size = None
+      while True:
+        size = os.path.getsize(path) if os.path.exists(path) else None
+        if size and size == last_size:
+          break
+        if time.time() - start > self.timeout:
+          logger.warn("Timed out waiting for %s" % path)
+          return
+        last_size = size
+        time.sleep(self.poll_interval)
+      yield index
@@ -0,0 +1,384 @@
+#!/usr/bin/env python
+#
+# dials.util.trace.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+
+'''
+Structured timing and memory instrumentation of the processing stages.
+
+Spans of time and counters are recorded with the stage they belong to and
+any other keys (such as the job index and image range) as arguments. The
+recording is off by default and each call is then a no-op. When turned on
+with the trace.output parameter, the events are written at exit, either in
+the Chrome trace event format (which can be loaded in chrome://tracing) or as
+plain JSON. Optionally, the resident set size of each process is sampled at
+a fixed interval by a background thread.
+
+Work done in other processes is recorded there and passed back with the
+results; see child_process and extend.
+
+'''
+
+from __future__ import absolute_import, division
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+from libtbx.phil import parse
+
+phil_scope = parse('''
+  trace {
+    output = None
+      .type = path
+      .help = "Write timing spans and counters for each stage to this file"
+    format = *chrome json
+      .type = choice
+      .help = "The format of the output file. The chrome format can be"
+              "viewed in chrome://tracing."
+    memory_sampling_interval = None
+      .type = float(value_min=0)
+      .help = "If set, sample the resident set size of each process at this"
+              "interval (seconds)"
+  }
+''')
+
+
+def resident_set_size():
+  '''
+  Get the current and peak resident set size of this process, in MB.
+
+  '''
+  import resource
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+  current = None
+  try:
+    with open('/proc/self/statm') as infile:
+      current = int(infile.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+      current /= 1024 * 1024
+  except (IOError, OSError, ValueError):
+    pass
+  return current, peak
+
+
+class Span(object):
+  '''
+  A context manager recording a span of time. The arguments dictionary is
+  returned on entry so that results can be added to it.
+
+  '''
+
+  def __init__(self, tracer, name, stage, args):
+    self.tracer = tracer
+    self.name = name
+    self.stage = stage
+    self.args = args
+
+  def __enter__(self):
+    self.start = time.time()
+    return self.args
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if exc_type is not None:
+      self.args['error'] = exc_type.__name__
+    self.tracer.complete(
+      self.name, self.stage, self.start, time.time(), **self.args)
+    return False
+
+
+class NullSpan(object):
+  '''
+  A span which records nothing.
+
+  '''
+
+  def __enter__(self):
+    return {}
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    return False
+
+
+class MemorySampler(threading.Thread):
+  '''
+  A thread to sample the resident set size of the process.
+
+  '''
+
+  def __init__(self, tracer, interval):
+    super(MemorySampler, self).__init__()
+    self.daemon = True
+    self.tracer = tracer
+    self.interval = interval
+    self.stopped = threading.Event()
+
+  def run(self):
+    while True:
+      current, peak = resident_set_size()
+      if current is not None:
+        self.tracer.counter('rss_mb', 'memory', rss_mb=current)
+      if self.stopped.wait(self.interval):
+        break
+
+  def stop(self):
+    self.stopped.set()
+    self.join()
+
+
+class Tracer(object):
+  '''
+  A class to record the trace events of a process.
+
+  '''
+
+  def __init__(self):
+    self.enabled = False
+    self.memory_sampling_interval = None
+    self.events = []
+    self.lock = threading.Lock()
+    self.sampler = None
+    self.owner = None
+
+  def enable(self, memory_sampling_interval=None):
+    '''
+    Start recording events.
+
+    :param memory_sampling_interval: The interval to sample memory usage
+
+    '''
+    self.enabled = True
+    self.memory_sampling_interval = memory_sampling_interval
+    if memory_sampling_interval and self.sampler is None:
+      self.sampler = MemorySampler(self, memory_sampling_interval)
+      self.sampler.start()
+
+  def disable(self):
+    '''
+    Stop recording events.
+
+    '''
+    if self.sampler is not None:
+      self.sampler.stop()
+      self.sampler = None
+    self.enabled = False
+
+  def add(self, event):
+    with self.lock:
+      self.events.append(event)
+
+  def span(self, name, stage, **args):
+    if not self.enabled:
+      return NullSpan()
+    return Span(self, name, stage, args)
+
+  def complete(self, name, stage, start, end, **args):
+    if not self.enabled:
+      return
+    self.add({
+      'name' : name,
+      'cat'  : stage,
+      'ph'   : 'X',
+      'ts'   : start * 1e6,
+      'dur'  : (end - start) * 1e6,
+      'pid'  : os.getpid(),
+      'tid'  : threading.current_thread().ident,
+      'args' : args })
+
+  def counter(self, name, stage, **values):
+    if not self.enabled:
+      return
+    self.add({
+      'name' : name,
+      'cat'  : stage,
+      'ph'   : 'C',
+      'ts'   : time.time() * 1e6,
+      'pid'  : os.getpid(),
+      'args' : values })
+
+  def collect(self):
+    '''
+    Remove and return the recorded events.
+
+    '''
+    with self.lock:
+      events, self.events = self.events, []
+    return events
+
+  def extend(self, events):
+    '''
+    Add events recorded elsewhere.
+
+    '''
+    if events:
+      with self.lock:
+        self.events.extend(events)
+
+  def write(self, filename, format='chrome'):
+    '''
+    Write the recorded events to file.
+
+    :param filename: The output filename
+    :param format: The output format (chrome or json)
+
+    '''
+    import json
+    with self.lock:
+      events = sorted(self.events, key=lambda e: e['ts'])
+    if format == 'chrome':
+      output = { 'traceEvents' : events, 'displayTimeUnit' : 'ms' }
+    else:
+      output = as_json(events)
+    with open(filename, 'w') as outfile:
+      json.dump(output, outfile, indent=1, sort_keys=True)
+    logger.info('Saved %d trace events to %s' % (len(events), filename))
+
+
+def as_json(events):
+  '''
+  Convert the events to plain spans and counters with times in seconds from
+  the first event.
+
+  '''
+  t0 = min(e['ts'] for e in events) if events else 0
+  spans = []
+  counters = []
+  for e in events:
+    if e['ph'] == 'X':
+      spans.append({
+        'name'     : e['name'],
+        'stage'    : e['cat'],
+        'start'    : (e['ts'] - t0) * 1e-6,
+        'duration' : e['dur'] * 1e-6,
+        'pid'      : e['pid'],
+        'thread'   : e['tid'],
+        'args'     : e['args'] })
+    else:
+      counters.append({
+        'name'   : e['name'],
+        'stage'  : e['cat'],
+        'time'   : (e['ts'] - t0) * 1e-6,
+        'pid'    : e['pid'],
+        'values' : e['args'] })
+  return { 'spans' : spans, 'counters' : counters }
+
+
+# The tracer for this process
+_tracer = Tracer()
+
+
+def configure(params):
+  '''
+  Configure tracing from the trace phil parameters. If an output file is
+  given, recording is started and the file is written at exit.
+
+  :param params: The trace parameters
+
+  '''
+  import atexit
+  if params.output is None:
+    return
+  _tracer.owner = os.getpid()
+  _tracer.enable(params.memory_sampling_interval)
+  def write():
+    _tracer.disable()
+    _tracer.write(params.output, params.format)
+  atexit.register(write)
+
+
+def enabled():
+  ''' Return True if events are being recorded. '''
+  return _tracer.enabled
+
+
+def span(name, stage, **args):
+  '''
+  Record a span of time.
+
+  :param name: The name of the span
+  :param stage: The processing stage
+  :param args: Other keys to record with the span
+  :return: A context manager returning the dictionary of arguments
+
+  '''
+  return _tracer.span(name, stage, **args)
+
+
+def complete(name, stage, start, end, **args):
+  '''
+  Record a span of time which has already ended.
+
+  :param name: The name of the span
+  :param stage: The processing stage
+  :param start: The start time (from time.time())
+  :param end: The end time (from time.time())
+  :param args: Other keys to record with the span
+
+  '''
+  _tracer.complete(name, stage, start, end, **args)
+
+
+def counter(name, stage, **values):
+  '''
+  Record the values of a counter.
+
+  :param name: The name of the counter
+  :param stage: The processing stage
+  :param values: The named values
+
+  '''
+  _tracer.counter(name, stage, **values)
+
+
+def extend(events):
+  '''
+  Add events recorded in another process.
+
+  :param events: The list of events
+
+  '''
+  _tracer.extend(events)
+
+
+def state():
+  '''
+  Get the tracing state to pass to another process.
+
+  '''
+  return (_tracer.enabled, _tracer.memory_sampling_interval)
+
+
+class child_process(object):
+  '''
+  A context manager to record events for a task run in another process with
+  the given tracing state. The events recorded within the context are given
+  by the events attribute on exit. If the task is run in the process which
+  owns the tracer, the events are recorded there directly.
+
+  '''
+
+  def __init__(self, state):
+    self.state = state
+    self.events = []
+
+  def __enter__(self):
+    enabled, interval = self.state
+    self.child = enabled and os.getpid() != _tracer.owner
+    if self.child:
+      # Drop any events inherited from the parent on fork
+      _tracer.collect()
+      _tracer.sampler = None
+      _tracer.enable(interval)
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    if self.child:
+      _tracer.disable()
+      self.events = _tracer.collect()
+    return False
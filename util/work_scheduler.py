@@ -0,0 +1,407 @@
+#
+# work_scheduler.py
+#
+#  Copyright (C) 2018 Diamond Light Source
+#
+#  This code is distributed under the BSD license, a copy of which is
+#  included in the root directory of this package.
+'''
+Dynamic scheduling of independent work items between worker processes.
+
+Rather than splitting the items between the workers before starting, each
+worker requests a small batch of items from a coordinator whenever it becomes
+free, so workers given cheap items simply process more of them. The
+coordinator is either the parent of a set of multiprocessing workers or rank 0
+of an MPI job. Items that fail or exceed a time limit may be retried, and the
+throughput of each worker is reported at the end.
+
+Items are referred to by their index, so each worker must be able to look up
+an item from its index. Each worker is created by a make_worker(worker)
+function returning a (process, finalize) pair: process(index) processes a
+single item and finalize() is called once when the worker has finished. An
+item which exceeds the time limit is interrupted by an ItemTimeout raised
+inside process(index), and the worker then goes on to its next item, so
+process must leave the worker's state as it was before the item when it
+raises.
+
+'''
+
+from __future__ import absolute_import, division
+import logging
+logger = logging.getLogger(__name__)
+
+
+class ItemTimeout(BaseException):
+  '''
+  Raised in a worker when an item exceeds its time limit. This does not
+  derive from Exception so that it is not swallowed by code which squashes
+  errors while processing an item.
+
+  '''
+  pass
+
+
+def call_with_timeout(func, timeout, *args):
+  '''
+  Call a function, raising ItemTimeout if it takes longer than the timeout.
+  The timer is a SIGALRM so must be used from the main thread of a process.
+
+  :param func: The function to call
+  :param timeout: The time limit in seconds (None for no limit)
+  :return: The result of the function
+
+  '''
+  import signal
+  if timeout is None:
+    return func(*args)
+  def handler(signum, frame):
+    raise ItemTimeout('Exceeded time limit of %g seconds' % timeout)
+  previous = signal.signal(signal.SIGALRM, handler)
+  signal.setitimer(signal.ITIMER_REAL, timeout)
+  try:
+    return func(*args)
+  finally:
+    signal.setitimer(signal.ITIMER_REAL, 0)
+    signal.signal(signal.SIGALRM, previous)
+
+
+class WorkerStats(object):
+  '''
+  The statistics for a single worker
+
+  '''
+
+  def __init__(self):
+    from time import time
+    self.processed = 0
+    self.failed = 0
+    self.busy_time = 0.0
+    self.start_time = time()
+    self.end_time = self.start_time
+
+  def throughput(self):
+    '''
+    :return: The number of items processed per second
+
+    '''
+    elapsed = self.end_time - self.start_time
+    if elapsed <= 0:
+      return 0.0
+    return self.processed / elapsed
+
+
+class WorkQueue(object):
+  '''
+  The coordinator's record of the items waiting to be processed, the items
+  given to each worker and the items which have failed.
+
+  '''
+
+  def __init__(self, nitems, batch_size=1, max_retries=0):
+    '''
+    Initialise the queue
+
+    :param nitems: The number of items
+    :param batch_size: The number of items to give a worker at once
+    :param max_retries: The number of times to retry a failed item
+
+    '''
+    from collections import deque
+    assert batch_size > 0, "Batch size must be > 0"
+    assert max_retries >= 0, "Number of retries must be >= 0"
+    self.batch_size = batch_size
+    self.max_retries = max_retries
+    self.pending = deque(range(nitems))
+    self.attempts = [0] * nitems
+    self.in_flight = {}
+    self.failed = []
+    self.stats = {}
+
+  def next_batch(self, worker):
+    '''
+    Get the next batch of items for a worker
+
+    :param worker: The worker id
+    :return: The list of item indices (empty if none are available now)
+
+    '''
+    if worker not in self.stats:
+      self.stats[worker] = WorkerStats()
+    batch = []
+    while self.pending and len(batch) < self.batch_size:
+      batch.append(self.pending.popleft())
+    self.in_flight.setdefault(worker, set()).update(batch)
+    return batch
+
+  def record(self, worker, results):
+    '''
+    Record the results of processing items
+
+    :param worker: The worker id
+    :param results: A list of (index, error, elapsed) tuples. The error is
+                    None if the item was processed successfully.
+
+    '''
+    from time import time
+    if not results:
+      return
+    stats = self.stats[worker]
+    for index, error, elapsed in results:
+      self.in_flight[worker].discard(index)
+      stats.busy_time += elapsed
+      if error is None:
+        stats.processed += 1
+      else:
+        stats.failed += 1
+        self._failed(index, error)
+    stats.end_time = time()
+
+  def worker_lost(self, worker):
+    '''
+    Handle a worker which has exited unexpectedly; any items it was given
+    are treated as failed.
+
+    :param worker: The worker id
+
+    '''
+    for index in sorted(self.in_flight.pop(worker, ())):
+      self._failed(index, 'Worker %s exited unexpectedly' % worker)
+
+  def _failed(self, index, error):
+    '''
+    Retry a failed item or give up on it
+
+    '''
+    self.attempts[index] += 1
+    if self.attempts[index] <= self.max_retries:
+      logger.info('Retrying item %d (attempt %d of %d)' % (
+        index, self.attempts[index], self.max_retries))
+      self.pending.append(index)
+    else:
+      logger.warning('Item %d failed: %s' % (index, error))
+      self.failed.append((index, error))
+
+  def finished(self):
+    '''
+    :return: True if there are no items waiting or being processed
+
+    '''
+    return not self.pending and not any(self.in_flight.values())
+
+  def report(self):
+    '''
+    Log the throughput of each worker
+
+    '''
+    from libtbx.table_utils import format as table
+    rows = [["Worker", "# processed", "# failed", "Busy (s)", "Items/s"]]
+    for worker in sorted(self.stats):
+      stats = self.stats[worker]
+      rows.append([
+        str(worker),
+        str(stats.processed),
+        str(stats.failed),
+        '%.1f' % stats.busy_time,
+        '%.2f' % stats.throughput()])
+    logger.info("Worker throughput:\n%s" % table(
+      rows, has_header=True, justify='right', prefix=' '))
+    if self.failed:
+      logger.info("%d items could not be processed" % len(self.failed))
+
+
+def worker_loop(worker, exchange, process, timeout=None):
+  '''
+  Process batches of items until told to stop
+
+  :param worker: The worker id
+  :param exchange: A function exchange(worker, results) which sends the
+                   results of the previous batch to the coordinator and
+                   returns the next batch of item indices, or None to stop
+  :param process: The function to process an item given its index
+  :param timeout: The time limit for each item in seconds (None for no limit)
+
+  '''
+  import traceback
+  from time import time
+  results = []
+  while True:
+    batch = exchange(worker, results)
+    if batch is None:
+      break
+    results = []
+    for index in batch:
+      st = time()
+      try:
+        call_with_timeout(process, timeout, index)
+        error = None
+      except ItemTimeout as e:
+        error = str(e)
+      except Exception:
+        error = traceback.format_exc()
+      results.append((index, error, time() - st))
+
+
+def _dispatch(queue, waiting, send):
+  '''
+  Give batches to the workers waiting for work. Workers are told to stop once
+  all items have been processed.
+
+  :param queue: The work queue
+  :param waiting: The set of waiting workers (updated in place)
+  :param send: A function send(worker, batch) to send a batch to a worker
+  :return: The list of workers told to stop
+
+  '''
+  stopped = []
+  for worker in sorted(waiting):
+    if queue.finished():
+      send(worker, None)
+      stopped.append(worker)
+    else:
+      batch = queue.next_batch(worker)
+      if not batch:
+        continue
+      send(worker, batch)
+    waiting.discard(worker)
+  return stopped
+
+
+def run_serial(nitems, make_worker, batch_size=1, timeout=None,
+               max_retries=0):
+  '''
+  Process all items in the current process
+
+  :param nitems: The number of items
+  :param make_worker: The function to create a worker
+  :param batch_size: The number of items to give a worker at once
+  :param timeout: The time limit for each item in seconds (None for no limit)
+  :param max_retries: The number of times to retry a failed item
+  :return: The work queue
+
+  '''
+  queue = WorkQueue(nitems, batch_size, max_retries)
+  def exchange(worker, results):
+    queue.record(worker, results)
+    if queue.finished():
+      return None
+    return queue.next_batch(worker)
+  process, finalize = make_worker(0)
+  try:
+    worker_loop(0, exchange, process, timeout)
+  finally:
+    finalize()
+  queue.report()
+  return queue
+
+
+def _multiprocessing_worker(worker, make_worker, timeout, tasks, results):
+  '''
+  The function run by each multiprocessing worker
+
+  '''
+  def exchange(worker, processed):
+    results.put((worker, processed))
+    return tasks.get()
+  process, finalize = make_worker(worker)
+  try:
+    worker_loop(worker, exchange, process, timeout)
+  finally:
+    finalize()
+
+
+def run_multiprocessing(nitems, make_worker, nproc=1, batch_size=1,
+                        timeout=None, max_retries=0):
+  '''
+  Process the items using a number of forked worker processes, with the
+  current process acting as the coordinator
+
+  :param nitems: The number of items
+  :param make_worker: The function to create a worker (called in the worker)
+  :param nproc: The number of worker processes
+  :param batch_size: The number of items to give a worker at once
+  :param timeout: The time limit for each item in seconds (None for no limit)
+  :param max_retries: The number of times to retry a failed item
+  :return: The work queue
+
+  '''
+  import multiprocessing
+  from Queue import Empty
+  if nproc == 1:
+    return run_serial(nitems, make_worker, batch_size, timeout, max_retries)
+  queue = WorkQueue(nitems, batch_size, max_retries)
+  results = multiprocessing.Queue()
+  tasks = [multiprocessing.Queue() for worker in range(nproc)]
+  processes = []
+  for worker in range(nproc):
+    process = multiprocessing.Process(
+      target=_multiprocessing_worker,
+      args=(worker, make_worker, timeout, tasks[worker], results))
+    process.daemon = True
+    process.start()
+    processes.append(process)
+  send = lambda worker, batch: tasks[worker].put(batch)
+  active = set(range(nproc))
+  waiting = set()
+  while active:
+    try:
+      worker, processed = results.get(timeout=1.0)
+    except Empty:
+      for worker in sorted(active):
+        if not processes[worker].is_alive():
+          logger.warning("Worker %d exited unexpectedly" % worker)
+          active.discard(worker)
+          waiting.discard(worker)
+          queue.worker_lost(worker)
+    else:
+      queue.record(worker, processed)
+      waiting.add(worker)
+    active.difference_update(_dispatch(queue, waiting, send))
+  for process in processes:
+    process.join()
+  if queue.pending:
+    logger.warning("%d items were not processed" % len(queue.pending))
+  queue.report()
+  return queue
+
+
+def run_mpi(comm, nitems, make_worker, batch_size=1, timeout=None,
+            max_retries=0):
+  '''
+  Process the items using MPI. Rank 0 acts as the coordinator and the other
+  ranks process the items. Every rank must call this function.
+
+  :param comm: The MPI communicator
+  :param nitems: The number of items
+  :param make_worker: The function to create a worker (called on each rank)
+  :param batch_size: The number of items to give a worker at once
+  :param timeout: The time limit for each item in seconds (None for no limit)
+  :param max_retries: The number of times to retry a failed item
+  :return: The work queue on rank 0, otherwise None
+
+  '''
+  from mpi4py import MPI
+  rank = comm.Get_rank()
+  size = comm.Get_size()
+  if size == 1:
+    return run_serial(nitems, make_worker, batch_size, timeout, max_retries)
+  if rank == 0:
+    queue = WorkQueue(nitems, batch_size, max_retries)
+    send = lambda worker, batch: comm.send(batch, dest=worker)
+    active = set(range(1, size))
+    waiting = set()
+    while active:
+      worker, processed = comm.recv(source=MPI.ANY_SOURCE)
+      queue.record(worker, processed)
+      waiting.add(worker)
+      active.difference_update(_dispatch(queue, waiting, send))
+    queue.report()
+    return queue
+  def exchange(worker, processed):
+    comm.send((worker, processed), dest=0)
+    return comm.recv(source=0)
+  process, finalize = make_worker(rank)
+  try:
+    worker_loop(rank, exchange, process, timeout)
+  finally:
+    finalize()
+  return None